@@ -0,0 +1,81 @@
+# backend/app/cabin_records.py
+"""Compact records (__slots__ dataclass) for the persisted color plan of a cabin."""
+
+import dataclasses
+from typing import Any, Dict, Sequence
+
+# Colonne di optimization_colors lette per una cabina, nell'ordine dei campi di CabinColor
+CABIN_COLOR_SELECT = """
+    color_code, color_type, cluster, ch_value, lunghezza_ordine,
+    input_sequence, sequence_type, locked, sequence_order
+"""
+
+
+@dataclasses.dataclass
+class CabinColor:
+    """
+    Un colore del piano salvato di una cabina. Con __slots__ occupa una frazione di un
+    dizionario con le stesse chiavi; orjson lo serializza direttamente (solo i campi
+    del dataclass, senza passare da un dict). Espone get / [] come un dizionario così
+    il codice esistente funziona sia con i record sia con i colori arrivati in JSON.
+    'position' è solo in memoria (blocchi e drag & drop): non è salvata né serializzata.
+    """
+    __slots__ = ('color_code', 'color_type', 'cluster', 'ch_value', 'lunghezza_ordine',
+                 'input_sequence', 'sequence_type', 'locked', 'sequence_order', 'position')
+
+    color_code: Any
+    color_type: Any
+    cluster: Any
+    ch_value: Any
+    lunghezza_ordine: Any
+    input_sequence: Any
+    sequence_type: Any
+    locked: bool
+    sequence_order: Any
+
+    @classmethod
+    def from_row(cls, row: Sequence[Any]) -> "CabinColor":
+        """Record da una riga SELECT {CABIN_COLOR_SELECT}."""
+        return cls(row[0], row[1], row[2], row[3], row[4], row[5], row[6], bool(row[7]), row[8])
+
+    @staticmethod
+    def row_factory(cursor, row) -> "CabinColor":
+        """Da usare come cursor.row_factory: le righe arrivano già come record."""
+        return CabinColor.from_row(row)
+
+    @classmethod
+    def from_optimized(cls, color: Dict[str, Any], sequence_order: int) -> "CabinColor":
+        """Record da salvare per un colore restituito dall'ottimizzazione (chiavi code/type/CH/sequence)."""
+        return cls(color.get('code', ''), color.get('type', ''), color.get('cluster', ''), color.get('CH', ''),
+                   color.get('lunghezza_ordine', ''), color.get('sequence', ''), color.get('sequence_type', ''),
+                   color.get('locked', False), sequence_order)
+
+    # --- Accesso in stile dizionario ---
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        try:
+            setattr(self, key, value)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key: str) -> bool:
+        return hasattr(self, key)
+
+    def copy(self) -> "CabinColor":
+        clone = CabinColor(self.color_code, self.color_type, self.cluster, self.ch_value, self.lunghezza_ordine,
+                           self.input_sequence, self.sequence_type, self.locked, self.sequence_order)
+        if hasattr(self, 'position'):
+            clone.position = self.position
+        return clone
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field.name: getattr(self, field.name) for field in dataclasses.fields(self)}
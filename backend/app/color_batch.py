@@ -0,0 +1,230 @@
+# backend/app/color_batch.py
+"""Columnar, per-request view of the colors to optimize, shared by every stage of the pipeline."""
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from app import config, metrics
+from app.models import ClusterDict
+
+NO_CLUSTER = -1
+# Priorità di sequenza di un cluster senza colori (es. cluster di partenza aggiunto d'ufficio)
+EMPTY_CLUSTER_SEQUENCE = 999
+URGENT_TYPES = ("R", "REINTEGRO")
+
+
+def sequence_value(value: Any) -> int:
+    """Valore di sequenza come intero: 0 se None, vuoto o non convertibile."""
+    if value is None:
+        return 0
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return 0
+
+
+def _field(record: Any, name: str, default: Any = None) -> Any:
+    """Campo di un colore, sia dizionario che modello Pydantic (ColorInput)."""
+    if isinstance(record, dict):
+        return record.get(name, default)
+    return getattr(record, name, default)
+
+
+def _record_dict(record: Any) -> Dict[str, Any]:
+    if isinstance(record, dict):
+        return record.copy()
+    try:
+        return record.model_dump()  # Pydantic v2
+    except AttributeError:
+        return record.dict()  # Pydantic v1
+
+
+def _intern(values: Iterable[Any], none_id: Optional[int] = None) -> Tuple[np.ndarray, List[Any], Dict[Any, int]]:
+    """Sostituisce i valori con id interi: (colonna id, vocabolario, valore -> id)."""
+    vocab: List[Any] = []
+    index: Dict[Any, int] = {}
+    ids = []
+    for value in values:
+        if value is None and none_id is not None:
+            ids.append(none_id)
+            continue
+        value_id = index.get(value)
+        if value_id is None:
+            value_id = index[value] = len(vocab)
+            vocab.append(value)
+        ids.append(value_id)
+    return np.array(ids, dtype=np.int32), vocab, index
+
+
+def _int_column(values: List[int]) -> np.ndarray:
+    try:
+        return np.array(values, dtype=np.int64)
+    except OverflowError:  # Sequenze fuori scala: colonna di interi Python
+        return np.array(values, dtype=object)
+
+
+class ClusterAggregates:
+    """Aggregati per cluster (indicizzati per id cluster del batch) usati da matrice costi e priorità."""
+
+    def __init__(self, batch: "ColorBatch", prioritized_reintegrations: Optional[Sequence[str]] = None):
+        k = len(batch.clusters)
+        cids = batch.cluster_ids
+        valid = cids != NO_CLUSTER
+        vcids = cids[valid]
+
+        self.counts = np.bincount(vcids, minlength=k)
+        mins = np.zeros(k, dtype=batch.sequences.dtype)
+        if vcids.size:
+            mins[:] = batch.sequences[valid].max()
+            np.minimum.at(mins, vcids, batch.sequences[valid])
+        self.min_sequence = mins
+
+        def flag(row_mask: np.ndarray) -> np.ndarray:
+            flags = np.zeros(k, dtype=bool)
+            flags[cids[valid & row_mask]] = True
+            return flags
+
+        types_upper = batch.types_upper_column()
+        prioritized = set(prioritized_reintegrations or [])
+        is_prioritized_code = np.array([c in prioritized for c in batch.codes], dtype=bool)[batch.code_ids] \
+            if batch.codes else np.zeros(0, dtype=bool)
+        self.has_reintegro = flag(types_upper == "R")
+        self.has_reintegro_non_urgente = flag(types_upper == "RE")
+        self.has_reintegro_prioritario = flag((types_upper == "R") & is_prioritized_code)
+
+        # Codici e tipi (maiuscoli) distinti per cluster, dalle coppie uniche (cluster, valore)
+        self.codes: List[Set[Any]] = [set() for _ in range(k)]
+        self.types: List[Set[str]] = [set() for _ in range(k)]
+        for target, ids, vocab in ((self.codes, batch.code_ids, batch.codes),
+                                   (self.types, batch.type_ids, batch.types_upper)):
+            width = max(len(vocab), 1)
+            for pair in np.unique(vcids.astype(np.int64) * width + ids[valid]):
+                target[int(pair) // width].add(vocab[int(pair) % width])
+
+
+class ColorBatch:
+    """
+    Colori di una richiesta in forma colonnare, costruiti una sola volta e condivisi
+    da mappatura cluster, matrice costi, priorità di sequenza e ordinamento finale.
+    Codice, tipo e cluster sono id interi su vocabolari del batch; i record originali
+    (dizionari o ColorInput) non vengono copiati né modificati e tornano dizionari
+    solo in uscita con to_dicts.
+    """
+
+    def __init__(self, records: Sequence[Any]):
+        self.records = list(records)
+        self.code_ids, self.codes, _ = _intern(_field(r, "code") for r in self.records)
+        self.type_ids, self.types, _ = _intern(_field(r, "type") for r in self.records)
+        self.types_upper = [str(t).upper() if t is not None else "" for t in self.types]
+        self.sequences = _int_column([sequence_value(_field(r, "sequence")) for r in self.records])
+        self.small = np.array([_field(r, "sequence_type") == config.SEQUENCE_TYPE_SMALL for r in self.records],
+                              dtype=bool)
+        # Cluster già presente nei record (es. colori letti dal DB), altrimenti assegnato da assign_clusters
+        self.cluster_ids, self.clusters, self._cluster_index = _intern(
+            (_field(r, "cluster") for r in self.records), none_id=NO_CLUSTER)
+        self._aggregates: Optional[ClusterAggregates] = None
+
+    @classmethod
+    def from_request(cls, request_data: Any) -> "ColorBatch":
+        """Batch dai ColorInput di una OptimizationRequest, senza passare da model_dump."""
+        return cls(request_data.colors_today)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    # --- Accesso per riga ---
+
+    def code(self, i: int) -> Any:
+        return self.codes[self.code_ids[i]]
+
+    def type(self, i: int) -> Any:
+        return self.types[self.type_ids[i]]
+
+    def cluster(self, i: int) -> Optional[str]:
+        cluster_id = self.cluster_ids[i]
+        return None if cluster_id == NO_CLUSTER else self.clusters[cluster_id]
+
+    def cluster_id(self, cluster_name: Any) -> int:
+        return self._cluster_index.get(cluster_name, NO_CLUSTER)
+
+    def field(self, name: str) -> List[Any]:
+        """Colonna di un campo non indicizzato (es. lunghezza_ordine, line)."""
+        return [_field(r, name) for r in self.records]
+
+    def types_upper_column(self) -> np.ndarray:
+        return np.array(self.types_upper, dtype=object)[self.type_ids] if self.records else np.zeros(0, dtype=object)
+
+    # --- Sottoinsiemi e uscita ---
+
+    def select(self, rows: Iterable[int]) -> "ColorBatch":
+        return ColorBatch([self.records[i] for i in rows])
+
+    def where(self, name: str, value: Any) -> "ColorBatch":
+        return self.select(i for i, v in enumerate(self.field(name)) if v == value)
+
+    def rows_by_cluster(self, cluster_names: Iterable[str]) -> List[int]:
+        """Righe raggruppate per cluster nell'ordine dato (ordine di input dentro ogni cluster)."""
+        order = np.argsort(self.cluster_ids, kind="stable")
+        sorted_ids = self.cluster_ids[order]
+        rows: List[int] = []
+        for name in cluster_names:
+            cluster_id = self.cluster_id(name)
+            if cluster_id == NO_CLUSTER:
+                continue
+            lo, hi = np.searchsorted(sorted_ids, [cluster_id, cluster_id + 1])
+            rows.extend(order[lo:hi].tolist())
+        return rows
+
+    def to_dicts(self, rows: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+        """Dizionari di output (copie dei record con il cluster assegnato) per le righe indicate."""
+        result = []
+        for i in (range(len(self.records)) if rows is None else rows):
+            color = _record_dict(self.records[i])
+            color["cluster"] = self.cluster(i)
+            result.append(color)
+        return result
+
+    # --- Stadi della pipeline ---
+
+    @metrics.timed("clusters")
+    def assign_clusters(self, cluster_dict: ClusterDict) -> Tuple[Dict[str, str], List[str], Set[str]]:
+        """
+        Assegna a ogni colore il cluster del suo codice (una ricerca per codice distinto).
+        Restituisce (mappa colore->cluster, lista cluster di oggi ordinata, set cluster urgenti).
+        """
+        colore2cluster: Dict[str, str] = {}
+        for cluster, colori in cluster_dict.items():
+            for c in colori:
+                colore2cluster[c] = cluster
+
+        cluster_of_code = [colore2cluster.get(code if code is not None else "", None) for code in self.codes]
+        _, self.clusters, self._cluster_index = _intern(c for c in cluster_of_code if c is not None)
+        code_to_cluster_id = np.array([self._cluster_index.get(c, NO_CLUSTER) if c is not None else NO_CLUSTER
+                                       for c in cluster_of_code], dtype=np.int32)
+        self.cluster_ids = code_to_cluster_id[self.code_ids] if self.records else np.zeros(0, dtype=np.int32)
+        self._aggregates = None
+
+        for i in np.flatnonzero(self.cluster_ids == NO_CLUSTER):
+            print(f"Attenzione: Colore {self.code(i)} non trovato in nessun cluster del DB.")
+
+        # Considera 'R' o 'reintegro' come urgente
+        urgent_rows = np.isin(self.types_upper_column(), URGENT_TYPES) & (self.cluster_ids != NO_CLUSTER)
+        clusters_urgenti = {self.clusters[cid] for cid in np.unique(self.cluster_ids[urgent_rows])}
+        clusters_oggi = sorted(self.clusters[cid] for cid in np.unique(self.cluster_ids[self.cluster_ids != NO_CLUSTER]))
+        return colore2cluster, clusters_oggi, clusters_urgenti
+
+    def aggregates(self, prioritized_reintegrations: Optional[Sequence[str]] = None) -> ClusterAggregates:
+        if prioritized_reintegrations:
+            return ClusterAggregates(self, prioritized_reintegrations)
+        if self._aggregates is None:
+            self._aggregates = ClusterAggregates(self)
+        return self._aggregates
+
+    def cluster_sequence_priority(self, cluster_name: str) -> int:
+        """Sequenza minima dei colori del cluster (priorità), EMPTY_CLUSTER_SEQUENCE se non ha colori."""
+        cluster_id = self.cluster_id(cluster_name)
+        aggregates = self.aggregates()
+        if cluster_id == NO_CLUSTER or not aggregates.counts[cluster_id]:
+            return EMPTY_CLUSTER_SEQUENCE
+        return int(aggregates.min_sequence[cluster_id])
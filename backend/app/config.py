@@ -83,4 +83,108 @@ PENALTY_SEQUENCE_PRIORITY = 25  # Penalità di 25 sul costo per priorità bassa
 # Soglia per la differenza di sequenza che attiva bonus/penalità.
 # Solo se la differenza di sequenza tra source e destination è >= questa soglia
 # verranno applicati i bonus/penalità.
-SEQUENCE_PRIORITY_THRESHOLD = 1
\ No newline at end of file
+SEQUENCE_PRIORITY_THRESHOLD = 1
+
+# --- CONFIGURAZIONI JOB DI OTTIMIZZAZIONE (progresso via Server-Sent Events) ---
+
+# Numero massimo di job mantenuti in memoria (i job terminati più vecchi vengono rimossi)
+OPTIMIZATION_JOBS_MAX = 50
+
+# Secondi dopo i quali un job terminato viene rimosso dal registro
+OPTIMIZATION_JOBS_TTL_SECONDS = 900
+
+# Intervallo di polling (secondi) dello stream SSE sugli eventi del job
+OPTIMIZATION_JOBS_EVENT_POLL_SECONDS = 0.2
+
+# --- CONFIGURAZIONI SERIALIZZAZIONE RISPOSTE ---
+# Le risposte di ottimizzazione più grandi di questa soglia vengono compresse con gzip
+# (se il client invia Accept-Encoding: gzip)
+RESPONSE_GZIP_MIN_BYTES = 16 * 1024
+RESPONSE_GZIP_LEVEL = 5
+
+# --- CONFIGURAZIONI OTTIMIZZAZIONE CON COLORI BLOCCATI ---
+
+# Thread usati per risolvere in parallelo i segmenti liberi tra i colori bloccati
+LOCKED_SEGMENTS_MAX_WORKERS = int(os.environ.get('LOCKED_SEGMENTS_MAX_WORKERS', '4'))
+
+# Riparazione locale dopo uno spostamento manuale (drag & drop): posizioni riottimizzate
+# prima e dopo il punto di inserimento e il punto da cui il colore è stato tolto
+LOCAL_REPAIR_RADIUS = int(os.environ.get('LOCAL_REPAIR_RADIUS', '8'))
+
+# --- CONFIGURAZIONI RIPARTIZIONE SU N CABINE (mode "cabine" di /optimize) ---
+
+OPTIMIZATION_MODE_CABINS = "cabine"
+
+# Numero di cabine di default tra cui ripartire i colori, e massimo accettato per cabin_count
+# (il frontend mostra solo le cabine 1..CABIN_COUNT)
+CABIN_COUNT = int(os.environ.get('CABIN_COUNT', '2'))
+
+# Thread che ottimizzano in parallelo le cabine della ripartizione
+PARTITION_MAX_WORKERS = int(os.environ.get('PARTITION_MAX_WORKERS', '4'))
+
+# Carico massimo ammesso per cabina rispetto alla media (0.15 = +15% di ore CH)
+PARTITION_BALANCE_TOLERANCE = float(os.environ.get('PARTITION_BALANCE_TOLERANCE', '0.15'))
+
+# Fino a questo numero di cluster per cabina la ricerca locale valuta il costo esatto (Held-Karp,
+# comunque non oltre HELD_KARP_MAX_NODES), oltre usa il percorso greedy
+PARTITION_EXACT_MAX_CLUSTERS = 12
+
+# --- CONFIGURAZIONI OTTIMIZZAZIONE PER LINEA (mode "linee" di /optimize) ---
+
+OPTIMIZATION_MODE_LINES = "linee"
+
+# Thread che ottimizzano in parallelo le linee di produzione
+LINE_MAX_WORKERS = int(os.environ.get('LINE_MAX_WORKERS', '4'))
+
+# --- CONFIGURAZIONI IMPORT FILE ORDINI (POST /optimize/import) ---
+
+# Il file ricevuto resta in memoria fino a questa dimensione, oltre viene scritto su un file temporaneo
+INGEST_SPOOL_MAX_BYTES = int(os.environ.get('INGEST_SPOOL_MAX_BYTES', str(8 * 1024 * 1024)))
+
+# Dimensione massima accettata per un file ordini
+INGEST_MAX_BYTES = int(os.environ.get('INGEST_MAX_BYTES', str(200 * 1024 * 1024)))
+
+# Righe scartate riportate con il motivo nella risposta (le altre sono solo contate)
+INGEST_MAX_REPORTED_ERRORS = 50
+
+# --- CONFIGURAZIONI DP HELD-KARP ---
+
+# Numero massimo di cluster per cui si calcola la tabella Held-Karp densa (2**n x n float64).
+# Memoria per ogni tabella: 2**n * n * 8 byte, più circa 2**n * 17 byte di maschere e
+# contatori di lavoro: 16 cluster -> 8 MB, 18 -> 38 MB, 20 -> 168 MB, 22 -> 738 MB.
+# Ogni ottimizzazione concorrente (job, cabine e linee in parallelo) alloca la propria,
+# quindi il picco è questo valore per il numero di calcoli contemporanei. Oltre il limite
+# si usa il percorso greedy migliorato con ricerca locale (ottimalità non garantita).
+HELD_KARP_MAX_NODES = int(os.environ.get('HELD_KARP_MAX_NODES', '20'))
+
+# --- CONFIGURAZIONI CACHE TABELLE HELD-KARP ---
+
+# Memoria massima delle tabelle Held-Karp riusate tra richieste (0 = cache disattivata)
+DP_CACHE_MAX_BYTES = int(os.environ.get('DP_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+# La ripartizione su cabine calcola una tabella su tutti i cluster (per partenza) e ne
+# legge i sottoinsiemi solo fino a questo numero di cluster
+DP_CACHE_UNIVERSE_MAX_NODES = int(os.environ.get('DP_CACHE_UNIVERSE_MAX_NODES', '14'))
+
+# --- CONFIGURAZIONI METRICHE (Server-Timing e /metrics) ---
+
+# Limiti superiori (secondi) dei bucket degli istogrammi Prometheus
+METRICS_BUCKETS = [float(b) for b in os.environ.get(
+    'METRICS_BUCKETS', '0.001,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60').split(',')]
+
+# Header Server-Timing con la durata di ogni fase nelle risposte
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING_ENABLED', '1') == '1'
+
+# --- CONFIGURAZIONI PROFILAZIONE (?profile=cpu|mem su /optimize e ottimizzazioni di cabina) ---
+
+# Il parametro ?profile è accettato solo se attivo: la profilazione rallenta la richiesta
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '0') == '1'
+
+# Cartella dei profili salvati (un .json di metadati più .prof / .txt per profilo)
+PROFILES_DIR = os.environ.get('PROFILES_DIR', str(current_dir / "../../shared/data/profiles"))
+
+# Profili conservati: oltre questo numero i più vecchi vengono cancellati
+PROFILES_KEEP = int(os.environ.get('PROFILES_KEEP', '50'))
+
+# Righe del riepilogo testuale (funzioni per tempo cumulativo / righe per memoria allocata)
+PROFILE_TOP_LINES = int(os.environ.get('PROFILE_TOP_LINES', '40'))
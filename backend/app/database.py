@@ -3,16 +3,20 @@
 
 import sqlite3
 import json
+import hashlib
+import threading
 from typing import Dict, List, Tuple, Any, Optional
-from app.config import DATABASE_PATH # Importa il path dal config
+from app import config # Path del DB letto a ogni connessione (i test lo cambiano dopo l'import)
+from app import metrics
 
 # Tipi definiti (possono stare qui o in models.py)
 ColorObject = Dict[str, Any]
 ClusterDict = Dict[str, List[str]]
 TransitionRuleDict = Dict[Tuple[str, str], Dict[str, Any]]
 
-def connect_to_db(db_path: str = DATABASE_PATH) -> Optional[sqlite3.Connection]:
-    """Crea una connessione al database SQLite."""
+def connect_to_db(db_path: Optional[str] = None) -> Optional[sqlite3.Connection]:
+    """Crea una connessione al database SQLite (default: config.DATABASE_PATH)."""
+    db_path = db_path or config.DATABASE_PATH
     try:
         conn = sqlite3.connect(db_path)
         # Permette di accedere ai risultati per nome colonna (molto comodo)
@@ -22,6 +26,7 @@ def connect_to_db(db_path: str = DATABASE_PATH) -> Optional[sqlite3.Connection]:
         print(f"Errore di connessione al database {db_path}: {e}")
         return None
 
+@metrics.timed("rules")
 def get_cluster_colori() -> ClusterDict:
     """Ottiene il mapping cluster -> lista codici colore dal DB."""
     clusters: ClusterDict = {}
@@ -46,6 +51,7 @@ def get_cluster_colori() -> ClusterDict:
             conn.close()
     return clusters
 
+@metrics.timed("rules")
 def get_cambio_colori() -> TransitionRuleDict:
     """Ottiene le regole di transizione tra cluster dal DB."""
     transitions: TransitionRuleDict = {}
@@ -91,6 +97,99 @@ def get_cambio_colori() -> TransitionRuleDict:
             conn.close()
     return transitions
 
+def _compute_rules_version() -> str:
+    """
+    Impronta (sha1) del contenuto delle regole usate dall'ottimizzatore
+    (cluster_colori + cambio_colori). Legge entrambe le tabelle per intero.
+    """
+    digest = hashlib.sha1()
+    conn = connect_to_db()
+    if not conn:
+        return ""
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT cluster, color_code FROM cluster_colori ORDER BY cluster, color_code')
+        for row in cursor:
+            digest.update(repr(tuple(row)).encode('utf-8'))
+        digest.update(b'|')
+        cursor.execute('''
+            SELECT source_cluster, target_cluster, peso, transition_colors, required_trigger_type
+            FROM cambio_colori ORDER BY source_cluster, target_cluster
+        ''')
+        for row in cursor:
+            digest.update(repr(tuple(row)).encode('utf-8'))
+    except sqlite3.Error as e:
+        print(f"Errore durante il calcolo della versione delle regole: {e}")
+        return ""
+    finally:
+        conn.close()
+    return digest.hexdigest()
+
+# Scope della tabella data_versions incrementato dai trigger su cluster_colori e cambio_colori
+# (installati dal frontend, frontend/app/versions.py)
+RULES_VERSION_SCOPE = "rules"
+
+class RulesVersionCache:
+    """
+    Impronta delle regole ricalcolata solo quando cambiano: una connessione dedicata,
+    che non scrive mai, controlla PRAGMA data_version (cambia solo dopo un commit di
+    un'altra connessione) e in quel caso rilegge il contatore "rules" di data_versions.
+    Lo sha1 completo si ricalcola solo se il contatore è cambiato, oppure a ogni
+    modifica del database se il contatore non c'è (trigger non ancora installati).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_path: Optional[str] = None
+        self._data_version: Optional[int] = None
+        self._counter: Optional[int] = None
+        self._version = ""
+
+    def _rules_counter(self) -> Optional[int]:
+        try:
+            row = self._conn.execute("SELECT version FROM data_versions WHERE scope = ?",
+                                     (RULES_VERSION_SCOPE,)).fetchone()
+        except sqlite3.Error:
+            return None # Tabella data_versions non ancora creata
+        return row[0] if row else None
+
+    def get(self) -> str:
+        with self._lock:
+            try:
+                if self._conn is None or self._db_path != config.DATABASE_PATH:
+                    if self._conn is not None:
+                        self._conn.close()
+                    self._db_path = config.DATABASE_PATH
+                    self._conn = sqlite3.connect(self._db_path, check_same_thread=False)
+                    self._data_version = None
+                    self._counter = None
+                data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+                if data_version == self._data_version and self._version:
+                    return self._version
+                counter = self._rules_counter()
+                if counter is None or counter != self._counter or not self._version:
+                    self._version = _compute_rules_version()
+                self._counter = counter
+                self._data_version = data_version
+                return self._version
+            except sqlite3.Error as e:
+                print(f"Versione delle regole non memorizzabile, ricalcolo completo: {e}")
+                self._conn = None
+                self._data_version = None
+                return _compute_rules_version()
+
+_rules_version_cache = RulesVersionCache()
+
+def get_rules_version() -> str:
+    """
+    Impronta (sha1) del contenuto delle regole usate dall'ottimizzatore
+    (cluster_colori + cambio_colori). Cambia a ogni modifica delle regole;
+    finché le regole non cambiano restituisce il valore memorizzato.
+    """
+    return _rules_version_cache.get()
+
 # --- NUOVE FUNZIONI PER LA GESTIONE DB ---
 
 # === CAMBIO COLORI ===
@@ -305,6 +404,7 @@ def get_unique_clusters() -> List[str]:
 
 # === OPTIMIZATION COLORS ===
 
+@metrics.timed("save")
 def save_optimization_results(ordered_colors: List[Dict[str, Any]], cabin_id: int = 1) -> bool:
     """
     Salva i risultati dell'ottimizzazione nella tabella optimization_colors.
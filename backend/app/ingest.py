@@ -0,0 +1,268 @@
+# backend/app/ingest.py
+"""Streaming import of order files (CSV / JSONL / XLSX) into optimizer-ready color records."""
+
+import codecs
+import csv
+import io
+import json
+import time
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional
+
+from app import config
+
+try:
+    import orjson
+except ImportError:  # Fallback al json della libreria standard
+    orjson = None
+
+try:
+    import openpyxl
+except ImportError:  # Senza openpyxl si importano solo CSV e JSONL
+    openpyxl = None
+
+FORMAT_CSV = "csv"
+FORMAT_JSONL = "jsonl"
+FORMAT_XLSX = "xlsx"
+FORMATS = (FORMAT_CSV, FORMAT_JSONL, FORMAT_XLSX)
+
+# Intestazioni riconosciute (minuscole) -> campo di ColorInput
+COLUMN_ALIASES = {
+    "code": "code", "codice": "code", "codice colore": "code", "colore": "code", "color_code": "code",
+    "type": "type", "tipo": "type", "tipologia": "type", "color_type": "type",
+    "sequence": "sequence", "sequenza": "sequence", "seq": "sequence",
+    "line": "line", "linea": "line",
+    "ch": "CH", "centiore": "CH",
+    "sequence_type": "sequence_type", "tipo sequenza": "sequence_type",
+    "lunghezza_ordine": "lunghezza_ordine", "lunghezza ordine": "lunghezza_ordine",
+    "day": "day", "giorno": "day",
+}
+
+# File senza intestazione: stesso ordine delle colonne incollabili in cabina (Codice,Tipo,Sequenza,Linea,CH)
+POSITIONAL_COLUMNS = ["code", "type", "sequence", "line", "CH"]
+
+LUNGHEZZE_ORDINE = ("corto", "lungo")
+
+
+class ImportResult:
+    """Colori validi letti dal file più le statistiche dell'import (righe, scarti, cluster, righe/s)."""
+
+    def __init__(self, file_format: str):
+        self.format = file_format
+        self.colors: List[Dict[str, Any]] = []
+        self.rows = 0
+        self.rejected = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.clusters: Dict[str, int] = {}
+        self.unknown_codes: Dict[str, int] = {}
+        self.bytes = 0
+        self.elapsed = 0.0
+
+    def reject(self, row_number: int, reason: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < config.INGEST_MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "error": reason})
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "format": self.format,
+            "rows": self.rows,
+            "accepted": len(self.colors),
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "clusters": self.clusters,
+            "unknown_codes": sorted(self.unknown_codes),
+            "bytes": self.bytes,
+            "elapsed_seconds": round(self.elapsed, 4),
+            "rows_per_second": round(self.rows_per_second, 1),
+        }
+
+
+def detect_format(requested: Optional[str], content_type: Optional[str], filename: Optional[str]) -> str:
+    """Formato dal parametro esplicito, altrimenti da Content-Type o estensione del nome file."""
+    if requested:
+        requested = requested.lower().lstrip(".")
+        if requested not in FORMATS:
+            raise ValueError(f"Formato '{requested}' non supportato (usa {', '.join(FORMATS)})")
+        return requested
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in ("text/csv", "application/csv"):
+        return FORMAT_CSV
+    if content_type in ("application/jsonl", "application/x-ndjson", "application/x-jsonlines"):
+        return FORMAT_JSONL
+    if content_type == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet":
+        return FORMAT_XLSX
+    extension = (filename or "").rsplit(".", 1)[-1].lower() if filename and "." in filename else ""
+    if extension in ("ndjson", "jsonl"):
+        return FORMAT_JSONL
+    if extension in FORMATS:
+        return extension
+    raise ValueError("Formato del file non riconosciuto: indica format=csv|jsonl|xlsx")
+
+
+# --- Conversione e validazione di una riga ---
+
+def _text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # Codici numerici letti da Excel (9005.0 -> "9005")
+    text = str(value).strip()
+    return text or None
+
+
+def _number(value: Any, name: str, cast: type) -> Optional[Any]:
+    text = _text(value)
+    if text is None:
+        return None
+    try:
+        number = float(text.replace(",", "."))  # Decimali con la virgola come in Excel italiano
+    except ValueError:
+        raise ValueError(f"{name} non numerico: '{text}'")
+    if cast is int:
+        if not number.is_integer():
+            raise ValueError(f"{name} non intero: '{text}'")
+        return int(number)
+    return number
+
+
+def color_record(values: Dict[str, Any]) -> Dict[str, Any]:
+    """Colore con i campi di ColorInput da una riga già associata ai nomi dei campi; ValueError se non valida."""
+    code, color_type = _text(values.get("code")), _text(values.get("type"))
+    if not code:
+        raise ValueError("campo 'code' mancante")
+    if not color_type:
+        raise ValueError("campo 'type' mancante")
+    sequence_type = _text(values.get("sequence_type"))
+    if sequence_type is not None and sequence_type not in config.VALID_SEQUENCE_TYPES:
+        raise ValueError(f"sequence_type non valido: '{sequence_type}'")
+    lunghezza = _text(values.get("lunghezza_ordine"))
+    if lunghezza is not None:
+        lunghezza = lunghezza.lower()
+        if lunghezza not in LUNGHEZZE_ORDINE:
+            raise ValueError(f"lunghezza_ordine non valida: '{lunghezza}'")
+    day = _number(values.get("day"), "day", int)
+    if day is not None and day < 0:
+        raise ValueError(f"day negativo: {day}")
+    return {
+        "code": code,
+        "type": color_type,
+        "line": _text(values.get("line")),
+        "sequence": _number(values.get("sequence"), "sequence", int),
+        "sequence_type": sequence_type,
+        "CH": _number(values.get("CH"), "CH", float),
+        "lunghezza_ordine": lunghezza,
+        "day": day,
+    }
+
+
+def _header_fields(row: List[Any]) -> Optional[List[Optional[str]]]:
+    """Campi delle colonne se la riga è un'intestazione (contiene la colonna del codice), altrimenti None."""
+    fields = [COLUMN_ALIASES.get((_text(cell) or "").lower()) for cell in row]
+    return fields if "code" in fields else None
+
+
+def _table_rows(rows: Iterable[List[Any]]) -> Iterator[Dict[str, Any]]:
+    """
+    Righe di una tabella (CSV / foglio Excel) come dizionari campo -> valore, con o senza
+    intestazione. L'intestazione esce come riga vuota, così i numeri di riga restano quelli del file.
+    """
+    fields: Optional[List[Optional[str]]] = None
+    for n_row, row in enumerate(rows):
+        if n_row == 0:
+            fields = _header_fields(row)
+            if fields is not None:
+                yield {}
+                continue
+            fields = POSITIONAL_COLUMNS
+        if not any(_text(cell) for cell in row):
+            yield {}
+            continue
+        yield {field: cell for field, cell in zip(fields, row) if field}
+
+
+# --- Lettori per formato (una riga alla volta dal file già ricevuto) ---
+
+def _csv_rows(stream: IO[bytes]) -> Iterator[Dict[str, Any]]:
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    try:
+        yield from _table_rows(csv.reader(text, dialect))
+    finally:
+        text.detach()
+
+
+def _jsonl_rows(stream: IO[bytes]) -> Iterator[Dict[str, Any]]:
+    reader = codecs.getreader("utf-8-sig")(stream)
+    for line in reader:
+        if not line.strip():
+            yield {}
+            continue
+        try:
+            value = orjson.loads(line) if orjson is not None else json.loads(line)
+        except ValueError as e:
+            yield {"__error__": f"JSON non valido: {e}"}
+            continue
+        if not isinstance(value, dict):
+            yield {"__error__": "la riga non è un oggetto JSON"}
+            continue
+        yield {COLUMN_ALIASES.get(str(k).strip().lower(), k): v for k, v in value.items()}
+
+
+def _xlsx_rows(stream: IO[bytes]) -> Iterator[Dict[str, Any]]:
+    if openpyxl is None:
+        raise RuntimeError("Import XLSX non disponibile: installare openpyxl")
+    # read_only: le righe del primo foglio sono lette una alla volta senza caricare il foglio intero
+    workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    try:
+        yield from _table_rows(list(row) for row in workbook.worksheets[0].iter_rows(values_only=True))
+    finally:
+        workbook.close()
+
+
+READERS = {FORMAT_CSV: _csv_rows, FORMAT_JSONL: _jsonl_rows, FORMAT_XLSX: _xlsx_rows}
+
+
+def import_colors(stream: IO[bytes], file_format: str, cluster_dict: Dict[str, List[str]]) -> ImportResult:
+    """
+    Legge il file riga per riga: ogni riga viene validata e associata al suo cluster mentre
+    scorre, e solo i colori validi (dizionari con i campi di ColorInput) restano in memoria.
+    Le righe vuote sono ignorate, quelle non valide scartate con il motivo.
+    """
+    result = ImportResult(file_format)
+    stream.seek(0, io.SEEK_END)
+    result.bytes = stream.tell()
+    stream.seek(0)
+    colore2cluster = {c: cluster for cluster, colori in cluster_dict.items() for c in colori}
+
+    start = time.perf_counter()
+    for n_row, values in enumerate(READERS[file_format](stream), start=1):
+        if not values:
+            continue
+        result.rows += 1
+        if "__error__" in values:
+            result.reject(n_row, values["__error__"])
+            continue
+        try:
+            color = color_record(values)
+        except ValueError as e:
+            result.reject(n_row, str(e))
+            continue
+        cluster = colore2cluster.get(color["code"])
+        if cluster is None:
+            result.unknown_codes[color["code"]] = result.unknown_codes.get(color["code"], 0) + 1
+        else:
+            result.clusters[cluster] = result.clusters.get(cluster, 0) + 1
+        result.colors.append(color)
+    result.elapsed = time.perf_counter() - start
+    print(f"[IMPORT] {file_format}: {result.rows} righe ({len(result.colors)} valide, {result.rejected} scartate) "
+          f"in {result.elapsed:.3f}s, {result.rows_per_second:.0f} righe/s")
+    return result
@@ -0,0 +1,139 @@
+# backend/app/jobs.py
+"""Background optimization jobs with streamable progress events."""
+
+import threading
+import time
+import uuid
+import traceback
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app import config
+from app.logic import SolverCancelled
+
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_STOPPED = "stopped"      # Interrotto dall'operatore: risultato = migliore sequenza trovata finora
+JOB_CANCELLED = "cancelled"  # Interrotto prima di avere una sequenza completa
+JOB_FAILED = "failed"
+
+FINAL_STATUSES = {JOB_COMPLETED, JOB_STOPPED, JOB_CANCELLED, JOB_FAILED}
+
+
+class OptimizationJob:
+    """
+    Un'ottimizzazione eseguita in un thread dedicato. Gli eventi di avanzamento del
+    solver vengono accumulati in `events` e letti dagli stream SSE tramite un cursore.
+    """
+
+    def __init__(self, job_id: str, key: Optional[str] = None):
+        self.id = job_id
+        self.key = key
+        self.status = JOB_RUNNING
+        self.events: List[Dict[str, Any]] = []
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.interrupted = False
+        self._stop_requested = threading.Event()
+        self._lock = threading.Lock()
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        with self._lock:
+            event = dict(event)
+            event["seq"] = len(self.events)
+            event["timestamp"] = round(time.time(), 3)
+            self.events.append(event)
+
+    def events_since(self, cursor: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            return self.events[cursor:]
+
+    def progress_callback(self, event: Dict[str, Any]) -> None:
+        """Callback passato al solver: pubblica l'evento e, tra uno strato DP e l'altro, interrompe la ricerca se richiesto."""
+        self.publish(event)
+        if event.get("event") == "dp_layer" and self._stop_requested.is_set():
+            self.interrupted = True
+            raise SolverCancelled("Ottimizzazione interrotta dall'operatore")
+
+    def request_stop(self) -> None:
+        self._stop_requested.set()
+
+    @property
+    def stop_requested(self) -> bool:
+        return self._stop_requested.is_set()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stop_requested": self.stop_requested,
+            "events_count": len(self.events),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobRegistry:
+    """Registro in memoria dei job di ottimizzazione (un processo backend)."""
+
+    def __init__(self, max_jobs: int = config.OPTIMIZATION_JOBS_MAX, ttl_seconds: int = config.OPTIMIZATION_JOBS_TTL_SECONDS):
+        self._jobs: Dict[str, OptimizationJob] = {}
+        self._lock = threading.Lock()
+        self.max_jobs = max_jobs
+        self.ttl_seconds = ttl_seconds
+
+    def start(self, run: Callable[[OptimizationJob], Dict[str, Any]], key: Optional[str] = None) -> Tuple[OptimizationJob, bool]:
+        """
+        Crea un job ed esegue `run(job)` in un thread. `run` deve restituire il
+        risultato serializzabile e usare `job.progress_callback` come hook del solver.
+        Se `key` corrisponde a un job ancora in corso (e non in fase di arresto) viene
+        restituito quello: (job, True). Altrimenti (nuovo_job, False).
+        """
+        with self._lock:
+            if key is not None:
+                for existing in self._jobs.values():
+                    if existing.key == key and existing.status == JOB_RUNNING and not existing.stop_requested:
+                        print(f"[Jobs] Richiesta identica al job in corso {existing.id}: riuso il job")
+                        return existing, True
+            self._prune()
+            job = OptimizationJob(uuid.uuid4().hex, key=key)
+            self._jobs[job.id] = job
+
+        def worker():
+            try:
+                job.result = run(job)
+                job.status = JOB_STOPPED if job.interrupted else JOB_COMPLETED
+            except SolverCancelled as e:
+                job.status = JOB_CANCELLED
+                job.error = str(e)
+            except Exception as e:
+                traceback.print_exc()
+                job.status = JOB_FAILED
+                job.error = str(e)
+            finally:
+                job.finished_at = time.time()
+                job.publish({"event": "finished", "status": job.status, "error": job.error})
+
+        threading.Thread(target=worker, name=f"optimization-job-{job.id[:8]}", daemon=True).start()
+        return job, False
+
+    def get(self, job_id: str) -> Optional[OptimizationJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self) -> None:
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.status in FINAL_STATUSES and job.finished_at and now - job.finished_at > self.ttl_seconds]
+        for job_id in expired:
+            del self._jobs[job_id]
+        # Se ancora troppi, elimina i job terminati più vecchi
+        finished = sorted((job for job in self._jobs.values() if job.status in FINAL_STATUSES), key=lambda j: j.created_at)
+        while len(self._jobs) >= self.max_jobs and finished:
+            del self._jobs[finished.pop(0).id]
+
+
+registry = JobRegistry()
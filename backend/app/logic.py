@@ -2,9 +2,16 @@
 """Core logic for color sequence optimization."""
 
 import numpy as np
-from functools import lru_cache
+import contextlib
+import contextvars
+import hashlib
 import itertools
-from typing import List, Dict, Any, Optional, Tuple, Set
+import math
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Set, Callable, Union
 import json
 import os
 from pathlib import Path
@@ -12,12 +19,11 @@ from pathlib import Path
 # Importa configurazioni, funzioni DB e modelli
 from app import config
 from app import database
+from app import metrics
+from app import profiling
 from app.models import ColorObject, ClusterDict, TransitionRuleDict
-
-# Variabili globali per Held-Karp (devono essere accessibili dalla funzione ricorsiva)
-# Vengono popolate dalla funzione principale `optimize_color_sequence`
-_cost_matrix: Optional[np.ndarray] = None
-_n_clusters: int = 0
+from app.color_batch import ColorBatch, NO_CLUSTER, sequence_value
+from app.cabin_records import CabinColor, CABIN_COLOR_SELECT
 
 
 def _safe_get_sequence(colore: ColorObject) -> int:
@@ -25,70 +31,16 @@ def _safe_get_sequence(colore: ColorObject) -> int:
     Estrae il valore di sequenza da un colore, convertendolo sempre a intero.
     Restituisce 0 se il valore è None, vuoto o non convertibile.
     """
-    seq_value = colore.get('sequence')
-    if seq_value is None:
-        return 0
-    try:
-        return int(seq_value)
-    except (ValueError, TypeError):
-        return 0
+    return sequence_value(colore.get('sequence'))
 
-def _get_cluster_sequence_priority(cluster_nome: str, colori_giorno: List[ColorObject]) -> int:
-    """
-    Calcola la priorità di sequenza di un cluster basata sul valore di sequenza minimo
-    dei colori che contiene. Valori più bassi hanno priorità più alta.
-    Restituisce il valore di sequenza minimo nel cluster, o 999 se non ci sono colori.
-    """
-    colori_del_cluster = [c for c in colori_giorno if c.get("cluster") == cluster_nome]
-    if not colori_del_cluster:
-        return 999  # Priorità più bassa per cluster senza colori
-    
-    # Trova il valore di sequenza minimo nel cluster
-    sequenze = []
-    for colore in colori_del_cluster:
-        seq_int = _safe_get_sequence(colore)
-        sequenze.append(seq_int)
-    
-    if sequenze:
-        min_sequence = min(sequenze)
-        return min_sequence
-    else:
-        return 999  # Nessuna sequenza valida trovata
-        
 
 # --- Funzioni Helper (simili a Cella 5 e 9 del notebook) ---
+# La mappatura colori -> cluster (Cella 4) e le priorità di sequenza per cluster
+# sono calcolate una volta per richiesta dal ColorBatch (color_batch.py).
 
-def _map_colors_to_clusters(colori_giorno: List[ColorObject], cluster_dict: ClusterDict) -> Tuple[Dict[str, str], List[str], Set[str]]:
-    """
-    Mappa i codici colore ai loro cluster, identifica cluster unici e urgenti.
-    Restituisce (mappa colore->cluster, lista cluster_oggi ordinata, set cluster urgenti).
-    (Logica da Cella 4)
-    """
-    colore2cluster: Dict[str, str] = {}
-    for cluster, colori in cluster_dict.items():
-        for c in colori:
-            colore2cluster[c] = cluster
-
-    clusters_presenti_oggi: Set[str] = set()
-    clusters_urgenti: Set[str] = set()
-
-    for c in colori_giorno:
-        cluster_name = colore2cluster.get(c.get("code", ""), None)
-        c["cluster"] = cluster_name # Aggiorna l'oggetto colore originale
-        if cluster_name:
-            clusters_presenti_oggi.add(cluster_name)
-            # Considera 'R' o 'reintegro' come urgente
-            if c.get("type", "").upper() in ["R", "REINTEGRO"]:
-                clusters_urgenti.add(cluster_name)
-        else:
-             print(f"Attenzione: Colore {c.get('code')} non trovato in nessun cluster del DB.")
-
-
-    clusters_oggi_list = sorted(list(clusters_presenti_oggi))
-    return colore2cluster, clusters_oggi_list, clusters_urgenti
-
+@metrics.timed("matrix")
 def _build_cost_matrix(clusters_oggi: List[str],
-                       colori_giorno: List[ColorObject],
+                       batch: ColorBatch,
                        cambio_colori: TransitionRuleDict,
                        prioritized_reintegrations: Optional[List[str]] = None) -> np.ndarray: # NUOVO PARAMETRO
     """
@@ -107,35 +59,26 @@ def _build_cost_matrix(clusters_oggi: List[str],
 
     cost_matrix = np.full((n, n), config.INFINITE_COST, dtype=float)
 
-    colori_per_cluster_oggi: Dict[str, List[ColorObject]] = {cl: [] for cl in clusters_oggi}
-    for c in colori_giorno:
-        cluster_key = c.get("cluster")
-        if cluster_key in colori_per_cluster_oggi:
-            colori_per_cluster_oggi[cluster_key].append(c)
+    # --- Aggregati per cluster dal batch: presenza reintegri (standard, non urgenti e prioritari),
+    # codici e tipi presenti, sequenza minima ---
+    aggregati = batch.aggregates(prioritized_reintegrations)
+    cluster_ids = {cl: batch.cluster_id(cl) for cl in clusters_oggi}
+
+    def _aggregato(flags: np.ndarray, cluster_nome: str) -> bool:
+        cluster_id = cluster_ids[cluster_nome]
+        return cluster_id != NO_CLUSTER and bool(flags[cluster_id])
 
-    # --- Cache per sapere se un cluster di destinazione ha reintegri (standard, non urgenti e prioritari) ---
     destinazione_ha_reintegri_standard: Dict[str, bool] = {}
     destinazione_ha_reintegri_non_urgenti: Dict[str, bool] = {}
     destinazione_ha_reintegri_prioritari: Dict[str, bool] = {}
-
-    # Crea un set dei codici dei reintegri prioritari per ricerche veloci
-    prioritized_reintegrations_set = set(prioritized_reintegrations or [])
+    sequenza_minima = {cl: batch.cluster_sequence_priority(cl) for cl in clusters_oggi}
 
     print("[MATRIX] Pre-calcolo presenza Reintegri (standard, non urgenti e prioritari) nei cluster di destinazione...")
     for cj_nome in clusters_oggi:
-        colori_in_cj = colori_per_cluster_oggi.get(cj_nome, [])
-        ha_r_standard = False
-        ha_re_non_urgente = False
-        ha_r_prioritario = False
-        for colore_in_cj in colori_in_cj:
-            color_type = colore_in_cj.get("type", "").upper()
-            if color_type == "R":
-                ha_r_standard = True # Trovato almeno un reintegro urgente standard
-                if colore_in_cj.get("code") in prioritized_reintegrations_set:
-                    ha_r_prioritario = True # Trovato anche un prioritario
-            elif color_type == "RE":
-                ha_re_non_urgente = True # Trovato almeno un reintegro non urgente
-        
+        ha_r_standard = _aggregato(aggregati.has_reintegro, cj_nome)
+        ha_re_non_urgente = _aggregato(aggregati.has_reintegro_non_urgente, cj_nome)
+        ha_r_prioritario = _aggregato(aggregati.has_reintegro_prioritario, cj_nome)
+
         destinazione_ha_reintegri_standard[cj_nome] = ha_r_standard
         destinazione_ha_reintegri_non_urgenti[cj_nome] = ha_re_non_urgente
         destinazione_ha_reintegri_prioritari[cj_nome] = ha_r_prioritario
@@ -187,14 +130,14 @@ def _build_cost_matrix(clusters_oggi: List[str],
             vincolo_colori_dest_ok = True 
             vincolo_tipo_dest_ok = True   
             costo_finale = config.INFINITE_COST 
-            colori_destinazione_oggi = colori_per_cluster_oggi.get(cj, [])
-            if not colori_destinazione_oggi:
+            cj_id = cluster_ids[cj]
+            if cj_id == NO_CLUSTER or not aggregati.counts[cj_id]:
                  print(f"[MATRIX]     ATTENZIONE: Cluster destinazione '{cj}' è vuoto oggi.")
                  if colori_richiesti_dest_set: vincolo_colori_dest_ok = False
                  if tipo_specifico_richiesto_dest: vincolo_tipo_dest_ok = False
             else:
-                 colori_destinazione_oggi_codes = {c['code'] for c in colori_destinazione_oggi}
-                 colori_destinazione_oggi_types = {c.get("type", "N/A").upper() for c in colori_destinazione_oggi}
+                 colori_destinazione_oggi_codes = aggregati.codes[cj_id]
+                 colori_destinazione_oggi_types = aggregati.types[cj_id]
                  if colori_richiesti_dest_set:
                       # ... (logica verifica colori specifici - NESSUNA MODIFICA QUI) ...
                       print(f"[MATRIX]     Verifico Vincolo Colori Specifici su Destinazione '{cj}'...")
@@ -245,8 +188,8 @@ def _build_cost_matrix(clusters_oggi: List[str],
                  
                  # --- E. Applica Prioritizzazione per Sequenza ---
                  # Calcola priorità di sequenza per i cluster source e destination
-                 source_seq_priority = _get_cluster_sequence_priority(ci, colori_giorno)
-                 dest_seq_priority = _get_cluster_sequence_priority(cj, colori_giorno)
+                 source_seq_priority = sequenza_minima[ci]
+                 dest_seq_priority = sequenza_minima[cj]
                  
                  # Applica bonus/penalità basato sulla differenza di priorità
                  sequence_diff = abs(source_seq_priority - dest_seq_priority)
@@ -291,87 +234,621 @@ def _build_cost_matrix(clusters_oggi: List[str],
 
 
 # --- Algoritmo Held-Karp (Cella 6, 7) ---
-# La cache è fondamentale qui!
-@lru_cache(maxsize=None)
-def _held_karp(mask: int, last: int, fixed_start_node: Optional[int] = None) -> float:
-    """Funzione ricorsiva Held-Karp."""
-    global _cost_matrix, _n_clusters # Usa le variabili globali popolate
+# La DP è calcolata "a strati" (bottom-up per numero di cluster visitati) su una
+# tabella numpy: ogni strato può essere notificato al progress_callback, che può
+# anche interrompere la ricerca sollevando SolverCancelled.
+# I percorsi possono avere partenza e/o arrivo fissati: gli stati che non possono
+# rispettare i vincoli (maschere senza la partenza, arrivo visitato prima dell'ultimo
+# passo, maschere non raggiungibili per transizioni vietate) non vengono calcolati.
+# Arrivo uguale alla partenza = il percorso torna sul nodo di partenza (es. finestra
+# tra due colori bloccati dello stesso cluster): il costo include il ritorno.
+# Un ordine parziale tra cluster (es. cluster bloccati dall'operatore) è espresso con
+# vincoli di precedenza: per ogni nodo la maschera dei nodi che devono precederlo.
+# Un nodo entra nella maschera solo dopo i suoi predecessori, quindi vengono
+# calcolate solo le maschere "chiuse" rispetto alle precedenze.
+# Con un piano di partenza (warm start, es. il piano attuale della cabina) il suo costo,
+# migliorato con una ricerca locale, fa da limite superiore: gli stati il cui costo più
+# una stima ottimistica del resto del percorso lo superano vengono scartati.
+
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+
+class SolverCancelled(Exception):
+    """
+    Sollevata (di solito dal progress_callback) per interrompere la ricerca Held-Karp.
+    Risalendo da `_find_best_path_and_reconstruct` porta con sé la migliore
+    soluzione completa trovata fino a quel momento (se esiste).
+    """
+
+    def __init__(self, message: str = "Ottimizzazione interrotta",
+                 best_cost: Optional[float] = None,
+                 best_tour: Optional[List[int]] = None):
+        super().__init__(message)
+        self.best_cost = best_cost
+        self.best_tour = best_tour
+
+
+def _mask_popcounts(n: int) -> np.ndarray:
+    """Numero di bit attivi per ogni maschera in [0, 2^n)."""
+    masks = np.arange(1 << n, dtype=np.int64)
+    counts = np.zeros(1 << n, dtype=np.int8)
+    for bit in range(n):
+        counts += ((masks >> bit) & 1).astype(np.int8)
+    return counts
+
+
+def _end_is_pinned(fixed_start_node: Optional[int], fixed_end_node: Optional[int]) -> bool:
+    """True se l'arrivo è un vincolo sull'ultimo nodo del percorso (e non un ritorno alla partenza)."""
+    return fixed_end_node is not None and fixed_end_node != fixed_start_node
+
+
+def _count_dp_states(n: int, fixed_start_node: Optional[int] = None, fixed_end_node: Optional[int] = None) -> List[int]:
+    """Numero massimo di stati (maschera, ultimo) valutati in ciascuno strato 2..n."""
+    if not _end_is_pinned(fixed_start_node, fixed_end_node):
+        if fixed_start_node is None:
+            return [math.comb(n, size) * size for size in range(2, n + 1)]
+        # Con start fisso contano solo le maschere che contengono lo start, con last != start
+        return [math.comb(n - 1, size - 1) * (size - 1) for size in range(2, n + 1)]
+    # Con arrivo fisso le maschere incomplete non lo contengono e lo strato completo ha un solo stato
+    if fixed_start_node is None:
+        return [math.comb(n - 1, size) * size for size in range(2, n)] + [1]
+    return [math.comb(n - 2, size - 1) * (size - 1) for size in range(2, n)] + [1]
 
-    if _cost_matrix is None or _n_clusters == 0:
-        return config.INFINITE_COST
 
-    # Caso base MODIFICATO
+def _predecessor_masks(nodes: List[str], precedences: Optional[List[Tuple[str, str]]]) -> Optional[List[int]]:
+    """
+    Converte le coppie (prima, dopo) in maschere di predecessori per indice di `nodes`
+    (chiusura transitiva inclusa). Le coppie con nodi assenti sono ignorate.
+    Restituisce None se non resta nessun vincolo; ValueError se i vincoli sono ciclici.
+    """
+    index = {nome: i for i, nome in enumerate(nodes)}
+    masks = [0] * len(nodes)
+    for prima, dopo in precedences or []:
+        if prima in index and dopo in index and prima != dopo:
+            masks[index[dopo]] |= 1 << index[prima]
+    if not any(masks):
+        return None
+    changed = True
+    while changed:
+        changed = False
+        for node in range(len(nodes)):
+            closure = masks[node]
+            for other in range(len(nodes)):
+                if masks[node] >> other & 1:
+                    closure |= masks[other]
+            if closure != masks[node]:
+                masks[node] = closure
+                changed = True
+    cyclic = [nodes[node] for node in range(len(nodes)) if masks[node] >> node & 1]
+    if cyclic:
+        raise ValueError(f"Vincoli di precedenza ciclici tra i cluster: {cyclic}")
+    return masks
+
+
+def _precedence_closed_masks(n: int, predecessor_masks: List[int]) -> np.ndarray:
+    """Per ogni maschera in [0, 2^n): True se ogni nodo della maschera ha dentro tutti i suoi predecessori."""
+    masks = np.arange(1 << n, dtype=np.int64)
+    closed = np.ones(1 << n, dtype=bool)
+    for node, required in enumerate(predecessor_masks):
+        if required:
+            closed &= (((masks >> node) & 1) == 0) | ((masks & required) == required)
+    return closed
+
+
+def _respects_precedences(tour: List[int], predecessor_masks: Optional[List[int]]) -> bool:
+    """True se ogni nodo del percorso compare dopo tutti i suoi predecessori."""
+    if not predecessor_masks:
+        return True
+    visited = 0
+    for node in tour:
+        if predecessor_masks[node] & ~visited:
+            return False
+        visited |= 1 << node
+    return True
+
+
+def _remaining_lower_bounds(cost_matrix: np.ndarray) -> np.ndarray:
+    """
+    Per ogni maschera: somma, sui nodi non ancora visitati, del costo minimo per entrarvi.
+    Ogni nodo mancante va raggiunto con almeno una transizione, quindi è una stima per difetto.
+    """
+    n = cost_matrix.shape[0]
+    transitions = np.where(cost_matrix >= config.INFINITE_COST, np.inf, cost_matrix).astype(float)
+    np.fill_diagonal(transitions, np.inf)
+    min_in = transitions.min(axis=0) if n > 1 else np.zeros(n)
+    masks = np.arange(1 << n, dtype=np.int64)
+    bounds = np.zeros(1 << n, dtype=float)
+    for node in range(n):
+        bounds += np.where(((masks >> node) & 1) == 1, 0.0, min_in[node])
+    return bounds
+
+
+def _tour_is_valid(tour: List[int], n: int,
+                   fixed_start_node: Optional[int] = None,
+                   fixed_end_node: Optional[int] = None,
+                   predecessor_masks: Optional[List[int]] = None) -> bool:
+    """True se il percorso visita ogni nodo una volta e rispetta partenza, arrivo e precedenze."""
+    if sorted(tour) != list(range(n)):
+        return False
+    if fixed_start_node is not None and tour[0] != fixed_start_node:
+        return False
+    if _end_is_pinned(fixed_start_node, fixed_end_node) and tour[-1] != fixed_end_node:
+        return False
+    return _respects_precedences(tour, predecessor_masks)
+
+
+def _local_search(cost_matrix: np.ndarray, tour: List[int],
+                  fixed_start_node: Optional[int] = None,
+                  fixed_end_node: Optional[int] = None,
+                  predecessor_masks: Optional[List[int]] = None) -> Tuple[float, List[int]]:
+    """
+    Migliora un percorso valido con due mosse: spostare un nodo in un'altra posizione
+    (or-opt) o scambiare due nodi (il tipico ritocco manuale di un piano). A ogni passo
+    applica la mossa valida che riduce di più il costo, finché nessuna migliora.
+    Restituisce (costo, percorso).
+    """
+    n = len(tour)
+    closes_on_start = fixed_start_node is not None and fixed_end_node == fixed_start_node
+
+    def moves(current: List[int]):
+        for i in range(n):
+            rest = current[:i] + current[i + 1:]
+            for j in range(n):
+                if j != i:
+                    yield rest[:j] + [current[i]] + rest[j:]
+            for j in range(i + 1, n):
+                swapped = current[:]
+                swapped[i], swapped[j] = swapped[j], swapped[i]
+                yield swapped
+
+    best_cost = _path_cost(cost_matrix, tour, closes_on_start)
+    while True:
+        best_move = None
+        for candidate in moves(tour):
+            if not _tour_is_valid(candidate, n, fixed_start_node, fixed_end_node, predecessor_masks):
+                continue
+            cost = _path_cost(cost_matrix, candidate, closes_on_start)
+            if cost < best_cost - 1e-9:
+                best_move, best_cost = candidate, cost
+        if best_move is None:
+            return best_cost, tour
+        tour = best_move
+
+
+def _warm_start_tour(cost_matrix: np.ndarray, nodes: List[str], sequence: List[str],
+                     fixed_start_node: Optional[int] = None,
+                     fixed_end_node: Optional[int] = None) -> List[int]:
+    """
+    Proietta una sequenza di cluster (es. il piano attuale) sui nodi della matrice: i cluster
+    non più presenti sono scartati, quelli nuovi inseriti nella posizione meno costosa;
+    partenza e arrivo fissati sono portati in testa e in coda.
+    """
+    index = {nome: i for i, nome in enumerate(nodes)}
+    tour: List[int] = []
+    for nome in sequence or []:
+        if nome in index and index[nome] not in tour:
+            tour.append(index[nome])
+    for node in range(len(nodes)):
+        if node in tour:
+            continue
+        options = [tour[:j] + [node] + tour[j:] for j in range(len(tour) + 1)]
+        tour = min(options, key=lambda option: _path_cost(cost_matrix, option))
+    for pinned, at_head in ((fixed_start_node, True), (fixed_end_node if _end_is_pinned(fixed_start_node, fixed_end_node) else None, False)):
+        if pinned is not None:
+            tour.remove(pinned)
+            tour = [pinned] + tour if at_head else tour + [pinned]
+    return tour
+
+
+def _path_cost(cost_matrix: np.ndarray, tour: List[int], closes_on_start: bool = False) -> float:
+    """
+    Costo di un percorso aperto (somma delle transizioni), INFINITE_COST se non percorribile.
+    Con closes_on_start include la transizione di ritorno dall'ultimo nodo al primo.
+    """
+    steps = list(zip(tour, tour[1:]))
+    if closes_on_start and len(tour) > 1:
+        steps.append((tour[-1], tour[0]))
+    total = 0.0
+    for a, b in steps:
+        step = cost_matrix[a, b]
+        if step >= config.INFINITE_COST:
+            return config.INFINITE_COST
+        total += step
+    return total if total < config.INFINITE_COST else config.INFINITE_COST
+
+
+def _greedy_path(cost_matrix: np.ndarray,
+                 fixed_start_node: Optional[int] = None,
+                 fixed_end_node: Optional[int] = None,
+                 predecessor_masks: Optional[List[int]] = None) -> Optional[Tuple[float, List[int]]]:
+    """
+    Percorso nearest-neighbour: soluzione completa immediata usata come "best-so-far"
+    mentre la DP esatta è in corso. Un arrivo fisso viene lasciato per ultimo e un
+    nodo è candidato solo dopo i suoi predecessori.
+    Restituisce None se nessun percorso greedy è percorribile.
+    """
+    n = cost_matrix.shape[0]
+    end_pinned = _end_is_pinned(fixed_start_node, fixed_end_node)
+    closes_on_start = fixed_start_node is not None and fixed_end_node == fixed_start_node
+    required = predecessor_masks or [0] * n
     if fixed_start_node is not None:
-        # If a start node is fixed, the path must originate from it.
-        # A path consisting of a single node 'last' can only have cost 0 if 'last' is the fixed_start_node.
-        if mask == (1 << last): # mask contains only 'last'
-            return 0.0 if last == fixed_start_node else config.INFINITE_COST
-    else: # Original behavior when no start node is fixed
-        if mask == (1 << last): # mask contains only 'last'
-            # This implies 'last' is the starting point of this subpath.
-            return 0.0
+        starts = [fixed_start_node]
+    else:
+        starts = [k for k in range(n) if (not end_pinned or k != fixed_end_node or n == 1) and not required[k]]
+    best: Optional[Tuple[float, List[int]]] = None
+    for start in starts:
+        tour = [start]
+        visited = 1 << start
+        while len(tour) < n:
+            last = tour[-1]
+            if end_pinned and len(tour) == n - 1:
+                candidates = [(cost_matrix[last, fixed_end_node], fixed_end_node)]
+            else:
+                candidates = [(cost_matrix[last, k], k) for k in range(n)
+                              if not visited >> k & 1 and not required[k] & ~visited
+                              and (not end_pinned or k != fixed_end_node)]
+            candidates = [(cost, k) for cost, k in candidates if cost < config.INFINITE_COST]
+            if not candidates:
+                break
+            _, nxt = min(candidates)
+            tour.append(nxt)
+            visited |= 1 << nxt
+        if len(tour) != n or not _respects_precedences(tour, predecessor_masks):
+            continue
+        cost = _path_cost(cost_matrix, tour, closes_on_start)
+        if cost < config.INFINITE_COST and (best is None or cost < best[0]):
+            best = (cost, tour)
+    return best
+
+
+def _held_karp_table(cost_matrix: np.ndarray,
+                     fixed_start_node: Optional[int] = None,
+                     progress_callback: Optional[ProgressCallback] = None,
+                     fixed_end_node: Optional[int] = None,
+                     predecessor_masks: Optional[List[int]] = None,
+                     upper_bound: Optional[float] = None) -> np.ndarray:
+    """
+    Calcola la tabella Held-Karp dp[mask, last] = costo minimo di un percorso aperto che
+    visita esattamente i cluster in `mask` terminando in `last` (INFINITE_COST se impossibile).
+    Se fixed_start_node è indicato, i percorsi devono partire da quel nodo; se
+    fixed_end_node è indicato (e diverso dalla partenza) il nodo compare solo come
+    ultimo del percorso completo. predecessor_masks[k] sono i nodi che devono
+    precedere k: le maschere che contengono k senza i suoi predecessori sono saltate.
+    Con upper_bound (costo di una soluzione nota) gli stati che non possono portare a un
+    percorso di costo <= upper_bound restano a INFINITE_COST. Sono calcolati solo gli stati che estendono una maschera raggiungibile. Dopo ogni
+    strato invoca progress_callback con lo stato di avanzamento.
+    ValueError se n supera config.HELD_KARP_MAX_NODES (memoria della tabella densa).
+    """
+    n = cost_matrix.shape[0]
+    if n > config.HELD_KARP_MAX_NODES:
+        raise ValueError(f"Tabella Held-Karp su {n} cluster oltre HELD_KARP_MAX_NODES ({config.HELD_KARP_MAX_NODES}): "
+                         f"servirebbero {(1 << n) * n * 8 / 2**20:.0f} MB")
+    inf = float(config.INFINITE_COST)
+    end_pinned = _end_is_pinned(fixed_start_node, fixed_end_node)
+    required = predecessor_masks or [0] * n
+    dp = np.full((1 << n, n), inf, dtype=float)
+    if fixed_start_node is not None:
+        if not required[fixed_start_node]:
+            dp[1 << fixed_start_node, fixed_start_node] = 0.0
+    else:
+        for node in range(n):
+            if (not end_pinned or node != fixed_end_node or n == 1) and not required[node]:
+                dp[1 << node, node] = 0.0
+
+    # Le transizioni vietate non devono mai vincere il minimo
+    transitions = np.where(cost_matrix >= inf, np.inf, cost_matrix)
+    masks = np.arange(1 << n, dtype=np.int64)
+    popcounts = _mask_popcounts(n)
+    # Maschere con almeno un percorso finito: solo queste possono essere estese
+    reachable = np.zeros(1 << n, dtype=bool)
+    reachable[masks[popcounts == 1]] = (dp[masks[popcounts == 1]] < inf).any(axis=1)
+    closed = _precedence_closed_masks(n, predecessor_masks) if predecessor_masks else None
+    lower_bounds = _remaining_lower_bounds(cost_matrix) if upper_bound is not None else None
+
+    layers = []
+    for size in range(2, n + 1):
+        layer_masks = masks[popcounts == size]
+        if fixed_start_node is not None:
+            layer_masks = layer_masks[((layer_masks >> fixed_start_node) & 1) == 1]
+        if end_pinned:
+            has_end = ((layer_masks >> fixed_end_node) & 1) == 1
+            layer_masks = layer_masks[has_end] if size == n else layer_masks[~has_end]
+        if closed is not None:
+            layer_masks = layer_masks[closed[layer_masks]]
+        layers.append(layer_masks)
+    if closed is None:
+        states_per_layer = _count_dp_states(n, fixed_start_node, fixed_end_node)
+    else:
+        # Stessa stima di _count_dp_states, sulle sole maschere chiuse rispetto alle precedenze
+        states_per_layer = [len(layer) * (1 if end_pinned and size == n else size - (fixed_start_node is not None))
+                            for size, layer in zip(range(2, n + 1), layers)]
+    states_total = sum(states_per_layer)
+    states_done = 0
+    evaluated = 0  # Stati (maschera, ultimo) effettivamente calcolati, meno della stima con il limite di costo
+    started_at = time.perf_counter()
+
+    bits = np.int64(1) << np.arange(n, dtype=np.int64)
+    for size, layer_masks in zip(range(2, n + 1), layers):
+        if lower_bounds is not None:
+            # Con il limite restano poche maschere raggiungibili: si valutano solo le loro estensioni
+            frontier = masks[popcounts == size - 1]
+            frontier = frontier[reachable[frontier]]
+            extended = np.zeros(1 << n, dtype=bool)
+            extended[(frontier[:, None] | bits[None, :]).ravel()] = True
+            layer_masks = layer_masks[extended[layer_masks]]
+        for last in range(n):
+            if last == fixed_start_node:
+                continue  # lo start fisso non può essere l'ultimo di un percorso con più nodi
+            if end_pinned and size == n and last != fixed_end_node:
+                continue
+            selected = layer_masks[((layer_masks >> last) & 1) == 1]
+            selected = selected[reachable[selected ^ (1 << last)]]
+            if selected.size == 0:
+                continue
+            previous = dp[selected ^ (1 << last)]
+            previous = np.where(previous >= inf, np.inf, previous)
+            best = (previous + transitions[:, last]).min(axis=1)
+            evaluated += selected.size
+            if lower_bounds is not None:
+                best[best + lower_bounds[selected] > upper_bound + 1e-9] = inf
+            dp[selected, last] = np.minimum(best, inf)
+        reachable[layer_masks] = (dp[layer_masks] < inf).any(axis=1)
+        states_done += states_per_layer[size - 2]
+
+        if progress_callback is not None:
+            elapsed = time.perf_counter() - started_at
+            eta = elapsed * (states_total - states_done) / states_done if states_done else None
+            progress_callback({
+                "event": "dp_layer",
+                "layers_done": size - 1,
+                "layers_total": n - 1,
+                "states_done": states_done,
+                "states_total": states_total,
+                "elapsed_seconds": round(elapsed, 4),
+                "eta_seconds": round(eta, 4) if eta is not None else None,
+            })
+    stats = current_solver_stats()
+    if stats is not None:
+        stats.add_table(evaluated, dp.nbytes)
+    return dp
+
+
+# --- Cache delle tabelle Held-Karp ---
+# Una tabella senza precedenze né limite di costo contiene il costo ottimo di ogni
+# sottoinsieme di nodi per ogni nodo finale: risponde quindi a qualunque richiesta con
+# la stessa matrice e partenza (anche con arrivo fissato) e, tramite i nomi dei cluster,
+# a quelle su un sottoinsieme dei cluster con la stessa sottomatrice.
+
+class _DPTableEntry:
+    def __init__(self, matrix: np.ndarray, start: Optional[int], labels: Optional[List[str]], table: np.ndarray):
+        self.matrix = matrix
+        self.start = start
+        self.labels = labels
+        self.index = {label: i for i, label in enumerate(labels)} if labels is not None else None
+        self.table = table
+
+    def subset_table(self, nodes: List[int]) -> np.ndarray:
+        """Tabella per la sottomatrice dei nodi indicati: dp_sub[m, j] = dp[maschera di m nell'universo, nodes[j]]."""
+        k = len(nodes)
+        bits = np.int64(1) << np.asarray(nodes, dtype=np.int64)
+        sub_masks = np.arange(1 << k, dtype=np.int64)
+        universe_masks = (((sub_masks[:, None] >> np.arange(k, dtype=np.int64)) & 1) * bits).sum(axis=1)
+        return self.table[universe_masks[:, None], np.asarray(nodes)[None, :]]
+
+
+class DPTableCache:
+    """
+    Tabelle Held-Karp complete indicizzate per (impronta della matrice, nodo di partenza),
+    con scadenza LRU oltre max_bytes. Condivisa tra i thread del processo.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.subset_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, Optional[int]], _DPTableEntry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(cost_matrix: np.ndarray) -> str:
+        matrix = np.ascontiguousarray(cost_matrix, dtype=float)
+        return f"{matrix.shape[0]}:" + hashlib.blake2b(matrix.tobytes(), digest_size=16).hexdigest()
+
+    def _subset_lookup(self, cost_matrix: np.ndarray, start: Optional[int], labels: List[str]) -> Optional[np.ndarray]:
+        with self._lock:
+            entries = [e for e in self._entries.values() if e.index is not None and len(e.labels) > len(labels)]
+        for entry in entries:
+            if any(label not in entry.index for label in labels):
+                continue
+            nodes = [entry.index[label] for label in labels]
+            if (entry.start is not None) if start is None else nodes[start] != entry.start:
+                continue
+            if np.array_equal(entry.matrix[np.ix_(nodes, nodes)], cost_matrix):
+                return entry.subset_table(nodes)
+        return None
+
+    def table(self, cost_matrix: np.ndarray, start: Optional[int] = None, labels: Optional[List[str]] = None,
+              progress_callback: Optional[ProgressCallback] = None) -> np.ndarray:
+        """
+        Tabella Held-Karp (partenza start, nessun altro vincolo) dalla cache: stessa matrice,
+        oppure sottomatrice di una tabella salvata con nomi dei nodi (labels); altrimenti la
+        calcola e la salva.
+        """
+        key = (self.fingerprint(cost_matrix), start)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        stats = current_solver_stats()
+        if entry is not None:
+            if stats is not None:
+                stats.add_cache_result("hit", entry.table.nbytes)
+            return entry.table
+        if labels is not None:
+            table = self._subset_lookup(cost_matrix, start, labels)
+            if table is not None:
+                with self._lock:
+                    self.subset_hits += 1
+                if stats is not None:
+                    stats.add_cache_result("subset_hit", table.nbytes)
+                return table
+        if stats is not None:
+            stats.add_cache_result("miss")
+        table = _held_karp_table(cost_matrix, start, progress_callback)
+        table.setflags(write=False)
+        with self._lock:
+            self.misses += 1
+            if table.nbytes <= self.max_bytes and key not in self._entries:
+                self._entries[key] = _DPTableEntry(np.array(cost_matrix, dtype=float), start,
+                                                   list(labels) if labels is not None else None, table)
+                self._bytes += table.nbytes
+                while self._bytes > self.max_bytes:
+                    _, expired = self._entries.popitem(last=False)
+                    self._bytes -= expired.table.nbytes
+        return table
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "subset_hits": self.subset_hits, "misses": self.misses}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+dp_cache = DPTableCache(config.DP_CACHE_MAX_BYTES)
+
+
+# --- Statistiche del solver per richiesta ---
+# Contatori raccolti durante un'ottimizzazione (stati DP, cache, memoria delle tabelle,
+# percorsi ricostruiti, motore usato) e restituiti come "stats" nella risposta. Il
+# raccoglitore corrente segue la richiesta nei thread come le fasi di metrics; un
+# raccoglitore annidato (es. una cabina) aggiorna anche quelli che lo contengono.
+
+ENGINE_HELD_KARP = "held_karp"          # DP esatta (tabella calcolata o dalla cache)
+ENGINE_GREEDY = "greedy"                # Ricerca interrotta o cluster oltre HELD_KARP_MAX_NODES: soluzione euristica
+ENGINE_SINGLE_CLUSTER = "single_cluster"  # Un solo cluster: nessuna sequenza da cercare
+
+
+class SolverStats:
+    def __init__(self, parent: Optional["SolverStats"] = None):
+        self.parent = parent
+        self.engines: List[str] = []
+        self.optimality_proven = True
+        self.solves = 0
+        self.dp_tables = 0
+        self.dp_states = 0
+        self.cache_hits = 0
+        self.cache_subset_hits = 0
+        self.cache_misses = 0
+        self.peak_table_bytes = 0
+        self.paths_reconstructed = 0
+        self._lock = threading.Lock()
+
+    def _chain(self):
+        stats = self
+        while stats is not None:
+            with stats._lock:
+                yield stats
+            stats = stats.parent
+
+    def add_table(self, states: int, nbytes: int) -> None:
+        for stats in self._chain():
+            stats.dp_tables += 1
+            stats.dp_states += int(states)
+            stats.peak_table_bytes = max(stats.peak_table_bytes, int(nbytes))
+
+    def add_cache_result(self, result: str, nbytes: int = 0) -> None:
+        for stats in self._chain():
+            if result == "hit":
+                stats.cache_hits += 1
+            elif result == "subset_hit":
+                stats.cache_subset_hits += 1
+            else:
+                stats.cache_misses += 1
+            stats.peak_table_bytes = max(stats.peak_table_bytes, int(nbytes))
+
+    def add_paths(self, count: int) -> None:
+        for stats in self._chain():
+            stats.paths_reconstructed += count
+
+    def add_solve(self, engine: str, proven: bool) -> None:
+        for stats in self._chain():
+            stats.solves += 1
+            if engine not in stats.engines:
+                stats.engines.append(engine)
+            stats.optimality_proven = stats.optimality_proven and proven
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "engine": ",".join(self.engines) or None,
+                "optimality_proven": self.optimality_proven and self.solves > 0,
+                "solves": self.solves,
+                "dp_tables": self.dp_tables,
+                "dp_states": self.dp_states,
+                "cache_hits": self.cache_hits,
+                "cache_subset_hits": self.cache_subset_hits,
+                "cache_misses": self.cache_misses,
+                "peak_table_bytes": self.peak_table_bytes,
+                "paths_reconstructed": self.paths_reconstructed,
+            }
 
-    prev_mask = mask ^ (1 << last)
-    min_cost = config.INFINITE_COST
 
-    for k in range(_n_clusters):
-        if prev_mask & (1 << k): # Se k era nel percorso precedente
-             if 0 <= k < _n_clusters and 0 <= last < _n_clusters:
-                transition_cost = _cost_matrix[k, last]
-                if transition_cost >= config.INFINITE_COST:
-                     continue
-                
-                # Recursive call MODIFIED
-                cost_via_k = _held_karp(prev_mask, k, fixed_start_node)
+_solver_stats: contextvars.ContextVar[Optional[SolverStats]] = contextvars.ContextVar("solver_stats", default=None)
+
 
-                if cost_via_k >= config.INFINITE_COST:
-                    continue
+def current_solver_stats() -> Optional[SolverStats]:
+    return _solver_stats.get()
 
-                current_total_cost = cost_via_k + transition_cost
-                if current_total_cost < min_cost:
-                    min_cost = current_total_cost
-             else:
-                  print(f"Errore indice in Held-Karp: k={k}, last={last}, n={_n_clusters}")
-    return min_cost
 
+def _record_solve(engine: str, proven: bool) -> None:
+    stats = _solver_stats.get()
+    if stats is not None:
+        stats.add_solve(engine, proven)
 
-def _reconstruct_tour(end_node: int, num_nodes: int, full_mask_val: int, fixed_start_node: Optional[int] = None) -> List[int]:
-    """Ricostruisce il percorso ottimale (lista di indici)."""
-    global _cost_matrix
 
+@contextlib.contextmanager
+def collect_solver_stats():
+    """Raccoglie le statistiche delle ottimizzazioni eseguite nel blocco (with ... as stats)."""
+    stats = SolverStats(parent=_solver_stats.get())
+    token = _solver_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _solver_stats.reset(token)
+
+
+@metrics.timed("reconstruction")
+def _reconstruct_tour(dp_table: np.ndarray, cost_matrix: np.ndarray, end_node: int,
+                      full_mask_val: int, fixed_start_node: Optional[int] = None) -> List[int]:
+    """Ricostruisce il percorso ottimale (lista di indici) risalendo la tabella Held-Karp."""
+    num_nodes = cost_matrix.shape[0]
     print(f"[RECONSTRUCT] Avvio ricostruzione tour per {num_nodes} nodi, terminante in {end_node}" + (f" (start fisso: {fixed_start_node})" if fixed_start_node is not None else ""))
     if num_nodes == 0: return []
     if num_nodes == 1:
         # If fixed_start_node is specified, it must be node 0. Otherwise, any single node is [0].
         return [0] if fixed_start_node is None or fixed_start_node == 0 else []
 
-    if _cost_matrix is None:
-        print("[RECONSTRUCT] Errore: Matrice costi non disponibile.")
-        return []
-
     last = end_node
     mask = full_mask_val
     tour = [last]
     visited_indices_in_tour = {last}
 
     for step in range(num_nodes - 1):
-        print(f"[RECONSTRUCT]   Passo {step+1}/{num_nodes-1}: Cerco predecessore di {last} (maschera attuale: {bin(mask)})")
         prev_mask = mask ^ (1 << last)
         candidates = []
         for k in range(num_nodes):
             if prev_mask & (1 << k):
-                if 0 <= k < num_nodes and 0 <= last < num_nodes:
-                    # Call to _held_karp MODIFIED
-                    cost_to_k = _held_karp(prev_mask, k, fixed_start_node)
-                    transition_cost = _cost_matrix[k, last]
-
-                    if cost_to_k < config.INFINITE_COST and transition_cost < config.INFINITE_COST:
-                        total_cost_via_k = cost_to_k + transition_cost
-                        candidates.append((total_cost_via_k, k))
-                    else:
-                        print(f"[RECONSTRUCT]     Candidato {k} scartato (cost_to_k={cost_to_k}, transition={transition_cost})")
-                else:
-                     print(f"[RECONSTRUCT] Errore indice in ricostruzione: k={k}, last={last}")
+                cost_to_k = dp_table[prev_mask, k]
+                transition_cost = cost_matrix[k, last]
+                if cost_to_k < config.INFINITE_COST and transition_cost < config.INFINITE_COST:
+                    candidates.append((cost_to_k + transition_cost, k))
 
         if not candidates:
              print(f"[RECONSTRUCT] --> ERRORE: Impossibile trovare predecessore valido per nodo {last} (maschera {bin(mask)})!")
@@ -379,7 +856,7 @@ def _reconstruct_tour(end_node: int, num_nodes: int, full_mask_val: int, fixed_s
              break
 
         min_cost_step, prev_node_idx = min(candidates, key=lambda x: x[0])
-        print(f"[RECONSTRUCT]   -> Predecessore scelto per {last}: {prev_node_idx} (con costo passo {min_cost_step:.1f})")
+        print(f"[RECONSTRUCT]   Passo {step+1}/{num_nodes-1}: predecessore scelto per {last}: {prev_node_idx} (con costo passo {min_cost_step:.1f})")
 
         if prev_node_idx in visited_indices_in_tour:
              print(f"[RECONSTRUCT] --> ATTENZIONE: Indice {prev_node_idx} già presente nel tour parziale {list(reversed(tour))}! Possibile ciclo errato.")
@@ -393,83 +870,135 @@ def _reconstruct_tour(end_node: int, num_nodes: int, full_mask_val: int, fixed_s
     print(f"[RECONSTRUCT] Tour ricostruito (indici): {tour}")
     if len(tour) != num_nodes:
          print(f"[RECONSTRUCT] --> ATTENZIONE: Lunghezza tour finale {len(tour)} diversa da {num_nodes}!")
-    
-    # Ensure the reconstructed tour starts with fixed_start_node if specified
-    if fixed_start_node is not None and num_nodes > 0:
-        if not tour or tour[0] != fixed_start_node:
-            # This might happen if the path reconstruction logic coupled with fixed_start_node in _held_karp
-            # doesn't naturally lead to it. This situation implies an issue or an impossible path.
-            # However, for an open path, any node can be the first if fixed_start_node is None.
-            # If fixed_start_node is set, the _held_karp logic should ensure paths originate from it.
-            # If reconstruction doesn't yield this, it's a deeper issue or no such path exists.
-            print(f"[RECONSTRUCT] ATTENZIONE: Tour ricostruito {tour} non inizia con il fixed_start_node {fixed_start_node}. Potrebbe essere un percorso non valido.")
-            # For now, we proceed, _find_best_path_and_reconstruct will check validity.
+    if fixed_start_node is not None and (not tour or tour[0] != fixed_start_node):
+        # _find_best_path_and_reconstruct scarterà il percorso non valido
+        print(f"[RECONSTRUCT] ATTENZIONE: Tour ricostruito {tour} non inizia con il fixed_start_node {fixed_start_node}. Potrebbe essere un percorso non valido.")
 
     return tour
 
 
-def _find_best_path_and_reconstruct(num_nodes: int, start_node_index: Optional[int] = None) -> List[Tuple[float, List[int]]]:
+def _find_best_path_and_reconstruct(cost_matrix: np.ndarray,
+                                    start_node_index: Optional[int] = None,
+                                    progress_callback: Optional[ProgressCallback] = None,
+                                    end_node_index: Optional[int] = None,
+                                    top_n: int = 3,
+                                    predecessor_masks: Optional[List[int]] = None,
+                                    warm_start_tour: Optional[List[int]] = None,
+                                    node_labels: Optional[List[str]] = None) -> List[Tuple[float, List[int]]]:
     """
-    Trova i TOP_N_RESULTS percorsi aperti ottimali usando Held-Karp e li ricostruisce.
-    Se start_node_index è fornito, forza l'inizio da lì.
+    Trova i top_n percorsi aperti ottimali usando Held-Karp e li ricostruisce.
+    Se start_node_index è fornito, forza l'inizio da lì; se end_node_index è fornito,
+    forza l'arrivo (uguale all'inizio: il percorso torna sul nodo di partenza e il
+    costo include il ritorno). predecessor_masks impone un ordine parziale tra i nodi
+    (vedi _predecessor_masks). warm_start_tour è un percorso noto (es. il piano attuale):
+    se valido viene migliorato con _local_search e il suo costo limita la DP, che
+    restituisce allora solo percorsi non peggiori. Senza precedenze né limite la tabella
+    viene da dp_cache; node_labels (nomi dei cluster dei nodi) permette di riusare una
+    tabella calcolata su un insieme di cluster più grande.
     Restituisce una lista di tuple (costo_minimo, lista_indici_percorso), ordinata per costo.
+    Oltre config.HELD_KARP_MAX_NODES nodi la DP non viene calcolata: restituisce solo il
+    percorso greedy (o il warm start) migliorato con _local_search.
+    Eventi inviati a progress_callback: "incumbent" (soluzione greedy immediata),
+    "dp_layer" (uno per strato della DP) e "solution" (ottimo esatto, o euristico oltre il limite).
     """
-    global _cost_matrix, _n_clusters
-    _held_karp.cache_clear() # Clear cache for each call to this overarching function.
-
-    TOP_N_RESULTS = 3
+    TOP_N_RESULTS = top_n
 
-    if num_nodes == 0 or _cost_matrix is None or _cost_matrix.size == 0:
+    if cost_matrix is None or cost_matrix.size == 0:
         return []
+    num_nodes = cost_matrix.shape[0]
     if num_nodes == 1:
-        if start_node_index is not None and start_node_index != 0:
-            print(f"[HELD-KARP] Single node path requested to start at {start_node_index} but only node 0 exists.")
+        if any(node is not None and node != 0 for node in (start_node_index, end_node_index)):
+            print(f"[HELD-KARP] Single node path requested to start at {start_node_index} / end at {end_node_index} but only node 0 exists.")
             return [] # Invalid request for fixed start
         return [(0.0, [0])] # Costo 0 per un solo nodo
 
-    full_mask = (1 << num_nodes) - 1
-    
-    all_potential_paths: List[Tuple[float, int, Optional[List[int]]]] = [] # (cost, end_node, optional_reconstructed_tour)
-
-    if start_node_index is not None and 0 <= start_node_index < num_nodes:
-        print(f"[HELD-KARP] Calcolo TOP {TOP_N_RESULTS} percorsi forzati inizio da indice {start_node_index}")
-        
-        calculated_paths_for_fixed_start: List[Tuple[float, int]] = [] # (cost_S_to_E, end_node)
-        for end_node in range(num_nodes):
-            print(f"[HELD-KARP]   Calcolo costo S={start_node_index} -> ... -> E={end_node}...")
-            cost_S_to_E = _held_karp(full_mask, end_node, start_node_index)
-            print(f"[HELD-KARP]     Costo S={start_node_index} -> ... -> E={end_node} (visitando tutti): {cost_S_to_E}")
-            if cost_S_to_E < config.INFINITE_COST:
-                 calculated_paths_for_fixed_start.append((cost_S_to_E, end_node))
-
-        if not calculated_paths_for_fixed_start:
-            print(f"[HELD-KARP] Errore: nessun percorso valido trovato partendo da nodo fisso {start_node_index}.")
+    if start_node_index is not None and not 0 <= start_node_index < num_nodes:
+        start_node_index = None
+    if end_node_index is not None and not 0 <= end_node_index < num_nodes:
+        end_node_index = None
+    end_pinned = _end_is_pinned(start_node_index, end_node_index)
+    closes_on_start = start_node_index is not None and end_node_index == start_node_index
+
+    incumbent = _greedy_path(cost_matrix, start_node_index, end_node_index, predecessor_masks)
+    upper_bound: Optional[float] = None
+    if warm_start_tour is not None:
+        if (_tour_is_valid(warm_start_tour, num_nodes, start_node_index, end_node_index, predecessor_masks)
+                and _path_cost(cost_matrix, warm_start_tour, closes_on_start) < config.INFINITE_COST):
+            warm = _local_search(cost_matrix, list(warm_start_tour), start_node_index, end_node_index, predecessor_masks)
+            print(f"[HELD-KARP] Warm start: costo {_path_cost(cost_matrix, warm_start_tour, closes_on_start):.2f}, "
+                  f"dopo ricerca locale {warm[0]:.2f}")
+            if incumbent is None or warm[0] < incumbent[0]:
+                incumbent = warm
+            upper_bound = incumbent[0]
+        else:
+            print(f"[HELD-KARP] Warm start {warm_start_tour} non percorribile con i vincoli richiesti: ignorato.")
+    if progress_callback is not None and incumbent is not None:
+        progress_callback({"event": "incumbent", "best_cost": incumbent[0], "best_tour": incumbent[1]})
+
+    if num_nodes > config.HELD_KARP_MAX_NODES:
+        # Tabella densa troppo grande (vedi config.HELD_KARP_MAX_NODES): niente DP, il
+        # percorso greedy (o il warm start) migliorato con ricerca locale
+        if incumbent is None:
+            print(f"[HELD-KARP] {num_nodes} cluster oltre HELD_KARP_MAX_NODES ({config.HELD_KARP_MAX_NODES}) "
+                  f"e nessun percorso greedy percorribile.")
             return []
+        incumbent = _local_search(cost_matrix, list(incumbent[1]), start_node_index, end_node_index, predecessor_masks)
+        print(f"[HELD-KARP] {num_nodes} cluster oltre HELD_KARP_MAX_NODES ({config.HELD_KARP_MAX_NODES}): "
+              f"percorso greedy con ricerca locale, costo {incumbent[0]:.2f}")
+        if progress_callback is not None:
+            progress_callback({"event": "solution", "best_cost": incumbent[0], "best_tour": incumbent[1]})
+        return [incumbent]
 
-        # Sort by cost to get the best ending nodes
-        calculated_paths_for_fixed_start.sort(key=lambda x: x[0])
-        
-        for cost, end_node_for_path in calculated_paths_for_fixed_start:
-            # We store cost and end_node here; reconstruction happens later if it's in top N
-            all_potential_paths.append((cost, end_node_for_path, None))
-
-    else: # Caso: Start node non è fisso
+    full_mask = (1 << num_nodes) - 1
+    vincoli = []
+    if start_node_index is not None:
+        vincoli.append(f"inizio da indice {start_node_index}")
+    if end_pinned:
+        vincoli.append(f"arrivo in indice {end_node_index}")
+    elif closes_on_start:
+        vincoli.append("ritorno all'indice di partenza")
+    if predecessor_masks:
+        vincoli.append(f"{sum(bin(m).count('1') for m in predecessor_masks)} precedenze")
+    if upper_bound is not None:
+        vincoli.append(f"costo massimo {upper_bound:.2f}")
+    if vincoli:
+        print(f"[HELD-KARP] Calcolo TOP {TOP_N_RESULTS} percorsi forzati ({', '.join(vincoli)})")
+    else:
         print(f"[HELD-KARP] Calcolo TOP {TOP_N_RESULTS} percorsi ottimali senza nodo iniziale fisso.")
-        calculated_paths_no_fixed_start: List[Tuple[float, int]] = [] # (cost_to_end, end_node)
-        for end_node in range(num_nodes):
-            print(f"[HELD-KARP]   Calcolo costo per finire in {end_node}...")
-            cost_to_end = _held_karp(full_mask, end_node, None)
-            print(f"[HELD-KARP]     Costo per finire in {end_node} (visitando tutti): {cost_to_end}")
-            if cost_to_end < config.INFINITE_COST:
-                 calculated_paths_no_fixed_start.append((cost_to_end, end_node))
-        
-        if not calculated_paths_no_fixed_start:
-            print("[HELD-KARP] Errore: nessun percorso valido trovato (senza nodo iniziale fisso).")
-            return []
 
-        calculated_paths_no_fixed_start.sort(key=lambda x: x[0])
-        for cost, end_node_for_path in calculated_paths_no_fixed_start:
-            all_potential_paths.append((cost, end_node_for_path, None))
+    try:
+        with metrics.stage("dp"):
+            if predecessor_masks is None and upper_bound is None and dp_cache.max_bytes > 0:
+                # La tabella senza arrivo fissato contiene già i percorsi che finiscono in end_node_index
+                dp_table = dp_cache.table(cost_matrix, start_node_index, node_labels, progress_callback)
+            else:
+                dp_table = _held_karp_table(cost_matrix, start_node_index, progress_callback, end_node_index,
+                                            predecessor_masks, upper_bound)
+    except SolverCancelled as exc:
+        if incumbent is not None:
+            exc.best_cost, exc.best_tour = incumbent
+        raise
+
+    stats = current_solver_stats()
+    all_potential_paths: List[Tuple[float, int]] = [] # (cost, end_node)
+    for end_node in range(num_nodes):
+        if end_pinned and end_node != end_node_index:
+            continue
+        cost_to_end = float(dp_table[full_mask, end_node])
+        if closes_on_start and cost_to_end < config.INFINITE_COST:
+            ritorno = cost_matrix[end_node, start_node_index] if end_node != start_node_index else config.INFINITE_COST
+            cost_to_end = cost_to_end + ritorno if ritorno < config.INFINITE_COST else config.INFINITE_COST
+        print(f"[HELD-KARP]   Costo per finire in {end_node} (visitando tutti): {cost_to_end}")
+        if cost_to_end < config.INFINITE_COST:
+            all_potential_paths.append((cost_to_end, end_node))
+
+    if not all_potential_paths and upper_bound is not None:
+        # Il limite scarta solo percorsi peggiori del warm start: resta valido quello
+        return [incumbent]
+
+    if not all_potential_paths:
+        print("[HELD-KARP] Errore: nessun percorso valido trovato" + (f" con vincoli: {', '.join(vincoli)}." if vincoli else " (senza nodo iniziale fisso)."))
+        return []
 
     # Sort all collected potential paths by cost
     all_potential_paths.sort(key=lambda x: x[0])
@@ -479,13 +1008,15 @@ def _find_best_path_and_reconstruct(num_nodes: int, start_node_index: Optional[i
     print(f"--- [HELD-KARP] Ricostruzione per i TOP {TOP_N_RESULTS} (o meno se non disponibili) ---")
     processed_tours_set = set() # To avoid duplicate tours if costs are identical
 
-    for i, (cost, end_node, _) in enumerate(all_potential_paths):
+    for i, (cost, end_node) in enumerate(all_potential_paths):
         if len(top_results) >= TOP_N_RESULTS:
             break # Abbiamo abbastanza risultati
 
         print(f"  Tentativo {i+1}: Ricostruzione per percorso con costo {cost:.2f}, finente in {end_node}" + (f", S={start_node_index}" if start_node_index is not None else ""))
         
-        current_tour_indices = _reconstruct_tour(end_node, num_nodes, full_mask, start_node_index)
+        current_tour_indices = _reconstruct_tour(dp_table, cost_matrix, end_node, full_mask, start_node_index)
+        if stats is not None:
+            stats.add_paths(1)
 
         valid_tour = True
         if not current_tour_indices or len(current_tour_indices) != num_nodes:
@@ -496,6 +1027,14 @@ def _find_best_path_and_reconstruct(num_nodes: int, start_node_index: Optional[i
             print(f"    [HELD-KARP] ATTENZIONE: Tour fisso ricostruito {current_tour_indices} non inizia con {start_node_index}. Scartato.")
             valid_tour = False
 
+        if valid_tour and end_pinned and current_tour_indices[-1] != end_node_index:
+            print(f"    [HELD-KARP] ATTENZIONE: Tour ricostruito {current_tour_indices} non termina con {end_node_index}. Scartato.")
+            valid_tour = False
+
+        if valid_tour and not _respects_precedences(current_tour_indices, predecessor_masks):
+            print(f"    [HELD-KARP] ATTENZIONE: Tour ricostruito {current_tour_indices} non rispetta le precedenze. Scartato.")
+            valid_tour = False
+
         if valid_tour:
             tour_tuple = tuple(current_tour_indices) # Use tuple for set operations
             if tour_tuple not in processed_tours_set:
@@ -513,19 +1052,89 @@ def _find_best_path_and_reconstruct(num_nodes: int, start_node_index: Optional[i
     for idx, (p_cost, p_indices) in enumerate(top_results):
         print(f"  {idx+1}. Costo: {p_cost:.2f}, Percorso: {p_indices}")
     print("------------------------------------")
+    if progress_callback is not None:
+        progress_callback({"event": "solution", "best_cost": top_results[0][0], "best_tour": top_results[0][1]})
     return top_results
 
 
-def _generate_final_ordered_list(tour_clusters: List[str],
-                                 colori_giorno: List[ColorObject],
-                                 first_color: Optional[str] = None) -> List[ColorObject]:
-    """Ordina i colori seguendo il tour dei cluster e le priorità interne."""
-    colori_ordinati: List[ColorObject] = []
-    colori_usati_keys: Set[str] = set() # Per tracciare i colori già aggiunti (code+type)
+# Priorità di tipo dei colori "stesso codice" aggiunti subito dopo il colore che li richiama
+# (mappa tipo -> rango, rango per i tipi non elencati)
+_RANGO_STESSO_CODICE = ({'F': 0, 'R': 1, 'K': 2, 'E': 4}, 3)
+_RANGO_DOPO_FISSO = ({'R': 0, 'K': 1, 'E': 3}, 2)
+_RANGO_DOPO_REINTEGRO = ({'F': 0, 'K': 1, 'E': 3}, 2)
+_TIPI_CON_GRUPPO = ('F', 'K', 'R', 'E')
+
+
+class _OrderingIndex:
+    """
+    Indice dell'ordinamento finale, costruito una sola volta per richiesta dalle colonne
+    del ColorBatch. I colori sono riferiti per riga; per ogni id cluster tiene:
+      - members: righe in ordine di input
+      - per_code: codice -> righe in ordine di input (gruppi "stesso codice")
+      - per_type: tipo (F/K/R/E, '*' per gli altri) -> righe già ordinate per
+        (sequenza, sequence_type); gli altri tipi prima per TIPOLOGIA_PESO.
+    Un unico ordinamento stabile globale equivale all'ordinamento separato di ogni
+    gruppo, perché i pari merito restano nell'ordine di input.
+    La chiave di deduplicazione resta la stringa code_type, internata per coppia distinta.
+    """
+
+    def __init__(self, batch: ColorBatch):
+        self.batch = batch
+        n = len(batch)
+        self.codes = [batch.codes[i] for i in batch.code_ids.tolist()]
+        self.types = [batch.types[i] for i in batch.type_ids.tolist()]
+        self.sequences = batch.sequences.tolist()
+
+        key_ids: Dict[str, int] = {}
+        pair_key: Dict[Tuple[int, int], int] = {}
+        self.keys: List[int] = []
+        for pair in zip(batch.code_ids.tolist(), batch.type_ids.tolist()):
+            key_id = pair_key.get(pair)
+            if key_id is None:
+                key_id = pair_key[pair] = key_ids.setdefault(
+                    f"{batch.codes[pair[0]]}_{batch.types[pair[1]]}", len(key_ids))
+            self.keys.append(key_id)
+        self.key_names = list(key_ids)
+
+        self.members: Dict[int, List[int]] = {}
+        self.per_code: Dict[int, Dict[Any, List[int]]] = {}
+        self.per_type: Dict[int, Dict[str, List[int]]] = {}
+        cluster_ids = batch.cluster_ids.tolist()
+        for i, cluster_id in enumerate(cluster_ids):
+            self.members.setdefault(cluster_id, []).append(i)
+            self.per_code.setdefault(cluster_id, {}).setdefault(self.codes[i], []).append(i)
+
+        small = batch.small.tolist()
+        ordine = sorted(range(n), key=lambda i: (self.sequences[i], 0 if small[i] else 1))
+        for i in ordine:
+            tipo = self.types[i] if self.types[i] in _TIPI_CON_GRUPPO else '*'
+            self.per_type.setdefault(cluster_ids[i], {}).setdefault(tipo, []).append(i)
+        for gruppi in self.per_type.values():
+            if '*' in gruppi:
+                gruppi['*'].sort(key=lambda i: config.TIPOLOGIA_PESO.get(self._tipo_peso(i), 100))
+
+    def _tipo_peso(self, i: int) -> Any:
+        # Come c.get("type", "E"): "E" solo se il campo manca del tutto (None e "E" pesano uguale)
+        return self.types[i] if self.types[i] is not None else "E"
+
+    def typed(self, cluster_id: int, tipo: str) -> List[int]:
+        return self.per_type.get(cluster_id, {}).get(tipo, [])
+
+
+@metrics.timed("ordering")
+def _ordered_rows(tour_clusters: List[str],
+                  batch: ColorBatch,
+                  first_color: Optional[str] = None) -> List[int]:
+    """Righe del batch ordinate seguendo il tour dei cluster e le priorità interne."""
+    index = _OrderingIndex(batch)
+    keys = index.keys
+    codes = index.codes
+    righe_ordinate: List[int] = []
+    colori_usati_keys: Set[int] = set() # Per tracciare i colori già aggiunti (code+type)
 
     print("\nGenerazione lista colori ordinata finale...")
-    # LOG: Stato colori_giorno in ingresso a questa funzione
-    print(f"[ORDERED_LIST] Ricevuti {len(colori_giorno)} colori per ordinamento. Codici: {[c.get('code') + ' ' + str(c.get('type')) for c in colori_giorno]}")
+    # LOG: Stato colori in ingresso a questa funzione
+    print(f"[ORDERED_LIST] Ricevuti {len(batch)} colori per ordinamento. Codici: {[f'{c} {t}' for c, t in zip(codes, index.types)]}")
     
     # Gestione first_color se specificato
     first_color_obj = None
@@ -535,10 +1144,9 @@ def _generate_final_ordered_list(tour_clusters: List[str],
         print(f"[FIRST_COLOR] DEBUG: first_color type: {type(first_color)}, repr: {repr(first_color)}")
         print(f"[FIRST_COLOR] first_color dopo strip: '{first_color.strip()}'" if isinstance(first_color, str) else f"[FIRST_COLOR] first_color non è stringa: {type(first_color)}")
         
-        print(f"[FIRST_COLOR] Tutti i colori disponibili ({len(colori_giorno)} totali):")
-        for i, c in enumerate(colori_giorno):
-            code = c.get('code', '')
-            print(f"  {i}: code='{code}' (type: {type(code)}), cluster='{c.get('cluster')}'")
+        print(f"[FIRST_COLOR] Tutti i colori disponibili ({len(batch)} totali):")
+        for i, code in enumerate(codes):
+            print(f"  {i}: code='{code}' (type: {type(code)}), cluster='{batch.cluster(i)}'")
         
         # Trova il colore nella lista - prova sia con che senza strip
         search_variations = [first_color]
@@ -550,29 +1158,19 @@ def _generate_final_ordered_list(tour_clusters: List[str],
         
         for variation in search_variations:
             print(f"[FIRST_COLOR] Cerco variazione: '{variation}'")
-            for c in colori_giorno:
-                color_code = c.get('code', '')
-                if color_code == variation:
-                    first_color_obj = c
-                    first_color_cluster = c.get('cluster')
-                    print(f"[FIRST_COLOR] ✓ Trovato colore {variation} nel cluster {first_color_cluster}")
-                    break
-            if first_color_obj:
+            if variation in codes:
+                first_color_obj = codes.index(variation)
+                first_color_cluster = batch.cluster(first_color_obj)
+                print(f"[FIRST_COLOR] ✓ Trovato colore {variation} nel cluster {first_color_cluster}")
                 break
         
-        if not first_color_obj:
+        if first_color_obj is None:
             print(f"[FIRST_COLOR] ❌ ATTENZIONE: Colore {first_color} non trovato nella lista colori!")
             print(f"[FIRST_COLOR] Confronti dettagliati effettuati:")
-            for i, c in enumerate(colori_giorno):
-                code = c.get('code', '')
+            for i, code in enumerate(codes):
                 for variation in search_variations:
                     result = code == variation
-                    print(f"  {i}: '{code}' == '{variation}' ? {result} (len: {len(code)} vs {len(variation)})")
-                    if not result and len(code) == len(variation):
-                        # Confronto carattere per carattere
-                        for j, (c1, c2) in enumerate(zip(code, variation)):
-                            if c1 != c2:
-                                print(f"    Differenza alla posizione {j}: '{c1}' != '{c2}' (ord: {ord(c1)} vs {ord(c2)})")
+                    print(f"  {i}: '{code}' == '{variation}' ? {result}")
         elif first_color_cluster and first_color_cluster in tour_clusters:
             # Riordina tour_clusters per mettere il cluster del primo colore all'inizio
             new_tour = [first_color_cluster] + [c for c in tour_clusters if c != first_color_cluster]
@@ -582,270 +1180,146 @@ def _generate_final_ordered_list(tour_clusters: List[str],
             print(f"[FIRST_COLOR] ❌ ATTENZIONE: Cluster {first_color_cluster} non trovato nel tour: {tour_clusters}")
     else:
         print(f"[FIRST_COLOR] Nessun primo colore specificato (first_color={repr(first_color)})")
-    
+
+    def emit(i: int) -> None:
+        righe_ordinate.append(i)
+        colori_usati_keys.add(keys[i])
+
+    def emit_same_code(gruppo: List[int], rango: Tuple[Dict[str, int], int]) -> None:
+        # Gli altri tipi dello stesso codice non ancora inseriti, per priorità di tipo e sequenza
+        ranghi, rango_altri = rango
+        pending = [j for j in gruppo if keys[j] not in colori_usati_keys]
+        pending.sort(key=lambda j: (ranghi.get(index.types[j], rango_altri), index.sequences[j]))
+        for j in pending:
+            if keys[j] not in colori_usati_keys:  # chiavi duplicate: vale la prima
+                emit(j)
+
     for cluster_nome in tour_clusters:
         print(f"  Processo cluster: {cluster_nome}")
-        colori_del_cluster = [c for c in colori_giorno if c.get("cluster") == cluster_nome and f"{c.get('code')}_{c.get('type')}" not in colori_usati_keys]
-
-        if not colori_del_cluster:
+        cluster_id = batch.cluster_id(cluster_nome)
+        if cluster_id == NO_CLUSTER or all(keys[i] in colori_usati_keys for i in index.members.get(cluster_id, [])):
             print(f"    Nessun colore nuovo per questo cluster.")
             continue
-
-        # Gestione first_color se il cluster corrente contiene il primo colore specificato
-        first_color_in_cluster = None
-        if first_color and first_color_obj and cluster_nome == first_color_cluster:
-            print(f"    [FIRST_COLOR] ✓ Processando cluster {cluster_nome} che contiene il primo colore {first_color}")
-            # Trova il primo colore in questo cluster
-            for c in colori_del_cluster:
-                if c.get('code') == first_color:
-                    first_color_in_cluster = c
-                    print(f"    [FIRST_COLOR] ✓ Trovato {first_color} in questo cluster")
-                    break
-            
-            if not first_color_in_cluster:
+        per_code = index.per_code.get(cluster_id, {})
+        inizio_cluster = len(righe_ordinate)
+
+        # PRIMA PRIORITÀ: se il cluster contiene il first_color, inizia con quello
+        # seguito dagli altri tipi dello stesso codice
+        if first_color and first_color_obj is not None and cluster_nome == first_color_cluster:
+            first_color_in_cluster = next(
+                (i for i in per_code.get(first_color, []) if keys[i] not in colori_usati_keys), None)
+            if first_color_in_cluster is not None:
+                print(f"    [FIRST_COLOR] ✓ Priorità assoluta a {first_color} nel cluster {cluster_nome}")
+                emit(first_color_in_cluster)
+                emit_same_code(per_code[first_color], _RANGO_STESSO_CODICE)
+            else:
                 print(f"    [FIRST_COLOR] ❌ ERRORE: {first_color} non trovato nei colori del cluster {cluster_nome}")
-                print(f"    [FIRST_COLOR]   colori_del_cluster: {[c.get('code') for c in colori_del_cluster]}")
-        elif first_color and cluster_nome == first_color_cluster:
-            print(f"    [FIRST_COLOR] ❌ ERRORE: Cluster {cluster_nome} dovrebbe contenere {first_color} ma first_color_obj è None")
-        elif first_color:
-            print(f"    [FIRST_COLOR] Cluster {cluster_nome} non contiene il primo colore {first_color} (first_color_cluster={first_color_cluster})")
-
-        # NUOVA REGOLA INTRA-CLUSTER: Raggruppa per stesso codice RAL/codice
-        print(f"    Applicazione regola raggruppamento per stesso codice...")
-        cluster_ordinato_temp = []
-        added_keys_this_cluster = set()
-        
-        # PRIMA PRIORITÀ: Se c'è un first_color in questo cluster, inizia con quello
-        if first_color_in_cluster:
-            cluster_ordinato_temp.append(first_color_in_cluster)
-            added_keys_this_cluster.add(f"{first_color_in_cluster['code']}_{first_color_in_cluster['type']}")
-            print(f"    + [FIRST_COLOR] PRIORITÀ ASSOLUTA: {first_color_in_cluster['code']} {first_color_in_cluster['type']}")
-            
-            # Aggiungi subito tutti gli altri tipi dello stesso codice del first_color
-            first_color_code = first_color_in_cluster.get('code')
-            altri_tipi_first_color = [c for c in colori_del_cluster 
-                                    if c.get('code') == first_color_code and c != first_color_in_cluster]
-            if altri_tipi_first_color:
-                altri_tipi_first_color.sort(key=lambda x: (
-                    0 if x.get('type') == 'F' else
-                    1 if x.get('type') == 'R' else
-                    2 if x.get('type') == 'K' else
-                    3 if x.get('type') not in ['E'] else 4,
-                    _safe_get_sequence(x)
-                ))
-                for colore_stesso_codice in altri_tipi_first_color:
-                    key = f"{colore_stesso_codice['code']}_{colore_stesso_codice['type']}"
-                    if key not in added_keys_this_cluster:
-                        cluster_ordinato_temp.append(colore_stesso_codice)
-                        added_keys_this_cluster.add(key)
-                        print(f"    + [FIRST_COLOR] Stesso codice: {colore_stesso_codice['code']} {colore_stesso_codice['type']}")
-        
-        # Ora continua con la logica normale per i colori rimanenti
-        
-        # Raggruppa i colori per codice (RAL o numerico) - solo quelli non ancora processati
-        colori_per_codice: Dict[str, List[ColorObject]] = {}
-        for c in colori_del_cluster:
-            key = f"{c.get('code')}_{c.get('type')}"
-            if key not in added_keys_this_cluster:  # Solo colori non ancora aggiunti
-                code = c.get('code', '')
-                if code not in colori_per_codice:
-                    colori_per_codice[code] = []
-                colori_per_codice[code].append(c)
-        
-        print(f"    Trovati {len(colori_per_codice)} codici distinti rimanenti: {list(colori_per_codice.keys())}")
-
-        # Separa per tipo e ordina considerando sequence_type per le sequenze piccole - solo colori non ancora processati
-        colori_rimanenti = [c for c in colori_del_cluster if f"{c.get('code')}_{c.get('type')}" not in added_keys_this_cluster]
-        fissi = sorted([c for c in colori_rimanenti if c.get("type") == "F"], 
-                      key=lambda x: (_safe_get_sequence(x), 
-                                   0 if x.get('sequence_type') == config.SEQUENCE_TYPE_SMALL else 1))
-        kit = sorted([c for c in colori_rimanenti if c.get("type") == "K"], 
-                    key=lambda x: (_safe_get_sequence(x), 
-                                 0 if x.get('sequence_type') == config.SEQUENCE_TYPE_SMALL else 1))
-        reintegri = sorted([c for c in colori_rimanenti if c.get("type") == "R"], 
-                          key=lambda x: (_safe_get_sequence(x), 
-                                       0 if x.get('sequence_type') == config.SEQUENCE_TYPE_SMALL else 1))
-        altri_non_estetici = sorted([c for c in colori_rimanenti if c.get("type") not in ["F", "K", "R", "E"]], 
-                                   key=lambda x: (config.TIPOLOGIA_PESO.get(x.get("type", "E"), 100), 
-                                                _safe_get_sequence(x), 
-                                                0 if x.get('sequence_type') == config.SEQUENCE_TYPE_SMALL else 1))
-        estetici = sorted([c for c in colori_rimanenti if c.get("type") == "E"], 
-                         key=lambda x: (_safe_get_sequence(x), 
-                                      0 if x.get('sequence_type') == config.SEQUENCE_TYPE_SMALL else 1))
-
-        # Logica di ordinamento con raggruppamento per stesso codice:
-        # 1. Prendi un fisso come trigger (se presente)
-        # 2. Se del fisso scelto ci sono altri tipi (E, K, R), li raggruppi subito dopo
-        # 3. Poi continui con reintegri, altri non-E, estetici rimanenti
-
-        # 1. Aggiungi UN SOLO pezzo Fisso (il primo) + eventuali altri tipi dello stesso codice
-        primo_fisso_code = None
+
+        # Gruppi per tipo (già ordinati dall'indice) dei colori non ancora inseriti
+        def remaining(*tipi: str) -> List[int]:
+            return [i for tipo in tipi for i in index.typed(cluster_id, tipo) if keys[i] not in colori_usati_keys]
+
+        fissi = remaining('F')
+        reintegri = remaining('R')
+        estetici = remaining('E')
+
+        # 1. UN SOLO Fisso (il primo) come trigger + altri tipi dello stesso codice (R > K > altri > E)
         if fissi:
-            primo_fisso = fissi.pop(0) # Prendi e rimuovi il primo
-            primo_fisso_code = primo_fisso.get('code')
-            cluster_ordinato_temp.append(primo_fisso)
-            added_keys_this_cluster.add(f"{primo_fisso['code']}_{primo_fisso['type']}")
-            print(f"    + Fisso (trigger): {primo_fisso['code']}")
-            
-            # NUOVA LOGICA: Aggiungi subito tutti gli altri tipi dello stesso codice del fisso
-            if primo_fisso_code and primo_fisso_code in colori_per_codice:
-                altri_tipi_stesso_codice = [c for c in colori_per_codice[primo_fisso_code] 
-                                          if f"{c.get('code')}_{c.get('type')}" not in added_keys_this_cluster]
-                # Ordina per priorità tipo: R > K > altri > E
-                altri_tipi_stesso_codice.sort(key=lambda x: (
-                    0 if x.get('type') == 'R' else
-                    1 if x.get('type') == 'K' else
-                    2 if x.get('type') not in ['E'] else 3,
-                    _safe_get_sequence(x)
-                ))
-                
-                for colore_stesso_codice in altri_tipi_stesso_codice:
-                    key = f"{colore_stesso_codice['code']}_{colore_stesso_codice['type']}"
-                    if key not in added_keys_this_cluster:
-                        cluster_ordinato_temp.append(colore_stesso_codice)
-                        added_keys_this_cluster.add(key)
-                        print(f"    + Stesso codice del fisso ({primo_fisso_code}): {colore_stesso_codice['type']}")
-
-        # 2. Aggiungi tutti i reintegri rimanenti + eventuali altri tipi degli stessi codici
-        reintegri_da_processare = [r for r in reintegri if f"{r['code']}_{r['type']}" not in added_keys_this_cluster]
-        codici_reintegri_processati = set()
-        
-        for r in reintegri_da_processare:
-            key = f"{r['code']}_{r['type']}"
-            if key not in added_keys_this_cluster:
-                cluster_ordinato_temp.append(r)
-                added_keys_this_cluster.add(key)
-                r_code = r.get('code')
-                print(f"    + Reintegro: {r_code}")
-                codici_reintegri_processati.add(r_code)
-                
-                # Aggiungi subito tutti gli altri tipi dello stesso codice del reintegro
-                if r_code and r_code in colori_per_codice:
-                    altri_tipi_stesso_codice_r = [c for c in colori_per_codice[r_code] 
-                                                if f"{c.get('code')}_{c.get('type')}" not in added_keys_this_cluster]
-                    altri_tipi_stesso_codice_r.sort(key=lambda x: (
-                        0 if x.get('type') == 'F' else
-                        1 if x.get('type') == 'K' else
-                        2 if x.get('type') not in ['E'] else 3,
-                        _safe_get_sequence(x)
-                    ))
-                    
-                    for colore_stesso_codice_r in altri_tipi_stesso_codice_r:
-                        key_r = f"{colore_stesso_codice_r['code']}_{colore_stesso_codice_r['type']}"
-                        if key_r not in added_keys_this_cluster:
-                            cluster_ordinato_temp.append(colore_stesso_codice_r)
-                            added_keys_this_cluster.add(key_r)
-                            print(f"    + Stesso codice del reintegro ({r_code}): {colore_stesso_codice_r['type']}")
-
-        # 3. Aggiungi i rimanenti non estetici + eventuali altri tipi degli stessi codici
-        # 3. Aggiungi i rimanenti non estetici + eventuali altri tipi degli stessi codici
-        rimanenti_non_estetici = [c for c in (fissi + kit + altri_non_estetici) 
-                                 if f"{c.get('code')}_{c.get('type')}" not in added_keys_this_cluster]
-        codici_non_estetici_processati = set()
-        
-        # Ordina per sicurezza per tipo e poi codice
-        rimanenti_non_estetici.sort(key=lambda c: (config.TIPOLOGIA_PESO.get(c.get("type", "E"), 100), c.get('code')))
-        
-        for rne in rimanenti_non_estetici:
-            key = f"{rne['code']}_{rne['type']}"
-            rne_code = rne.get('code')
-            if key not in added_keys_this_cluster and rne_code not in codici_non_estetici_processati:
-                cluster_ordinato_temp.append(rne)
-                added_keys_this_cluster.add(key)
-                print(f"    + {rne['type']}: {rne_code}")
-                codici_non_estetici_processati.add(rne_code)
-                
-                # Aggiungi subito tutti gli altri tipi dello stesso codice
-                if rne_code and rne_code in colori_per_codice:
-                    altri_tipi_stesso_codice_ne = [c for c in colori_per_codice[rne_code] 
-                                                  if f"{c.get('code')}_{c.get('type')}" not in added_keys_this_cluster]
-                    altri_tipi_stesso_codice_ne.sort(key=lambda x: (
-                        0 if x.get('type') == 'F' else
-                        1 if x.get('type') == 'R' else
-                        2 if x.get('type') == 'K' else
-                        3 if x.get('type') not in ['E'] else 4,
-                        _safe_get_sequence(x)
-                    ))
-                    
-                    for colore_stesso_codice_ne in altri_tipi_stesso_codice_ne:
-                        key_ne = f"{colore_stesso_codice_ne['code']}_{colore_stesso_codice_ne['type']}"
-                        if key_ne not in added_keys_this_cluster:
-                            cluster_ordinato_temp.append(colore_stesso_codice_ne)
-                            added_keys_this_cluster.add(key_ne)
-                            print(f"    + Stesso codice ({rne_code}): {colore_stesso_codice_ne['type']}")
-
-        # 4. Aggiungi gli estetici rimanenti + eventuali altri tipi degli stessi codici
-        estetici_da_processare = [e for e in estetici if f"{e['code']}_{e['type']}" not in added_keys_this_cluster]
-        codici_estetici_processati = set()
-        
-        for e in estetici_da_processare:
-            key = f"{e['code']}_{e['type']}"
-            e_code = e.get('code')
-            if key not in added_keys_this_cluster and e_code not in codici_estetici_processati:
-                cluster_ordinato_temp.append(e)
-                added_keys_this_cluster.add(key)
-                print(f"    + Estetico: {e_code}")
-                codici_estetici_processati.add(e_code)
-                
-                # Aggiungi subito tutti gli altri tipi dello stesso codice dell'estetico
-                if e_code and e_code in colori_per_codice:
-                    altri_tipi_stesso_codice_e = [c for c in colori_per_codice[e_code] 
-                                                if f"{c.get('code')}_{c.get('type')}" not in added_keys_this_cluster]
-                    altri_tipi_stesso_codice_e.sort(key=lambda x: (
-                        0 if x.get('type') == 'F' else
-                        1 if x.get('type') == 'R' else
-                        2 if x.get('type') == 'K' else
-                        3 if x.get('type') not in ['E'] else 4,
-                        _safe_get_sequence(x)
-                    ))
-                    
-                    for colore_stesso_codice_e in altri_tipi_stesso_codice_e:
-                        key_e = f"{colore_stesso_codice_e['code']}_{colore_stesso_codice_e['type']}"
-                        if key_e not in added_keys_this_cluster:
-                            cluster_ordinato_temp.append(colore_stesso_codice_e)
-                            added_keys_this_cluster.add(key_e)
-                            print(f"    + Stesso codice dell'estetico ({e_code}): {colore_stesso_codice_e['type']}")
-
-        colori_ordinati.extend(cluster_ordinato_temp)
-        colori_usati_keys.update(added_keys_this_cluster) # Aggiorna set globale
+            primo_fisso = fissi[0]
+            primo_fisso_code = codes[primo_fisso]
+            emit(primo_fisso)
+            if primo_fisso_code and primo_fisso_code in per_code:
+                emit_same_code(per_code[primo_fisso_code], _RANGO_DOPO_FISSO)
+
+        # 2. Tutti i reintegri rimanenti, ognuno seguito dagli altri tipi dello stesso codice (F > K > altri > E)
+        for r in reintegri:
+            if keys[r] not in colori_usati_keys:
+                emit(r)
+                r_code = codes[r]
+                if r_code and r_code in per_code:
+                    emit_same_code(per_code[r_code], _RANGO_DOPO_REINTEGRO)
+
+        # 3. Rimanenti non estetici per peso tipologia e codice, un trigger per codice
+        rimanenti_non_estetici = remaining('F', 'K', '*')
+        rimanenti_non_estetici.sort(key=lambda i: (config.TIPOLOGIA_PESO.get(index._tipo_peso(i), 100), codes[i]))
+        # 4. Estetici rimanenti, un trigger per codice
+        for gruppo_trigger in (rimanenti_non_estetici, estetici):
+            codici_processati = set()
+            for i in gruppo_trigger:
+                code = codes[i]
+                if keys[i] not in colori_usati_keys and code not in codici_processati:
+                    emit(i)
+                    codici_processati.add(code)
+                    if code and code in per_code:
+                        emit_same_code(per_code[code], _RANGO_STESSO_CODICE)
+
+        print(f"    {len(righe_ordinate) - inizio_cluster} colori inseriti")
 
     # Verifica se tutti i colori sono stati inclusi
-    if len(colori_ordinati) != len(colori_giorno):
-        print(f"ATTENZIONE: Numero colori finali ({len(colori_ordinati)}) diverso da input ({len(colori_giorno)}).")
-        original_keys = {f"{c['code']}_{c['type']}" for c in colori_giorno}
-        missing_keys = original_keys - colori_usati_keys
+    if len(righe_ordinate) != len(batch):
+        print(f"ATTENZIONE: Numero colori finali ({len(righe_ordinate)}) diverso da input ({len(batch)}).")
+        missing_keys = {index.key_names[k] for k in set(keys) - colori_usati_keys}
         if missing_keys:
              print(f"Colori mancanti: {missing_keys}")
     # LOG: Stato finale lista ordinata
-    print(f"[ORDERED_LIST OUTPUT] Lista finale ({len(colori_ordinati)}):")
-    for i, color in enumerate(colori_ordinati):
-        if color.get('code') == 'RAL5019':
-            print(f"  [ORDERED OUT] {i}: {color}")
-    print(f"  Tutti i codici ordinati: {[c.get('code') + ' ' + str(c.get('type')) for c in colori_ordinati]}")
-    return colori_ordinati
+    print(f"[ORDERED_LIST OUTPUT] Lista finale ({len(righe_ordinate)}):")
+    print(f"  Tutti i codici ordinati: {[f'{codes[i]} {index.types[i]}' for i in righe_ordinate]}")
+    return righe_ordinate
+
+
+def _generate_final_ordered_list(tour_clusters: List[str],
+                                 colori_giorno: List[ColorObject],
+                                 first_color: Optional[str] = None) -> List[ColorObject]:
+    """Ordina i colori (dizionari con 'cluster' già assegnato) seguendo il tour dei cluster e le priorità interne."""
+    righe = _ordered_rows(tour_clusters, ColorBatch(colori_giorno), first_color)
+    return [colori_giorno[i] for i in righe]
 
 
 # --- Funzione Principale di Orchestrazione ---
 # backend/app/logic.py
 # ...
 
-def optimize_color_sequence(colori_giorno_input: List[Dict[str, Any]],
+def optimize_color_sequence(colori_giorno_input: Union[List[Dict[str, Any]], ColorBatch],
                             start_cluster_nome: Optional[str] = None,
                             first_color: Optional[str] = None,
-                            prioritized_reintegrations: Optional[List[str]] = None
+                            prioritized_reintegrations: Optional[List[str]] = None,
+                            progress_callback: Optional[ProgressCallback] = None,
+                            end_cluster_nome: Optional[str] = None,
+                            cluster_precedences: Optional[List[Tuple[str, str]]] = None,
+                            warm_start_sequence: Optional[List[str]] = None,
+                            cluster_dict: Optional[ClusterDict] = None,
+                            cambio_colori: Optional[TransitionRuleDict] = None
                            ) -> Tuple[List[Dict[str, Any]], List[str], float, str]:
     
     """
     Funzione principale che orchestra l'intero processo di ottimizzazione.
     Restituisce (lista_colori_ordinata_BEST, sequenza_cluster_BEST, costo_calcolato_BEST, messaggio_CON_TOP_N).
+    Se progress_callback è fornito riceve gli eventi di avanzamento del solver, con
+    gli indici dei percorsi già tradotti in nomi cluster ("best_sequence"). Se il
+    callback interrompe la ricerca (SolverCancelled) viene usata la migliore sequenza
+    trovata fino a quel momento.
+    end_cluster_nome forza il cluster con cui termina la sequenza (es. aggancio al
+    primo cluster del giorno successivo); uguale allo start, la sequenza torna sul
+    cluster di partenza.
+    cluster_precedences sono coppie (prima, dopo): il cluster "dopo" compare nella
+    sequenza solo dopo il cluster "prima" (coppie con cluster assenti ignorate);
+    ValueError se i vincoli sono ciclici.
+    warm_start_sequence è l'ordine dei cluster del piano attuale (es. la cabina da
+    riottimizzare): fa da soluzione iniziale e limite del solver, e il messaggio
+    riporta quanto la nuova sequenza migliora su di esso.
+    cluster_dict / cambio_colori evitano di rileggere le regole dal DB quando il
+    chiamante le ha già caricate (es. più giorni o cabine nella stessa richiesta).
+    I colori possono arrivare come lista di dizionari o come ColorBatch già costruito
+    (es. da OptimizationRequest): tutti gli stadi lavorano sul batch, che torna una
+    lista di dizionari solo per il risultato.
     """
-    global _cost_matrix, _n_clusters
-    _held_karp.cache_clear()
-    print(f"  Cache Held-Karp pulita (inizio optimize_color_sequence): {_held_karp.cache_info()}")
+    batch = colori_giorno_input if isinstance(colori_giorno_input, ColorBatch) else ColorBatch(colori_giorno_input)
 
     print("\n" + "="*50)
     print("--- Inizio Ottimizzazione Sequenza Colori ---")
     print(f"Input: {len(colori_giorno_input)} colori. Start Cluster Forzato: {start_cluster_nome or 'Nessuno'}")
+    if end_cluster_nome:
+        print(f"End Cluster Forzato: {end_cluster_nome}")
     print(f"Primo Colore Specificato: {first_color or 'Nessuno'}")
     print(f"DEBUG: first_color type: {type(first_color)}, repr: {repr(first_color)}")
     if first_color:
@@ -853,32 +1327,27 @@ def optimize_color_sequence(colori_giorno_input: List[Dict[str, Any]],
         print(f"DEBUG: first_color is truthy: {bool(first_color and first_color.strip())}")
     if prioritized_reintegrations:
         print(f"Reintegri Prioritari Richiesti: {prioritized_reintegrations}")
-    if not colori_giorno_input:
+    if not len(batch):
         print("Errore: Lista colori input vuota.")
         return [], [], 0.0, "Errore: Lista colori input vuota."
     # LOG: Dettaglio input
-    print(f"[LOGIC INPUT] Ricevuti {len(colori_giorno_input)} colori:")
-    for i, color in enumerate(colori_giorno_input):
-        print(f"  [INPUT] {i}: code={color.get('code')}, type={color.get('type')}, line={color.get('line')}")
-        if color.get('code') == 'RAL5019':
-            print(f"  [INPUT] {i}: {color}")
-    print(f"  Tutti i codici input: {[c.get('code') + ' ' + str(c.get('type')) for c in colori_giorno_input]}")
+    print(f"[LOGIC INPUT] Ricevuti {len(batch)} colori:")
+    for i, line in enumerate(batch.field('line')):
+        print(f"  [INPUT] {i}: code={batch.code(i)}, type={batch.type(i)}, line={line}")
 
     # 1. Carica dati DB
     print("\n[STEP 1] Caricamento dati da DB...")
-    cluster_dict = database.get_cluster_colori()
-    cambio_colori = database.get_cambio_colori()
+    if cluster_dict is None or cambio_colori is None:
+        cluster_dict = database.get_cluster_colori()
+        cambio_colori = database.get_cambio_colori()
     if not cluster_dict or not cambio_colori:
          print("Errore: Impossibile caricare dati cluster o transizioni dal DB.")
          return [], [], 0.0, "Errore: Impossibile caricare dati cluster o transizioni dal DB."
     print(f"  Caricati {len(cluster_dict)} cluster mapping e {len(cambio_colori)} regole transizione.")
 
-    # Crea una copia per non modificare l'input originale direttamente con i cluster
-    colori_giorno = [c.copy() for c in colori_giorno_input]
-
-    # 2. Mappa colori a cluster e identifica quelli di oggi
+    # 2. Mappa colori a cluster e identifica quelli di oggi (colonna cluster del batch, input non modificato)
     print("\n[STEP 2] Mappatura colori a cluster...")
-    colore2cluster, clusters_oggi_from_input, urgenti = _map_colors_to_clusters(colori_giorno, cluster_dict)
+    colore2cluster, clusters_oggi_from_input, urgenti = batch.assign_clusters(cluster_dict)
     
     # Costruisci la lista finale di cluster per la matrice, includendo start_cluster_nome se specificato
     _clusters_for_matrix_build = list(set(clusters_oggi_from_input)) # Cluster unici dagli input
@@ -886,6 +1355,9 @@ def optimize_color_sequence(colori_giorno_input: List[Dict[str, Any]],
     if start_cluster_nome and start_cluster_nome not in _clusters_for_matrix_build:
         _clusters_for_matrix_build.append(start_cluster_nome)
         print(f"  INFO: Requested start cluster '{start_cluster_nome}' was not in input colors' clusters. Added to the optimization set.")
+    if end_cluster_nome and end_cluster_nome not in _clusters_for_matrix_build:
+        _clusters_for_matrix_build.append(end_cluster_nome)
+        print(f"  INFO: Requested end cluster '{end_cluster_nome}' was not in input colors' clusters. Added to the optimization set.")
 
     # Ordina i cluster con prioritizzazione per sequenza: prima i cluster con valori di sequenza più bassi
     clusters_unique = list(set(_clusters_for_matrix_build))
@@ -894,7 +1366,7 @@ def optimize_color_sequence(colori_giorno_input: List[Dict[str, Any]],
     cluster_priorities = []
     print("\n[CLUSTER SEQUENCE PRIORITIZATION] Calcolo priorità sequenza per cluster...")
     for cluster_nome in clusters_unique:
-        seq_priority = _get_cluster_sequence_priority(cluster_nome, colori_giorno)
+        seq_priority = batch.cluster_sequence_priority(cluster_nome)
         cluster_priorities.append((cluster_nome, seq_priority))
         print(f"  Cluster '{cluster_nome}': sequenza minima = {seq_priority if seq_priority != 999 else 'N/D'}")
     
@@ -904,14 +1376,20 @@ def optimize_color_sequence(colori_giorno_input: List[Dict[str, Any]],
     print(f"  Cluster considerati per la matrice ({len(final_matrix_clusters)}) - ORDINATI PER PRIORITÀ SEQUENZA: {final_matrix_clusters}")
     print(f"  Cluster urgenti ({len(urgenti)}): {urgenti}")
 
-    _n_clusters = len(final_matrix_clusters) # Aggiorna variabile globale per Held-Karp
+    n_clusters = len(final_matrix_clusters)
     
     start_index: Optional[int] = None
+    predecessor_masks = _predecessor_masks(final_matrix_clusters, cluster_precedences)
+    if predecessor_masks:
+        print(f"  Vincoli di precedenza: " + ", ".join(
+            f"{final_matrix_clusters[k]} dopo {[final_matrix_clusters[j] for j in range(n_clusters) if m >> j & 1]}"
+            for k, m in enumerate(predecessor_masks) if m))
     
     # Se non è stato specificato un cluster di partenza, usa quello con priorità sequenza più alta
     if not start_cluster_nome and final_matrix_clusters:
-        # Trova il cluster con la sequenza più bassa (priorità più alta)
-        best_cluster = final_matrix_clusters[0]  # Già ordinato per priorità sequenza
+        # Trova il cluster con la sequenza più bassa (priorità più alta) tra quelli senza predecessori
+        candidati = [c for k, c in enumerate(final_matrix_clusters) if not predecessor_masks or not predecessor_masks[k]]
+        best_cluster = candidati[0]  # Già ordinato per priorità sequenza
         start_cluster_nome = best_cluster
         print(f"  INFO: Nessun cluster di partenza specificato. Auto-selezione cluster con priorità sequenza più alta: '{start_cluster_nome}'")
     
@@ -925,49 +1403,80 @@ def optimize_color_sequence(colori_giorno_input: List[Dict[str, Any]],
             start_cluster_nome = None # Resetta
             # start_index rimane None
 
-    if _n_clusters == 0:
+    end_index: Optional[int] = None
+    if end_cluster_nome:
+        end_index = final_matrix_clusters.index(end_cluster_nome)
+        print(f"  Forcing optimization to end at cluster '{end_cluster_nome}' (index {end_index} in {final_matrix_clusters})")
+
+    if n_clusters == 0:
         print("Nessun cluster valido trovato (neanche lo start_cluster_nome se specificato). Restituito ordine input.")
-        return colori_giorno_input, [], 0.0, "Nessun cluster valido trovato. Restituito ordine input."
+        return batch.to_dicts(), [], 0.0, "Nessun cluster valido trovato. Restituito ordine input."
     
-    if _n_clusters == 1:
+    if n_clusters == 1:
          # Se c'è un solo cluster (potrebbe essere lo start_cluster_nome aggiunto artificialmente)
          the_only_cluster = final_matrix_clusters[0]
          print(f"Trovato solo 1 cluster per l'ottimizzazione: {the_only_cluster}. Ordinamento banale.")
          tour_clusters = [the_only_cluster]
-         # Filtra colori_giorno per includere solo quelli che appartengono a the_only_cluster (se ce ne sono)
-         colori_per_unico_cluster = [c for c in colori_giorno if c.get("cluster") == the_only_cluster]
-         colori_finali_ordinati = _generate_final_ordered_list(tour_clusters, colori_per_unico_cluster, first_color)
+         # Solo i colori che appartengono a the_only_cluster (se ce ne sono)
+         colori_finali_ordinati = batch.to_dicts(_ordered_rows(tour_clusters, batch, first_color))
          for c_out in colori_finali_ordinati:
              if 'cluster' not in c_out or not c_out['cluster']:
                   c_out['cluster'] = colore2cluster.get(c_out.get('code',''), the_only_cluster)
+         _record_solve(ENGINE_SINGLE_CLUSTER, True)
          return colori_finali_ordinati, tour_clusters, 0.0, f"Ottimizzazione completata (solo 1 cluster considerato: {tour_clusters[0]})."
 
     # 3. Costruisci matrice costi usando final_matrix_clusters
     print("\n[STEP 3] Costruzione matrice costi...")
-    _cost_matrix = _build_cost_matrix(final_matrix_clusters, colori_giorno, cambio_colori, prioritized_reintegrations)
-    if _cost_matrix.size == 0 or _cost_matrix.shape != (_n_clusters, _n_clusters):
+    cost_matrix = _build_cost_matrix(final_matrix_clusters, batch, cambio_colori, prioritized_reintegrations)
+    if cost_matrix.size == 0 or cost_matrix.shape != (n_clusters, n_clusters):
         # ... (gestione errore matrice come prima, ma usa final_matrix_clusters per fallback)
-        fallback_ordered = []
-        for cl_name in final_matrix_clusters: # Itera sui cluster della matrice
-            # Aggiungi solo colori che effettivamente appartengono a questo cluster
-            fallback_ordered.extend([c for c in colori_giorno if c.get('cluster') == cl_name])
-        return fallback_ordered, [], config.INFINITE_COST, f"Errore: Matrice costi non valida (shape: {_cost_matrix.shape}). Restituito raggruppamento per cluster."
+        # Raggruppamento per cluster della matrice (solo colori che vi appartengono)
+        fallback_ordered = batch.to_dicts(batch.rows_by_cluster(final_matrix_clusters))
+        return fallback_ordered, [], config.INFINITE_COST, f"Errore: Matrice costi non valida (shape: {cost_matrix.shape}). Restituito raggruppamento per cluster."
 
     # 4. Trova percorso ottimale (Held-Karp)
     print("\n[STEP 4] Ricerca percorsi ottimali (Held-Karp)...")
     
     # start_index è già stato calcolato sopra basandosi su final_matrix_clusters
     # _find_best_path_and_reconstruct ora restituisce una lista di (costo, indici_tour)
-    top_paths_data = _find_best_path_and_reconstruct(_n_clusters, start_index)
+    solver_progress = None
+    if progress_callback is not None:
+        def solver_progress(event: Dict[str, Any]) -> None:
+            if "best_tour" in event:
+                event = dict(event)
+                event["best_sequence"] = [final_matrix_clusters[i] for i in event.pop("best_tour")]
+            progress_callback(event)
+
+    warm_tour = warm_cost = None
+    if warm_start_sequence:
+        warm_tour = _warm_start_tour(cost_matrix, final_matrix_clusters, warm_start_sequence, start_index, end_index)
+        warm_cost = _path_cost(cost_matrix, warm_tour, start_index is not None and end_index == start_index)
+        print(f"  Warm start dal piano attuale: {' -> '.join(final_matrix_clusters[i] for i in warm_tour)} (Costo: {warm_cost:.2f})")
+
+    interrupted = False
+    try:
+        top_paths_data = _find_best_path_and_reconstruct(cost_matrix, start_index, solver_progress, end_index,
+                                                         predecessor_masks=predecessor_masks,
+                                                         warm_start_tour=warm_tour,
+                                                         node_labels=final_matrix_clusters)
+    except SolverCancelled as exc:
+        if exc.best_tour is None:
+            raise
+        print(f"  Ricerca Held-Karp interrotta: uso la migliore sequenza trovata finora (costo {exc.best_cost:.2f}).")
+        top_paths_data = [(exc.best_cost, exc.best_tour)]
+        interrupted = True
 
     if not top_paths_data:
-         fallback_ordered = []
-         for cl_name in final_matrix_clusters:
-             fallback_ordered.extend([c for c in colori_giorno if c.get('cluster') == cl_name])
+         fallback_ordered = batch.to_dicts(batch.rows_by_cluster(final_matrix_clusters))
          err_msg = "Errore: Held-Karp non ha trovato nessun percorso valido."
          if start_cluster_nome:
              err_msg += f" (partendo da '{start_cluster_nome}')"
+         if end_cluster_nome:
+             err_msg += f" (arrivando a '{end_cluster_nome}')"
+         if predecessor_masks:
+             err_msg += " (rispettando l'ordine parziale dei cluster)"
          err_msg += " Restituito raggruppamento per cluster."
+         _record_solve(ENGINE_HELD_KARP, False)
          return fallback_ordered, [], config.INFINITE_COST, err_msg
 
     # Il primo elemento è il migliore in assoluto
@@ -975,37 +1484,41 @@ def optimize_color_sequence(colori_giorno_input: List[Dict[str, Any]],
     
     print(f"  Miglior risultato Held-Karp (1 di {len(top_paths_data)}): Costo={best_cost}, Tour Indici={best_tour_indices}")
 
-    if not best_tour_indices or len(best_tour_indices) != _n_clusters or best_cost >= config.INFINITE_COST:
+    if not best_tour_indices or len(best_tour_indices) != n_clusters or best_cost >= config.INFINITE_COST:
          # Questo blocco potrebbe non essere più necessario se _find_best_path_and_reconstruct
          # garantisce di restituire solo percorsi validi o una lista vuota.
          # Ma lo teniamo per sicurezza.
-         fallback_ordered = []
-         for cl_name in final_matrix_clusters:
-             fallback_ordered.extend([c for c in colori_giorno if c.get('cluster') == cl_name])
+         fallback_ordered = batch.to_dicts(batch.rows_by_cluster(final_matrix_clusters))
+         _record_solve(ENGINE_HELD_KARP, False)
          return fallback_ordered, [], config.INFINITE_COST, "Errore: Il miglior percorso Held-Karp non è valido. Restituito raggruppamento per cluster."
 
     best_tour_clusters = [final_matrix_clusters[i] for i in best_tour_indices]
+    heuristic = interrupted or n_clusters > config.HELD_KARP_MAX_NODES
+    _record_solve(ENGINE_GREEDY if heuristic else ENGINE_HELD_KARP, not heuristic)
     print(f"  Percorso cluster ottimale (TOP 1): {' -> '.join(best_tour_clusters)} (Costo: {best_cost:.2f})")
 
     # 5. Genera lista colori finale ordinata (SOLO PER IL MIGLIOR PERCORSO)
     print("\n[STEP 5] Generazione lista colori finale ordinata (per il miglior percorso)...")
-    colori_finali_ordinati = _generate_final_ordered_list(best_tour_clusters, colori_giorno, first_color)
+    righe_ordinate = _ordered_rows(best_tour_clusters, batch, first_color)
+    # Uscita dal batch: dizionari (copie dei record con il cluster) solo per le righe ordinate
+    colori_finali_ordinati = batch.to_dicts(righe_ordinate)
     print(f"  Generata lista finale con {len(colori_finali_ordinati)} colori.")
-    print(f"[LOGIC OUTPUT] colori_finali_ordinati (len {len(colori_finali_ordinati)}):")
-    for i, color in enumerate(colori_finali_ordinati):
-        if color.get('code') == 'RAL5019': # Esempio di log specifico
-            print(f"  [OUTPUT] {i}: {color}")
-    print(f"  Tutti i codici output: {[c.get('code') + ' ' + str(c.get('type')) for c in colori_finali_ordinati]}")
-
-    if len(colori_finali_ordinati) != len(colori_giorno_input):
-         print(f"  ATTENZIONE: Numero colori finali ({len(colori_finali_ordinati)}) diverso da input ({len(colori_giorno_input)})!")
-         input_codes = {c['code'] for c in colori_giorno_input}
-         output_codes = {c['code'] for c in colori_finali_ordinati}
+
+    if len(colori_finali_ordinati) != len(batch):
+         print(f"  ATTENZIONE: Numero colori finali ({len(colori_finali_ordinati)}) diverso da input ({len(batch)})!")
+         input_codes = set(batch.codes)
+         output_codes = {batch.code(i) for i in righe_ordinate}
          print(f"    Colori input non in output: {input_codes - output_codes}")
          print(f"    Colori output non in input: {output_codes - input_codes}")
 
     # 6. Prepara messaggio finale, includendo i TOP N percorsi
     messaggio = f"Ottimizzazione completata. \n"
+    if interrupted:
+        messaggio = "Ottimizzazione interrotta: usata la migliore sequenza trovata finora (ottimalità non garantita). \n"
+    elif heuristic:
+        messaggio = (f"Ottimizzazione euristica: {n_clusters} cluster oltre il limite della DP esatta "
+                     f"(HELD_KARP_MAX_NODES={config.HELD_KARP_MAX_NODES}), usato il percorso greedy migliorato "
+                     f"con ricerca locale (ottimalità non garantita). \n")
     messaggio += f"Miglior Percorso Cluster (usato per ordinamento colori): {' -> '.join(best_tour_clusters)}. Costo: {best_cost:.2f}.\n"
     
     if len(top_paths_data) > 1:
@@ -1021,6 +1534,12 @@ def optimize_color_sequence(colori_giorno_input: List[Dict[str, Any]],
 
     if start_cluster_nome and start_index is not None:
          messaggio += f" (Nota: Inizio forzato da '{start_cluster_nome}')."
+    if end_cluster_nome and end_index is not None:
+         messaggio += f" (Nota: Fine forzata in '{end_cluster_nome}')."
+    if predecessor_masks:
+         messaggio += f" (Nota: Rispettato l'ordine parziale dei cluster)."
+    if warm_cost is not None and warm_cost < config.INFINITE_COST:
+         messaggio += f" (Piano attuale: costo {warm_cost:.2f}, miglioramento {warm_cost - best_cost:.2f})."
     if prioritized_reintegrations:
         messaggio += f" (Considerati reintegri prioritari: {prioritized_reintegrations})."
 
@@ -1034,6 +1553,318 @@ def optimize_color_sequence(colori_giorno_input: List[Dict[str, Any]],
     final_cost_value = config.INFINITE_COST if best_cost >= config.INFINITE_COST else best_cost
     return colori_finali_ordinati, best_tour_clusters, final_cost_value, messaggio.strip()
 
+# --- Pianificazione su più giorni ---
+# I colori sono divisi per giorno: il campo 'day' (0 = oggi) se presente, altrimenti
+# sequence_type "successiva" vale il giorno dopo e tutto il resto oggi. I giorni sono
+# concatenati: ogni giorno parte dal cluster con cui è finito il precedente, così il
+# cambio colore a cavallo dei giorni entra nel costo del giorno che inizia.
+
+def _color_days(batch: ColorBatch) -> List[int]:
+    """Giorno di produzione (0 = oggi) di ogni riga del batch."""
+    giorni = []
+    for day, sequence_type in zip(batch.field('day'), batch.field('sequence_type')):
+        if isinstance(day, int) and day >= 0:
+            giorni.append(day)
+        else:
+            giorni.append(1 if sequence_type == config.SEQUENCE_TYPE_NEXT else 0)
+    return giorni
+
+
+def optimize_multi_day(colori_input: Union[List[Dict[str, Any]], ColorBatch],
+                       start_cluster_nome: Optional[str] = None,
+                       end_cluster_nome: Optional[str] = None,
+                       first_color: Optional[str] = None,
+                       prioritized_reintegrations: Optional[List[str]] = None,
+                       progress_callback: Optional[ProgressCallback] = None,
+                       warm_start_sequence: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Pianifica i colori su più giorni concatenati. start_cluster_nome, first_color e
+    warm_start_sequence valgono per il primo giorno, end_cluster_nome per l'ultimo.
+    Le regole sono lette dal DB una sola volta e condivise da tutti i giorni; i giorni
+    sono risolti uno dopo l'altro perché ciascuno parte dal cluster finale del precedente.
+    Restituisce 'days' (per giorno: day, colors, cluster_sequence, cost, message) più
+    colors / cluster_sequence / cost / message dell'intero orizzonte; ogni colore
+    riporta il suo 'day'.
+    """
+    batch = colori_input if isinstance(colori_input, ColorBatch) else ColorBatch(colori_input)
+    giorni = _color_days(batch)
+    numeri_giorno = sorted(set(giorni))
+    print(f"[MULTI-DAY] {len(batch)} colori su {len(numeri_giorno)} giorni: {numeri_giorno}")
+
+    cluster_dict = database.get_cluster_colori()
+    cambio_colori = database.get_cambio_colori()
+
+    def day_progress(day: int) -> Optional[ProgressCallback]:
+        if progress_callback is None:
+            return None
+        return lambda event: progress_callback({**event, "day": day})
+
+    days: List[Dict[str, Any]] = []
+    partenza = start_cluster_nome
+    for n_day, day in enumerate(numeri_giorno):
+        ultimo = n_day == len(numeri_giorno) - 1
+        ordered, cluster_seq, cost, message = optimize_color_sequence(
+            batch.select([i for i, g in enumerate(giorni) if g == day]),
+            start_cluster_nome=partenza,
+            first_color=first_color if n_day == 0 else None,
+            prioritized_reintegrations=prioritized_reintegrations,
+            progress_callback=day_progress(day),
+            end_cluster_nome=end_cluster_nome if ultimo else None,
+            warm_start_sequence=warm_start_sequence if n_day == 0 else None,
+            cluster_dict=cluster_dict,
+            cambio_colori=cambio_colori,
+        )
+        for color in ordered:
+            color['day'] = day
+        days.append({'day': day, 'colors': ordered, 'cluster_sequence': cluster_seq,
+                     'cost': cost, 'message': message})
+        if cluster_seq:
+            partenza = cluster_seq[-1]
+        print(f"[MULTI-DAY] Giorno {day}: {len(ordered)} colori, costo {cost:.2f}, fine in '{partenza}'")
+
+    sequenza: List[str] = []
+    for giorno in days:
+        # Il cluster di partenza di un giorno è quello finale del precedente: non ripeterlo
+        inizio = 1 if sequenza and giorno['cluster_sequence'][:1] == sequenza[-1:] else 0
+        sequenza.extend(giorno['cluster_sequence'][inizio:])
+    costo = sum(g['cost'] for g in days)
+    costo = config.INFINITE_COST if costo >= config.INFINITE_COST else costo
+    return {
+        'days': days,
+        'colors': [c for g in days for c in g['colors']],
+        'cluster_sequence': sequenza,
+        'cost': costo,
+        'message': f"Pianificazione su {len(days)} giorni completata. Costo totale: {costo:.2f}.",
+    }
+
+# --- Ripartizione dei colori su N cabine ---
+# I colori di uno stesso cluster restano nella stessa cabina (un cluster diviso costerebbe
+# un cambio colore in più cabine). I cluster partono bilanciati sulle ore (CH; i colori
+# senza CH valgono la media) con LPT, poi una ricerca locale sposta o scambia cluster tra
+# cabine finché si riduce la somma dei costi di cambio senza superare il carico massimo.
+
+def _color_hours(batch: ColorBatch) -> np.ndarray:
+    """Ore di lavoro (CH) per riga; i colori senza CH valgono la media di quelli che lo hanno (1 se nessuno)."""
+    ore: List[Optional[float]] = []
+    for valore in batch.field('CH'):
+        try:
+            ore.append(float(valore) if valore is not None and float(valore) > 0 else None)
+        except (TypeError, ValueError):
+            ore.append(None)
+    note = [h for h in ore if h is not None]
+    media = sum(note) / len(note) if note else 1.0
+    return np.array([media if h is None else h for h in ore], dtype=float)
+
+
+def partition_cabins(batch: ColorBatch,
+                     cabin_count: int,
+                     cluster_dict: ClusterDict,
+                     cambio_colori: TransitionRuleDict,
+                     prioritized_reintegrations: Optional[List[str]] = None) -> Tuple[List[List[int]], List[float]]:
+    """
+    Assegna le righe del batch a cabin_count cabine. Restituisce (righe per cabina, ore per cabina).
+    Il costo di una cabina è quello del percorso tra i suoi cluster con la stessa partenza
+    che userebbe optimize_color_sequence (cluster con sequenza prioritaria).
+    """
+    batch.assign_clusters(cluster_dict)
+    ore = _color_hours(batch)
+    clusters = sorted({batch.clusters[cid] for cid in batch.cluster_ids.tolist() if cid != NO_CLUSTER})
+    peso = {c: float(ore[batch.cluster_ids == batch.cluster_id(c)].sum()) for c in clusters}
+    priorita = {c: (batch.cluster_sequence_priority(c), c) for c in clusters}
+    indice = {c: i for i, c in enumerate(clusters)}
+    matrix = _build_cost_matrix(clusters, batch, cambio_colori, prioritized_reintegrations) if clusters else None
+
+    costi_memo: Dict[frozenset, float] = {}
+
+    def costo_cabina(gruppo: frozenset) -> float:
+        if len(gruppo) <= 1:
+            return 0.0
+        if gruppo not in costi_memo:
+            nodi = [indice[c] for c in sorted(gruppo, key=priorita.get)]
+            sub = matrix[np.ix_(nodi, nodi)]
+            if len(clusters) <= min(config.DP_CACHE_UNIVERSE_MAX_NODES, config.HELD_KARP_MAX_NODES) and dp_cache.max_bytes > 0:
+                # Sottoinsieme della tabella su tutti i cluster con la stessa partenza
+                mask = sum(1 << k for k in nodi)
+                costo = float(dp_cache.table(matrix, nodi[0], clusters)[mask].min())
+            elif len(nodi) <= min(config.PARTITION_EXACT_MAX_CLUSTERS, config.HELD_KARP_MAX_NODES):
+                costo = float(_held_karp_table(sub, 0)[(1 << len(nodi)) - 1].min())
+            else:
+                greedy = _greedy_path(sub, 0)
+                costo = greedy[0] if greedy else config.INFINITE_COST
+            costi_memo[gruppo] = min(costo, config.INFINITE_COST)
+        return costi_memo[gruppo]
+
+    # Partenza LPT: cluster dal più pesante alla cabina meno carica
+    gruppi: List[Set[str]] = [set() for _ in range(cabin_count)]
+    carichi = [0.0] * cabin_count
+    for c in sorted(clusters, key=lambda c: (-peso[c], c)):
+        k = min(range(cabin_count), key=lambda k: (carichi[k], k))
+        gruppi[k].add(c)
+        carichi[k] += peso[c]
+    limite = max(sum(peso.values()) / cabin_count * (1 + config.PARTITION_BALANCE_TOLERANCE),
+                 max(peso.values(), default=0.0))
+
+    def valuta(candidati: List[Set[str]]) -> Tuple[int, float, float, float]:
+        """Chiave da minimizzare: prima rientrare nel carico massimo, poi costo, poi carico."""
+        carico = max(sum(peso[c] for c in g) for g in candidati)
+        costo = round(sum(costo_cabina(frozenset(g)) for g in candidati), 6)
+        fuori_limite = carico > limite + 1e-9
+        return int(fuori_limite), carico if fuori_limite else 0.0, costo, carico
+
+    migliore = valuta(gruppi)
+    print(f"[PARTITION] {len(clusters)} cluster su {cabin_count} cabine, carico massimo ammesso {limite:.2f} h; "
+          f"partenza LPT: costo {migliore[2]:.2f}, carico massimo {migliore[3]:.2f} h")
+    while True:
+        mossa = None
+        for a in range(cabin_count):
+            for c in gruppi[a]:
+                for b in range(cabin_count):
+                    if b == a:
+                        continue
+                    # Sposta c da a in b, oppure scambialo con un cluster d di b
+                    for d in [None] + sorted(gruppi[b]):
+                        candidati = [set(g) for g in gruppi]
+                        candidati[a].discard(c)
+                        candidati[b].add(c)
+                        if d is not None:
+                            candidati[b].discard(d)
+                            candidati[a].add(d)
+                        valore = valuta(candidati)
+                        if valore < (mossa or (migliore, None))[0]:
+                            mossa = (valore, candidati)
+        if mossa is None:
+            break
+        migliore, gruppi = mossa
+    print(f"[PARTITION] Dopo ricerca locale: costo {migliore[2]:.2f}, carico massimo {migliore[3]:.2f} h")
+
+    righe: List[List[int]] = [[] for _ in range(cabin_count)]
+    cabina_di = {c: k for k, g in enumerate(gruppi) for c in g}
+    carichi = [sum(peso[c] for c in g) for g in gruppi]
+    for i, cid in enumerate(batch.cluster_ids.tolist()):
+        if cid == NO_CLUSTER:
+            # Colori senza cluster: alla cabina meno carica
+            k = min(range(cabin_count), key=lambda k: (carichi[k], k))
+            carichi[k] += float(ore[i])
+        else:
+            k = cabina_di[batch.clusters[cid]]
+        righe[k].append(i)
+    return righe, carichi
+
+
+def optimize_cabin_partition(colori_input: Union[List[Dict[str, Any]], ColorBatch],
+                             cabin_count: Optional[int] = None,
+                             start_cluster_nome: Optional[str] = None,
+                             first_color: Optional[str] = None,
+                             prioritized_reintegrations: Optional[List[str]] = None,
+                             progress_callback: Optional[ProgressCallback] = None,
+                             max_workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Ripartisce i colori su cabin_count cabine (partition_cabins) e ottimizza le sequenze
+    delle cabine in parallelo (al più max_workers thread, default PARTITION_MAX_WORKERS)
+    con regole lette una sola volta. start_cluster_nome e
+    first_color valgono per la cabina che contiene quel cluster / colore.
+    Restituisce 'cabins' (cabin_id, colors, cluster_sequence, cost, message, hours, stats)
+    più costo totale e messaggio.
+    """
+    batch = colori_input if isinstance(colori_input, ColorBatch) else ColorBatch(colori_input)
+    cabin_count = max(1, cabin_count or config.CABIN_COUNT)
+    cluster_dict = database.get_cluster_colori()
+    cambio_colori = database.get_cambio_colori()
+    righe, ore = partition_cabins(batch, cabin_count, cluster_dict, cambio_colori, prioritized_reintegrations)
+
+    def solve(k: int) -> Dict[str, Any]:
+        cabin_id = k + 1
+        if not righe[k]:
+            return {'cabin_id': cabin_id, 'colors': [], 'cluster_sequence': [], 'cost': 0.0, 'hours': 0.0,
+                    'message': "Nessun colore assegnato alla cabina."}
+        cabina = batch.select(righe[k])
+        clusters = {batch.cluster(i) for i in righe[k]}
+        progress = None
+        if progress_callback is not None:
+            progress = lambda event: progress_callback({**event, "cabin_id": cabin_id})
+        with collect_solver_stats() as stats:
+            ordered, cluster_seq, cost, message = optimize_color_sequence(
+                cabina,
+                start_cluster_nome=start_cluster_nome if start_cluster_nome in clusters else None,
+                first_color=first_color if first_color in cabina.codes else None,
+                prioritized_reintegrations=prioritized_reintegrations,
+                progress_callback=progress,
+                cluster_dict=cluster_dict,
+                cambio_colori=cambio_colori,
+            )
+        return {'cabin_id': cabin_id, 'colors': ordered, 'cluster_sequence': cluster_seq, 'cost': cost,
+                'hours': round(ore[k], 4), 'message': message, 'stats': stats.to_dict()}
+
+    workers = max(1, min(max_workers or config.PARTITION_MAX_WORKERS, cabin_count))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        cabins = list(executor.map(metrics.with_request_context(profiling.in_worker(solve)), range(cabin_count)))
+    costo = sum(c['cost'] for c in cabins)
+    costo = config.INFINITE_COST if costo >= config.INFINITE_COST else costo
+    return {
+        'cabins': cabins,
+        'cost': costo,
+        'message': f"Colori ripartiti su {cabin_count} cabine. Costo totale: {costo:.2f}; ore per cabina: "
+                   + ", ".join(f"{c['hours']:.1f}" for c in cabins) + ".",
+    }
+
+# --- Ottimizzazione per linea di produzione ---
+# Linee diverse non condividono cabine: i colori sono raggruppati per 'line' e ogni linea
+# ha la sua sequenza, calcolata in parallelo con le stesse regole lette una volta.
+
+def optimize_by_line(colori_input: Union[List[Dict[str, Any]], ColorBatch],
+                     start_cluster_nome: Optional[str] = None,
+                     first_color: Optional[str] = None,
+                     prioritized_reintegrations: Optional[List[str]] = None,
+                     progress_callback: Optional[ProgressCallback] = None,
+                     max_workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Ottimizza separatamente i colori di ogni linea (i colori senza linea formano un gruppo
+    a parte, line None). start_cluster_nome e first_color valgono per le linee che contengono
+    quel cluster / colore.
+    Restituisce 'lines' (per linea: line, colors, cluster_sequence, cost, message, stats) più
+    costo totale e messaggio.
+    """
+    batch = colori_input if isinstance(colori_input, ColorBatch) else ColorBatch(colori_input)
+    cluster_dict = database.get_cluster_colori()
+    cambio_colori = database.get_cambio_colori()
+    batch.assign_clusters(cluster_dict)
+
+    linee: Dict[Optional[str], List[int]] = {}
+    for i, line in enumerate(batch.field('line')):
+        linee.setdefault(line or None, []).append(i)
+    nomi = sorted(linee, key=lambda line: (line is None, line or ""))
+    print(f"[LINES] {len(batch)} colori su {len(nomi)} linee: {nomi}")
+
+    def solve(line: Optional[str]) -> Dict[str, Any]:
+        colori = batch.select(linee[line])
+        clusters = {batch.cluster(i) for i in linee[line]}
+        progress = None
+        if progress_callback is not None:
+            progress = lambda event: progress_callback({**event, "line": line})
+        with collect_solver_stats() as stats:
+            ordered, cluster_seq, cost, message = optimize_color_sequence(
+                colori,
+                start_cluster_nome=start_cluster_nome if start_cluster_nome in clusters else None,
+                first_color=first_color if first_color in colori.codes else None,
+                prioritized_reintegrations=prioritized_reintegrations,
+                progress_callback=progress,
+                cluster_dict=cluster_dict,
+                cambio_colori=cambio_colori,
+            )
+        return {'line': line, 'colors': ordered, 'cluster_sequence': cluster_seq, 'cost': cost, 'message': message,
+                'stats': stats.to_dict()}
+
+    workers = max(1, min(max_workers or config.LINE_MAX_WORKERS, len(nomi)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        lines = list(executor.map(metrics.with_request_context(profiling.in_worker(solve)), nomi))
+    costo = sum(l['cost'] for l in lines)
+    costo = config.INFINITE_COST if costo >= config.INFINITE_COST else costo
+    return {
+        'lines': lines,
+        'cost': costo,
+        'message': f"Ottimizzazione per linea completata su {len(lines)} linee. Costo totale: {costo:.2f}.",
+    }
+
 # Funzioni helper per la gestione persistente dei dati delle cabine
 import json
 import os
@@ -1046,9 +1877,10 @@ def _ensure_cabin_data_dir():
     """Assicura che la directory per i dati delle cabine esista."""
     CABIN_DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-def get_colors_for_cabin(cabin_id: int) -> List[Dict[str, Any]]:
+def get_colors_for_cabin(cabin_id: int) -> List[CabinColor]:
     """
-    Recupera la lista colori salvata per una cabina specifica dal database.
+    Recupera la lista colori salvata per una cabina specifica dal database,
+    come record compatti CabinColor (accessibili anche come dizionari).
     """
     try:
         conn = database.connect_to_db()
@@ -1057,34 +1889,19 @@ def get_colors_for_cabin(cabin_id: int) -> List[Dict[str, Any]]:
             return []
             
         cursor = conn.cursor()
+        cursor.row_factory = CabinColor.row_factory  # Le righe arrivano già come record
         
         # Legge i colori dal database ordinati per sequence_order
-        cursor.execute("""
-            SELECT color_code, color_type, cluster, ch_value, lunghezza_ordine, 
-                   input_sequence, sequence_type, locked, sequence_order
+        cursor.execute(f"""
+            SELECT {CABIN_COLOR_SELECT}
             FROM optimization_colors 
             WHERE cabin_id = ? 
             ORDER BY sequence_order ASC
         """, (cabin_id,))
         
-        rows = cursor.fetchall()
+        colors = cursor.fetchall()
         conn.close()
         
-        colors = []
-        for row in rows:
-            color_dict = {
-                'color_code': row[0],
-                'color_type': row[1], 
-                'cluster': row[2],
-                'ch_value': row[3],
-                'lunghezza_ordine': row[4],
-                'input_sequence': row[5],
-                'sequence_type': row[6],
-                'locked': bool(row[7]) if row[7] is not None else False,
-                'sequence_order': row[8]
-            }
-            colors.append(color_dict)
-        
         print(f"[DB] Caricati {len(colors)} colori per cabina {cabin_id}")
         return colors
         
@@ -1092,9 +1909,10 @@ def get_colors_for_cabin(cabin_id: int) -> List[Dict[str, Any]]:
         print(f"Errore durante il caricamento dei colori della cabina {cabin_id}: {e}")
         return []
 
-def save_colors_for_cabin(cabin_id: int, colors: List[Dict[str, Any]]):
+def save_colors_for_cabin(cabin_id: int, colors: List[Union[CabinColor, Dict[str, Any]]]):
     """
-    Salva la lista colori per una cabina specifica nel database.
+    Salva la lista colori per una cabina specifica nel database
+    (record CabinColor o dizionari con le stesse chiavi).
     """
     try:
         conn = database.connect_to_db()
@@ -1107,25 +1925,24 @@ def save_colors_for_cabin(cabin_id: int, colors: List[Dict[str, Any]]):
         # Prima cancella tutti i colori esistenti per questa cabina
         cursor.execute("DELETE FROM optimization_colors WHERE cabin_id = ?", (cabin_id,))
         
-        # Inserisce i nuovi colori
-        for i, color in enumerate(colors):
-            cursor.execute("""
-                INSERT INTO optimization_colors 
-                (cabin_id, color_code, color_type, cluster, ch_value, lunghezza_ordine, 
-                 input_sequence, sequence_type, locked, sequence_order)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                cabin_id,
-                color.get('color_code', ''),
-                color.get('color_type', ''),
-                color.get('cluster', ''),
-                color.get('ch_value', ''),
-                color.get('lunghezza_ordine', ''),
-                color.get('input_sequence', ''),
-                color.get('sequence_type', ''),
-                color.get('locked', False),
-                color.get('sequence_order', i + 1)
-            ))
+        # Inserisce i nuovi colori (un solo executemany, righe generate senza liste intermedie)
+        cursor.executemany("""
+            INSERT INTO optimization_colors 
+            (cabin_id, color_code, color_type, cluster, ch_value, lunghezza_ordine, 
+             input_sequence, sequence_type, locked, sequence_order)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, ((
+            cabin_id,
+            color.get('color_code', ''),
+            color.get('color_type', ''),
+            color.get('cluster', ''),
+            color.get('ch_value', ''),
+            color.get('lunghezza_ordine', ''),
+            color.get('input_sequence', ''),
+            color.get('sequence_type', ''),
+            color.get('locked', False),
+            color.get('sequence_order', i + 1)
+        ) for i, color in enumerate(colors)))
         
         conn.commit()
         conn.close()
@@ -1136,10 +1953,11 @@ def save_colors_for_cabin(cabin_id: int, colors: List[Dict[str, Any]]):
         print(f"Errore durante il salvataggio dei colori della cabina {cabin_id}: {e}")
         raise
 
-def reorganize_colors_by_cluster_order(colors: List[Dict[str, Any]], cluster_order: List[str]) -> List[Dict[str, Any]]:
+def reorganize_colors_by_cluster_order(colors: List[Union[CabinColor, Dict[str, Any]]], cluster_order: List[str]) -> List[Union[CabinColor, Dict[str, Any]]]:
     """
     Riorganizza i colori secondo un ordine specifico dei cluster.
     I colori vengono raggruppati per cluster secondo l'ordine specificato.
+    Lavora sugli stessi oggetti (record CabinColor o dizionari) senza copiarli.
     """
     try:
         print(f"[LOGIC] Riorganizzazione {len(colors)} colori secondo ordine cluster: {cluster_order}")
@@ -1202,14 +2020,264 @@ def reorganize_colors_by_cluster_order(colors: List[Dict[str, Any]], cluster_ord
     except Exception as e:
         print(f"Errore durante riorganizzazione colori per cluster: {e}")
         raise
-def optimize_with_locked_colors(colors: List[Dict[str, Any]], cluster_sequence: List[str] = None) -> Dict[str, Any]:
+# --- Ottimizzazione a segmenti tra colori bloccati ---
+# I colori bloccati dividono il piano in finestre libere indipendenti: ogni finestra
+# è risolta con Held-Karp partendo dal cluster del colore bloccato che la precede e
+# arrivando al cluster di quello che la segue, e le finestre sono risolte in parallelo.
+
+class _FreeWindow:
+    """Posizioni [start, end) di colori liberi consecutivi e indici dei bloccati ai lati (None ai bordi del piano)."""
+
+    def __init__(self, start: int, end: int, left_anchor: Optional[int], right_anchor: Optional[int]):
+        self.start = start
+        self.end = end
+        self.left_anchor = left_anchor
+        self.right_anchor = right_anchor
+
+
+def _split_free_windows(colors: List[Dict[str, Any]]) -> List[_FreeWindow]:
+    windows: List[_FreeWindow] = []
+    previous_locked: Optional[int] = None
+    start: Optional[int] = None
+    for i, color in enumerate(colors):
+        if color.get('locked', False):
+            if start is not None:
+                windows.append(_FreeWindow(start, i, previous_locked, i))
+                start = None
+            previous_locked = i
+        elif start is None:
+            start = i
+    if start is not None:
+        windows.append(_FreeWindow(start, len(colors), previous_locked, None))
+    return windows
+
+
+def _solve_free_window(colors: List[Dict[str, Any]],
+                       window: _FreeWindow,
+                       cluster_dict: ClusterDict,
+                       cambio_colori: TransitionRuleDict,
+                       prioritized_reintegrations: Optional[List[str]] = None
+                       ) -> Tuple[List[Dict[str, Any]], List[str], float]:
+    """
+    Ordina i colori liberi di una finestra. I bloccati ai lati entrano nella matrice costi
+    (la transizione verso il bloccato successivo dipende anche dai suoi tipi) ma non
+    nell'ordinamento. Restituisce (colori liberi ordinati, tour cluster con gli estremi, costo).
+    """
+    anchors = [a for a in (window.left_anchor, window.right_anchor) if a is not None]
+    free_colors = colors[window.start:window.end]
+    batch = ColorBatch([colors[a] for a in anchors] + free_colors)
+    batch.assign_clusters(cluster_dict)
+
+    def anchor_cluster(position: Optional[int]) -> Optional[str]:
+        if position is None:
+            return None
+        # Codice non mappato: vale il cluster salvato sul colore bloccato (cluster vuoto nella matrice)
+        return batch.cluster(anchors.index(position)) or colors[position].get('cluster') or None
+
+    start_cluster = anchor_cluster(window.left_anchor)
+    end_cluster = anchor_cluster(window.right_anchor)
+
+    clusters = {batch.cluster(i) for i in range(len(batch))} - {None}
+    clusters.update(c for c in (start_cluster, end_cluster) if c)
+    matrix_clusters = sorted(clusters, key=lambda c: (batch.cluster_sequence_priority(c), c))
+
+    free_batch = ColorBatch(free_colors)
+    free_batch.assign_clusters(cluster_dict)
+    tour_clusters: List[str] = []
+    cost = 0.0
+    if matrix_clusters:
+        cost_matrix = _build_cost_matrix(matrix_clusters, batch, cambio_colori, prioritized_reintegrations)
+        start_node = matrix_clusters.index(start_cluster) if start_cluster else None
+        end_node = matrix_clusters.index(end_cluster) if end_cluster else None
+        paths = _find_best_path_and_reconstruct(cost_matrix, start_node, end_node_index=end_node, top_n=1,
+                                                node_labels=matrix_clusters)
+        if not paths and end_node is not None:
+            print(f"[SEGMENTS] Finestra {window.start}-{window.end}: nessun percorso fino a '{end_cluster}', arrivo libero.")
+            paths = _find_best_path_and_reconstruct(cost_matrix, start_node, top_n=1, node_labels=matrix_clusters)
+        if not paths:
+            print(f"[SEGMENTS] Finestra {window.start}-{window.end}: nessun percorso valido, raggruppamento per cluster.")
+            tour_clusters = matrix_clusters
+            cost = config.INFINITE_COST
+        else:
+            cost, tour = paths[0]
+            tour_clusters = [matrix_clusters[i] for i in tour]
+
+    rows = _ordered_rows(tour_clusters, free_batch)
+    # Colori esclusi dall'ordinamento (codice senza cluster, code+type duplicato): restano
+    # in coda alla finestra nell'ordine di input, il piano non perde colori
+    emitted = set(rows)
+    rows.extend(i for i in range(len(free_batch)) if i not in emitted)
+    print(f"[SEGMENTS] Finestra {window.start}-{window.end} ({len(free_colors)} colori, {len(anchors)} bloccati ai lati): "
+          f"{' -> '.join(tour_clusters)} (costo {cost:.2f})")
+    return free_batch.to_dicts(rows), tour_clusters, cost
+
+
+def optimize_locked_segments(colors: List[Dict[str, Any]],
+                             prioritized_reintegrations: Optional[List[str]] = None,
+                             max_workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Ottimizza un piano con colori bloccati risolvendo separatamente le finestre libere tra
+    un bloccato e il successivo, con cluster di partenza e di arrivo fissati dai bloccati.
+    I bloccati restano nella loro posizione; i colori liberi di ogni finestra restano nella
+    finestra e ricevono 'position'. 'cluster_sequence' è la sequenza cluster dell'intero piano.
+    """
+    windows = _split_free_windows(colors)
+    cluster_dict = database.get_cluster_colori()
+    cambio_colori = database.get_cambio_colori()
+    if not cluster_dict or not cambio_colori:
+        raise ValueError("Impossibile caricare dati cluster o transizioni dal DB.")
+
+    def solve(window: _FreeWindow):
+        return _solve_free_window(colors, window, cluster_dict, cambio_colori, prioritized_reintegrations)
+
+    workers = min(max_workers or config.LOCKED_SEGMENTS_MAX_WORKERS, len(windows))
+    print(f"[SEGMENTS] {len(windows)} finestre libere tra {sum(1 for c in colors if c.get('locked', False))} colori bloccati ({max(workers, 1)} thread)")
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="locked-segment") as executor:
+            solved = list(executor.map(metrics.with_request_context(profiling.in_worker(solve)), windows))
+    else:
+        solved = [solve(window) for window in windows]
+
+    final_colors = list(colors)
+    total_cost = 0.0
+    tours: Dict[int, List[str]] = {}
+    for window, (ordered_free, tour, cost) in zip(windows, solved):
+        for offset, color in enumerate(ordered_free):
+            color['position'] = window.start + offset
+            final_colors[window.start + offset] = color
+        tours[window.start] = tour
+        if cost >= config.INFINITE_COST or total_cost >= config.INFINITE_COST:
+            total_cost = config.INFINITE_COST
+        else:
+            total_cost += cost
+
+    # Sequenza cluster del piano risultante (cluster consecutivi uguali compressi)
+    cluster_sequence: List[str] = []
+    ends = {window.start: window.end for window in windows}
+    position = 0
+    while position < len(colors):
+        if position in tours:
+            segment = tours[position]
+            position = ends[position]
+        else:
+            segment = [colors[position].get('cluster')]
+            position += 1
+        for cluster in segment:
+            if cluster and (not cluster_sequence or cluster_sequence[-1] != cluster):
+                cluster_sequence.append(cluster)
+
+    return {
+        'colors': final_colors,
+        'cluster_sequence': cluster_sequence,
+        'cost': total_cost,
+        'message': f'{len(windows)} segmenti liberi ottimizzati tra i colori bloccati. Costo totale: {total_cost:.2f}.'
+    }
+
+def _plan_costs(plans: List[List[Dict[str, Any]]],
+                cluster_dict: ClusterDict,
+                cambio_colori: TransitionRuleDict,
+                prioritized_reintegrations: Optional[List[str]] = None) -> List[float]:
+    """
+    Costo di transizione di uno o più ordinamenti degli stessi colori: somma dei costi tra
+    cluster consecutivi diversi (i colori senza cluster non interrompono la sequenza),
+    con un'unica matrice costi costruita sui colori del piano. Ogni transizione vietata
+    conta INFINITE_COST senza saturare il totale, così la variazione resta confrontabile
+    anche per un piano che (dopo uno spostamento manuale) ne contiene.
+    """
+    batch = ColorBatch(plans[0])
+    _, clusters, _ = batch.assign_clusters(cluster_dict)
+    if not clusters:
+        return [0.0 for _ in plans]
+    cost_matrix = _build_cost_matrix(clusters, batch, cambio_colori, prioritized_reintegrations)
+    index = {cluster: i for i, cluster in enumerate(clusters)}
+    cluster_of = {code: cluster for cluster, codes in cluster_dict.items() for code in codes}
+    costs = []
+    for plan in plans:
+        sequence = [index[cluster_of[c.get('code')]] for c in plan if c.get('code') in cluster_of]
+        sequence = [node for k, node in enumerate(sequence) if k == 0 or node != sequence[k - 1]]
+        costs.append(float(sum(cost_matrix[a, b] for a, b in zip(sequence, sequence[1:]))))
+    return costs
+
+
+def repair_after_move(colors: List[Dict[str, Any]],
+                      moved_from: int,
+                      moved_to: int,
+                      radius: Optional[int] = None,
+                      prioritized_reintegrations: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Riparazione locale dopo uno spostamento manuale (drag & drop). `colors` è il piano DOPO
+    lo spostamento del colore da moved_from a moved_to. Il colore spostato resta dove
+    l'operatore l'ha messo e, come i colori bloccati e tutto il resto del piano, fa da
+    estremo fisso: vengono riottimizzate solo le finestre di `radius` posizioni intorno
+    al punto di inserimento e al punto da cui il colore è stato tolto (optimize_locked_segments).
+    Restituisce il piano riparato, 'order' (indici in `colors` del piano riparato), le
+    finestre riottimizzate e i costi prima dello spostamento, dopo lo spostamento e dopo
+    la riparazione ('cost_delta' = riparato - prima dello spostamento).
+    """
+    n = len(colors)
+    if not 0 <= moved_from < n or not 0 <= moved_to < n:
+        raise ValueError(f"Spostamento non valido: {moved_from} -> {moved_to} su {n} colori")
+    radius = config.LOCAL_REPAIR_RADIUS if radius is None else max(radius, 0)
+
+    # Il buco lasciato dal colore spostato è tra le posizioni moved_from - 1 e moved_from
+    # (spostamento in avanti) o tra moved_from e moved_from + 1 (spostamento indietro)
+    hole = moved_from if moved_from < moved_to else moved_from + 1
+    repair_positions: Set[int] = set()
+    for low, high in ((hole - radius, hole + radius - 1), (moved_to - radius, moved_to + radius)):
+        repair_positions.update(range(max(low, 0), min(high, n - 1) + 1))
+    repair_positions.discard(moved_to)
+
+    # Copie di lavoro: fuori dalle finestre tutti i colori diventano estremi bloccati
+    working = []
+    for i, color in enumerate(colors):
+        copy = dict(color)
+        copy['plan_index'] = i
+        copy['locked'] = bool(color.get('locked', False)) or i not in repair_positions
+        working.append(copy)
+    windows = [[w.start, w.end] for w in _split_free_windows(working)]
+    repaired = optimize_locked_segments(working, prioritized_reintegrations) \
+        if any(not c['locked'] for c in working) else {'colors': working}
+
+    order = []
+    result_colors = []
+    for position, color in enumerate(repaired['colors']):
+        original_index = color.pop('plan_index')
+        color['locked'] = bool(colors[original_index].get('locked', False))
+        color['position'] = position
+        order.append(original_index)
+        result_colors.append(color)
+
+    before_move = list(colors)
+    before_move.insert(moved_from, before_move.pop(moved_to))
+    cost_before, cost_after_move, cost_after_repair = _plan_costs(
+        [before_move, colors, result_colors], database.get_cluster_colori(), database.get_cambio_colori(),
+        prioritized_reintegrations)
+    print(f"[REPAIR] Spostamento {moved_from} -> {moved_to}: finestre {windows}, costo "
+          f"{cost_before:.2f} -> {cost_after_move:.2f} (spostato) -> {cost_after_repair:.2f} (riparato)")
+    return {
+        'colors': result_colors,
+        'order': order,
+        'windows': windows,
+        'cost_before_move': cost_before,
+        'cost_after_move': cost_after_move,
+        'cost_after_repair': cost_after_repair,
+        'cost_delta': cost_after_repair - cost_before,
+        'message': f"Riottimizzate {len(repair_positions)} posizioni intorno allo spostamento "
+                   f"({len(windows)} finestre). Variazione costo: {cost_after_repair - cost_before:+.2f}."
+    }
+
+
+def optimize_with_locked_colors(colors: List[Dict[str, Any]], cluster_sequence: List[str] = None,
+                                prioritized_reintegrations: Optional[List[str]] = None) -> Dict[str, Any]:
     """
     Ottimizza la sequenza colori rispettando i colori bloccati.
-    I colori bloccati mantengono la loro posizione, quelli non bloccati vengono riordinati.
+    I colori bloccati mantengono la loro posizione; i colori liberi tra due bloccati
+    vengono ottimizzati nella loro finestra, dal cluster del bloccato precedente a
+    quello del successivo (vedi optimize_locked_segments). I reintegri prioritari
+    entrano nella matrice dei costi come in optimize_color_sequence.
     """
     try:
-        # Separa colori bloccati da quelli liberi
-        locked_colors = [c for c in colors if c.get('locked', False)]
+        locked_count = sum(1 for c in colors if c.get('locked', False))
         free_colors = [c for c in colors if not c.get('locked', False)]
         
         # Se non ci sono colori liberi, restituisci la sequenza attuale
@@ -1221,100 +2289,80 @@ def optimize_with_locked_colors(colors: List[Dict[str, Any]], cluster_sequence:
                 'message': 'Tutti i colori sono bloccati - nessuna ottimizzazione eseguita'
             }
         
-        # Determina il cluster di partenza dall'ultimo colore bloccato
-        starting_cluster = None
-        if locked_colors:
-            # Trova l'ultimo colore bloccato nella sequenza originale
-            last_locked_index = -1
-            last_locked_color = None
-            
-            for i, color in enumerate(colors):
-                if color.get('locked', False):
-                    if i > last_locked_index:
-                        last_locked_index = i
-                        last_locked_color = color
-            
-            if last_locked_color:
-                starting_cluster = last_locked_color.get('cluster')
-                print(f"[OPTIMIZE] Cluster di partenza determinato dall'ultimo colore bloccato (pos {last_locked_index + 1}): {starting_cluster}")
-        
-        # Se c'è un cluster di partenza, riordina i colori liberi per iniziare con quelli dello stesso cluster
-        if starting_cluster:
-            same_cluster_colors = [c for c in free_colors if c.get('cluster') == starting_cluster]
-            other_colors = [c for c in free_colors if c.get('cluster') != starting_cluster]
-            
-            print(f"[OPTIMIZE] Colori liberi stesso cluster ({starting_cluster}): {len(same_cluster_colors)}")
-            print(f"[OPTIMIZE] Altri colori liberi: {len(other_colors)}")
-            
-            # Riordina: prima i colori dello stesso cluster, poi gli altri
-            free_colors_ordered = same_cluster_colors + other_colors
-        else:
-            free_colors_ordered = free_colors
-        
-        # Ottimizza i colori liberi con informazione del cluster di partenza
-        if starting_cluster:
-            # Forza l'ottimizzazione a partire dal cluster determinato
+        if not locked_count:
+            # Nessun blocco: ottimizzazione normale dell'intero piano
             optimized_free, cluster_seq, cost, message = optimize_color_sequence(
-                free_colors_ordered, start_cluster_nome=starting_cluster
-            )
-        else:
-            # Ottimizzazione normale
-            optimized_free, cluster_seq, cost, message = optimize_color_sequence(free_colors_ordered)
-        
-        # Ricostruisci la sequenza finale rispettando le posizioni bloccate
-        final_colors = []
-        free_index = 0
-        
-        for i, original_color in enumerate(colors):
-            if original_color.get('locked', False):
-                # Mantieni il colore bloccato nella sua posizione
-                final_colors.append(original_color)
-            else:
-                # Inserisci il prossimo colore ottimizzato
-                if free_index < len(optimized_free):
-                    optimized_color = optimized_free[free_index].copy()
-                    optimized_color['position'] = i
-                    final_colors.append(optimized_color)
-                    free_index += 1
+                free_colors, prioritized_reintegrations=prioritized_reintegrations)
+            # optimize_color_sequence restituisce già copie: nessuna copia ulteriore
+            for i, optimized_color in enumerate(optimized_free):
+                optimized_color['position'] = i
+            return {
+                'colors': optimized_free,
+                'cluster_sequence': cluster_seq,
+                'cost': cost,
+                'message': f'Ottimizzazione completata con 0 colori bloccati. {message}'
+            }
         
-        return {
-            'colors': final_colors,
-            'cluster_sequence': cluster_seq,
-            'cost': cost,
-            'message': f'Ottimizzazione completata con {len(locked_colors)} colori bloccati. {message}'
-        }
+        result = optimize_locked_segments(colors, prioritized_reintegrations)
+        result['message'] = f"Ottimizzazione completata con {locked_count} colori bloccati. {result['message']}"
+        return result
     
     except Exception as e:
         print(f"Errore durante l'ottimizzazione con colori bloccati: {e}")
         raise
 
-def optimize_with_partial_cluster_order(colors: List[Dict[str, Any]], cluster_locks: Dict[str, bool] = None) -> Dict[str, Any]:
+def _partial_order_precedences(partial_cluster_order: List[Dict[str, Any]],
+                               all_clusters: List[str]) -> List[Tuple[str, str]]:
     """
-    Ottimizza la sequenza colori considerando i cluster bloccati.
-    Quando un cluster è bloccato, tutti i suoi colori vengono automaticamente bloccati.
+    Traduce l'ordine parziale dei cluster (voci {cluster, position, locked}) in coppie (prima, dopo):
+    - i cluster bloccati mantengono tra loro l'ordine delle posizioni;
+    - i bloccati in testa (posizioni iniziali consecutive tutte bloccate) restano esattamente
+      in testa: ogni altro cluster viene dopo di loro.
+    Le coppie sono esplicite (non solo tra voci consecutive), così un cluster bloccato
+    senza colori oggi non interrompe la catena.
     """
-    try:
-        cluster_locks = cluster_locks or {}
-        
-        # Applica il blocco automatico ai colori dei cluster bloccati
-        updated_colors = []
-        for color in colors:
-            color_copy = color.copy()
-            cluster_name = color_copy.get('cluster', '')
-            
-            # Se il cluster è bloccato, blocca automaticamente tutti i suoi colori
-            if cluster_locks.get(cluster_name, False):
-                color_copy['locked'] = True
-                color_copy['cluster_locked'] = True
-            
-            updated_colors.append(color_copy)
-        
-        # Usa la funzione di ottimizzazione con colori bloccati
-        return optimize_with_locked_colors(updated_colors)
-    
-    except Exception as e:
-        print(f"Errore durante l'ottimizzazione con cluster parzialmente bloccati: {e}")
-        raise
+    voci = sorted((v for v in partial_cluster_order or [] if v.get('cluster')),
+                  key=lambda v: v.get('position', 0))
+    bloccati = [v['cluster'] for v in voci if v.get('locked')]
+    testa: List[str] = []
+    for voce in voci:
+        if not voce.get('locked'):
+            break
+        testa.append(voce['cluster'])
+
+    precedenze = [(prima, dopo) for i, prima in enumerate(bloccati) for dopo in bloccati[i + 1:]]
+    precedenze += [(prima, dopo) for prima in testa for dopo in all_clusters if dopo not in testa]
+    return precedenze
+
+
+def optimize_with_partial_cluster_order(colori_giorno_input: List[Dict[str, Any]],
+                                        partial_cluster_order: Optional[List[Dict[str, Any]]] = None,
+                                        cabin_id: Optional[int] = None,
+                                        prioritized_reintegrations: Optional[List[str]] = None
+                                       ) -> Tuple[List[Dict[str, Any]], List[str], float, str]:
+    """
+    Ottimizza la sequenza rispettando l'ordine parziale dei cluster scelto dall'operatore.
+    I cluster bloccati diventano vincoli di precedenza dentro la DP Held-Karp (vedi
+    _partial_order_precedences), i cluster liberi e quelli nuovi vengono ottimizzati
+    intorno a loro. Restituisce la stessa tupla di optimize_color_sequence.
+    """
+    cluster_dict = database.get_cluster_colori()
+    precedenze = _partial_order_precedences(partial_cluster_order, list(cluster_dict or {}))
+    bloccati = [v['cluster'] for v in partial_cluster_order or [] if v.get('locked')]
+    print(f"[PARTIAL ORDER] Cabina {cabin_id}: {len(colori_giorno_input)} colori, cluster bloccati {bloccati}, "
+          f"{len(precedenze)} vincoli di precedenza")
+
+    ordered, cluster_seq, cost, message = optimize_color_sequence(
+        colori_giorno_input,
+        prioritized_reintegrations=prioritized_reintegrations,
+        cluster_precedences=precedenze,
+        # L'ordine mostrato all'operatore è il piano attuale: soluzione iniziale del solver
+        warm_start_sequence=[v['cluster'] for v in sorted(partial_cluster_order or [], key=lambda v: v.get('position', 0))
+                             if v.get('cluster')],
+    )
+    if bloccati:
+        message = f"Ordine parziale: {len(bloccati)} cluster bloccati ({', '.join(bloccati)}). {message}"
+    return ordered, cluster_seq, cost, message
 
 def update_color_positions(colors: List[Dict[str, Any]], new_positions: List[int]) -> List[Dict[str, Any]]:
     """
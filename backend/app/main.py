@@ -1,20 +1,33 @@
 # backend/app/main.py
 """FastAPI application for color sequence optimization."""
 
-from fastapi import FastAPI, HTTPException, Body, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Body, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict, Any, Optional, Union # Assicurati che Optional e Union siano importati
+from starlette.concurrency import run_in_threadpool
+from typing import List, Dict, Any, Optional, Union, Callable # Assicurati che Optional e Union siano importati
 import traceback # Per logging errori dettagliato
 import json
+import asyncio
+import tempfile
+import time
 
 # Importa modelli e logica
 # Assicurati che i percorsi siano corretti per la tua struttura
 from app.models import OptimizationRequest, OptimizationResponse, ColorInput, OptimizedColorOutput, CabinOptimizationResponse
 from app.logic import optimize_color_sequence
+from app.color_batch import ColorBatch
+from app.cabin_records import CabinColor
 from app.config import INFINITE_COST
+from app import config
 from app import logic
 from app import database
+from app import jobs
+from app import serialization
+from app import singleflight
+from app import ingest
+from app import metrics
+from app import profiling
 
 app = FastAPI(
     title="Color Sequence Optimizer API",
@@ -31,6 +44,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Coalescing delle ottimizzazioni identiche in corso (stesso payload e stesse regole)
+optimization_flights = singleflight.SingleFlight("Optimize")
+
+# Durata di ogni richiesta (istogramma per route) e delle sue fasi (header Server-Timing)
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    timings, token = metrics.begin_request()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        route = getattr(request.scope.get("route"), "path", "non_trovata")  # Template (/api/cabin/{cabin_id}/...)
+        metrics.REQUEST_SECONDS.observe(elapsed, request.method, route, str(status))
+        metrics.end_request(token)
+    if config.SERVER_TIMING_ENABLED:
+        response.headers["Server-Timing"] = timings.server_timing(elapsed)
+    return response
+
 # Add validation error handler
 @app.exception_handler(422)
 async def validation_exception_handler(request: Request, exc):
@@ -62,12 +96,15 @@ async def validation_exception_handler(request: Request, exc):
           response_model=Union[OptimizationResponse, CabinOptimizationResponse],
           summary="Ottimizza la sequenza dei colori",
           description="Riceve una lista di colori da produrre e restituisce la sequenza ottimizzata. Può includere reintegri prioritari e ottimizzazione per cabine.")
-async def optimize_sequence(request: Request, request_data: OptimizationRequest = Body(...)):
+async def optimize_sequence(request: Request, request_data: OptimizationRequest = Body(...),
+                            profile: Optional[str] = None):
     """
     Endpoint principale per l'ottimizzazione.
     Riceve la lista colori, il cluster iniziale opzionale e la lista
     opzionale dei codici dei reintegri da prioritizzare.
+    Con ?profile=cpu|mem (se PROFILING_ENABLED) la richiesta viene profilata.
     """
+    profile_mode = _profile_mode(profile)
     print("=" * 80)
     print("DETTAGLI RICHIESTA RICEVUTA:")
     
@@ -127,210 +164,603 @@ async def optimize_sequence(request: Request, request_data: OptimizationRequest
     print("=" * 80)
 
 
-    # Converti Pydantic model in dict per la funzione logica
-    # Usa .dict() o .model_dump() a seconda della versione di Pydantic
+    batch = ColorBatch.from_request(request_data)
+    # La versione delle regole può richiedere una lettura del DB: fuori dall'event loop
+    key = await run_in_threadpool(_optimization_key, request_data)
+
+    try:
+        if profile_mode:
+            # Richiesta profilata: senza coalescing, il profilo misura proprio questo calcolo
+            result, profile_id = await run_in_threadpool(
+                profiling.profile_call, profile_mode, "optimize", _request_payload(request_data),
+                _run_optimization, request_data, batch)
+            return serialization.fast_response(result, request, headers={"X-Optimization-Coalesced": "0",
+                                                                         "X-Profile-Id": profile_id})
+        # Il calcolo gira nel threadpool: richieste identiche concorrenti condividono lo stesso
+        result, shared = await optimization_flights.do(
+            key, lambda: run_in_threadpool(_run_optimization, request_data, batch)
+        )
+        return serialization.fast_response(result, request, headers={"X-Optimization-Coalesced": "1" if shared else "0"})
+    except HTTPException:
+         raise # Rilancia le eccezioni HTTP già gestite (raro qui)
+    except profiling.ProfilingError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        # Log dettagliato dell'errore inatteso nel backend
+        print("="*30 + " ERRORE INATTESO IN API /optimize " + "="*30)
+        print(f"Errore durante l'ottimizzazione: {e}")
+        # Stampa lo stack trace completo nei log del backend per debug
+        traceback.print_exc()
+        print("="*80)
+        # Restituisce un errore generico 500 al client
+        raise HTTPException(
+            status_code=500,
+            detail=f"Errore interno del server durante l'ottimizzazione. Controlla i log del backend per dettagli."
+        )
+
+
+def _request_payload(request_data: OptimizationRequest) -> Dict[str, Any]:
     try:
-        # Per Pydantic v1.x
-        # colori_input_dict = [color.dict() for color in request_data.colors_today]
-        # Per Pydantic v2.x
-        colori_input_dict = [color.model_dump() for color in request_data.colors_today]
+        return request_data.model_dump()
     except AttributeError:
-         # Fallback se uno dei due metodi non esiste
-         try:
-              colori_input_dict = [color.dict() for color in request_data.colors_today]
-         except AttributeError:
-              print("Errore: Impossibile convertire modelli Pydantic in dizionari.")
-              raise HTTPException(status_code=500, detail="Errore interno nella conversione dei dati di input.")
+        return request_data.dict()
 
 
+def _optimization_key(request_data: OptimizationRequest) -> str:
+    """Chiave di coalescing: payload canonico della richiesta + versione delle regole nel DB."""
+    return singleflight.request_key(_request_payload(request_data), database.get_rules_version())
+
+
+def _profile_mode(profile: Optional[str]) -> Optional[str]:
+    """Valida ?profile: 403 se la profilazione non è attiva nella configurazione, 400 se sconosciuta."""
+    if profile is None:
+        return None
+    if not config.PROFILING_ENABLED:
+        raise HTTPException(status_code=403, detail="Profilazione disattivata (PROFILING_ENABLED=0)")
     try:
-        # Verifica se ci sono colori con lunghezza_ordine per usare la logica delle cabine
-        has_cabin_info = any(color.get('lunghezza_ordine') for color in colori_input_dict)
+        return profiling.check_mode(profile)
+    except profiling.ProfilingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def _call_profiled(profile_mode: Optional[str], endpoint: str, payload: Any, response: Response,
+                         func: Callable[..., Any], *args) -> Any:
+    """
+    func(*args) nel threadpool (un calcolo lungo non blocca l'event loop), profilata se
+    richiesto; l'id del profilo va nell'header X-Profile-Id.
+    """
+    if not profile_mode:
+        return await run_in_threadpool(func, *args)
+    result, profile_id = await run_in_threadpool(profiling.profile_call, profile_mode, endpoint, payload, func, *args)
+    response.headers["X-Profile-Id"] = profile_id
+    return result
+
+
+def _scoped_progress(progress_callback: Optional[logic.ProgressCallback], scope: str) -> Optional[logic.ProgressCallback]:
+    """Aggiunge agli eventi di avanzamento l'indicazione della cabina/sequenza a cui si riferiscono."""
+    if progress_callback is None:
+        return None
+    def callback(event: Dict[str, Any]) -> None:
+        progress_callback({**event, "scope": scope})
+    return callback
+
+
+def _run_cabin_partition(request_data: OptimizationRequest,
+                         batch: ColorBatch,
+                         progress_callback: Optional[logic.ProgressCallback] = None
+                        ) -> Dict[str, Any]:
+    """
+    Modalità "cabine" di /optimize: ripartisce i colori su cabin_count cabine bilanciando
+    le ore CH e ottimizza le cabine in parallelo. Ogni cabina viene salvata nel DB.
+    """
+    result = logic.optimize_cabin_partition(
+        batch,
+        cabin_count=request_data.cabin_count,
+        start_cluster_nome=request_data.start_cluster_name,
+        first_color=request_data.first_color,
+        prioritized_reintegrations=request_data.prioritized_reintegrations,
+        progress_callback=progress_callback,
+    )
+    cabine = []
+    for cabina in result['cabins']:
+        database.save_optimization_results(cabina['colors'], cabin_id=cabina['cabin_id'])
+        cabine.append({
+            "cabin_id": cabina['cabin_id'],
+            "ordered_colors": serialization.color_output_records(cabina['colors']),
+            "optimal_cluster_sequence": cabina['cluster_sequence'],
+            "calculated_cost": _format_cost(cabina['cost']),
+            "hours": cabina['hours'],
+            "message": cabina['message'],
+            "stats": cabina['stats'],
+        })
+    print(f"[API] Invio risposta multi-cabina: {[len(c['ordered_colors']) for c in cabine]} colori per cabina")
+    return {
+        "cabine": cabine,
+        "calculated_cost": _format_cost(result['cost']),
+        "message": result['message'],
+    }
+
+
+def _run_line_partition(request_data: OptimizationRequest,
+                        batch: ColorBatch,
+                        progress_callback: Optional[logic.ProgressCallback] = None
+                       ) -> Dict[str, Any]:
+    """
+    Modalità "linee" di /optimize: una sequenza per linea di produzione (campo line),
+    calcolate in parallelo. Le linee non corrispondono alle cabine: il piano non viene salvato.
+    """
+    result = logic.optimize_by_line(
+        batch,
+        start_cluster_nome=request_data.start_cluster_name,
+        first_color=request_data.first_color,
+        prioritized_reintegrations=request_data.prioritized_reintegrations,
+        progress_callback=progress_callback,
+    )
+    print(f"[API] Invio risposta per linea: {[(l['line'], len(l['colors'])) for l in result['lines']]}")
+    return {
+        "linee": [{
+            "line": linea['line'],
+            "ordered_colors": serialization.color_output_records(linea['colors']),
+            "optimal_cluster_sequence": linea['cluster_sequence'],
+            "calculated_cost": _format_cost(linea['cost']),
+            "message": linea['message'],
+            "stats": linea['stats'],
+        } for linea in result['lines']],
+        "calculated_cost": _format_cost(result['cost']),
+        "message": result['message'],
+    }
+
+
+def _run_optimization(request_data: OptimizationRequest,
+                      batch: ColorBatch,
+                      progress_callback: Optional[logic.ProgressCallback] = None
+                     ) -> Dict[str, Any]:
+    """
+    Esegue l'ottimizzazione di /optimize (con separazione cabine se presente
+    lunghezza_ordine). Condivisa dall'endpoint sincrono e dai job in background.
+    Restituisce direttamente il dizionario della risposta (stessa forma di
+    OptimizationResponse / CabinOptimizationResponse) senza un modello per riga,
+    con le statistiche del solver di tutta la richiesta in "stats".
+    I colori arrivano come ColorBatch costruito una volta dalla richiesta.
+    """
+    with logic.collect_solver_stats() as stats:
+        response_data = _optimize_request(request_data, batch, progress_callback)
+    response_data["stats"] = stats.to_dict()
+    return response_data
+
+
+def _optimize_request(request_data: OptimizationRequest,
+                      batch: ColorBatch,
+                      progress_callback: Optional[logic.ProgressCallback] = None
+                     ) -> Dict[str, Any]:
+    if request_data.mode == config.OPTIMIZATION_MODE_CABINS:
+        return _run_cabin_partition(request_data, batch, progress_callback)
+    if request_data.mode == config.OPTIMIZATION_MODE_LINES:
+        return _run_line_partition(request_data, batch, progress_callback)
+
+    # Verifica se ci sono colori con lunghezza_ordine per usare la logica delle cabine
+    has_cabin_info = any(batch.field('lunghezza_ordine'))
+    
+    if has_cabin_info:
+        print("Rilevata informazione lunghezza_ordine, utilizzo della logica con separazione cabine...")
         
-        if has_cabin_info:
-            print("Rilevata informazione lunghezza_ordine, utilizzo della logica con separazione cabine...")
-            
-            # Separa i colori per cabina basandosi su lunghezza_ordine
-            colori_cabin1 = [c for c in colori_input_dict if c.get('lunghezza_ordine') == 'corto']
-            colori_cabin2 = [c for c in colori_input_dict if c.get('lunghezza_ordine') == 'lungo']
-            
-            print(f"Separazione cabine: Cabin1 (corto)={len(colori_cabin1)}, Cabin2 (lungo)={len(colori_cabin2)}")
-            
-            result_cabin1 = None
-            result_cabin2 = None
-            
-            # Ottimizza Cabina 1 se ci sono colori
-            if colori_cabin1:
-                print("Ottimizzando Cabina 1 (corto)...")
+        # Separa i colori per cabina basandosi su lunghezza_ordine
+        colori_cabin1 = batch.where('lunghezza_ordine', 'corto')
+        colori_cabin2 = batch.where('lunghezza_ordine', 'lungo')
+        
+        print(f"Separazione cabine: Cabin1 (corto)={len(colori_cabin1)}, Cabin2 (lungo)={len(colori_cabin2)}")
+        
+        result_cabin1 = None
+        result_cabin2 = None
+        
+        # Ottimizza Cabina 1 se ci sono colori
+        if colori_cabin1:
+            print("Ottimizzando Cabina 1 (corto)...")
+            with logic.collect_solver_stats() as stats_1:
                 ordered_colors_1, cluster_seq_1, cost_1, message_1 = logic.optimize_color_sequence(
                     colori_giorno_input=colori_cabin1,
                     start_cluster_nome=request_data.start_cluster_name,
+                    end_cluster_nome=request_data.end_cluster_name,
+                    warm_start_sequence=request_data.warm_start_sequence,
                     first_color=request_data.first_color,
-                    prioritized_reintegrations=request_data.prioritized_reintegrations
+                    prioritized_reintegrations=request_data.prioritized_reintegrations,
+                    progress_callback=_scoped_progress(progress_callback, "cabina_1")
                 )
-                
-                # Salva nel database per Cabina 1
-                database.save_optimization_results(ordered_colors_1, cabin_id=1)
-                
-                cost_str_1 = "infinito" if cost_1 >= INFINITE_COST else f"{cost_1:.2f}"
-                result_cabin1 = {
-                    "ordered_colors": [OptimizedColorOutput(**c) for c in ordered_colors_1],
-                    "optimal_cluster_sequence": cluster_seq_1,
-                    "calculated_cost": cost_str_1,
-                    "message": message_1
-                }
-                print(f"Cabina 1 ottimizzata: {len(ordered_colors_1)} colori, costo={cost_str_1}")
             
-            # Ottimizza Cabina 2 se ci sono colori
-            if colori_cabin2:
-                print("Ottimizzando Cabina 2 (lungo)...")
+            # Salva nel database per Cabina 1
+            database.save_optimization_results(ordered_colors_1, cabin_id=1)
+            
+            cost_str_1 = "infinito" if cost_1 >= INFINITE_COST else f"{cost_1:.2f}"
+            result_cabin1 = {
+                "ordered_colors": serialization.color_output_records(ordered_colors_1),
+                "optimal_cluster_sequence": cluster_seq_1,
+                "calculated_cost": cost_str_1,
+                "message": message_1,
+                "stats": stats_1.to_dict()
+            }
+            print(f"Cabina 1 ottimizzata: {len(ordered_colors_1)} colori, costo={cost_str_1}")
+        
+        # Ottimizza Cabina 2 se ci sono colori
+        if colori_cabin2:
+            print("Ottimizzando Cabina 2 (lungo)...")
+            with logic.collect_solver_stats() as stats_2:
                 ordered_colors_2, cluster_seq_2, cost_2, message_2 = logic.optimize_color_sequence(
                     colori_giorno_input=colori_cabin2,
                     start_cluster_nome=request_data.start_cluster_name,
+                    end_cluster_nome=request_data.end_cluster_name,
+                    warm_start_sequence=request_data.warm_start_sequence,
                     first_color=request_data.first_color,
-                    prioritized_reintegrations=request_data.prioritized_reintegrations
+                    prioritized_reintegrations=request_data.prioritized_reintegrations,
+                    progress_callback=_scoped_progress(progress_callback, "cabina_2")
                 )
-                
-                # Salva nel database per Cabina 2
-                database.save_optimization_results(ordered_colors_2, cabin_id=2)
-                
-                cost_str_2 = "infinito" if cost_2 >= INFINITE_COST else f"{cost_2:.2f}"
-                result_cabin2 = {
-                    "ordered_colors": [OptimizedColorOutput(**c) for c in ordered_colors_2],
-                    "optimal_cluster_sequence": cluster_seq_2,
-                    "calculated_cost": cost_str_2,
-                    "message": message_2
-                }
-                print(f"Cabina 2 ottimizzata: {len(ordered_colors_2)} colori, costo={cost_str_2}")
             
-            # Restituisci risposta combinata per le cabine
-            response_data = CabinOptimizationResponse(
-                cabina_1=result_cabin1,
-                cabina_2=result_cabin2,
-                message="Ottimizzazione completata per le cabine separate"
-            )
-            
-            print(f"[API] Invio risposta cabine: Cabin1={result_cabin1 is not None}, Cabin2={result_cabin2 is not None}")
-            return response_data
+            # Salva nel database per Cabina 2
+            database.save_optimization_results(ordered_colors_2, cabin_id=2)
             
-        # Verifica se ci sono sequenze con sequence_type per usare la nuova logica
-        has_sequence_types = any(color.get('sequence_type') for color in colori_input_dict)
-        
-        if has_sequence_types:
-            print("Rilevati tipi di sequenza, utilizzo della logica avanzata...")
-            # Chiama la funzione che gestisce i tipi di sequenza (ora è un wrapper)
-            ordered_colors_dict, cluster_seq, cost_num, message = logic.optimize_color_sequence_with_types(
-                colors_input=colori_input_dict,
-                start_cluster_nome=request_data.start_cluster_name,
-                first_color=request_data.first_color,
-                prioritized_reintegrations=request_data.prioritized_reintegrations
-            )
-        else:
-            print("Nessun tipo di sequenza rilevato, utilizzo della logica standard...")
-            # Chiama la funzione logica standard
-            ordered_colors_dict, cluster_seq, cost_num, message = logic.optimize_color_sequence(
-                colori_giorno_input=colori_input_dict,
-                start_cluster_nome=request_data.start_cluster_name,
-                first_color=request_data.first_color,
-                prioritized_reintegrations=request_data.prioritized_reintegrations # Passa la lista
-            )
+            cost_str_2 = "infinito" if cost_2 >= INFINITE_COST else f"{cost_2:.2f}"
+            result_cabin2 = {
+                "ordered_colors": serialization.color_output_records(ordered_colors_2),
+                "optimal_cluster_sequence": cluster_seq_2,
+                "calculated_cost": cost_str_2,
+                "message": message_2,
+                "stats": stats_2.to_dict()
+            }
+            print(f"Cabina 2 ottimizzata: {len(ordered_colors_2)} colori, costo={cost_str_2}")
+        
+        # Restituisci risposta combinata per le cabine
+        response_data = {
+            "cabina_1": result_cabin1,
+            "cabina_2": result_cabin2,
+            "message": "Ottimizzazione completata per le cabine separate"
+        }
+        
+        print(f"[API] Invio risposta cabine: Cabin1={result_cabin1 is not None}, Cabin2={result_cabin2 is not None}")
+        return response_data
+        
+    # Verifica se ci sono sequenze con sequence_type per usare la nuova logica
+    has_sequence_types = any(batch.field('sequence_type'))
+    
+    if has_sequence_types:
+        print("Rilevati tipi di sequenza, utilizzo della logica avanzata...")
+        # Chiama la funzione che gestisce i tipi di sequenza (ora è un wrapper)
+        ordered_colors_dict, cluster_seq, cost_num, message = logic.optimize_color_sequence_with_types(
+            colors_input=batch,
+            start_cluster_nome=request_data.start_cluster_name,
+            end_cluster_nome=request_data.end_cluster_name,
+            warm_start_sequence=request_data.warm_start_sequence,
+            first_color=request_data.first_color,
+            prioritized_reintegrations=request_data.prioritized_reintegrations,
+            progress_callback=progress_callback
+        )
+    else:
+        print("Nessun tipo di sequenza rilevato, utilizzo della logica standard...")
+        # Chiama la funzione logica standard
+        ordered_colors_dict, cluster_seq, cost_num, message = logic.optimize_color_sequence(
+            colori_giorno_input=batch,
+            start_cluster_nome=request_data.start_cluster_name,
+            end_cluster_nome=request_data.end_cluster_name,
+            warm_start_sequence=request_data.warm_start_sequence,
+            first_color=request_data.first_color,
+            prioritized_reintegrations=request_data.prioritized_reintegrations, # Passa la lista
+            progress_callback=progress_callback
+        )
 
-        # Converti i dizionari risultato nel modello Pydantic per la risposta
-        ordered_colors_output = [OptimizedColorOutput(**c) for c in ordered_colors_dict]
+    # Record di output costruiti direttamente dai dizionari risultato
+    ordered_colors_output = serialization.color_output_records(ordered_colors_dict)
 
-        # Formatta costo infinito per JSON
-        # Usa il costo numerico restituito per il confronto
-        cost_str = "infinito" if cost_num >= INFINITE_COST else f"{cost_num:.2f}"
+    # Formatta costo infinito per JSON
+    # Usa il costo numerico restituito per il confronto
+    cost_str = "infinito" if cost_num >= INFINITE_COST else f"{cost_num:.2f}"
 
-        # Costruisci la risposta Pydantic
-        response_data = OptimizationResponse(
-            ordered_colors=ordered_colors_output,
-            optimal_cluster_sequence=cluster_seq,
-            calculated_cost=cost_str, # Usa la stringa formattata
-            message=message
+    # Costruisci la risposta (stessa forma di OptimizationResponse)
+    response_data = {
+        "ordered_colors": ordered_colors_output,
+        "optimal_cluster_sequence": cluster_seq,
+        "calculated_cost": cost_str, # Usa la stringa formattata
+        "message": message
+    }
+
+    print(f"[API] Invio risposta: Costo={response_data['calculated_cost']}, Seq={response_data['optimal_cluster_sequence']}, Msg='{response_data['message']}'")
+    return response_data
+
+# --- Pianificazione su più giorni (sequence_type "successiva" / campo day) ---
+
+def _format_cost(cost: float) -> str:
+    return "infinito" if cost >= INFINITE_COST else f"{cost:.2f}"
+
+
+def _run_multi_day(request_data: OptimizationRequest, batch: ColorBatch) -> Dict[str, Any]:
+    """
+    Orizzonte su più giorni per /optimize/multi-day: un piano per giorno, ogni giorno
+    agganciato al cluster finale del precedente. Con lunghezza_ordine le due cabine
+    sono pianificate separatamente. Il piano non viene salvato nelle cabine.
+    """
+    def plan(colors: ColorBatch) -> Dict[str, Any]:
+        result = logic.optimize_multi_day(
+            colors,
+            start_cluster_nome=request_data.start_cluster_name,
+            end_cluster_nome=request_data.end_cluster_name,
+            first_color=request_data.first_color,
+            prioritized_reintegrations=request_data.prioritized_reintegrations,
+            warm_start_sequence=request_data.warm_start_sequence,
         )
+        return {
+            "days": [{
+                "day": giorno["day"],
+                "ordered_colors": serialization.color_output_records(giorno["colors"]),
+                "optimal_cluster_sequence": giorno["cluster_sequence"],
+                "calculated_cost": _format_cost(giorno["cost"]),
+                "message": giorno["message"],
+            } for giorno in result["days"]],
+            "optimal_cluster_sequence": result["cluster_sequence"],
+            "calculated_cost": _format_cost(result["cost"]),
+            "message": result["message"],
+        }
 
-        print(f"[API] Invio risposta: Costo={response_data.calculated_cost}, Seq={response_data.optimal_cluster_sequence}, Msg='{response_data.message}'")
-        return response_data
+    if any(batch.field('lunghezza_ordine')):
+        colori_cabin1 = batch.where('lunghezza_ordine', 'corto')
+        colori_cabin2 = batch.where('lunghezza_ordine', 'lungo')
+        return {
+            "cabina_1": plan(colori_cabin1) if colori_cabin1 else None,
+            "cabina_2": plan(colori_cabin2) if colori_cabin2 else None,
+            "message": "Pianificazione su più giorni completata per le cabine separate",
+        }
+    return plan(batch)
 
-    except HTTPException:
-         raise # Rilancia le eccezioni HTTP già gestite (raro qui)
+
+@app.post("/optimize/multi-day",
+          summary="Pianificazione su più giorni",
+          tags=["Optimization"])
+async def optimize_multi_day(request: Request, request_data: OptimizationRequest = Body(...)):
+    """
+    Divide i colori per giorno (campo day, oppure sequence_type "successiva" = domani)
+    e ottimizza i giorni in catena: ogni giorno parte dal cluster con cui finisce il
+    precedente. start_cluster_name vale per il primo giorno, end_cluster_name per l'ultimo.
+    """
+    if not request_data.colors_today:
+        raise HTTPException(status_code=400, detail="Lista colori vuota")
+    batch = ColorBatch.from_request(request_data)
+    print(f"[API] Pianificazione su più giorni per {len(batch)} colori")
+    try:
+        result = await run_in_threadpool(_run_multi_day, request_data, batch)
     except Exception as e:
-        # Log dettagliato dell'errore inatteso nel backend
-        print("="*30 + " ERRORE INATTESO IN API /optimize " + "="*30)
-        print(f"Errore durante l'ottimizzazione: {e}")
-        # Stampa lo stack trace completo nei log del backend per debug
+        print(f"Errore durante la pianificazione su più giorni: {e}")
         traceback.print_exc()
-        print("="*80)
-        # Restituisce un errore generico 500 al client
-        raise HTTPException(
-            status_code=500,
-            detail=f"Errore interno del server durante l'ottimizzazione. Controlla i log del backend per dettagli."
+        raise HTTPException(status_code=500, detail=f"Errore interno: {str(e)}")
+    return serialization.fast_response(result, request)
+
+@app.post("/optimize/import",
+          summary="Importa un file ordini (CSV/JSONL/XLSX) e ottimizza",
+          tags=["Optimization"])
+async def import_and_optimize(request: Request,
+                              format: Optional[str] = None,
+                              filename: Optional[str] = None,
+                              optimize: bool = True,
+                              start_cluster_name: Optional[str] = None,
+                              end_cluster_name: Optional[str] = None,
+                              first_color: Optional[str] = None,
+                              prioritized_reintegrations: Optional[str] = None,
+                              mode: Optional[str] = None,
+                              cabin_count: Optional[int] = None):
+    """
+    Il corpo della richiesta è il file ordini (CSV con o senza intestazione, JSONL con un
+    colore per riga, XLSX primo foglio). Il file viene ricevuto a blocchi, letto riga per
+    riga validando e associando ogni colore al suo cluster, e i colori validi passano
+    direttamente all'ottimizzazione (stessi parametri di /optimize in query string,
+    prioritized_reintegrations separati da virgola). Con optimize=false restituisce solo
+    i colori letti. La risposta riporta sempre le statistiche dell'import (righe/s).
+    """
+    try:
+        file_format = ingest.detect_format(format, request.headers.get("content-type"), filename)
+        request_data = OptimizationRequest(
+            colors_today=[],
+            start_cluster_name=start_cluster_name,
+            end_cluster_name=end_cluster_name,
+            first_color=first_color,
+            prioritized_reintegrations=[c.strip() for c in prioritized_reintegrations.split(",") if c.strip()]
+                                       if prioritized_reintegrations else None,
+            mode=mode,
+            cabin_count=cabin_count,
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Il file arriva a blocchi: in memoria fino a INGEST_SPOOL_MAX_BYTES, poi su disco
+    with tempfile.SpooledTemporaryFile(max_size=config.INGEST_SPOOL_MAX_BYTES) as spool:
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > config.INGEST_MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"File oltre {config.INGEST_MAX_BYTES} byte")
+            spool.write(chunk)
+        print(f"[API] Import {file_format}: ricevuti {received} byte")
+        try:
+            imported = await run_in_threadpool(ingest.import_colors, spool, file_format, database.get_cluster_colori())
+        except RuntimeError as e:
+            raise HTTPException(status_code=501, detail=str(e))
+        except Exception as e:
+            print(f"Errore durante la lettura del file {file_format}: {e}")
+            raise HTTPException(status_code=400, detail=f"File {file_format} non leggibile: {e}")
+
+    stats = imported.stats()
+    if not imported.colors:
+        raise HTTPException(status_code=400, detail={"message": "Nessun colore valido nel file", "import": stats})
+    if not optimize:
+        return serialization.fast_response({"colors_today": imported.colors, "import": stats}, request)
+    try:
+        result = await run_in_threadpool(_run_optimization, request_data, ColorBatch(imported.colors))
+    except Exception as e:
+        print(f"Errore durante l'ottimizzazione del file importato: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Errore interno: {str(e)}")
+    return serialization.fast_response({**result, "import": stats}, request)
+
+# --- Ottimizzazione in background con avanzamento via Server-Sent Events ---
+
+@app.post("/optimize/jobs",
+          summary="Avvia un'ottimizzazione in background",
+          tags=["Optimization"])
+async def start_optimization_job(request_data: OptimizationRequest = Body(...)):
+    """
+    Avvia la stessa ottimizzazione di /optimize in un thread separato e restituisce
+    subito l'id del job. L'avanzamento si segue con GET /optimize/jobs/{job_id}/events.
+    """
+    batch = ColorBatch.from_request(request_data)
+    print(f"[API] Avvio job di ottimizzazione per {len(batch)} colori")
+
+    def run(job: jobs.OptimizationJob) -> Dict[str, Any]:
+        return _run_optimization(request_data, batch, progress_callback=job.progress_callback)
+
+    # Una richiesta identica a un job ancora in corso si aggancia a quel job
+    key = await run_in_threadpool(_optimization_key, request_data)
+    job, shared = jobs.registry.start(run, key=key)
+    return {"job_id": job.id, "status": job.status, "coalesced": shared}
+
+
+def _get_job_or_404(job_id: str) -> jobs.OptimizationJob:
+    job = jobs.registry.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} non trovato o scaduto")
+    return job
+
+
+@app.get("/optimize/jobs/{job_id}",
+         summary="Stato e risultato di un job di ottimizzazione",
+         tags=["Optimization"])
+async def get_optimization_job(job_id: str, request: Request):
+    return serialization.fast_response(_get_job_or_404(job_id).snapshot(), request)
+
+
+@app.post("/optimize/jobs/{job_id}/stop",
+          summary="Interrompe un job accettando la migliore sequenza trovata finora",
+          tags=["Optimization"])
+async def stop_optimization_job(job_id: str):
+    job = _get_job_or_404(job_id)
+    if job.status == jobs.JOB_RUNNING:
+        job.request_stop()
+        print(f"[API] Richiesta interruzione job {job_id}")
+    return {"job_id": job.id, "status": job.status, "stop_requested": job.stop_requested}
+
+
+def _sse_format(event_name: str, data: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_name}")
+    lines.append(f"data: {serialization.dumps_json(data).decode('utf-8')}")
+    return "\n".join(lines) + "\n\n"
+
+
+@app.get("/optimize/jobs/{job_id}/events",
+         summary="Stream SSE dell'avanzamento di un job di ottimizzazione",
+         tags=["Optimization"])
+async def stream_optimization_job(job_id: str, request: Request):
+    """
+    Server-Sent Events: un evento `progress` per ogni notifica del solver
+    (incumbent, dp_layer, solution, finished) e un evento finale `result`
+    con lo snapshot del job. Supporta la ripresa tramite header Last-Event-ID.
+    """
+    job = _get_job_or_404(job_id)
+    last_event_id = request.headers.get("last-event-id")
+    cursor = int(last_event_id) + 1 if last_event_id and last_event_id.isdigit() else 0
+
+    async def event_stream():
+        nonlocal cursor
+        while True:
+            if await request.is_disconnected():
+                print(f"[API] Client disconnesso dallo stream del job {job_id}")
+                return
+            finished = False
+            for event in job.events_since(cursor):
+                yield _sse_format("progress", event, event_id=event["seq"])
+                cursor = event["seq"] + 1
+                finished = finished or event.get("event") == "finished"
+            if finished:
+                yield _sse_format("result", job.snapshot())
+                return
+            await asyncio.sleep(config.OPTIMIZATION_JOBS_EVENT_POLL_SECONDS)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/", summary="Endpoint di Health Check")
 async def read_root():
     """Endpoint di base per verificare che il servizio sia attivo."""
     return {"status": "Color Optimizer Backend running!"}
 
+@app.get("/metrics", summary="Metriche Prometheus", response_class=PlainTextResponse)
+async def get_metrics():
+    """Istogrammi delle fasi di ottimizzazione e delle richieste HTTP, nel formato di testo Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/admin/profiles", summary="Profili salvati delle richieste")
+async def list_saved_profiles(limit: int = 20):
+    """Profili salvati con ?profile=cpu|mem, dal più recente (metadati e nomi dei file in PROFILES_DIR)."""
+    if not config.PROFILING_ENABLED:
+        raise HTTPException(status_code=403, detail="Profilazione disattivata (PROFILING_ENABLED=0)")
+    return {"profiles_dir": config.PROFILES_DIR, "profiles": profiling.list_profiles(limit)}
+
 @app.post("/optimize-partial",
           summary="Ottimizza con ordine parziale dei cluster",
           description="Ottimizza rispettando un ordine parziale specificato dall'utente per i cluster.")
 async def optimize_partial_sequence(request_data: dict = Body(...)):
     """
     Endpoint per ottimizzazione con ordine parziale dei cluster.
+    partial_cluster_order: lista di {cluster, position, locked}; i cluster bloccati
+    mantengono il loro ordine relativo e quelli bloccati in testa restano in testa.
     """
     print("=" * 80)
     print("RICHIESTA OTTIMIZZAZIONE PARZIALE:")
     print(f"Request data: {request_data}")
-    
+
+    colors_data = request_data.get('colors', [])
+    partial_order = request_data.get('partial_cluster_order', [])
+    cabin_id = request_data.get('cabin_id', 1)
+    prioritized_reintegrations = request_data.get('prioritized_reintegrations', [])
+
+    if not colors_data:
+        raise HTTPException(status_code=400, detail="Lista colori vuota")
+
     try:
-        colors_data = request_data.get('colors', [])
-        partial_order = request_data.get('partial_cluster_order', [])
-        cabin_id = request_data.get('cabin_id', 1)
-        prioritized_reintegrations = request_data.get('prioritized_reintegrations', [])
-        
-        if not colors_data:
-            raise HTTPException(status_code=400, detail="Lista colori vuota")
-        
-        # Chiama la funzione di ottimizzazione parziale
-        from .logic import optimize_with_partial_cluster_order
-        
-        ordered_colors, cluster_sequence, cost, message = optimize_with_partial_cluster_order(
+        # I cluster bloccati diventano vincoli di precedenza nella DP (solver CPU-bound fuori dall'event loop)
+        ordered_colors, cluster_sequence, cost, message = await run_in_threadpool(
+            logic.optimize_with_partial_cluster_order,
             colori_giorno_input=colors_data,
             partial_cluster_order=partial_order,
             cabin_id=cabin_id,
-            prioritized_reintegrations=prioritized_reintegrations
+            prioritized_reintegrations=prioritized_reintegrations,
         )
-        
-        # Converti i risultati
-        ordered_colors_output = [OptimizedColorOutput(**c) for c in ordered_colors]
-        cost_str = "infinito" if cost >= INFINITE_COST else f"{cost:.2f}"
-        
-        response_data = OptimizationResponse(
-            ordered_colors=ordered_colors_output,
-            optimal_cluster_sequence=cluster_sequence,
-            calculated_cost=cost_str,
-            message=message
-        )
-        
-        print(f"[API] Risposta ottimizzazione parziale: {len(ordered_colors)} colori, {len(cluster_sequence)} cluster")
-        return response_data
-        
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Errore durante ottimizzazione parziale: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Errore interno: {str(e)}")
 
+    cost_str = "inf" if cost >= INFINITE_COST else cost
+    print(f"[API] Risposta ottimizzazione parziale: {len(ordered_colors)} colori, {len(cluster_sequence)} cluster")
+    return OptimizationResponse(
+        ordered_colors=serialization.color_output_records(ordered_colors),
+        optimal_cluster_sequence=cluster_sequence,
+        calculated_cost=cost_str,
+        message=message
+    )
+
 @app.post("/optimize-locked-colors",
           response_model=OptimizationResponse,
           summary="Ottimizzazione con colori bloccati individualmente",
           description="Ottimizza la sequenza considerando colori bloccati in posizioni specifiche")
-async def optimize_locked_colors_sequence(request_data: dict = Body(...)):
+async def optimize_locked_colors_sequence(response: Response, request_data: dict = Body(...),
+                                          profile: Optional[str] = None):
     """
     Ottimizza la sequenza di colori rispettando i blocchi individuali.
     I colori bloccati mantengono la loro posizione, gli altri vengono ottimizzati.
+    Con ?profile=cpu|mem (se PROFILING_ENABLED) l'ottimizzazione viene profilata.
     """
+    profile_mode = _profile_mode(profile)
     try:
         print(f"[API] Richiesta ottimizzazione con colori bloccati: {request_data}")
         
@@ -342,7 +772,9 @@ async def optimize_locked_colors_sequence(request_data: dict = Body(...)):
             raise HTTPException(status_code=400, detail="Lista colori vuota")
         
         # Chiama la funzione di ottimizzazione con colori bloccati
-        result = logic.optimize_with_locked_colors(colors_today)
+        result = await _call_profiled(profile_mode, "optimize_locked_colors", request_data, response,
+                                      logic.optimize_with_locked_colors, colors_today, None,
+                                      prioritized_reintegrations)
         
         ordered_colors = result['colors']
         cluster_sequence = result['cluster_sequence']
@@ -377,12 +809,45 @@ async def optimize_locked_colors_sequence(request_data: dict = Body(...)):
         
         print(f"[API] Risposta ottimizzazione con colori bloccati: {len(ordered_colors)} colori, {len(cluster_sequence)} cluster")
         return response_data
-        
+
+    except profiling.ProfilingError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         print(f"Errore durante ottimizzazione con colori bloccati: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Errore interno: {str(e)}")
 
+@app.post("/optimize-locked-colors/repair",
+          summary="Riparazione locale dopo uno spostamento manuale",
+          description="Riottimizza solo le posizioni vicine a un colore spostato con drag & drop e restituisce la variazione di costo")
+async def repair_locked_colors_after_move(request_data: dict = Body(...)):
+    """
+    Riceve il piano già riordinato (colors_today) e lo spostamento (moved_from, moved_to).
+    Il colore spostato e i colori bloccati restano fermi; sono riottimizzate solo le
+    finestre di `radius` posizioni intorno allo spostamento.
+    """
+    colors_today = request_data.get('colors_today', [])
+    moved_from = request_data.get('moved_from')
+    moved_to = request_data.get('moved_to')
+    if not colors_today:
+        raise HTTPException(status_code=400, detail="Lista colori vuota")
+    if not isinstance(moved_from, int) or not isinstance(moved_to, int):
+        raise HTTPException(status_code=400, detail="moved_from e moved_to sono obbligatori")
+
+    try:
+        result = await run_in_threadpool(
+            logic.repair_after_move, colors_today, moved_from, moved_to,
+            request_data.get('radius'), request_data.get('prioritized_reintegrations'))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Errore durante la riparazione locale: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Errore interno: {str(e)}")
+
+    result['ordered_colors'] = serialization.color_output_records(result.pop('colors'))
+    return result
+
 @app.post("/update-color-lock",
           summary="Aggiorna stato di blocco di un colore",
           description="Blocca o sblocca un singolo colore nella lista della cabina")
@@ -531,11 +996,14 @@ async def reorder_colors(request_data: dict = Body(...)):
         raise HTTPException(status_code=500, detail=f"Errore interno: {str(e)}")
 
 @app.post("/api/cabin/{cabin_id}/optimize-locked")
-async def optimize_cabin_with_locks(cabin_id: int, request_data: dict = Body(...)):
+async def optimize_cabin_with_locks(cabin_id: int, response: Response, request_data: dict = Body(...),
+                                    profile: Optional[str] = None):
     """
     Ottimizza la sequenza di colori per una cabina specifica rispettando i blocchi 
     e salva i risultati nel database.
+    Con ?profile=cpu|mem (se PROFILING_ENABLED) l'ottimizzazione viene profilata.
     """
+    profile_mode = _profile_mode(profile)
     try:
         print(f"[API] Ottimizzazione cabina {cabin_id} con blocchi: {request_data}")
         
@@ -546,7 +1014,9 @@ async def optimize_cabin_with_locks(cabin_id: int, request_data: dict = Body(...
             raise HTTPException(status_code=400, detail="Lista colori vuota")
         
         # Prima ottimizza la sequenza rispettando i blocchi
-        result = logic.optimize_with_locked_colors(colors_today)
+        result = await _call_profiled(profile_mode, f"cabin{cabin_id}_optimize_locked", request_data, response,
+                                      logic.optimize_with_locked_colors, colors_today, None,
+                                      prioritized_reintegrations)
         
         ordered_colors = result['colors']
         cluster_sequence = result['cluster_sequence']
@@ -556,24 +1026,11 @@ async def optimize_cabin_with_locks(cabin_id: int, request_data: dict = Body(...
         print(f"[API] Ottimizzazione completata, salvando {len(ordered_colors)} colori per cabina {cabin_id}")
         
         # Ora salva i risultati nel database
-        # Converte i colori ottimizzati nel formato per il salvataggio
-        colors_to_save = []
-        for i, color in enumerate(ordered_colors):
-            color_dict = {
-                'color_code': color.get('code', ''),
-                'color_type': color.get('type', ''),
-                'cluster': color.get('cluster', ''),
-                'ch_value': color.get('CH', ''),
-                'lunghezza_ordine': color.get('lunghezza_ordine', ''),
-                'input_sequence': color.get('sequence', ''),
-                'sequence_type': color.get('sequence_type', ''),
-                'locked': color.get('locked', False),
-                'sequence_order': i + 1  # Posizione nella sequenza ottimizzata
-            }
-            colors_to_save.append(color_dict)
+        # Converte i colori ottimizzati in record per il salvataggio (sequence_order = posizione ottimizzata)
+        colors_to_save = [CabinColor.from_optimized(color, i + 1) for i, color in enumerate(ordered_colors)]
         
         # Salva nel database
-        logic.save_colors_for_cabin(cabin_id, colors_to_save)
+        await run_in_threadpool(logic.save_colors_for_cabin, cabin_id, colors_to_save)
         
         print(f"[API] Colori salvati nel database per cabina {cabin_id}")
         
@@ -586,13 +1043,15 @@ async def optimize_cabin_with_locks(cabin_id: int, request_data: dict = Body(...
             "cost": cost if cost != float('inf') else "infinito"
         }
         
+    except profiling.ProfilingError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         print(f"Errore durante ottimizzazione cabina {cabin_id}: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Errore interno: {str(e)}")
 
 @app.get("/api/cabin/{cabin_id}/colors")
-async def get_cabin_colors(cabin_id: int):
+async def get_cabin_colors(cabin_id: int, request: Request):
     """
     Ottiene tutti i colori per una cabina specifica dal database.
     """
@@ -604,12 +1063,13 @@ async def get_cabin_colors(cabin_id: int):
         
         print(f"[API] Trovati {len(colors)} colori per cabina {cabin_id}")
         
-        return {
+        # I record CabinColor sono serializzati direttamente (orjson), senza dizionari intermedi
+        return serialization.fast_response({
             "success": True,
             "cabin_id": cabin_id,
             "colors": colors,
             "count": len(colors)
-        }
+        }, request)
         
     except Exception as e:
         print(f"Errore durante recupero colori cabina {cabin_id}: {e}")
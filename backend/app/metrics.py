@@ -0,0 +1,152 @@
+# backend/app/metrics.py
+"""Per-stage timing of optimization requests: Server-Timing header and Prometheus histograms."""
+
+import bisect
+import contextlib
+import contextvars
+import functools
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app import config
+
+# Fasi dell'ottimizzazione misurate (nome -> descrizione per Server-Timing)
+STAGES = {
+    "rules": "caricamento regole",
+    "clusters": "mappatura cluster",
+    "matrix": "matrice costi",
+    "dp": "Held-Karp",
+    "reconstruction": "ricostruzione percorsi",
+    "ordering": "ordinamento colori",
+    "save": "salvataggio DB",
+}
+
+
+class Histogram:
+    """Istogramma cumulativo in formato Prometheus, con etichette; thread-safe."""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = sorted(buckets)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # etichette -> [conteggi per bucket..., +Inf, somma]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        k = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+            series[k] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            base = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(self.label_names, labels))
+            sep = "," if base else ""
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + [float("inf")], series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{le}"}} {cumulative:g}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative:g}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+STAGE_SECONDS = Histogram("giotto_optimization_stage_seconds",
+                          "Durata delle fasi dell'ottimizzazione", ["stage"], config.METRICS_BUCKETS)
+REQUEST_SECONDS = Histogram("giotto_http_request_seconds",
+                            "Durata delle richieste HTTP al backend", ["method", "route", "status"],
+                            config.METRICS_BUCKETS)
+
+
+class RequestTimings:
+    """Durate cumulate per fase di una richiesta (più chiamate alla stessa fase si sommano)."""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage_name: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage_name] = self.stages.get(stage_name, 0.0) + seconds
+
+    def server_timing(self, total: Optional[float] = None) -> str:
+        """Valore dell'header Server-Timing (durate in millisecondi)."""
+        with self._lock:
+            parts = [f'{name};desc="{STAGES.get(name, name)}";dur={seconds * 1000:.1f}'
+                     for name, seconds in self.stages.items()]
+        if total is not None:
+            parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+# Fasi della richiesta in corso: il contesto segue la richiesta anche nel threadpool
+_current: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar("request_timings", default=None)
+
+
+def begin_request() -> Tuple[RequestTimings, contextvars.Token]:
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token: contextvars.Token) -> None:
+    _current.reset(token)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+@contextlib.contextmanager
+def stage(stage_name: str) -> Iterator[None]:
+    """Misura una fase: sempre nell'istogramma, e nella richiesta in corso se ce n'è una."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage_name)
+        timings = _current.get()
+        if timings is not None:
+            timings.add(stage_name, elapsed)
+
+
+def timed(stage_name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Decoratore: ogni chiamata della funzione è misurata come la fase stage_name."""
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def with_request_context(func: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    func eseguita nei thread di un ThreadPoolExecutor con il contesto del chiamante, così
+    le fasi delle cabine / linee / segmenti calcolati in parallelo finiscono nella richiesta.
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+
+def render() -> str:
+    """Tutte le metriche nel formato di testo Prometheus."""
+    return "\n".join(STAGE_SECONDS.render() + REQUEST_SECONDS.render()) + "\n"
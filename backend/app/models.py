@@ -2,7 +2,8 @@
 """Pydantic models for API data validation and type hinting."""
 
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional, Tuple, Union
+from typing import List, Dict, Any, Optional, Tuple, Union, Literal
+from app import config
 
 # Alias di tipi come nel notebook
 ColorObject = Dict[str, Any]
@@ -20,13 +21,18 @@ class ColorInput(BaseModel):
     lunghezza_ordine: Optional[str] = None # "corto" o "lungo" - per divisione in cabine
     locked: Optional[bool] = False # Nuovo campo per bloccare singoli colori
     position: Optional[int] = None # Posizione specifica se bloccato
+    day: Optional[int] = None # Giorno di produzione (0 = oggi); se assente "successiva" vale 1
 
 # Modello per il corpo della richiesta all'endpoint /optimize
 class OptimizationRequest(BaseModel):
     colors_today: List[ColorInput] = Field(..., description="Lista dei colori da produrre oggi.")
     start_cluster_name: Optional[str] = Field(None, description="Nome del cluster con cui forzare l'inizio (opzionale).")
+    end_cluster_name: Optional[str] = Field(None, description="Nome del cluster con cui forzare la fine della sequenza (opzionale).")
     first_color: Optional[str] = Field(None, description="Codice del primo colore con cui iniziare il cluster (opzionale).")
     prioritized_reintegrations: Optional[List[str]] = Field(None, description="Lista dei codici colore dei reintegri a cui dare priorità extra.") # NUOVO CAMPO
+    warm_start_sequence: Optional[List[str]] = Field(None, description="Ordine dei cluster del piano attuale, usato come soluzione iniziale del solver (opzionale).")
+    mode: Optional[Literal["cabine", "linee"]] = Field(None, description="Modalità di ottimizzazione: 'cabine' ripartisce i colori su cabin_count cabine, 'linee' ottimizza separatamente ogni linea di produzione (opzionale).")
+    cabin_count: Optional[int] = Field(None, ge=1, le=config.CABIN_COUNT, description="Numero di cabine per la modalità 'cabine' (default e massimo CABIN_COUNT).")
 
 # Modello per un singolo colore nell'output ottimizzato
 class OptimizedColorOutput(BaseModel):
@@ -41,15 +47,30 @@ class OptimizedColorOutput(BaseModel):
     locked: Optional[bool] = False # Mantenuto se presente in input
     position: Optional[int] = None # Posizione finale nel risultato ottimizzato
 
+# Statistiche del solver per una richiesta (o una cabina)
+class SolverStatsOutput(BaseModel):
+    engine: Optional[str] = None # "held_karp", "greedy" (ricerca interrotta), "single_cluster"; più motori separati da virgola
+    optimality_proven: bool = False # True se ogni sequenza è l'ottimo esatto della DP
+    solves: int = 0 # Sequenze ottimizzate
+    dp_tables: int = 0 # Tabelle Held-Karp calcolate (escluse quelle lette dalla cache)
+    dp_states: int = 0 # Stati (maschera, ultimo cluster) valutati
+    cache_hits: int = 0 # Tabelle lette dalla cache con la stessa matrice
+    cache_subset_hits: int = 0 # Tabelle ricavate da una tabella in cache su più cluster
+    cache_misses: int = 0
+    peak_table_bytes: int = 0 # Memoria della tabella più grande usata
+    paths_reconstructed: int = 0 # Percorsi candidati ricostruiti dalla tabella
+
 # Modello per la risposta dell'endpoint /optimize
 class OptimizationResponse(BaseModel):
     ordered_colors: List[OptimizedColorOutput]
     optimal_cluster_sequence: List[str]
     calculated_cost: Union[float, str] # Può essere 'inf' o un numero
     message: str # Messaggio di successo o errore
+    stats: Optional[SolverStatsOutput] = None # Statistiche del solver (opzionale)
 
 # Modello per la risposta dell'endpoint /optimize con gestione cabine
 class CabinOptimizationResponse(BaseModel):
     cabina_1: Optional[OptimizationResponse] = None  # Risultati per colori "corto" (opzionale)
     cabina_2: Optional[OptimizationResponse] = None  # Risultati per colori "lungo" (opzionale)
-    message: str # Messaggio di successo o errore generale
\ No newline at end of file
+    message: str # Messaggio di successo o errore generale
+    stats: Optional[SolverStatsOutput] = None # Statistiche del solver su tutte le cabine (opzionale)
\ No newline at end of file
@@ -0,0 +1,199 @@
+# backend/app/profiling.py
+"""Opt-in per-request profiling (?profile=cpu|mem): cProfile or tracemalloc, saved by payload hash."""
+
+import contextvars
+import cProfile
+import functools
+import hashlib
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app import config
+
+PROFILE_CPU = "cpu"
+PROFILE_MEM = "mem"
+PROFILE_MODES = (PROFILE_CPU, PROFILE_MEM)
+
+
+class ProfilingError(Exception):
+    """Profilazione non disponibile (modalità sconosciuta, memoria già in profilazione)."""
+
+
+def payload_hash(payload: Any) -> str:
+    """Hash breve del payload normalizzato (chiavi ordinate), per ritrovare i profili della stessa richiesta."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def check_mode(mode: Optional[str]) -> Optional[str]:
+    """Valida il parametro ?profile; None se la richiesta non chiede profilazione."""
+    if mode is None:
+        return None
+    if mode not in PROFILE_MODES:
+        raise ProfilingError(f"profile deve essere uno di {', '.join(PROFILE_MODES)}")
+    return mode
+
+
+# --- Profilazione CPU anche nei thread delle cabine / linee / segmenti ---
+
+class _CpuSession:
+    def __init__(self):
+        self.profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def add(self, profile: cProfile.Profile) -> None:
+        with self._lock:
+            self.profiles.append(profile)
+
+
+_cpu_session: contextvars.ContextVar[Optional[_CpuSession]] = contextvars.ContextVar("giotto_cpu_profile", default=None)
+
+
+def in_worker(func: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    cProfile misura solo il thread in cui è attivo: func eseguita in un thread di un
+    ThreadPoolExecutor viene profilata a parte e unita al profilo della richiesta.
+    Va applicata dentro metrics.with_request_context, che porta il contesto nel thread.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        session = _cpu_session.get()
+        if session is None:
+            return func(*args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            session.add(profile)
+    return wrapper
+
+
+# tracemalloc è globale al processo: una sola profilazione della memoria alla volta
+_mem_lock = threading.Lock()
+
+
+def profile_call(mode: str, endpoint: str, payload: Any,
+                 func: Callable[..., Any], *args, **kwargs) -> Tuple[Any, str]:
+    """
+    Esegue func(*args, **kwargs) profilandola e salva il profilo in PROFILES_DIR.
+    Restituisce (risultato, id del profilo); il profilo è salvato anche se func fallisce.
+    """
+    digest = payload_hash(payload)
+    started = time.time()
+    start = time.perf_counter()
+    error = None
+    if mode == PROFILE_CPU:
+        session = _CpuSession()
+        profile = cProfile.Profile()
+        token = _cpu_session.set(session)
+        try:
+            result = profile.runcall(func, *args, **kwargs)
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            _cpu_session.reset(token)
+            profile_id = _save(endpoint, mode, digest, started, time.perf_counter() - start, error,
+                               lambda base: _write_cpu(base, [profile] + session.profiles))
+    else:
+        if not _mem_lock.acquire(blocking=False):
+            raise ProfilingError("Un'altra richiesta è già in profilazione della memoria")
+        try:
+            tracemalloc.start(25)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                error = repr(e)
+                raise
+            finally:
+                snapshot = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                profile_id = _save(endpoint, mode, digest, started, time.perf_counter() - start, error,
+                                   lambda base: _write_mem(base, snapshot, peak))
+        finally:
+            _mem_lock.release()
+    print(f"[PROFILO] {endpoint} profilato ({mode}): {profile_id}")
+    return result, profile_id
+
+
+def _write_cpu(base: str, profiles: List[cProfile.Profile]) -> Dict[str, Any]:
+    stats = pstats.Stats(profiles[0])
+    for profile in profiles[1:]:
+        stats.add(profile)
+    stats.dump_stats(base + ".prof")
+    text = io.StringIO()
+    pstats.Stats(base + ".prof", stream=text).sort_stats("cumulative").print_stats(config.PROFILE_TOP_LINES)
+    with open(base + ".txt", "w", encoding="utf-8") as f:
+        f.write(text.getvalue())
+    return {"files": [os.path.basename(base + ".prof"), os.path.basename(base + ".txt")],
+            "threads": len(profiles), "total_calls": stats.total_calls}
+
+
+def _write_mem(base: str, snapshot: tracemalloc.Snapshot, peak: int) -> Dict[str, Any]:
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ])
+    top = snapshot.statistics("lineno")
+    with open(base + ".txt", "w", encoding="utf-8") as f:
+        f.write(f"Picco di memoria tracciata: {peak / 1024:.1f} KiB\n")
+        f.write(f"Memoria ancora allocata a fine richiesta, per riga (prime {config.PROFILE_TOP_LINES}):\n")
+        for stat in top[:config.PROFILE_TOP_LINES]:
+            f.write(f"{stat}\n")
+    return {"files": [os.path.basename(base + ".txt")], "peak_bytes": peak,
+            "retained_bytes": sum(stat.size for stat in top)}
+
+
+def _save(endpoint: str, mode: str, digest: str, started: float, seconds: float,
+          error: Optional[str], write: Callable[[str], Dict[str, Any]]) -> str:
+    os.makedirs(config.PROFILES_DIR, exist_ok=True)
+    profile_id = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(started))}-{int(started * 1000) % 1000:03d}_{endpoint}_{mode}_{digest}"
+    base = os.path.join(config.PROFILES_DIR, profile_id)
+    meta = {
+        "id": profile_id,
+        "endpoint": endpoint,
+        "mode": mode,
+        "payload_hash": digest,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+        "duration_ms": round(seconds * 1000, 1),
+        "error": error,
+        **write(base),
+    }
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    _prune()
+    return profile_id
+
+
+def _prune() -> None:
+    """Cancella i profili oltre PROFILES_KEEP, dal più vecchio."""
+    for meta in list_profiles(limit=None)[config.PROFILES_KEEP:]:
+        for name in meta.get("files", []) + [meta["id"] + ".json"]:
+            try:
+                os.remove(os.path.join(config.PROFILES_DIR, name))
+            except OSError:
+                pass
+
+
+def list_profiles(limit: Optional[int] = 20) -> List[Dict[str, Any]]:
+    """Metadati dei profili salvati, dal più recente."""
+    if not os.path.isdir(config.PROFILES_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(config.PROFILES_DIR):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(config.PROFILES_DIR, name), encoding="utf-8") as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    profiles.sort(key=lambda meta: meta["id"], reverse=True)
+    return profiles if limit is None else profiles[:limit]
@@ -0,0 +1,105 @@
+# backend/app/serialization.py
+"""Fast serialization of optimization responses (orjson / msgpack + gzip)."""
+
+import dataclasses
+import gzip
+import json
+from typing import Any, Dict, List, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from app import config
+from app.models import OptimizedColorOutput
+
+try:
+    import orjson
+except ImportError:  # Fallback al json della libreria standard
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Senza msgpack si risponde sempre in JSON
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack")
+
+
+def _output_field_defaults() -> Dict[str, Any]:
+    """Campi di OptimizedColorOutput con il relativo default (None per i campi obbligatori)."""
+    try:
+        fields = OptimizedColorOutput.model_fields  # Pydantic v2
+        return {name: (None if field.is_required() else field.default) for name, field in fields.items()}
+    except AttributeError:
+        fields = OptimizedColorOutput.__fields__  # Pydantic v1
+        return {name: (None if field.required else field.default) for name, field in fields.items()}
+
+
+# Ordine e default dei campi di un colore ottimizzato, come nel modello di risposta
+OUTPUT_COLOR_FIELDS = _output_field_defaults()
+
+
+def color_output_record(color: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Record di output per un colore ottimizzato, costruito direttamente dal dizionario
+    interno senza istanziare un OptimizedColorOutput per riga (stessi campi e default).
+    """
+    return {field: color.get(field, default) for field, default in OUTPUT_COLOR_FIELDS.items()}
+
+
+def color_output_records(colors: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [color_output_record(c) for c in colors]
+
+
+def _default(obj: Any) -> Any:
+    """Conversione dei tipi non nativi (es. scalari numpy restituiti dal solver)."""
+    if dataclasses.is_dataclass(obj):  # es. CabinColor con msgpack o json (orjson li gestisce da solo)
+        return {field.name: getattr(obj, field.name) for field in dataclasses.fields(obj)}
+    if hasattr(obj, "item"):
+        return obj.item()
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if isinstance(obj, (set, tuple)):
+        return list(obj)
+    return str(obj)
+
+
+def dumps_json(payload: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, default=_default, ensure_ascii=False).encode("utf-8")
+
+
+def dumps_msgpack(payload: Any) -> bytes:
+    return msgpack.packb(payload, default=_default, use_bin_type=True)
+
+
+def negotiate_media_type(accept: Optional[str]) -> str:
+    """Sceglie il formato di risposta dall'header Accept: msgpack se richiesto e disponibile, altrimenti JSON."""
+    if msgpack is not None and accept:
+        if any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES):
+            return MSGPACK_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+
+def encode(payload: Any, media_type: str) -> bytes:
+    if media_type == MSGPACK_MEDIA_TYPE:
+        return dumps_msgpack(payload)
+    return dumps_json(payload)
+
+
+def fast_response(payload: Any, request: Request, status_code: int = 200,
+                  headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Risposta già serializzata: formato negoziato con Accept, compressione gzip
+    se il client la accetta e il corpo supera RESPONSE_GZIP_MIN_BYTES.
+    """
+    media_type = negotiate_media_type(request.headers.get("accept"))
+    body = encode(payload, media_type)
+    headers = {"Vary": "Accept, Accept-Encoding", **(headers or {})}
+    if len(body) >= config.RESPONSE_GZIP_MIN_BYTES and "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzip.compress(body, compresslevel=config.RESPONSE_GZIP_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
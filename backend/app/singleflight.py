@@ -0,0 +1,52 @@
+# backend/app/singleflight.py
+"""Single-flight coalescing of identical concurrent optimization requests."""
+
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+def request_key(payload: Dict[str, Any], rules_version: str) -> str:
+    """
+    Chiave canonica di una richiesta: hash del payload normalizzato (chiavi ordinate,
+    separatori compatti) più la versione delle regole con cui verrebbe calcolata.
+    L'ordine dei colori resta significativo perché determina l'ordine dei pari merito.
+    """
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{rules_version}\n{canonical}".encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Esegue una sola volta le richieste identiche in corso: il primo chiamante avvia
+    il calcolo, gli altri attendono lo stesso task e ne ricevono il risultato (o l'errore).
+    Il task è protetto da shield, quindi la disconnessione di un client non lo annulla
+    per gli altri in attesa.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.coalesced_count = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Restituisce (risultato, condiviso) dove condiviso=True se il calcolo era già in corso."""
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced_count += 1
+            print(f"[{self.name}] Richiesta identica già in corso ({key[:12]}): attendo il risultato condiviso")
+        else:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    @property
+    def inflight_count(self) -> int:
+        return len(self._inflight)
@@ -0,0 +1,266 @@
+# frontend/app/cabin_events.py
+"""Push of per-cabin row-level deltas (SSE) from an in-process pub/sub fed by a trigger-maintained change log."""
+
+import dataclasses
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+logger = logging.getLogger('frontend')
+
+# Intervallo di controllo delle nuove scritture (PRAGMA data_version, nessuna query se invariato)
+CABIN_EVENTS_POLL_SECONDS = float(os.environ.get('CABIN_EVENTS_POLL_SECONDS', '0.25'))
+# Commento keep-alive sullo stream SSE (rileva anche i client disconnessi)
+CABIN_EVENTS_HEARTBEAT_SECONDS = 15
+# Oltre questo numero di righe modificate in un colpo (ottimizzazione, riordino completo)
+# si invia un evento "reset" e il client ricarica la lista una volta sola
+CABIN_EVENTS_MAX_DELTA_ROWS = 200
+# Eventi in coda per client lento prima di sostituirli con un "reset"
+CABIN_EVENTS_QUEUE_SIZE = 100
+
+# Colonne e forma di una riga colore, condivise con /api/cabin/<id>/colors
+CABIN_COLOR_COLUMNS = """
+    id, color_code, color_type, cluster, ch_value, lunghezza_ordine,
+    input_sequence, sequence_type, completed, in_execution, sequence_order, line
+"""
+
+
+@dataclasses.dataclass
+class CabinColorRow:
+    """
+    Riga colore di una cabina come record compatto (__slots__, nessun dizionario per riga).
+    orjson lo serializza direttamente con gli stessi campi e nello stesso ordine del JSON
+    di /api/cabin/<id>/colors; jsonify lo gestisce come dataclass.
+    """
+    __slots__ = ('id', 'color_code', 'color_type', 'cluster', 'ch_value', 'lunghezza_ordine',
+                 'input_sequence', 'sequence_type', 'completed', 'in_execution', 'sequence_order', 'line')
+
+    id: int
+    color_code: Any
+    color_type: Any
+    cluster: Any
+    ch_value: Any
+    lunghezza_ordine: Any
+    input_sequence: Any
+    sequence_type: Any
+    completed: bool
+    in_execution: bool
+    sequence_order: Any
+    line: Any
+
+
+def cabin_color_row(row) -> CabinColorRow:
+    """Record da una riga SELECT {CABIN_COLOR_COLUMNS}."""
+    return CabinColorRow(row[0], row[1], row[2], row[3], row[4], row[5], row[6], row[7],
+                         bool(row[8]), bool(row[9]), row[10], row[11])
+
+
+def cabin_color_row_factory(cursor, row) -> CabinColorRow:
+    """Da usare come cursor.row_factory: le righe arrivano già come record."""
+    return cabin_color_row(row)
+
+
+_CABIN_NEW = "IFNULL(NEW.cabin_id, 1)"
+_CABIN_OLD = "IFNULL(OLD.cabin_id, 1)"
+
+# Log delle modifiche a optimization_colors scritto dai trigger: copre tutte le scritture,
+# anche quelle del backend che usa una propria connessione al database.
+CHANGE_LOG_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS cabin_changes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        cabin_id INTEGER NOT NULL,
+        color_id INTEGER NOT NULL,
+        op TEXT NOT NULL
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS optimization_colors_log_insert
+    AFTER INSERT ON optimization_colors
+    BEGIN
+        INSERT INTO cabin_changes (cabin_id, color_id, op) VALUES ({_CABIN_NEW}, NEW.id, 'insert');
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS optimization_colors_log_update
+    AFTER UPDATE ON optimization_colors WHEN {_CABIN_OLD} = {_CABIN_NEW}
+    BEGIN
+        INSERT INTO cabin_changes (cabin_id, color_id, op) VALUES ({_CABIN_NEW}, NEW.id, 'update');
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS optimization_colors_log_move_cabin
+    AFTER UPDATE ON optimization_colors WHEN {_CABIN_OLD} != {_CABIN_NEW}
+    BEGIN
+        INSERT INTO cabin_changes (cabin_id, color_id, op) VALUES ({_CABIN_OLD}, OLD.id, 'delete');
+        INSERT INTO cabin_changes (cabin_id, color_id, op) VALUES ({_CABIN_NEW}, NEW.id, 'insert');
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS optimization_colors_log_delete
+    AFTER DELETE ON optimization_colors
+    BEGIN
+        INSERT INTO cabin_changes (cabin_id, color_id, op) VALUES ({_CABIN_OLD}, OLD.id, 'delete');
+    END
+    """,
+    # Il log si pota da solo: ogni 1000 righe elimina quelle oltre le ultime 10000
+    """
+    CREATE TRIGGER IF NOT EXISTS cabin_changes_prune
+    AFTER INSERT ON cabin_changes WHEN NEW.id % 1000 = 0
+    BEGIN
+        DELETE FROM cabin_changes WHERE id <= NEW.id - 10000;
+    END
+    """,
+]
+
+
+def install_change_log(cursor: sqlite3.Cursor) -> None:
+    """Crea (se mancanti) la tabella cabin_changes e i trigger che la alimentano."""
+    for statement in CHANGE_LOG_SQL:
+        cursor.execute(statement)
+
+
+class CabinEventBus:
+    """
+    Pub/sub in processo per cabina. Un thread, attivo solo finché ci sono iscritti,
+    legge le nuove righe di cabin_changes dopo ogni commit e pubblica a ogni iscritto
+    della cabina un evento "delta" (righe inserite/aggiornate/spostate/eliminate)
+    oppure "reset" quando le modifiche sono troppe per un delta.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._subscribers: Dict[int, Set[queue.Queue]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    # --- Iscrizioni ---
+
+    def subscribe(self, cabin_id: int) -> queue.Queue:
+        q: queue.Queue = queue.Queue(maxsize=CABIN_EVENTS_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(cabin_id, set()).add(q)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="cabin-events", daemon=True)
+                self._thread.start()
+        logger.info(f"[CabinEvents] Nuovo iscritto cabina {cabin_id} (totale {self.subscriber_count()})")
+        return q
+
+    def unsubscribe(self, cabin_id: int, q: queue.Queue) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(cabin_id)
+            if subscribers:
+                subscribers.discard(q)
+                if not subscribers:
+                    del self._subscribers[cabin_id]
+        logger.info(f"[CabinEvents] Iscritto cabina {cabin_id} disconnesso")
+
+    def subscriber_count(self) -> int:
+        return sum(len(s) for s in self._subscribers.values())
+
+    def publish(self, cabin_id: int, event: Dict[str, Any]) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(cabin_id, ()))
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # Client troppo lento: scarta gli eventi accodati e chiedi un ricaricamento completo
+                with q.mutex:
+                    q.queue.clear()
+                q.put_nowait({"event": "reset", "cabin_id": cabin_id})
+
+    # --- Thread di lettura del log ---
+
+    def _run(self) -> None:
+        conn = sqlite3.connect(self.db_path)
+        last_id = None
+        data_version = None
+        try:
+            while True:
+                with self._lock:
+                    if not self._subscribers:
+                        self._thread = None
+                        return
+                try:
+                    if last_id is None:
+                        last_id = conn.execute("SELECT IFNULL(MAX(id), 0) FROM cabin_changes").fetchone()[0]
+                        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+                    time.sleep(CABIN_EVENTS_POLL_SECONDS)
+                    current_version = conn.execute("PRAGMA data_version").fetchone()[0]
+                    if current_version == data_version:
+                        continue
+                    data_version = current_version
+                    last_id = self._dispatch_changes(conn, last_id)
+                except sqlite3.Error as e:
+                    # Es. database bloccato da una scrittura lunga: gli iscritti ricaricano la lista
+                    # e si riparte dalla fine del log
+                    logger.warning(f"[CabinEvents] Errore lettura log modifiche: {e}")
+                    last_id = None
+                    with self._lock:
+                        cabin_ids = list(self._subscribers)
+                    for cabin_id in cabin_ids:
+                        self.publish(cabin_id, {"event": "reset", "cabin_id": cabin_id})
+                    time.sleep(CABIN_EVENTS_POLL_SECONDS)
+        finally:
+            conn.close()
+
+    def _dispatch_changes(self, conn: sqlite3.Connection, last_id: int) -> int:
+        rows = conn.execute(
+            "SELECT id, cabin_id, color_id, op FROM cabin_changes WHERE id > ? ORDER BY id", (last_id,)
+        ).fetchall()
+        if not rows:
+            return last_id
+
+        # Ultima operazione per colore, per cabina, mantenendo l'ordine di arrivo
+        per_cabin: Dict[int, Dict[int, str]] = {}
+        for _, cabin_id, color_id, op in rows:
+            changes = per_cabin.setdefault(cabin_id, {})
+            previous_op = changes.pop(color_id, None)
+            if previous_op == 'insert' and op == 'delete':
+                continue  # Inserito ed eliminato nello stesso batch: il client non l'ha mai visto
+            # Un colore inserito e poi aggiornato nello stesso batch resta un "insert"
+            changes[color_id] = 'insert' if previous_op == 'insert' else op
+        change_id = rows[-1][0]
+
+        for cabin_id, changes in per_cabin.items():
+            with self._lock:
+                if cabin_id not in self._subscribers or not changes:
+                    continue
+            if len(changes) > CABIN_EVENTS_MAX_DELTA_ROWS:
+                self.publish(cabin_id, {"event": "reset", "cabin_id": cabin_id, "change_id": change_id})
+                continue
+            self.publish(cabin_id, {
+                "event": "delta",
+                "cabin_id": cabin_id,
+                "change_id": change_id,
+                "changes": self._build_delta(conn, cabin_id, changes),
+            })
+        return change_id
+
+    def _build_delta(self, conn: sqlite3.Connection, cabin_id: int, changes: Dict[int, str]) -> List[Dict[str, Any]]:
+        live_ids = [color_id for color_id, op in changes.items() if op != 'delete']
+        current = {}
+        if live_ids:
+            placeholders = ",".join("?" * len(live_ids))
+            cursor = conn.cursor()
+            cursor.row_factory = cabin_color_row_factory
+            for color in cursor.execute(
+                f"SELECT {CABIN_COLOR_COLUMNS} FROM optimization_colors WHERE cabin_id = ? AND id IN ({placeholders})",
+                (cabin_id, *live_ids),
+            ):
+                current[color.id] = color
+
+        delta = []
+        for color_id, op in changes.items():
+            color = current.get(color_id)
+            if op == 'delete' or color is None:
+                # Eliminato (o già spostato/eliminato da una scrittura successiva)
+                delta.append({"op": "delete", "id": color_id})
+            else:
+                delta.append({"op": op, "id": color_id, "color": color})
+        return delta
@@ -5,8 +5,12 @@ import json
 import traceback # Importa traceback
 import sqlite3
 import logging
+import threading
+import hashlib
+import queue
+import time
 from typing import Dict, List, Tuple, Any, Optional
-from flask import Flask, render_template, request, flash, redirect, url_for, jsonify # Importa jsonify
+from flask import Flask, render_template, request, flash, redirect, url_for, jsonify, Response, stream_with_context # Importa jsonify
 # from flask_wtf.csrf import CSRFProtect  # Temporarily disabled for testing
 try:
     from .forms import (
@@ -18,6 +22,24 @@ except ImportError:
         OptimizationInputForm, CambioColoriRowForm,
         ClusterColoriRowForm, NewClusterForm, NewCambioColoriForm
     )
+try:
+    from .serialization import BACKEND_HEADERS, decode_backend_response, dumps_text, fast_jsonify
+    from .singleflight import SingleFlight, request_key
+    from .versions import DataVersions, install_version_tracking, cabin_scope, CLUSTERS_SCOPE, RULES_SCOPE
+    from .cabin_events import (
+        CabinEventBus, install_change_log, cabin_color_row_factory,
+        CABIN_COLOR_COLUMNS, CABIN_EVENTS_HEARTBEAT_SECONDS
+    )
+    from . import metrics
+except ImportError:
+    from serialization import BACKEND_HEADERS, decode_backend_response, dumps_text, fast_jsonify
+    from singleflight import SingleFlight, request_key
+    from versions import DataVersions, install_version_tracking, cabin_scope, CLUSTERS_SCOPE, RULES_SCOPE
+    from cabin_events import (
+        CabinEventBus, install_change_log, cabin_color_row_factory,
+        CABIN_COLOR_COLUMNS, CABIN_EVENTS_HEARTBEAT_SECONDS
+    )
+    import metrics
 
 # Configurazione del logging
 logging.basicConfig(
@@ -37,6 +59,17 @@ else:
 
 DATABASE_PATH = os.environ.get('DATABASE_PATH', DEFAULT_DB_PATH)
 
+# Cabine gestite dall'interfaccia (1..CABIN_COUNT); la modalità "cabine" del backend
+# ripartisce i colori sullo stesso numero di cabine
+CABIN_COUNT = int(os.environ.get('CABIN_COUNT', '2'))
+CABIN_IDS = list(range(1, CABIN_COUNT + 1))
+
+# Versioni per cabina (aggiornate da trigger SQLite) per ETag / If-None-Match sulle API di lettura
+data_versions = DataVersions(DATABASE_PATH)
+
+# Pub/sub in processo per gli aggiornamenti push delle cabine (SSE /api/cabin/<id>/events)
+cabin_events = CabinEventBus(DATABASE_PATH)
+
 # --- DATABASE FUNCTIONS ---
 def connect_to_db(db_path: str = DATABASE_PATH) -> Optional[sqlite3.Connection]:
     """Connette al database SQLite."""
@@ -204,6 +237,11 @@ def init_db():
                 if "duplicate column name" not in str(e).lower():
                     logger.warning(f"Errore durante aggiunta campo position: {e}")
         
+        # Tabella data_versions e trigger che la aggiornano a ogni scrittura
+        install_version_tracking(cursor)
+        # Log delle modifiche per cabina che alimenta gli aggiornamenti push
+        install_change_log(cursor)
+        
         # Verifica i dati esistenti per debug
         cursor.execute("SELECT DISTINCT source_cluster FROM cambio_colori")
         source_clusters = [row[0] for row in cursor.fetchall()]
@@ -283,6 +321,46 @@ def get_all_cambio_colori_grouped() -> Dict[str, List[Dict[str, Any]]]:
             conn.close()
     return grouped_rules
 
+def _compute_rules_version() -> str:
+    """Impronta (sha1) di cluster_colori + cambio_colori, come get_rules_version del backend."""
+    digest = hashlib.sha1()
+    conn = connect_to_db()
+    if not conn: return ""
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT cluster, color_code FROM cluster_colori ORDER BY cluster, color_code")
+        for row in cursor:
+            digest.update(repr(tuple(row)).encode('utf-8'))
+        digest.update(b'|')
+        cursor.execute("SELECT source_cluster, target_cluster, peso, transition_colors, required_trigger_type FROM cambio_colori ORDER BY source_cluster, target_cluster")
+        for row in cursor:
+            digest.update(repr(tuple(row)).encode('utf-8'))
+        return digest.hexdigest()
+    except sqlite3.Error as e:
+        print(f"Errore in get_rules_version: {e}")
+        return ""
+    finally:
+        if conn: conn.close()
+
+# Ultima impronta calcolata e contatore RULES_SCOPE (data_versions) a cui si riferisce
+_rules_version_cache: Dict[str, Any] = {"counter": None, "version": ""}
+_rules_version_lock = threading.Lock()
+
+def get_rules_version() -> str:
+    """
+    Impronta delle regole ricalcolata solo quando il contatore RULES_SCOPE (aggiornato dai
+    trigger su cluster_colori e cambio_colori) cambia; senza contatore ricalcola ogni volta.
+    """
+    versions = data_versions.get()
+    counter = versions.get(RULES_SCOPE) if versions else None
+    if counter is None:
+        return _compute_rules_version()
+    with _rules_version_lock:
+        if _rules_version_cache["counter"] != counter or not _rules_version_cache["version"]:
+            _rules_version_cache["version"] = _compute_rules_version()
+            _rules_version_cache["counter"] = counter
+        return _rules_version_cache["version"]
+
 def get_cambio_colori_row_by_id(row_id: int) -> Optional[Dict[str, Any]]:
     """Ottiene una singola riga da cambio_colori per ID."""
     conn = connect_to_db()
@@ -687,6 +765,9 @@ def merge_locked_colors(original_colors, optimized_colors):
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET_KEY', 'una-chiave-segreta-default-per-sviluppo')
 
+# Istogrammi Prometheus delle richieste (esposti su /metrics)
+metrics.install_request_metrics(app)
+
 # Disable CSRF protection entirely for testing
 app.config['WTF_CSRF_ENABLED'] = False
 
@@ -707,6 +788,7 @@ app.config['WTF_CSRF_ENABLED'] = False
 # ... (rest of the code remains the same)
 BACKEND_URL = os.environ.get('FASTAPI_BACKEND_URL', 'http://localhost:8001')
 OPTIMIZE_ENDPOINT = f"{BACKEND_URL}/optimize"
+OPTIMIZE_JOBS_ENDPOINT = f"{BACKEND_URL}/optimize/jobs"
 
 # Inizializza il database all'avvio dell'applicazione
 with app.app_context():
@@ -731,6 +813,11 @@ def index():
     host_backend_url = "http://localhost:8000"  # For external access
     return render_template('index.html', form=form, docker_backend_url=docker_backend_url, host_backend_url=host_backend_url)
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Durata delle richieste al frontend e dell'attesa sul backend, nel formato di testo Prometheus."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/db-check')
 def db_check():
     """Endpoint per verificare lo stato della connessione al database."""
@@ -934,9 +1021,9 @@ def optimize():
     logger.warning(f"Invio start_cluster_name al backend: '{payload_to_backend.get('start_cluster_name')}'")
     logger.debug(f"Payload completo: {json.dumps(payload_to_backend)}")
     try:
-        response = requests.post(OPTIMIZE_ENDPOINT, json=payload_to_backend, timeout=120)
+        response = metrics.backend_post(OPTIMIZE_ENDPOINT, json=payload_to_backend, headers=BACKEND_HEADERS, timeout=120)
         response.raise_for_status()
-        backend_results = response.json() 
+        backend_results = decode_backend_response(response)
         logger.info(f"Risposta ricevuta dal backend")
         
         # Log dettagliati sui risultati dell'ottimizzazione
@@ -1130,7 +1217,7 @@ def optimize():
 
         if is_json_request:
             backend_results["prioritized_reintegrations_used"] = payload_to_backend.get("prioritized_reintegrations", [])
-            return jsonify(backend_results)
+            return fast_jsonify(backend_results)
         else:
             # Per il primo rendering, popola i risultati e i dati iniziali
             initial_page_data_for_script["results"] = backend_results
@@ -1140,7 +1227,7 @@ def optimize():
                                    results=backend_results, # Per la visualizzazione Jinja iniziale
                                    error_message=None,      
                                    current_prioritized_reintegrations=payload_to_backend.get("prioritized_reintegrations", []),
-                                   initial_data_json=json.dumps(initial_page_data_for_script)
+                                   initial_data_json=dumps_text(initial_page_data_for_script)
                                   )
 
     except requests.exceptions.RequestException as e_req:
@@ -1162,7 +1249,7 @@ def optimize():
                                     results=None, # Jinja non mostrerà la tabella
                                     error_message=error_text, # Jinja mostrerà questo errore
                                     current_prioritized_reintegrations=payload_to_backend.get("prioritized_reintegrations", []),
-                                    initial_data_json=json.dumps(initial_page_data_for_script)
+                                    initial_data_json=dumps_text(initial_page_data_for_script)
                                    )
     except Exception as e_gen:
         error_text = f"Errore imprevisto nel frontend: {e_gen}"
@@ -1182,7 +1269,7 @@ def optimize():
                                         results=None, 
                                         error_message="Errore interno grave.", 
                                         current_prioritized_reintegrations=initial_page_data_for_script.get("current_prioritized_reintegrations", []),
-                                        initial_data_json=json.dumps(initial_page_data_for_script))
+                                        initial_data_json=dumps_text(initial_page_data_for_script))
 
 @app.route('/show_saved_results')
 def show_saved_results():
@@ -1233,7 +1320,7 @@ def show_saved_results():
                                results=sequence_data,
                                error_message=None,
                                current_prioritized_reintegrations=sequence_data.get("prioritized_reintegrations", []),
-                               initial_data_json=json.dumps(initial_page_data))
+                               initial_data_json=dumps_text(initial_page_data))
     
     except Exception as e:
         print(f"Errore nel caricare la sequenza salvata: {e}")
@@ -1915,8 +2002,8 @@ def home():
 @app.route('/cabin/<int:cabin_id>')
 def cabin_view(cabin_id):
     """Vista della cabina specifica."""
-    if cabin_id not in [1, 2]:
-        flash('Cabina non valida. Seleziona cabina 1 o 2.', 'error')
+    if cabin_id not in CABIN_IDS:
+        flash(f'Cabina non valida. Seleziona una cabina da 1 a {CABIN_COUNT}.', 'error')
         return redirect(url_for('home'))
     
     return render_template('cabin.html', cabin_id=cabin_id)
@@ -1924,6 +2011,7 @@ def cabin_view(cabin_id):
 # ==================== API ENDPOINTS ====================
 
 @app.route('/api/clusters')
+@data_versions.conditional(lambda: [CLUSTERS_SCOPE])
 def api_get_clusters():
     """API per ottenere la lista dei clusters disponibili."""
     try:
@@ -1942,8 +2030,9 @@ def api_get_clusters():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/cabin-status')
+@data_versions.conditional(lambda: [cabin_scope(cabin_id) for cabin_id in CABIN_IDS])
 def api_cabin_status():
-    """API per ottenere lo stato delle cabine."""
+    """API per ottenere lo stato delle cabine (una chiave cabin_<id> per ogni cabina di CABIN_IDS)."""
     try:
         conn = connect_to_db()
         if not conn:
@@ -1951,49 +2040,35 @@ def api_cabin_status():
         
         cursor = conn.cursor()
         
-        # Statistiche cabina 1
-        cursor.execute("SELECT COUNT(*) FROM optimization_colors WHERE cabin_id = 1")
-        cabin1_total = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM optimization_colors WHERE cabin_id = 1 AND in_execution = 1")
-        cabin1_executing = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM optimization_colors WHERE cabin_id = 1 AND completed = 1")
-        cabin1_completed = cursor.fetchone()[0]
-        
-        # Statistiche cabina 2
-        cursor.execute("SELECT COUNT(*) FROM optimization_colors WHERE cabin_id = 2")
-        cabin2_total = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM optimization_colors WHERE cabin_id = 2 AND in_execution = 1")
-        cabin2_executing = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM optimization_colors WHERE cabin_id = 2 AND completed = 1")
-        cabin2_completed = cursor.fetchone()[0]
+        # Totale, in esecuzione e completati per cabina in una sola lettura
+        cursor.execute("""
+            SELECT cabin_id, COUNT(*), SUM(in_execution = 1), SUM(completed = 1)
+            FROM optimization_colors
+            GROUP BY cabin_id
+        """)
+        counts = {row[0]: row[1:] for row in cursor.fetchall()}
         
         conn.close()
         
-        return jsonify({
-            "cabin_1": {
-                "total": cabin1_total,
-                "executing": cabin1_executing,
-                "completed": cabin1_completed
-            },
-            "cabin_2": {
-                "total": cabin2_total,
-                "executing": cabin2_executing,
-                "completed": cabin2_completed
+        status = {}
+        for cabin_id in CABIN_IDS:
+            total, executing, completed = counts.get(cabin_id, (0, 0, 0))
+            status[f"cabin_{cabin_id}"] = {
+                "total": total,
+                "executing": executing or 0,
+                "completed": completed or 0
             }
-        })
+        return jsonify(status)
     except Exception as e:
         logger.error(f"Errore in api_cabin_status: {e}")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/cabin/<int:cabin_id>/colors')
+@data_versions.conditional(lambda cabin_id: [cabin_scope(cabin_id)])
 def api_get_cabin_colors(cabin_id):
     """API per ottenere i colori di una cabina specifica."""
     try:
-        if cabin_id not in [1, 2]:
+        if cabin_id not in CABIN_IDS:
             return jsonify({"error": "Cabina non valida"}), 400
         
         conn = connect_to_db()
@@ -2001,42 +2076,58 @@ def api_get_cabin_colors(cabin_id):
             return jsonify({"error": "Connessione database fallita"}), 500
         
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, color_code, color_type, cluster, ch_value, lunghezza_ordine, 
-                   input_sequence, sequence_type, completed, in_execution, sequence_order, line
+        cursor.row_factory = cabin_color_row_factory  # Righe già come record compatti
+        cursor.execute(f"""
+            SELECT {CABIN_COLOR_COLUMNS}
             FROM optimization_colors 
             WHERE cabin_id = ? 
             ORDER BY sequence_order ASC, id ASC
         """, (cabin_id,))
         
-        colors = []
-        for row in cursor.fetchall():
-            colors.append({
-                "id": row[0],
-                "color_code": row[1],
-                "color_type": row[2],
-                "cluster": row[3],
-                "ch_value": row[4],
-                "lunghezza_ordine": row[5],
-                "input_sequence": row[6],
-                "sequence_type": row[7],
-                "completed": bool(row[8]),
-                "in_execution": bool(row[9]),
-                "sequence_order": row[10],
-                "line": row[11]
-            })
+        colors = cursor.fetchall()
         
         conn.close()
-        return jsonify({"colors": colors})
+        # Serializzati direttamente da orjson, senza dizionari intermedi
+        return fast_jsonify({"colors": colors})
     except Exception as e:
         logger.error(f"Errore in api_get_cabin_colors: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/cabin/<int:cabin_id>/events')
+def api_cabin_events(cabin_id):
+    """
+    Stream SSE degli aggiornamenti della cabina: eventi "delta" con le righe
+    inserite/aggiornate/spostate/eliminate ed eventi "reset" (ricaricare la lista).
+    """
+    if cabin_id not in CABIN_IDS:
+        return jsonify({"error": "Cabina non valida"}), 400
+    
+    def stream():
+        q = cabin_events.subscribe(cabin_id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = q.get(timeout=CABIN_EVENTS_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                data = dumps_text(event)
+                if 'change_id' in event:
+                    yield f"id: {event['change_id']}\nevent: {event['event']}\ndata: {data}\n\n"
+                else:
+                    yield f"event: {event['event']}\ndata: {data}\n\n"
+        finally:
+            cabin_events.unsubscribe(cabin_id, q)
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/cabin/<int:cabin_id>/colors/<int:color_id>/execution', methods=['PUT'])
 def api_update_color_execution(cabin_id, color_id):
     """API per aggiornare lo stato di esecuzione di un colore."""
     try:
-        if cabin_id not in [1, 2]:
+        if cabin_id not in CABIN_IDS:
             return jsonify({"error": "Cabina non valida"}), 400
         
         data = request.get_json()
@@ -2101,7 +2192,7 @@ def api_update_color_execution(cabin_id, color_id):
 def api_delete_color(cabin_id, color_id):
     """API per rimuovere un colore dalla cabina."""
     try:
-        if cabin_id not in [1, 2]:
+        if cabin_id not in CABIN_IDS:
             return jsonify({"error": "Cabina non valida"}), 400
         
         conn = connect_to_db()
@@ -2126,111 +2217,313 @@ def api_delete_color(cabin_id, color_id):
         logger.error(f"Errore in api_delete_color: {e}")
         return jsonify({"error": str(e)}), 500
 
+def _validate_optimization_request(data):
+    """
+    Valida il payload di ottimizzazione ricevuto dall'interfaccia.
+    Restituisce (backend_payload, None) oppure (None, messaggio_errore).
+    """
+    if not data or 'colors_today' not in data:
+        logger.error("Lista colori mancante nella richiesta")
+        return None, "Lista colori mancante"
+    
+    # Valida i dati di input
+    colors_today = data['colors_today']
+    if not isinstance(colors_today, list) or len(colors_today) == 0:
+        logger.error("colors_today deve essere un array non vuoto")
+        return None, "colors_today deve essere un array non vuoto"
+    
+    # Valida ogni colore
+    for i, color in enumerate(colors_today):
+        if not isinstance(color, dict):
+            logger.error(f"Colore {i} non è un oggetto valido")
+            return None, f"Colore {i} non è un oggetto valido"
+        
+        if 'code' not in color or not color['code']:
+            logger.error(f"Colore {i}: campo 'code' mancante o vuoto")
+            return None, f"Colore {i}: campo 'code' è richiesto"
+        
+        if 'type' not in color or not color['type']:
+            logger.error(f"Colore {i}: campo 'type' mancante o vuoto")
+            return None, f"Colore {i}: campo 'type' è richiesto"
+    
+    # Prepara la richiesta per il backend
+    backend_payload = {
+        "colors_today": colors_today,
+        "start_cluster_name": data.get('start_cluster_name'),
+        "prioritized_reintegrations": data.get('prioritized_reintegrations', [])
+    }
+    # Modalità "cabine": il backend ripartisce i colori su cabin_count cabine. La modalità
+    # "linee" restituisce un piano per linea che non si salva nelle cabine: non ammessa qui
+    if data.get('mode'):
+        if data['mode'] != 'cabine':
+            logger.error(f"Modalità di ottimizzazione non supportata: {data['mode']}")
+            return None, f"Modalità '{data['mode']}' non supportata: i risultati non possono essere salvati nelle cabine"
+        cabin_count = data.get('cabin_count') or CABIN_COUNT
+        # Cabine oltre CABIN_COUNT verrebbero salvate ma l'interfaccia non le mostra
+        if not isinstance(cabin_count, int) or isinstance(cabin_count, bool) or not 1 <= cabin_count <= CABIN_COUNT:
+            logger.error(f"cabin_count non valido: {cabin_count!r}")
+            return None, f"cabin_count deve essere un intero tra 1 e {CABIN_COUNT}"
+        backend_payload["mode"] = data['mode']
+        backend_payload["cabin_count"] = cabin_count
+    # Ordine dei cluster del piano attuale della cabina: soluzione iniziale del solver
+    if isinstance(data.get('warm_start_sequence'), list):
+        backend_payload["warm_start_sequence"] = [c for c in data['warm_start_sequence'] if isinstance(c, str) and c]
+    return backend_payload, None
+
+def _backend_error_detail(response):
+    """Estrae il messaggio di errore da una risposta non-200 del backend."""
+    error_detail = "Errore backend sconosciuto"
+    try:
+        error_data = response.json()
+        error_detail = error_data.get('detail', error_detail)
+        logger.error(f"Errore backend dettagliato: {error_data}")
+    except Exception as e:
+        logger.error(f"Impossibile parsare errore backend: {e}")
+        error_detail = f"Errore backend HTTP {response.status_code}: {response.text[:500]}"
+    return error_detail
+
+def save_optimization_results_to_db(backend_results, backend_payload):
+    """
+    Salva nel database delle cabine i risultati di un'ottimizzazione del backend.
+    Un risultato senza colori per le cabine (cabine, cabina_1/cabina_2 o ordered_colors)
+    non viene salvato e lascia intatti i piani esistenti.
+    """
+    if not ('cabine' in backend_results or 'ordered_colors' in backend_results
+            or ('cabina_1' in backend_results and 'cabina_2' in backend_results)):
+        logger.warning(f"Risultato senza colori per le cabine (chiavi {sorted(backend_results)}): piani esistenti non modificati")
+        return
+    conn = connect_to_db()
+    if conn:
+        try:
+            cursor = conn.cursor()
+            
+            # Pulisci i dati esistenti
+            cursor.execute("DELETE FROM optimization_colors")
+            
+            # Crea una mappa dei dati originali per preservare i campi extra
+            original_data_map = {}
+            for color in backend_payload['colors_today']:
+                original_data_map[color['code']] = color
+            
+            # Ottieni la lista dei reintegri prioritari
+            prioritized_reintegrations = backend_payload.get('prioritized_reintegrations', [])
+            
+            if 'cabine' in backend_results:
+                # Modalità "cabine": una lista per cabina con il suo cabin_id
+                for cabina in backend_results['cabine']:
+                    if cabina.get('ordered_colors'):
+                        save_colors_to_db_internal_with_original_data(cursor, cabina['ordered_colors'], cabina['cabin_id'], prioritized_reintegrations, original_data_map)
+            elif 'cabina_1' in backend_results and 'cabina_2' in backend_results:
+                # Risultati per cabine separate
+                if backend_results['cabina_1'] and backend_results['cabina_1'].get('ordered_colors'):
+                    save_colors_to_db_internal_with_original_data(cursor, backend_results['cabina_1']['ordered_colors'], 1, prioritized_reintegrations, original_data_map)
+                
+                if backend_results['cabina_2'] and backend_results['cabina_2'].get('ordered_colors'):
+                    save_colors_to_db_internal_with_original_data(cursor, backend_results['cabina_2']['ordered_colors'], 2, prioritized_reintegrations, original_data_map)
+            else:
+                # Risultati standard - separa per lunghezza ordine
+                if backend_results.get('ordered_colors'):
+                    for idx, color in enumerate(backend_results['ordered_colors']):
+                        cabin_id = 2 if color.get('lunghezza_ordine') == 'lungo' else 1
+                        save_color_to_db_internal_simple_with_original_data(cursor, color, idx, cabin_id, original_data_map)
+            
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Errore durante il salvataggio: {e}")
+        finally:
+            conn.close()
+
+# Richieste /api/optimize identiche e concorrenti (doppio click, più pagine aperte)
+# condividono una sola chiamata al backend e un solo salvataggio
+optimize_flights = SingleFlight("api_optimize")
+
+def _optimize_and_save(backend_payload):
+    """Chiama /optimize del backend e salva il risultato. Restituisce (corpo, status)."""
+    logger.info(f"Invio richiesta al backend con {len(backend_payload['colors_today'])} colori")
+    logger.debug(f"Payload backend: {json.dumps(backend_payload, indent=2)}")
+    
+    # Chiama il backend API
+    response = metrics.backend_post(
+        OPTIMIZE_ENDPOINT,
+        json=backend_payload,
+        headers={'Content-Type': 'application/json', **BACKEND_HEADERS},
+        timeout=60
+    )
+    
+    logger.info(f"Risposta backend: status={response.status_code}")
+    
+    if response.status_code != 200:
+        return {"error": _backend_error_detail(response)}, response.status_code
+    
+    backend_results = decode_backend_response(response)
+    
+    # Salva i risultati nel database
+    save_optimization_results_to_db(backend_results, backend_payload)
+    return backend_results, 200
+
 @app.route('/api/optimize', methods=['POST'])
 def api_optimize():
     """API per eseguire l'ottimizzazione dei colori."""
     try:
-        data = request.get_json()
-        if not data or 'colors_today' not in data:
-            logger.error("Lista colori mancante nella richiesta")
-            return jsonify({"error": "Lista colori mancante"}), 400
-        
-        # Valida i dati di input
-        colors_today = data['colors_today']
-        if not isinstance(colors_today, list) or len(colors_today) == 0:
-            logger.error("colors_today deve essere un array non vuoto")
-            return jsonify({"error": "colors_today deve essere un array non vuoto"}), 400
-        
-        # Valida ogni colore
-        for i, color in enumerate(colors_today):
-            if not isinstance(color, dict):
-                logger.error(f"Colore {i} non è un oggetto valido")
-                return jsonify({"error": f"Colore {i} non è un oggetto valido"}), 400
-            
-            if 'code' not in color or not color['code']:
-                logger.error(f"Colore {i}: campo 'code' mancante o vuoto")
-                return jsonify({"error": f"Colore {i}: campo 'code' è richiesto"}), 400
-            
-            if 'type' not in color or not color['type']:
-                logger.error(f"Colore {i}: campo 'type' mancante o vuoto")
-                return jsonify({"error": f"Colore {i}: campo 'type' è richiesto"}), 400
-        
-        # Prepara la richiesta per il backend
-        backend_payload = {
-            "colors_today": colors_today,
-            "start_cluster_name": data.get('start_cluster_name'),
-            "prioritized_reintegrations": data.get('prioritized_reintegrations', [])
-        }
-        
-        logger.info(f"Invio richiesta al backend con {len(colors_today)} colori")
-        logger.debug(f"Payload backend: {json.dumps(backend_payload, indent=2)}")
+        backend_payload, error = _validate_optimization_request(request.get_json())
+        if error:
+            return jsonify({"error": error}), 400
+        
+        key = request_key(backend_payload, get_rules_version())
+        (body, status), shared = optimize_flights.do(key, lambda: _optimize_and_save(backend_payload))
+        if shared:
+            logger.info("Risultato condiviso con una richiesta identica già in corso")
+        return fast_jsonify(body, status=status)
+    except requests.RequestException as e:
+        logger.error(f"Errore durante la chiamata al backend: {e}")
+        return jsonify({"error": "Errore di comunicazione con il backend"}), 500
+    except Exception as e:
+        logger.error(f"Errore in api_optimize: {e}")
+        return jsonify({"error": str(e)}), 500
+
+# --- Ottimizzazione in background con avanzamento (Server-Sent Events) ---
+
+# Payload originali dei job avviati da questo frontend, necessari per salvare il risultato.
+# Stessa politica del registro job del backend (JobRegistry._prune): una voce non usata
+# (avvio, stream, stop) da più di TTL secondi scade e oltre MAX voci si scartano le più
+# vecchie, così i job interrotti, falliti o abbandonati non restano in memoria.
+OPTIMIZATION_JOB_PAYLOADS_MAX = int(os.environ.get('OPTIMIZATION_JOB_PAYLOADS_MAX', '50'))
+OPTIMIZATION_JOB_PAYLOADS_TTL_SECONDS = float(os.environ.get('OPTIMIZATION_JOB_PAYLOADS_TTL_SECONDS', '900'))
+
+# job_id -> (payload, ultimo utilizzo time.time())
+_optimization_job_payloads: Dict[str, Tuple[Dict[str, Any], float]] = {}
+_optimization_job_payloads_lock = threading.Lock()
+
+def _prune_job_payloads(now: float) -> None:
+    """Da chiamare con il lock: rimuove le voci scadute e, se ancora troppe, le meno recenti."""
+    expired = [job_id for job_id, (_, used_at) in _optimization_job_payloads.items()
+               if now - used_at > OPTIMIZATION_JOB_PAYLOADS_TTL_SECONDS]
+    for job_id in expired:
+        del _optimization_job_payloads[job_id]
+    oldest = sorted(_optimization_job_payloads, key=lambda job_id: _optimization_job_payloads[job_id][1])
+    while len(_optimization_job_payloads) >= OPTIMIZATION_JOB_PAYLOADS_MAX and oldest:
+        del _optimization_job_payloads[oldest.pop(0)]
+
+def _remember_job_payload(job_id: str, backend_payload: Dict[str, Any]) -> None:
+    now = time.time()
+    with _optimization_job_payloads_lock:
+        _prune_job_payloads(now)
+        _optimization_job_payloads[job_id] = (backend_payload, now)
+
+def _job_payload(job_id: str) -> Optional[Dict[str, Any]]:
+    """Payload del job (None se sconosciuto o scaduto); l'accesso ne rinnova la scadenza."""
+    now = time.time()
+    with _optimization_job_payloads_lock:
+        entry = _optimization_job_payloads.get(job_id)
+        if entry is None or now - entry[1] > OPTIMIZATION_JOB_PAYLOADS_TTL_SECONDS:
+            _optimization_job_payloads.pop(job_id, None)
+            return None
+        _optimization_job_payloads[job_id] = (entry[0], now)
+        return entry[0]
+
+def _forget_job_payload(job_id: str) -> None:
+    with _optimization_job_payloads_lock:
+        _optimization_job_payloads.pop(job_id, None)
+
+@app.route('/api/optimize/jobs', methods=['POST'])
+def api_start_optimization_job():
+    """Avvia un'ottimizzazione in background sul backend e restituisce l'id del job."""
+    try:
+        backend_payload, error = _validate_optimization_request(request.get_json())
+        if error:
+            return jsonify({"error": error}), 400
         
-        # Chiama il backend API
-        response = requests.post(
-            OPTIMIZE_ENDPOINT,
+        logger.info(f"Avvio job di ottimizzazione con {len(backend_payload['colors_today'])} colori")
+        response = metrics.backend_post(
+            OPTIMIZE_JOBS_ENDPOINT,
             json=backend_payload,
             headers={'Content-Type': 'application/json'},
-            timeout=60
+            timeout=30
         )
+        if response.status_code != 200:
+            return jsonify({"error": _backend_error_detail(response)}), response.status_code
         
-        logger.info(f"Risposta backend: status={response.status_code}")
-        
+        job_info = response.json()
+        _remember_job_payload(job_info['job_id'], backend_payload)
+        return jsonify(job_info)
+    except requests.RequestException as e:
+        logger.error(f"Errore durante la chiamata al backend: {e}")
+        return jsonify({"error": "Errore di comunicazione con il backend"}), 500
+    except Exception as e:
+        logger.error(f"Errore in api_start_optimization_job: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/optimize/jobs/<job_id>/events')
+def api_optimization_job_events(job_id):
+    """Inoltra al browser lo stream SSE di avanzamento del backend."""
+    _job_payload(job_id)  # Job seguito dal browser: rinnova la scadenza del payload
+    headers = {'Accept': 'text/event-stream'}
+    if request.headers.get('Last-Event-ID'):
+        headers['Last-Event-ID'] = request.headers['Last-Event-ID']
+    try:
+        upstream = metrics.backend_get(f"{OPTIMIZE_JOBS_ENDPOINT}/{job_id}/events", headers=headers, stream=True, timeout=(5, None))
+    except requests.RequestException as e:
+        logger.error(f"Errore apertura stream job {job_id}: {e}")
+        return jsonify({"error": "Errore di comunicazione con il backend"}), 500
+    if upstream.status_code != 200:
+        error_detail = _backend_error_detail(upstream)
+        upstream.close()
+        return jsonify({"error": error_detail}), upstream.status_code
+    
+    def relay():
+        try:
+            for chunk in upstream.iter_content(chunk_size=None):
+                if chunk:
+                    yield chunk
+        finally:
+            upstream.close()
+    
+    return Response(stream_with_context(relay()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/optimize/jobs/<job_id>/stop', methods=['POST'])
+def api_stop_optimization_job(job_id):
+    """Interrompe il job: il backend restituirà la migliore sequenza trovata finora."""
+    _job_payload(job_id)  # Il risultato interrotto potrà ancora essere applicato
+    try:
+        response = metrics.backend_post(f"{OPTIMIZE_JOBS_ENDPOINT}/{job_id}/stop", timeout=10)
+        if response.status_code == 404:
+            _forget_job_payload(job_id)
         if response.status_code != 200:
-            error_detail = "Errore backend sconosciuto"
-            try:
-                error_data = response.json()
-                error_detail = error_data.get('detail', error_detail)
-                logger.error(f"Errore backend dettagliato: {error_data}")
-            except Exception as e:
-                logger.error(f"Impossibile parsare errore backend: {e}")
-                error_detail = f"Errore backend HTTP {response.status_code}: {response.text[:500]}"
-            return jsonify({"error": error_detail}), response.status_code
+            return jsonify({"error": _backend_error_detail(response)}), response.status_code
+        return jsonify(response.json())
+    except requests.RequestException as e:
+        logger.error(f"Errore durante la chiamata al backend: {e}")
+        return jsonify({"error": "Errore di comunicazione con il backend"}), 500
+
+@app.route('/api/optimize/jobs/<job_id>/apply', methods=['POST'])
+def api_apply_optimization_job(job_id):
+    """Salva nelle cabine il risultato (completo o interrotto) di un job terminato."""
+    try:
+        backend_payload = _job_payload(job_id)
+        if backend_payload is None:
+            return jsonify({"error": f"Job {job_id} non avviato da questa interfaccia"}), 404
         
-        backend_results = response.json()
+        response = metrics.backend_get(f"{OPTIMIZE_JOBS_ENDPOINT}/{job_id}", headers=BACKEND_HEADERS, timeout=10)
+        if response.status_code == 404:
+            _forget_job_payload(job_id)  # Job già rimosso dal registro del backend
+        if response.status_code != 200:
+            return jsonify({"error": _backend_error_detail(response)}), response.status_code
         
-        # Salva i risultati nel database
-        conn = connect_to_db()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                
-                # Pulisci i dati esistenti
-                cursor.execute("DELETE FROM optimization_colors")
-                
-                # Crea una mappa dei dati originali per preservare i campi extra
-                original_data_map = {}
-                for color in colors_today:
-                    original_data_map[color['code']] = color
-                
-                # Ottieni la lista dei reintegri prioritari
-                prioritized_reintegrations = backend_payload.get('prioritized_reintegrations', [])
-                
-                if 'cabina_1' in backend_results and 'cabina_2' in backend_results:
-                    # Risultati per cabine separate
-                    if backend_results['cabina_1'] and backend_results['cabina_1'].get('ordered_colors'):
-                        save_colors_to_db_internal_with_original_data(cursor, backend_results['cabina_1']['ordered_colors'], 1, prioritized_reintegrations, original_data_map)
-                    
-                    if backend_results['cabina_2'] and backend_results['cabina_2'].get('ordered_colors'):
-                        save_colors_to_db_internal_with_original_data(cursor, backend_results['cabina_2']['ordered_colors'], 2, prioritized_reintegrations, original_data_map)
-                else:
-                    # Risultati standard - separa per lunghezza ordine
-                    if backend_results.get('ordered_colors'):
-                        for idx, color in enumerate(backend_results['ordered_colors']):
-                            cabin_id = 2 if color.get('lunghezza_ordine') == 'lungo' else 1
-                            save_color_to_db_internal_simple_with_original_data(cursor, color, idx, cabin_id, original_data_map)
-                
-                conn.commit()
-            except Exception as e:
-                logger.error(f"Errore durante il salvataggio: {e}")
-            finally:
-                conn.close()
+        job_info = decode_backend_response(response)
+        if not job_info.get('result'):
+            return jsonify({"error": f"Job in stato '{job_info.get('status')}': nessuna sequenza disponibile",
+                            "status": job_info.get('status')}), 409
         
-        return jsonify(backend_results)
+        save_optimization_results_to_db(job_info['result'], backend_payload)
+        _forget_job_payload(job_id)
+        logger.info(f"Risultato job {job_id} ({job_info.get('status')}) salvato nelle cabine")
+        return fast_jsonify({**job_info['result'], "status": job_info.get('status')})
     except requests.RequestException as e:
         logger.error(f"Errore durante la chiamata al backend: {e}")
         return jsonify({"error": "Errore di comunicazione con il backend"}), 500
     except Exception as e:
-        logger.error(f"Errore in api_optimize: {e}")
+        logger.error(f"Errore in api_apply_optimization_job: {e}")
         return jsonify({"error": str(e)}), 500
 
 def save_color_to_db_internal(cursor, color, cabin_id, position):
@@ -2388,7 +2681,7 @@ def api_clear_all():
 def api_cabin_optimize_partial(cabin_id):
     """API per eseguire l'ottimizzazione parziale dei cluster per una cabina specifica."""
     try:
-        if cabin_id not in [1, 2]:
+        if cabin_id not in CABIN_IDS:
             return jsonify({"error": "Cabina non valida"}), 400
             
         data = request.get_json()
@@ -2418,7 +2711,7 @@ def api_cabin_optimize_partial(cabin_id):
         
         # Chiama il backend API
         backend_url = f"{BACKEND_URL}/optimize-partial"
-        response = requests.post(
+        response = metrics.backend_post(
             backend_url,
             json=backend_payload,
             headers={'Content-Type': 'application/json'},
@@ -2475,10 +2768,11 @@ def api_cabin_optimize_partial(cabin_id):
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/cabin/<int:cabin_id>/cluster_order')
+@data_versions.conditional(lambda cabin_id: [cabin_scope(cabin_id)])
 def api_get_cabin_cluster_order(cabin_id):
     """API per ottenere l'ordine dei cluster di una cabina specifica."""
     try:
-        if cabin_id not in [1, 2]:
+        if cabin_id not in CABIN_IDS:
             return jsonify({"error": "Cabina non valida"}), 400
         
         conn = connect_to_db()
@@ -2503,10 +2797,11 @@ def api_get_cabin_cluster_order(cabin_id):
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/cabin/<int:cabin_id>/original_cluster_order')
+@data_versions.conditional(lambda cabin_id: [cabin_scope(cabin_id)])
 def api_get_cabin_original_cluster_order(cabin_id):
     """API per ottenere l'ordine originale dei cluster di una cabina specifica."""
     try:
-        if cabin_id not in [1, 2]:
+        if cabin_id not in CABIN_IDS:
             return jsonify({"error": "Cabina non valida"}), 400
         
         # Per l'ordine originale, usiamo l'ordine alfabetico dei cluster presenti
@@ -2534,7 +2829,7 @@ def api_get_cabin_original_cluster_order(cabin_id):
 def api_update_color_lock(cabin_id, color_index):
     """API per aggiornare lo stato di blocco di un singolo colore."""
     try:
-        if cabin_id not in [1, 2]:
+        if cabin_id not in CABIN_IDS:
             return jsonify({"error": "Cabina non valida"}), 400
         
         data = request.get_json()
@@ -2601,7 +2896,7 @@ def api_update_color_lock(cabin_id, color_index):
 def api_update_cluster_lock(cabin_id, cluster_name):
     """API per aggiornare lo stato di blocco di tutti i colori di un cluster."""
     try:
-        if cabin_id not in [1, 2]:
+        if cabin_id not in CABIN_IDS:
             return jsonify({"error": "Cabina non valida"}), 400
         
         data = request.get_json()
@@ -2612,7 +2907,7 @@ def api_update_cluster_lock(cabin_id, cluster_name):
         
         # Chiama il backend per aggiornare il blocco del cluster
         backend_url = f"{BACKEND_URL}/update-cluster-lock"
-        response = requests.post(
+        response = metrics.backend_post(
             backend_url,
             json={
                 'cabin_id': cabin_id,
@@ -2649,11 +2944,49 @@ def api_update_cluster_lock(cabin_id, cluster_name):
         logger.error(f"Errore in api_update_cluster_lock: {e}")
         return jsonify({"error": str(e)}), 500
 
+def repair_reordered_colors(rows, moved_from, moved_to):
+    """
+    Chiede al backend la riparazione locale di un piano appena riordinato con drag & drop
+    (righe SELECT di api_reorder_colors, già nel nuovo ordine). Restituisce la risposta del
+    backend ('order' = nuovo ordine delle righe, costi e finestre) oppure None se la
+    riparazione non è disponibile: in quel caso resta l'ordine scelto dall'operatore.
+    """
+    colors_payload = [{
+        'code': row[0],
+        'type': row[1],
+        'cluster': row[2],
+        'sequence': row[3],
+        'sequence_type': row[4],
+        'CH': row[5],
+        'lunghezza_ordine': row[6],
+        'locked': bool(row[7]),
+        'line': row[10] if len(row) > 10 else None
+    } for row in rows]
+    try:
+        response = metrics.backend_post(
+            f"{BACKEND_URL}/optimize-locked-colors/repair",
+            json={'colors_today': colors_payload, 'moved_from': moved_from, 'moved_to': moved_to},
+            headers=BACKEND_HEADERS,
+            timeout=30
+        )
+        if response.status_code != 200:
+            logger.warning(f"Riparazione locale non riuscita ({response.status_code}): {response.text[:200]}")
+            return None
+        repair = decode_backend_response(response)
+        if sorted(repair.get('order', [])) != list(range(len(rows))):
+            logger.warning("Riparazione locale: ordine restituito non valido, mantenuto l'ordine dell'operatore")
+            return None
+        logger.info(f"Riparazione locale {moved_from} -> {moved_to}: {repair.get('message')}")
+        return repair
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Riparazione locale non disponibile: {e}")
+        return None
+
 @app.route('/api/cabin/<int:cabin_id>/colors/reorder', methods=['PUT'])
 def api_reorder_colors(cabin_id):
     """API per riordinare i colori con drag & drop."""
     try:
-        if cabin_id not in [1, 2]:
+        if cabin_id not in CABIN_IDS:
             return jsonify({"error": "Cabina non valida"}), 400
         
         data = request.get_json()
@@ -2692,12 +3025,20 @@ def api_reorder_colors(cabin_id):
                 if index < 0 or index >= len(current_colors):
                     return jsonify({"error": f"Indice non valido: {index}"}), 400
             
+            reordered_colors = [current_colors[old_index] for old_index in new_order]
+            
+            # Riparazione locale: il backend riottimizza solo le posizioni vicine allo spostamento
+            repair = None
+            if data.get('local_repair') and isinstance(data.get('moved_from'), int) and isinstance(data.get('moved_to'), int):
+                repair = repair_reordered_colors(reordered_colors, data['moved_from'], data['moved_to'])
+                if repair is not None:
+                    reordered_colors = [reordered_colors[i] for i in repair['order']]
+            
             # Elimina tutti i colori esistenti per questa cabina
             cursor.execute("DELETE FROM optimization_colors WHERE cabin_id = ?", (cabin_id,))
             
             # Reinserisci i colori nel nuovo ordine
-            for new_pos, old_index in enumerate(new_order):
-                color_data = current_colors[old_index]
+            for new_pos, color_data in enumerate(reordered_colors):
                 
                 cursor.execute("""
                     INSERT INTO optimization_colors 
@@ -2723,12 +3064,16 @@ def api_reorder_colors(cabin_id):
             
             logger.info(f"Riordinati {len(new_order)} colori per cabina {cabin_id}")
             
-            return jsonify({
+            response_data = {
                 "success": True,
                 "message": f"Riordinati {len(new_order)} colori per cabina {cabin_id}",
                 "cabin_id": cabin_id,
                 "colors_count": len(new_order)
-            })
+            }
+            if repair is not None:
+                response_data["repair"] = {key: repair[key] for key in (
+                    "windows", "cost_before_move", "cost_after_move", "cost_after_repair", "cost_delta", "message")}
+            return jsonify(response_data)
             
         except Exception as e:
             conn.rollback()
@@ -2745,7 +3090,7 @@ def api_reorder_colors(cabin_id):
 def api_optimize_with_locked_colors(cabin_id):
     """API per ottimizzazione con colori bloccati individualmente."""
     try:
-        if cabin_id not in [1, 2]:
+        if cabin_id not in CABIN_IDS:
             return jsonify({"error": "Cabina non valida"}), 400
         
         data = request.get_json()
@@ -2757,7 +3102,7 @@ def api_optimize_with_locked_colors(cabin_id):
         
         # Chiama il backend per ottimizzazione con colori bloccati
         backend_url = f"{BACKEND_URL}/optimize-locked-colors"
-        response = requests.post(
+        response = metrics.backend_post(
             backend_url,
             json={
                 'colors_today': colors_today,
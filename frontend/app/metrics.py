@@ -0,0 +1,114 @@
+# frontend/app/metrics.py
+"""Prometheus histograms for Flask requests and for the time spent waiting on the FastAPI backend."""
+
+import bisect
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Sequence, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from flask import Flask, g, request
+
+# Limiti superiori (secondi) dei bucket, come nel backend
+METRICS_BUCKETS = [float(b) for b in os.environ.get(
+    'METRICS_BUCKETS', '0.001,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60').split(',')]
+
+# Segmenti di percorso con cifre (id cabina, id job): una sola serie per endpoint del backend
+_ID_SEGMENT = re.compile(r"/[^/]*\d[^/]*")
+
+
+class Histogram:
+    """Istogramma cumulativo in formato Prometheus, con etichette; thread-safe."""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = sorted(buckets)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # etichette -> [conteggi per bucket..., +Inf, somma]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        k = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+            series[k] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            base = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(self.label_names, labels))
+            sep = "," if base else ""
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + [float("inf")], series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{le}"}} {cumulative:g}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative:g}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_SECONDS = Histogram("giotto_frontend_request_seconds",
+                            "Durata delle richieste HTTP al frontend", ["method", "endpoint", "status"],
+                            METRICS_BUCKETS)
+BACKEND_SECONDS = Histogram("giotto_frontend_backend_wait_seconds",
+                            "Attesa del frontend sulle chiamate al backend FastAPI (fino agli header della risposta)",
+                            ["method", "route", "status"], METRICS_BUCKETS)
+
+
+def install_request_metrics(app: Flask) -> None:
+    """Misura ogni richiesta Flask per endpoint (nome della view, non l'URL con gli id)."""
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            REQUEST_SECONDS.observe(time.perf_counter() - start, request.method,
+                                    request.endpoint or "non_trovato", str(response.status_code))
+        return response
+
+
+def backend_request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    requests.request verso il backend con il tempo di attesa nell'istogramma. Le eccezioni
+    di requests (timeout, connessione rifiutata) sono contate con status "errore" e rilanciate.
+    """
+    route = _ID_SEGMENT.sub("/{id}", urlsplit(url).path) or "/"
+    start = time.perf_counter()
+    status = "errore"
+    try:
+        response = requests.request(method, url, **kwargs)
+        status = str(response.status_code)
+        return response
+    finally:
+        BACKEND_SECONDS.observe(time.perf_counter() - start, method, route, status)
+
+
+def backend_get(url: str, **kwargs) -> requests.Response:
+    return backend_request("GET", url, **kwargs)
+
+
+def backend_post(url: str, **kwargs) -> requests.Response:
+    return backend_request("POST", url, **kwargs)
+
+
+def render() -> str:
+    """Tutte le metriche nel formato di testo Prometheus."""
+    return "\n".join(REQUEST_SECONDS.render() + BACKEND_SECONDS.render()) + "\n"
@@ -0,0 +1,56 @@
+# frontend/app/serialization.py
+"""Fast (de)serialization of backend optimization payloads (orjson / msgpack)."""
+
+import dataclasses
+import json
+from typing import Any
+
+from flask import Response
+
+try:
+    import orjson
+except ImportError:  # Fallback al json della libreria standard
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Senza msgpack si chiede al backend solo JSON
+    msgpack = None
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+# Header Accept per le chiamate di ottimizzazione: msgpack se disponibile, altrimenti JSON.
+# La decompressione gzip è gestita automaticamente da requests.
+BACKEND_ACCEPT = "application/msgpack, application/json;q=0.9" if msgpack is not None else "application/json"
+BACKEND_HEADERS = {'Accept': BACKEND_ACCEPT, 'Accept-Encoding': 'gzip'}
+
+
+def decode_backend_response(response) -> Any:
+    """Decodifica il corpo di una risposta del backend in base al Content-Type."""
+    content_type = response.headers.get('Content-Type', '')
+    if msgpack is not None and any(media_type in content_type for media_type in MSGPACK_MEDIA_TYPES):
+        return msgpack.unpackb(response.content, raw=False)
+    if orjson is not None:
+        return orjson.loads(response.content)
+    return response.json()
+
+
+def _default(obj: Any) -> Any:
+    """Per il json della libreria standard: i record dataclass (es. CabinColorRow) come dizionari."""
+    if dataclasses.is_dataclass(obj):
+        return {field.name: getattr(obj, field.name) for field in dataclasses.fields(obj)}
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_text(data: Any) -> str:
+    """Serializza in stringa JSON (es. per initial_data_json nei template)."""
+    if orjson is not None:
+        return orjson.dumps(data).decode('utf-8')
+    return json.dumps(data, default=_default)
+
+
+def fast_jsonify(data: Any, status: int = 200) -> Response:
+    """Come jsonify, ma serializza con orjson quando disponibile."""
+    if orjson is not None:
+        return Response(orjson.dumps(data), status=status, mimetype='application/json')
+    return Response(json.dumps(data, default=_default), status=status, mimetype='application/json')
@@ -0,0 +1,62 @@
+# frontend/app/singleflight.py
+"""Single-flight coalescing of identical concurrent optimization requests (thread-based)."""
+
+import hashlib
+import json
+import logging
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+logger = logging.getLogger('frontend')
+
+
+def request_key(payload: Dict[str, Any], rules_version: str) -> str:
+    """Hash canonico del payload (chiavi ordinate) più la versione delle regole."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{rules_version}\n{canonical}".encode("utf-8")).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Exception = None
+
+
+class SingleFlight:
+    """
+    Il primo thread con una certa chiave esegue la funzione, i thread che arrivano
+    con la stessa chiave mentre è in corso attendono e ricevono lo stesso risultato.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Restituisce (risultato, condiviso); le eccezioni del primo chiamante vengono propagate a tutti."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            logger.info(f"[{self.name}] Richiesta identica già in corso ({key[:12]}): attendo il risultato condiviso")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
@@ -0,0 +1,180 @@
+# frontend/app/versions.py
+"""Per-cabin data versions maintained by SQLite triggers, used for ETag / 304 responses."""
+
+import functools
+import logging
+import sqlite3
+import threading
+from typing import Callable, Dict, Iterable, Optional
+
+from flask import Response, make_response, request
+
+logger = logging.getLogger('frontend')
+
+CLUSTERS_SCOPE = "clusters"
+# Regole dell'ottimizzatore (cluster_colori + cambio_colori): il contatore evita di
+# ricalcolare get_rules_version (frontend e backend) finché le regole non cambiano
+RULES_SCOPE = "rules"
+
+
+def cabin_scope(cabin_id) -> str:
+    return f"cabin:{cabin_id}"
+
+
+# Un nuovo scope parte dall'istante di creazione (in secondi) e non da 0, così un ETag
+# emesso prima di una ricreazione del database non può combaciare per caso.
+_BUMP = """
+    INSERT OR IGNORE INTO data_versions (scope, version) VALUES ({scope}, CAST(strftime('%s', 'now') AS INTEGER));
+    UPDATE data_versions SET version = version + 1 WHERE scope = {scope};
+"""
+_CABIN_NEW = "'cabin:' || IFNULL(NEW.cabin_id, 1)"
+_CABIN_OLD = "'cabin:' || IFNULL(OLD.cabin_id, 1)"
+_CLUSTERS = f"'{CLUSTERS_SCOPE}'"
+_RULES = f"'{RULES_SCOPE}'"
+
+# Ogni scrittura su optimization_colors (da frontend o backend) incrementa la versione
+# della cabina interessata; le scritture su cluster_colori quella della lista cluster,
+# quelle su cluster_colori e cambio_colori la versione delle regole.
+VERSION_TRACKING_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS data_versions (
+        scope TEXT PRIMARY KEY NOT NULL,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS optimization_colors_version_insert
+    AFTER INSERT ON optimization_colors
+    BEGIN {_BUMP.format(scope=_CABIN_NEW)} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS optimization_colors_version_update
+    AFTER UPDATE ON optimization_colors
+    BEGIN {_BUMP.format(scope=_CABIN_OLD)} {_BUMP.format(scope=_CABIN_NEW)} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS optimization_colors_version_delete
+    AFTER DELETE ON optimization_colors
+    BEGIN {_BUMP.format(scope=_CABIN_OLD)} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS cluster_colori_version_insert
+    AFTER INSERT ON cluster_colori
+    BEGIN {_BUMP.format(scope=_CLUSTERS)} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS cluster_colori_version_update
+    AFTER UPDATE ON cluster_colori
+    BEGIN {_BUMP.format(scope=_CLUSTERS)} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS cluster_colori_version_delete
+    AFTER DELETE ON cluster_colori
+    BEGIN {_BUMP.format(scope=_CLUSTERS)} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS cluster_colori_rules_version_insert
+    AFTER INSERT ON cluster_colori
+    BEGIN {_BUMP.format(scope=_RULES)} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS cluster_colori_rules_version_update
+    AFTER UPDATE ON cluster_colori
+    BEGIN {_BUMP.format(scope=_RULES)} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS cluster_colori_rules_version_delete
+    AFTER DELETE ON cluster_colori
+    BEGIN {_BUMP.format(scope=_RULES)} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS cambio_colori_rules_version_insert
+    AFTER INSERT ON cambio_colori
+    BEGIN {_BUMP.format(scope=_RULES)} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS cambio_colori_rules_version_update
+    AFTER UPDATE ON cambio_colori
+    BEGIN {_BUMP.format(scope=_RULES)} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS cambio_colori_rules_version_delete
+    AFTER DELETE ON cambio_colori
+    BEGIN {_BUMP.format(scope=_RULES)} END
+    """,
+]
+
+
+def install_version_tracking(cursor: sqlite3.Cursor) -> None:
+    """Crea (se mancanti) la tabella data_versions e i trigger che la aggiornano."""
+    for statement in VERSION_TRACKING_SQL:
+        cursor.execute(statement)
+    # Inizializza gli scope già presenti (stessa logica dei trigger: parte dall'istante attuale)
+    cursor.execute("""
+        INSERT OR IGNORE INTO data_versions (scope, version)
+        SELECT scope, CAST(strftime('%s', 'now') AS INTEGER) FROM (
+            SELECT 'cabin:1' AS scope UNION SELECT 'cabin:2' UNION SELECT ? UNION SELECT ?
+            UNION SELECT DISTINCT 'cabin:' || IFNULL(cabin_id, 1) FROM optimization_colors
+        )
+    """, (CLUSTERS_SCOPE, RULES_SCOPE))
+
+
+class DataVersions:
+    """
+    Lettura economica delle versioni: una connessione dedicata, che non scrive mai,
+    controlla PRAGMA data_version (cambia solo quando un'altra connessione ha fatto
+    commit) e rilegge data_versions soltanto in quel caso. Finché nessuno scrive,
+    una richiesta condizionale non esegue query sulle tabelle.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._data_version: Optional[int] = None
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[Dict[str, int]]:
+        with self._lock:
+            try:
+                if self._conn is None:
+                    self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+                data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+                if data_version != self._data_version:
+                    self._versions = dict(self._conn.execute("SELECT scope, version FROM data_versions").fetchall())
+                    self._data_version = data_version
+                return self._versions
+            except sqlite3.Error as e:
+                logger.warning(f"Versioni dati non disponibili, risposta senza ETag: {e}")
+                self._data_version = None
+                return None
+
+    def etag(self, scopes: Iterable[str]) -> Optional[str]:
+        versions = self.get()
+        if versions is None:
+            return None
+        return "-".join(f"{scope}={versions.get(scope, 0)}" for scope in scopes)
+
+    def conditional(self, scopes_for: Callable[..., Iterable[str]]):
+        """
+        Decoratore per le API di lettura: se If-None-Match corrisponde alla versione
+        corrente degli scope restituisce 304 senza eseguire la view, altrimenti
+        esegue la view e aggiunge l'ETag alle risposte 200.
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                # La versione va letta prima dei dati: una scrittura concorrente produce
+                # al più un ETag "vecchio" e quindi un ricaricamento in più, mai dati vecchi.
+                etag = self.etag(scopes_for(**kwargs))
+                if etag is not None and request.if_none_match.contains_weak(etag):
+                    response = Response(status=304)
+                    response.set_etag(etag, weak=True)
+                    return response
+                response = make_response(view(*args, **kwargs))
+                if etag is not None and response.status_code == 200:
+                    response.set_etag(etag, weak=True)
+                    response.headers['Cache-Control'] = 'no-cache'
+                return response
+            return wrapper
+        return decorator
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Baseline delle prestazioni dell'ottimizzatore e confronto con una nuova esecuzione di
+benchmark_optimizer.py: per ogni scenario mediana e p95 del tempo e picco di memoria.
+
+Una modifica a logic.py (regole della matrice, bonus, ordinamento) è una regressione se
+uno scenario peggiora oltre la soglia relativa E oltre il minimo assoluto (i tempi di
+pochi millisecondi sono rumore). Cambi di stati DP o di costo vengono segnalati a parte:
+non sono lentezza, ma il solver non calcola più la stessa cosa.
+
+Eseguire dalla root del progetto:
+    python test/benchmark_baseline.py save test/benchmark_results/optimizer.json   # registra la baseline
+    python test/benchmark_baseline.py compare --run                                # riesegue e confronta
+    python test/benchmark_baseline.py compare risultati.json --time-threshold 0.2 --report report.md
+
+Il confronto termina con codice 1 se c'è almeno una regressione. Le baseline vanno
+registrate sulla macchina su cui gira il confronto: i metadati (processore, Python,
+numpy) vengono confrontati e una differenza è segnalata nel rapporto.
+"""
+
+import argparse
+import datetime
+import json
+import math
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+import benchmark_optimizer
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baselines", "optimizer.json")
+
+# Metadati che devono coincidere perché i tempi siano confrontabili
+ENVIRONMENT_KEYS = ("python", "numpy", "processor", "platform")
+
+STATUS_REGRESSION = "REGRESSIONE"
+STATUS_IMPROVED = "migliorato"
+STATUS_OK = "ok"
+STATUS_CHANGED = "CAMBIATO"
+STATUS_NEW = "nuovo"
+STATUS_MISSING = "mancante"
+
+
+def _p95(values: List[float]) -> float:
+    """Percentile 95 per rango più vicino (con poche ripetizioni coincide con il massimo)."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)]
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Per scenario: mediana e p95 in ms, picco MB e i valori che non dipendono dalla macchina."""
+    scenarios = {}
+    for record in results:
+        times = record["wall_ms"]["all"]
+        scenarios[record["scenario"]] = {
+            "component": record["component"],
+            "clusters": record["clusters"],
+            "colors": record["colors"],
+            "repeat": len(times),
+            "median_ms": record["wall_ms"]["median"],
+            "p95_ms": round(_p95(times), 3),
+            "peak_mb": record["peak_mb"],
+            "dp_states": record.get("dp_states"),
+            "cost": record.get("cost"),
+        }
+    return scenarios
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    """File JSON di benchmark_optimizer.py ({"metadata", "results"})."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {"metadata": data["metadata"], "scenarios": summarize(data["results"])}
+
+
+def save_baseline(run: Dict[str, Any], path: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    baseline = {"saved": datetime.datetime.now().isoformat(timespec="seconds"), **run}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2)
+
+
+def load_baseline(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _relative(new: Optional[float], old: Optional[float]) -> Optional[float]:
+    if new is None or old is None:
+        return None
+    if old == 0:
+        return 0.0 if new == 0 else math.inf
+    return new / old - 1
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], time_threshold: float = 0.15,
+            p95_threshold: float = 0.25, memory_threshold: float = 0.10,
+            min_ms: float = 1.0, min_mb: float = 0.5) -> List[Dict[str, Any]]:
+    """
+    Una riga per scenario con le variazioni relative e lo stato. Una metrica peggiora se
+    supera la soglia relativa e la differenza assoluta supera min_ms / min_mb.
+    """
+    rows = []
+    old_scenarios, new_scenarios = baseline["scenarios"], current["scenarios"]
+    for scenario in sorted(set(old_scenarios) | set(new_scenarios)):
+        old, new = old_scenarios.get(scenario), new_scenarios.get(scenario)
+        row = {"scenario": scenario, "baseline": old, "current": new, "problems": []}
+        rows.append(row)
+        if old is None or new is None:
+            row["status"] = STATUS_NEW if old is None else STATUS_MISSING
+            continue
+
+        checks = (("median_ms", time_threshold, min_ms), ("p95_ms", p95_threshold, min_ms),
+                  ("peak_mb", memory_threshold, min_mb))
+        improved = False
+        for metric, threshold, minimum in checks:
+            delta = _relative(new[metric], old[metric])
+            row[metric] = delta
+            if delta is None:
+                continue
+            if delta > threshold and new[metric] - old[metric] > minimum:
+                row["problems"].append(f"{metric} +{delta * 100:.0f}% (soglia {threshold * 100:.0f}%)")
+            elif delta < -threshold and old[metric] - new[metric] > minimum:
+                improved = True
+
+        changed = [key for key in ("dp_states", "cost") if old.get(key) != new.get(key)]
+        if row["problems"]:
+            row["status"] = STATUS_REGRESSION
+        elif changed:
+            row["status"] = STATUS_CHANGED
+        else:
+            row["status"] = STATUS_IMPROVED if improved else STATUS_OK
+        row["problems"] += [f"{key} {old.get(key)} -> {new.get(key)}" for key in changed]
+    return rows
+
+
+def environment_differences(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    old, new = baseline["metadata"], current["metadata"]
+    return [f"{key}: {old.get(key)} -> {new.get(key)}" for key in ENVIRONMENT_KEYS if old.get(key) != new.get(key)]
+
+
+def _pct(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    if math.isinf(value):
+        return "+inf"
+    return f"{value * 100:+.0f}%"
+
+
+def _num(scenario: Optional[Dict[str, Any]], key: str) -> str:
+    value = scenario.get(key) if scenario else None
+    return "-" if value is None else f"{value:.2f}"
+
+
+def format_report(rows: List[Dict[str, Any]], baseline: Dict[str, Any], current: Dict[str, Any],
+                  show_all: bool = False) -> str:
+    """Rapporto Markdown: riepilogo, ambiente diverso, tabella degli scenari (solo i non ok, salvo show_all)."""
+    counts = {}
+    for row in rows:
+        counts[row["status"]] = counts.get(row["status"], 0) + 1
+    lines = [
+        "# Confronto prestazioni ottimizzatore",
+        "",
+        f"Baseline del {baseline.get('saved', baseline['metadata'].get('timestamp'))}, "
+        f"esecuzione del {current['metadata'].get('timestamp')}: {len(rows)} scenari, "
+        + ", ".join(f"{n} {status}" for status, n in sorted(counts.items())),
+        "",
+    ]
+    differenze = environment_differences(baseline, current)
+    if differenze:
+        lines += ["**Attenzione: ambiente diverso dalla baseline, i tempi non sono confrontabili.**", ""]
+        lines += [f"- {d}" for d in differenze] + [""]
+
+    shown = [row for row in rows if show_all or row["status"] != STATUS_OK]
+    if not shown:
+        lines.append("Nessuna variazione oltre le soglie.")
+        return "\n".join(lines) + "\n"
+    lines += [
+        "| scenario | stato | mediana ms (base -> nuova) | Δ mediana | Δ p95 | picco MB (base -> nuovo) | Δ memoria | note |",
+        "|---|---|---|---|---|---|---|---|",
+    ]
+    order = [STATUS_REGRESSION, STATUS_CHANGED, STATUS_MISSING, STATUS_NEW, STATUS_IMPROVED, STATUS_OK]
+    for row in sorted(shown, key=lambda r: (order.index(r["status"]), r["scenario"])):
+        old, new = row["baseline"], row["current"]
+        lines.append(
+            f"| {row['scenario']} | {row['status']} | {_num(old, 'median_ms')} -> {_num(new, 'median_ms')} "
+            f"| {_pct(row.get('median_ms'))} | {_pct(row.get('p95_ms'))} "
+            f"| {_num(old, 'peak_mb')} -> {_num(new, 'peak_mb')} | {_pct(row.get('peak_mb'))} "
+            f"| {'; '.join(row['problems'])} |")
+    return "\n".join(lines) + "\n"
+
+
+def run_like(baseline: Dict[str, Any], repeat: Optional[int], memory: bool) -> Dict[str, Any]:
+    """Riesegue benchmark_optimizer sugli stessi numeri di cluster e di colori della baseline."""
+    scenarios = baseline["scenarios"].values()
+    clusters = sorted({s["clusters"] for s in scenarios})
+    colors = sorted({s["colors"] for s in scenarios if s["colors"] is not None})
+    args = argparse.Namespace(profile="baseline", repeat=repeat or baseline["metadata"]["repeat"])
+    print(f"Esecuzione benchmark: cluster {clusters}, colori {colors}, {args.repeat} ripetizioni")
+    results = benchmark_optimizer.run(clusters, colors, args.repeat, memory)
+    return {"metadata": benchmark_optimizer.metadata(args), "scenarios": summarize(results)}
+
+
+def confirm_regressions(current: Dict[str, Any], rows: List[Dict[str, Any]], repeat: int, memory: bool) -> int:
+    """
+    Rimisura gli scenari in regressione e tiene per ciascuno l'esecuzione più veloce: un
+    picco di carico della macchina durante una sola misura non diventa una regressione.
+    Restituisce il numero di scenari rimisurati.
+    """
+    rerun = {(row["current"]["clusters"], row["current"]["colors"])
+             for row in rows if row["status"] == STATUS_REGRESSION}
+    for n_clusters, n_colors in sorted(rerun, key=lambda k: (k[0], k[1] or 0)):
+        results = benchmark_optimizer.run([n_clusters], [n_colors] if n_colors is not None else [], repeat, memory)
+        for scenario, again in summarize(results).items():
+            previous = current["scenarios"].get(scenario)
+            if previous is not None and again["median_ms"] < previous["median_ms"]:
+                current["scenarios"][scenario] = again
+    return len(rerun)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Baseline e confronto delle prestazioni dell'ottimizzatore")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    save = commands.add_parser("save", help="registra una baseline da un file di benchmark_optimizer.py")
+    save.add_argument("results", nargs="?", default=benchmark_optimizer.DEFAULT_OUTPUT)
+    save.add_argument("--baseline", default=DEFAULT_BASELINE)
+
+    cmp = commands.add_parser("compare", help="confronta un'esecuzione con la baseline")
+    cmp.add_argument("results", nargs="?", help="file di benchmark_optimizer.py (con --run non serve)")
+    cmp.add_argument("--run", action="store_true", help="riesegue il benchmark sugli scenari della baseline")
+    cmp.add_argument("--repeat", type=int, help="ripetizioni con --run (default: quelle della baseline)")
+    cmp.add_argument("--confirm", type=int, default=1,
+                     help="con --run, rimisurazioni degli scenari in regressione prima del verdetto")
+    cmp.add_argument("--baseline", default=DEFAULT_BASELINE)
+    cmp.add_argument("--time-threshold", type=float, default=0.15, help="peggioramento relativo della mediana")
+    cmp.add_argument("--p95-threshold", type=float, default=0.25, help="peggioramento relativo del p95")
+    cmp.add_argument("--memory-threshold", type=float, default=0.10, help="peggioramento relativo del picco di memoria")
+    cmp.add_argument("--min-ms", type=float, default=1.0, help="differenza di tempo sotto cui non è regressione")
+    cmp.add_argument("--min-mb", type=float, default=0.5, help="differenza di memoria sotto cui non è regressione")
+    cmp.add_argument("--all", action="store_true", help="mostra anche gli scenari invariati")
+    cmp.add_argument("--report", help="scrive il rapporto Markdown in questo file")
+    args = parser.parse_args(argv)
+
+    if args.command == "save":
+        run = load_results(args.results)
+        save_baseline(run, args.baseline)
+        print(f"✅ Baseline di {len(run['scenarios'])} scenari scritta in {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"❌ Baseline {args.baseline} assente: registrarla con 'save'")
+        return 2
+    baseline = load_baseline(args.baseline)
+    memory = any(s["peak_mb"] is not None for s in baseline["scenarios"].values())
+    if args.run:
+        current = run_like(baseline, args.repeat, memory)
+    elif args.results:
+        current = load_results(args.results)
+    else:
+        parser.error("indicare un file di risultati oppure --run")
+
+    def compare_current():
+        return compare(baseline, current, args.time_threshold, args.p95_threshold, args.memory_threshold,
+                       args.min_ms, args.min_mb)
+
+    rows = compare_current()
+    for _ in range(args.confirm if args.run else 0):
+        if not any(row["status"] == STATUS_REGRESSION for row in rows):
+            break
+        print("Rimisurazione degli scenari in regressione...")
+        confirm_regressions(current, rows, args.repeat or baseline["metadata"]["repeat"], memory)
+        rows = compare_current()
+    report = format_report(rows, baseline, current, args.all)
+    print(report)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(report)
+    regressioni = [row["scenario"] for row in rows if row["status"] == STATUS_REGRESSION]
+    if regressioni:
+        print(f"❌ {len(regressioni)} scenari in regressione")
+        return 1
+    print("✅ Nessuna regressione oltre le soglie")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Benchmark in-process del nucleo dell'ottimizzatore, senza server HTTP né log:
+_build_cost_matrix, DP Held-Karp (_held_karp_table), _generate_final_ordered_list e
+optimize_color_sequence completo, su impianti sintetici (synthetic_plant) da 3 a 22
+cluster e da 10 a 10.000 colori (seed fissi, risultati riproducibili).
+
+Per ogni scenario misura il tempo (mediana, minimo, massimo su --repeat ripetizioni),
+il picco di memoria (tracemalloc, in un'esecuzione a parte per non falsare i tempi)
+e gli stati della DP, e scrive i risultati in JSON.
+
+Eseguire dalla root del progetto:
+    python test/benchmark_optimizer.py                   # profilo "quick"
+    python test/benchmark_optimizer.py --profile full    # 3..22 cluster
+La tabella Held-Karp da sola si misura fino a HELD_KARP_MAX_NODES cluster (oltre il solver
+non la calcola: optimize_color_sequence usa il percorso greedy con ricerca locale).
+    python test/benchmark_optimizer.py --clusters 8 12 --colors 100 1000 --output risultati.json
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import numpy as np
+
+from app import config, logic
+from app.color_batch import ColorBatch
+from synthetic_plant import generate_orders, generate_rules
+
+PROFILES = {
+    "quick": {"clusters": [3, 6, 9, 12, 16], "colors": [10, 100, 1000, 10000]},
+    "full": {"clusters": list(range(3, 23)), "colors": [10, 100, 1000, 10000]},
+}
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_results", "optimizer.json")
+
+
+class _NullOutput:
+    """Scarta i print del solver: misuriamo il calcolo, non il logging."""
+
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def synthetic_rules(n_clusters: int):
+    """Impianto sintetico con le quote di default del generatore (regole vietate, tipi e colori richiesti)."""
+    return generate_rules(n_clusters, seed=n_clusters)
+
+
+def synthetic_orders(cluster_dict, n_colors: int):
+    """n_colors colori su tutti i cluster (almeno uno per cluster se possibile)."""
+    return generate_orders(cluster_dict, n_colors, cover_clusters=True, seed=n_colors)
+
+
+def _measure(func, repeat: int, memory: bool):
+    """(tempi in ms, picco MB, ultimo risultato); il picco viene da un'esecuzione aggiuntiva con tracemalloc."""
+    times = []
+    result = None
+    with contextlib.redirect_stdout(_NullOutput()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            times.append((time.perf_counter() - start) * 1000)
+        peak_mb = None
+        if memory:
+            tracemalloc.start()
+            func()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.stop()
+    return times, peak_mb, result
+
+
+def _record(component, n_clusters, n_colors, active_clusters, times, peak_mb, **extra):
+    return {
+        "scenario": f"{component}/c{n_clusters}" + (f"/n{n_colors}" if n_colors is not None else ""),
+        "component": component,
+        "clusters": n_clusters,
+        "active_clusters": active_clusters,  # Cluster con almeno un colore (meno dei richiesti se i colori sono pochi)
+        "colors": n_colors,
+        "repeat": len(times),
+        "wall_ms": {"median": round(statistics.median(times), 3), "min": round(min(times), 3),
+                    "max": round(max(times), 3), "all": [round(t, 3) for t in times]},
+        "peak_mb": round(peak_mb, 3) if peak_mb is not None else None,
+        **extra,
+    }
+
+
+def bench_dp(n_clusters: int, repeat: int, memory: bool):
+    cluster_dict, cambio_colori = synthetic_rules(n_clusters)
+    colors = synthetic_orders(cluster_dict, max(n_clusters, 100))
+    batch = ColorBatch(colors)
+    clusters = batch.assign_clusters(cluster_dict)[1]
+    with contextlib.redirect_stdout(_NullOutput()):
+        matrix = logic._build_cost_matrix(clusters, batch, cambio_colori)
+    eventi = []
+    times, peak_mb, table = _measure(lambda: logic._held_karp_table(matrix, 0, eventi.append), repeat, memory)
+    return _record("held_karp_table", n_clusters, None, len(clusters), times, peak_mb,
+                   dp_states=eventi[-1]["states_total"] if eventi else 0, table_mb=round(table.nbytes / 1e6, 3))
+
+
+def bench_grid(n_clusters: int, n_colors: int, repeat: int, memory: bool):
+    cluster_dict, cambio_colori = synthetic_rules(n_clusters)
+    colors = synthetic_orders(cluster_dict, n_colors)
+    batch = ColorBatch(colors)
+    clusters = batch.assign_clusters(cluster_dict)[1]
+    records = []
+
+    times, peak_mb, matrix = _measure(lambda: logic._build_cost_matrix(clusters, ColorBatch(colors), cambio_colori),
+                                      repeat, memory)
+    records.append(_record("build_cost_matrix", n_clusters, n_colors, len(clusters), times, peak_mb))
+
+    with_cluster = [{**c, "cluster": batch.cluster(i)} for i, c in enumerate(colors)]
+    times, peak_mb, _ = _measure(lambda: logic._generate_final_ordered_list(clusters, with_cluster), repeat, memory)
+    records.append(_record("generate_final_ordered_list", n_clusters, n_colors, len(clusters), times, peak_mb))
+
+    eventi = []
+
+    def end_to_end():
+        logic.dp_cache.clear()  # Ogni ripetizione calcola la DP da capo
+        return logic.optimize_color_sequence(colors, progress_callback=eventi.append,
+                                             cluster_dict=cluster_dict, cambio_colori=cambio_colori)
+    times, peak_mb, result = _measure(end_to_end, repeat, memory)
+    stati = [e["states_total"] for e in eventi if e.get("event") == "dp_layer"]
+    records.append(_record("optimize_color_sequence", n_clusters, n_colors, len(clusters), times, peak_mb,
+                           dp_states=stati[-1] if stati else 0, cost=result[2]))
+    return records
+
+
+def run(clusters, colors, repeat: int, memory: bool):
+    results = []
+    for n_clusters in clusters:
+        if n_clusters <= config.HELD_KARP_MAX_NODES:
+            results.append(bench_dp(n_clusters, repeat, memory))
+            print(_line(results[-1]))
+        else:
+            print(f"  held_karp_table/c{n_clusters:<34} saltato: oltre HELD_KARP_MAX_NODES ({config.HELD_KARP_MAX_NODES})")
+        for n_colors in colors:
+            for record in bench_grid(n_clusters, n_colors, repeat, memory):
+                results.append(record)
+                print(_line(record))
+    return results
+
+
+def _line(record) -> str:
+    memoria = f"{record['peak_mb']:9.2f} MB" if record["peak_mb"] is not None else " " * 12
+    stati = f"  {record['dp_states']:>10} stati" if "dp_states" in record else ""
+    return f"  {record['scenario']:<42} {record['wall_ms']['median']:10.2f} ms  {memoria}{stati}"
+
+
+def metadata(args):
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "profile": args.profile,
+        "repeat": args.repeat,
+        "dp_cache_max_bytes": config.DP_CACHE_MAX_BYTES,
+        "held_karp_max_nodes": config.HELD_KARP_MAX_NODES,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark in-process dell'ottimizzatore")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    parser.add_argument("--clusters", type=int, nargs="+", help="numeri di cluster (sostituisce il profilo)")
+    parser.add_argument("--colors", type=int, nargs="+", help="numeri di colori (sostituisce il profilo)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="salta la misura del picco di memoria")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="file JSON dei risultati")
+    args = parser.parse_args(argv)
+
+    clusters = args.clusters or PROFILES[args.profile]["clusters"]
+    colors = args.colors or PROFILES[args.profile]["colors"]
+    print("=" * 80)
+    print(f"BENCHMARK OTTIMIZZATORE - cluster {clusters}, colori {colors}, {args.repeat} ripetizioni")
+    print("=" * 80)
+    results = run(clusters, colors, args.repeat, not args.no_memory)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"metadata": metadata(args), "results": results}, f, indent=2)
+    print("-" * 80)
+    print(f"✅ {len(results)} misure scritte in {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+"""
+Generatore di carico: sessioni di operatori di cabina contro una coppia frontend Flask +
+backend FastAPI. Ogni sessione apre la pagina della cabina, interroga i colori a intervalli
+(con ETag, come la pagina) e a caso mette in esecuzione un colore, sposta un colore (drag &
+drop), blocca / sblocca un cluster o lancia l'ottimizzazione con i blocchi.
+
+Le sessioni arrivano come processo di Poisson (--rate al secondo per --duration secondi).
+Il rapporto riporta per azione richieste, errori, percentili di latenza e risposte con
+"database is locked", più l'attesa per il lock di scrittura SQLite misurata da una sonda
+che apre periodicamente una transazione BEGIN IMMEDIATE sullo stesso database.
+
+Con --start-servers (default se non si indica --frontend-url) avvia backend (uvicorn) e
+frontend (flask run) su porte libere con una copia di shared/data/colors.db e riempie le
+cabine con ordini sintetici (synthetic_plant); il database condiviso non viene toccato.
+
+Eseguire dalla root del progetto:
+    python test/load_operator_sessions.py --rate 2 --duration 30
+    python test/load_operator_sessions.py --frontend-url http://localhost:8080 --db shared/data/colors.db
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from synthetic_plant import generate_orders, read_rules_db
+
+ACTIONS = ["open_cabin", "poll", "toggle_execution", "reorder", "lock_cluster", "optimize_locked"]
+
+# Peso delle azioni dell'operatore (le interrogazioni periodiche hanno un loro intervallo)
+DEFAULT_MIX = {"toggle_execution": 0.4, "reorder": 0.3, "lock_cluster": 0.2, "optimize_locked": 0.1}
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+class LoadStats:
+    """Latenze ed esiti per azione, condivisi dai thread delle sessioni."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {a: [] for a in ACTIONS}
+        self.errors: Dict[str, int] = {a: 0 for a in ACTIONS}
+        self.lock_errors: Dict[str, int] = {a: 0 for a in ACTIONS}
+        self.status_codes: Dict[str, Dict[str, int]] = {a: {} for a in ACTIONS}
+        self.sessions_started = 0
+        self.sessions_rejected = 0
+        self.active_sessions = 0
+        self.peak_sessions = 0
+        self._lock = threading.Lock()
+
+    def record(self, action: str, seconds: float, status: str, ok: bool, db_locked: bool) -> None:
+        with self._lock:
+            self.latencies[action].append(seconds)
+            self.status_codes[action][status] = self.status_codes[action].get(status, 0) + 1
+            if not ok:
+                self.errors[action] += 1
+            if db_locked:
+                self.lock_errors[action] += 1
+
+    def session_started(self) -> None:
+        with self._lock:
+            self.sessions_started += 1
+            self.active_sessions += 1
+            self.peak_sessions = max(self.peak_sessions, self.active_sessions)
+
+    def session_ended(self) -> None:
+        with self._lock:
+            self.active_sessions -= 1
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    """Percentile per rango più vicino (None senza valori)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(q / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class LockProbe(threading.Thread):
+    """
+    Apre a intervalli una transazione di scrittura (BEGIN IMMEDIATE) sul database e misura
+    quanto aspetta il lock: l'attesa è la contesa vista da una scrittura qualsiasi in quel momento.
+    """
+
+    def __init__(self, db_path: str, interval: float, timeout: float = 10.0):
+        super().__init__(daemon=True)
+        self.db_path = db_path
+        self.interval = interval
+        self.timeout = timeout
+        self.waits: List[float] = []
+        self.timeouts = 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None)
+        try:
+            while not self._stop_event.wait(self.interval):
+                start = time.perf_counter()
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.execute("ROLLBACK")
+                    self.waits.append(time.perf_counter() - start)
+                except sqlite3.OperationalError:
+                    self.timeouts += 1
+        finally:
+            conn.close()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+    def report(self, busy_threshold: float = 0.001) -> Dict[str, Any]:
+        waits = self.waits
+        return {
+            "probes": len(waits) + self.timeouts,
+            "busy_share": round(sum(w > busy_threshold for w in waits) / len(waits), 4) if waits else None,
+            "timeouts": self.timeouts,
+            "wait_ms": {f"p{q}": _ms(_percentile(waits, q)) for q in PERCENTILES} | {"max": _ms(max(waits, default=None))},
+        }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+class OperatorSession:
+    """Una schermata di cabina: stesso comportamento della pagina cabin.html, su una connessione keep-alive."""
+
+    def __init__(self, base_url: str, cabin_id: int, stats: LoadStats, rng: random.Random, args):
+        self.base_url = base_url.rstrip("/")
+        self.cabin_id = cabin_id
+        self.stats = stats
+        self.rng = rng
+        self.args = args
+        self.http = requests.Session()
+        self.etag: Optional[str] = None
+        self.colors: List[Dict[str, Any]] = []
+        self.locked_clusters = set()
+
+    def _call(self, action: str, method: str, path: str, **kwargs) -> Optional[requests.Response]:
+        start = time.perf_counter()
+        try:
+            response = self.http.request(method, self.base_url + path, timeout=self.args.timeout, **kwargs)
+        except requests.RequestException as e:
+            self.stats.record(action, time.perf_counter() - start, type(e).__name__, False, False)
+            return None
+        elapsed = time.perf_counter() - start
+        ok = response.status_code < 400
+        db_locked = not ok and "database is locked" in response.text
+        self.stats.record(action, elapsed, str(response.status_code), ok, db_locked)
+        return response
+
+    def open_cabin(self) -> None:
+        self._call("open_cabin", "GET", f"/cabin/{self.cabin_id}")
+        self.poll()
+
+    def poll(self) -> None:
+        headers = {"If-None-Match": self.etag} if self.etag else {}
+        response = self._call("poll", "GET", f"/api/cabin/{self.cabin_id}/colors", headers=headers)
+        if response is not None and response.status_code == 200:
+            self.etag = response.headers.get("ETag")
+            self.colors = response.json().get("colors", [])
+
+    def toggle_execution(self) -> None:
+        if not self.colors:
+            return
+        color = self.rng.choice(self.colors)
+        self._call("toggle_execution", "PUT", f"/api/cabin/{self.cabin_id}/colors/{color['id']}/execution",
+                   json={"in_execution": not color.get("in_execution")})
+
+    def reorder(self) -> None:
+        if len(self.colors) < 2:
+            return
+        moved_from, moved_to = self.rng.sample(range(len(self.colors)), 2)
+        order = list(range(len(self.colors)))
+        order.insert(moved_to, order.pop(moved_from))
+        self._call("reorder", "PUT", f"/api/cabin/{self.cabin_id}/colors/reorder",
+                   json={"new_order": order, "moved_from": moved_from, "moved_to": moved_to,
+                         "local_repair": self.args.local_repair})
+
+    def lock_cluster(self) -> None:
+        clusters = sorted({c["cluster"] for c in self.colors if c.get("cluster")})
+        if not clusters:
+            return
+        cluster = self.rng.choice(clusters)
+        locked = cluster not in self.locked_clusters
+        response = self._call("lock_cluster", "PUT", f"/api/cabin/{self.cabin_id}/cluster/{cluster}/lock",
+                              json={"locked": locked})
+        if response is not None and response.status_code == 200:
+            (self.locked_clusters.add if locked else self.locked_clusters.discard)(cluster)
+
+    def optimize_locked(self) -> None:
+        if not self.colors:
+            return
+        colors_today = [{
+            "code": c["color_code"], "type": c["color_type"], "cluster": c.get("cluster"),
+            "CH": c.get("ch_value"), "sequence": c.get("input_sequence"), "sequence_type": c.get("sequence_type"),
+            "lunghezza_ordine": c.get("lunghezza_ordine"), "line": c.get("line"),
+            "locked": c.get("cluster") in self.locked_clusters,
+        } for c in self.colors]
+        self._call("optimize_locked", "POST", f"/api/cabin/{self.cabin_id}/optimize-locked",
+                   json={"colors_today": colors_today, "prioritized_reintegrations": []})
+
+    def run(self, session_seconds: float, mix: Dict[str, float]) -> None:
+        actions, weights = list(mix), list(mix.values())
+        self.open_cabin()
+        now = time.monotonic()
+        end = now + self.rng.expovariate(1 / session_seconds)
+        next_poll = now + self.args.poll_interval
+        next_action = now + self.rng.expovariate(1 / self.args.think_time)
+        while True:
+            wake = min(next_poll, next_action)
+            if wake >= end:
+                break
+            time.sleep(max(0.0, wake - time.monotonic()))
+            if next_poll <= next_action:
+                self.poll()
+                next_poll += self.args.poll_interval
+            else:
+                getattr(self, self.rng.choices(actions, weights)[0])()
+                next_action += self.rng.expovariate(1 / self.args.think_time)
+        self.http.close()
+
+
+# --- Avvio della coppia frontend / backend ---
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url: str, process: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Il processo per {url} è terminato (codice {process.returncode})")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} non risponde dopo {timeout:.0f}s")
+
+
+def start_servers(work_dir: str, cabin_count: int):
+    """Backend e frontend su porte libere con una copia del database; restituisce (url frontend, db, processi)."""
+    db_path = os.path.join(work_dir, "colors.db")
+    shutil.copy(os.path.join(ROOT, "shared", "data", "colors.db"), db_path)
+    backend_port, frontend_port = _free_port(), _free_port()
+    env = {**os.environ, "DATABASE_PATH": db_path, "CABIN_COUNT": str(cabin_count),
+           "FASTAPI_BACKEND_URL": f"http://127.0.0.1:{backend_port}"}
+    backend_log = open(os.path.join(work_dir, "backend.log"), "w")
+    frontend_log = open(os.path.join(work_dir, "frontend.log"), "w")
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(backend_port),
+         "--log-level", "warning"],
+        cwd=os.path.join(ROOT, "backend"), env=env, stdout=backend_log, stderr=subprocess.STDOUT)
+    frontend = subprocess.Popen(
+        [sys.executable, "-m", "flask", "--app", "main", "run", "--host", "127.0.0.1", "--port", str(frontend_port),
+         "--no-reload", "--no-debugger", "--with-threads"],
+        cwd=os.path.join(ROOT, "frontend", "app"), env=env, stdout=frontend_log, stderr=subprocess.STDOUT)
+    processes = [backend, frontend]
+    try:
+        _wait_ready(f"http://127.0.0.1:{backend_port}/", backend)
+        _wait_ready(f"http://127.0.0.1:{frontend_port}/api/clusters", frontend)
+    except Exception:
+        stop_servers(processes)
+        raise
+    return f"http://127.0.0.1:{frontend_port}", db_path, processes
+
+
+def stop_servers(processes: List[subprocess.Popen]) -> None:
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def seed_cabins(frontend_url: str, db_path: str, cabin_count: int, colors_per_cabin: int, seed: int) -> None:
+    """Riempie le cabine con un'ottimizzazione "cabine" di ordini sintetici sui cluster del database."""
+    orders = generate_orders(read_rules_db(db_path), colors_per_cabin * cabin_count, cover_clusters=True, seed=seed)
+    response = requests.post(f"{frontend_url}/api/optimize",
+                             json={"colors_today": orders, "mode": "cabine", "cabin_count": cabin_count},
+                             timeout=300)
+    response.raise_for_status()
+
+
+# --- Esecuzione e rapporto ---
+
+def run_load(frontend_url: str, args, mix: Dict[str, float], db_path: Optional[str]) -> Dict[str, Any]:
+    stats = LoadStats()
+    rng = random.Random(args.seed)
+    probe = LockProbe(db_path, args.probe_interval) if db_path else None
+    if probe is not None:
+        probe.start()
+
+    threads: List[threading.Thread] = []
+
+    def session(session_seed: int, cabin_id: int) -> None:
+        try:
+            OperatorSession(frontend_url, cabin_id, stats, random.Random(session_seed), args).run(args.session_seconds, mix)
+        finally:
+            stats.session_ended()
+
+    start = time.monotonic()
+    next_arrival = start + rng.expovariate(args.rate)
+    while next_arrival < start + args.duration:
+        time.sleep(max(0.0, next_arrival - time.monotonic()))
+        if stats.active_sessions >= args.max_sessions:
+            stats.sessions_rejected += 1
+        else:
+            stats.session_started()
+            thread = threading.Thread(target=session, args=(rng.randrange(1 << 30), rng.randint(1, args.cabins)),
+                                      daemon=True)
+            thread.start()
+            threads.append(thread)
+        next_arrival += rng.expovariate(args.rate)
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    if probe is not None:
+        probe.stop()
+    return report(stats, elapsed, args, probe)
+
+
+def report(stats: LoadStats, elapsed: float, args, probe: Optional[LockProbe]) -> Dict[str, Any]:
+    actions = {}
+    for action in ACTIONS:
+        latencies = stats.latencies[action]
+        if not latencies:
+            continue
+        actions[action] = {
+            "requests": len(latencies),
+            "errors": stats.errors[action],
+            "error_rate": round(stats.errors[action] / len(latencies), 4),
+            "db_locked": stats.lock_errors[action],
+            "status": stats.status_codes[action],
+            "latency_ms": {f"p{q}": _ms(_percentile(latencies, q)) for q in PERCENTILES} | {"max": _ms(max(latencies))},
+        }
+    total = sum(a["requests"] for a in actions.values())
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("output",)},
+        "elapsed_seconds": round(elapsed, 2),
+        "sessions": {"started": stats.sessions_started, "rejected": stats.sessions_rejected,
+                     "peak_concurrent": stats.peak_sessions},
+        "requests": total,
+        "requests_per_second": round(total / elapsed, 2) if elapsed else None,
+        "error_rate": round(sum(a["errors"] for a in actions.values()) / total, 4) if total else None,
+        "actions": actions,
+        "sqlite_write_lock": probe.report() if probe is not None else None,
+    }
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    print("-" * 96)
+    print(f"{'azione':<18} {'richieste':>9} {'errori':>7} {'locked':>7} " +
+          " ".join(f"{'p' + str(q):>8}" for q in PERCENTILES) + f" {'max':>8}  (ms)")
+    for action, data in result["actions"].items():
+        lat = data["latency_ms"]
+        print(f"{action:<18} {data['requests']:>9} {data['errors']:>7} {data['db_locked']:>7} " +
+              " ".join(f"{lat['p' + str(q)]:>8.1f}" for q in PERCENTILES) + f" {lat['max']:>8.1f}")
+    print("-" * 96)
+    sessioni = result["sessions"]
+    print(f"Sessioni: {sessioni['started']} avviate, {sessioni['rejected']} rifiutate, "
+          f"{sessioni['peak_concurrent']} contemporanee al massimo")
+    print(f"Richieste: {result['requests']} in {result['elapsed_seconds']}s "
+          f"({result['requests_per_second']}/s), tasso di errore {result['error_rate']}")
+    lock = result["sqlite_write_lock"]
+    if lock:
+        print(f"Lock di scrittura SQLite: {lock['probes']} sonde, occupato nel {(lock['busy_share'] or 0) * 100:.1f}% "
+              f"dei casi, attesa p95 {lock['wait_ms']['p95']} ms, max {lock['wait_ms']['max']} ms, "
+              f"{lock['timeouts']} timeout")
+
+
+def _parse_mix(values: Optional[List[str]]) -> Dict[str, float]:
+    if not values:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for value in values:
+        action, _, weight = value.partition("=")
+        if action not in DEFAULT_MIX or not weight:
+            raise argparse.ArgumentTypeError(f"--mix {value}: usa azione=peso con azione in {', '.join(DEFAULT_MIX)}")
+        mix[action] = float(weight)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Carico di sessioni operatore su frontend Flask + backend FastAPI")
+    parser.add_argument("--rate", type=float, default=1.0, help="nuove sessioni al secondo (Poisson)")
+    parser.add_argument("--duration", type=float, default=30.0, help="secondi durante i quali arrivano sessioni")
+    parser.add_argument("--session-seconds", type=float, default=20.0, help="durata media di una sessione")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="secondi tra due interrogazioni dei colori")
+    parser.add_argument("--think-time", type=float, default=5.0, help="secondi medi tra due azioni dell'operatore")
+    parser.add_argument("--mix", nargs="*", help="pesi delle azioni, es. toggle_execution=4 reorder=3 optimize_locked=1")
+    parser.add_argument("--max-sessions", type=int, default=200, help="sessioni contemporanee oltre le quali si rifiuta")
+    parser.add_argument("--cabins", type=int, default=2)
+    parser.add_argument("--colors-per-cabin", type=int, default=40)
+    parser.add_argument("--local-repair", action="store_true", help="gli spostamenti chiedono la riparazione locale")
+    parser.add_argument("--timeout", type=float, default=60.0, help="timeout di una richiesta HTTP")
+    parser.add_argument("--probe-interval", type=float, default=0.05, help="secondi tra due sonde del lock SQLite")
+    parser.add_argument("--frontend-url", help="frontend già avviato (altrimenti viene avviata una coppia locale)")
+    parser.add_argument("--db", help="database del frontend già avviato, per la sonda del lock")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="file JSON del rapporto")
+    args = parser.parse_args(argv)
+    mix = _parse_mix(args.mix)
+
+    work_dir, processes = None, []
+    try:
+        if args.frontend_url:
+            frontend_url, db_path = args.frontend_url, args.db
+        else:
+            work_dir = tempfile.mkdtemp(prefix="carico_")
+            print(f"Avvio backend e frontend locali (log e database in {work_dir})...")
+            frontend_url, db_path, processes = start_servers(work_dir, args.cabins)
+            seed_cabins(frontend_url, db_path, args.cabins, args.colors_per_cabin, args.seed)
+        print("=" * 96)
+        print(f"CARICO SESSIONI OPERATORE - {frontend_url}, {args.rate} sessioni/s per {args.duration}s, "
+              f"mix {mix}")
+        print("=" * 96)
+        result = run_load(frontend_url, args, mix, db_path)
+    finally:
+        stop_servers(processes)
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_report(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"✅ Rapporto scritto in {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Generatore di impianti sintetici per test di scala e benchmark:
+- regole: cluster_colori / cambio_colori con numero di cluster e di codici, densità
+  delle regole, quota di transizioni vietate (peso INFINITE_COST) e di regole con
+  tipo richiesto (required_trigger_type) o colori richiesti (transition_colors);
+- ordini: colori da produrre con mix di tipi, sequenze, linee, cabine, CH e giorni.
+
+Le regole escono nello stesso formato di database.get_cluster_colori/get_cambio_colori
+oppure come database SQLite con lo schema di shared/data/colors.db; gli ordini come
+lista di dizionari ColorInput oppure come file CSV/JSONL (gli stessi di /optimize/import).
+
+Eseguire dalla root del progetto:
+    python test/synthetic_plant.py rules --clusters 20 --codes 50 --output /tmp/impianto.db
+    python test/synthetic_plant.py orders --db /tmp/impianto.db --colors 5000 --output /tmp/ordini.jsonl
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import sqlite3
+import sys
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from app import config
+
+# Pesi come nelle regole reali dell'impianto (shared/data/colors.db)
+PESI = [1, 20, 30, 40, 40, 50, 50, 60, 85, 100, 150, 250]
+REQUIRED_TYPES = ["F", "K", "R"]
+TYPE_MIX = {"E": 0.6, "K": 0.1, "F": 0.1, "R": 0.1, "RE": 0.1}
+
+SCHEMA = [
+    """CREATE TABLE cluster_colori (
+        id INTEGER PRIMARY KEY,
+        cluster TEXT NOT NULL,
+        color_code TEXT NOT NULL,
+        UNIQUE(cluster, color_code)
+    )""",
+    """CREATE TABLE cambio_colori (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        source_cluster TEXT NOT NULL,
+        target_cluster TEXT NOT NULL,
+        peso INTEGER DEFAULT 5,
+        required_trigger_type TEXT, transition_colors TEXT,
+        UNIQUE(source_cluster, target_cluster)
+    )""",
+    "CREATE INDEX idx_cambio_colori_clusters ON cambio_colori (source_cluster, target_cluster)",
+    """CREATE TABLE optimization_colors (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        color_code TEXT NOT NULL,
+        color_type TEXT NOT NULL,
+        cluster TEXT,
+        ch_value REAL,
+        lunghezza_ordine TEXT,
+        input_sequence INTEGER,
+        sequence_type TEXT,
+        completed INTEGER DEFAULT 0,
+        in_execution INTEGER DEFAULT 0,
+        sequence_order INTEGER,
+        cabin_id INTEGER DEFAULT 1,
+        is_prioritized INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        locked BOOLEAN DEFAULT 0, position INTEGER, line TEXT
+    )""",
+    "CREATE INDEX idx_cabin_id ON optimization_colors(cabin_id)",
+    "CREATE INDEX idx_sequence_order ON optimization_colors(sequence_order)",
+]
+
+
+def generate_rules(n_clusters: int,
+                   codes_per_cluster: int = 20,
+                   rule_density: float = 0.9,
+                   forbidden_share: float = 0.15,
+                   required_type_share: float = 0.1,
+                   required_colors_share: float = 0.05,
+                   feasible: bool = True,
+                   seed: int = 0) -> Tuple[Dict[str, List[str]], Dict[Tuple[str, str], Dict[str, Any]]]:
+    """
+    Cluster -> codici e regole (sorgente, destinazione) -> {peso, colors, required_type}.
+    rule_density è la quota di coppie ordinate con una regola esplicita (le altre valgono
+    DEFAULT_TRANSITION_COST); forbidden_share, required_type_share e required_colors_share
+    sono quote sulle regole esplicite. Con feasible=True una catena casuale di transizioni
+    resta sempre permessa e senza vincoli, così esiste almeno una sequenza percorribile.
+    """
+    rng = random.Random(seed)
+    cluster_dict = {f"C{k:03d}": [f"S{k:03d}-{c:04d}" for c in range(codes_per_cluster)] for k in range(n_clusters)}
+    clusters = list(cluster_dict)
+    catena = clusters[:]
+    rng.shuffle(catena)
+    sicure = set(zip(catena, catena[1:])) if feasible else set()
+
+    cambio_colori: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for source in clusters:
+        for target in clusters:
+            if source == target:
+                continue
+            if (source, target) not in sicure and rng.random() >= rule_density:
+                continue
+            regola: Dict[str, Any] = {"peso": rng.choice(PESI), "colors": [], "required_type": None}
+            if (source, target) not in sicure:
+                if rng.random() < forbidden_share:
+                    regola["peso"] = config.INFINITE_COST
+                elif rng.random() < required_type_share:
+                    regola["required_type"] = rng.choice(REQUIRED_TYPES)
+                elif rng.random() < required_colors_share:
+                    regola["colors"] = rng.sample(cluster_dict[target], min(len(cluster_dict[target]), rng.randint(1, 3)))
+            cambio_colori[(source, target)] = regola
+    return cluster_dict, cambio_colori
+
+
+def write_rules_db(path: str,
+                   cluster_dict: Dict[str, List[str]],
+                   cambio_colori: Dict[Tuple[str, str], Dict[str, Any]]) -> None:
+    """Scrive un database SQLite nuovo con lo schema di colors.db (optimization_colors vuota)."""
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    try:
+        for statement in SCHEMA:
+            conn.execute(statement)
+        conn.executemany("INSERT INTO cluster_colori (cluster, color_code) VALUES (?, ?)",
+                         ((cluster, code) for cluster, codes in cluster_dict.items() for code in codes))
+        conn.executemany(
+            "INSERT INTO cambio_colori (source_cluster, target_cluster, peso, required_trigger_type, transition_colors) "
+            "VALUES (?, ?, ?, ?, ?)",
+            ((source, target, regola["peso"], regola["required_type"],
+              json.dumps(regola["colors"]) if regola["colors"] else None)
+             for (source, target), regola in cambio_colori.items()))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def read_rules_db(path: str) -> Dict[str, List[str]]:
+    """Cluster -> codici di un database di regole (per generare ordini su un impianto già scritto)."""
+    conn = sqlite3.connect(path)
+    try:
+        cluster_dict: Dict[str, List[str]] = {}
+        for cluster, code in conn.execute("SELECT cluster, color_code FROM cluster_colori ORDER BY id"):
+            cluster_dict.setdefault(cluster, []).append(code)
+        return cluster_dict
+    finally:
+        conn.close()
+
+
+def generate_orders(cluster_dict: Dict[str, List[str]],
+                    n_colors: int,
+                    type_mix: Optional[Dict[str, float]] = None,
+                    cluster_skew: float = 1.0,
+                    sequence_share: float = 0.3,
+                    sequence_type_share: float = 0.1,
+                    lines: Sequence[str] = (),
+                    cabin_split: Optional[float] = None,
+                    days: int = 1,
+                    cover_clusters: bool = False,
+                    seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    n_colors ordini (dizionari con i campi di ColorInput). cluster_skew > 0 rende alcuni
+    cluster più frequenti (pesi 1/rango^skew, 0 = uniforme); cabin_split è la quota di
+    ordini "corto" (cabina 1), None per non assegnare lunghezza_ordine; con days > 1 gli
+    ordini hanno un giorno di produzione. Con cover_clusters=True i primi ordini toccano
+    ogni cluster una volta (se n_colors basta), così la DP lavora su tutto l'impianto.
+    """
+    rng = random.Random(seed)
+    clusters = list(cluster_dict)
+    rng.shuffle(clusters)
+    pesi_cluster = [1 / (rank + 1) ** cluster_skew for rank in range(len(clusters))]
+    mix = type_mix or TYPE_MIX
+    tipi, pesi_tipi = list(mix), list(mix.values())
+    orders = []
+    for i in range(n_colors):
+        cluster = clusters[i] if cover_clusters and i < len(clusters) else rng.choices(clusters, pesi_cluster)[0]
+        order: Dict[str, Any] = {
+            "code": rng.choice(cluster_dict[cluster]),
+            "type": rng.choices(tipi, pesi_tipi)[0],
+            "line": rng.choice(lines) if lines else None,
+            "sequence": rng.randint(1, 5) if rng.random() < sequence_share else None,
+            "sequence_type": rng.choice(config.VALID_SEQUENCE_TYPES) if rng.random() < sequence_type_share else None,
+            "CH": round(rng.uniform(0.5, 8.0), 1),
+            "lunghezza_ordine": None if cabin_split is None else ("corto" if rng.random() < cabin_split else "lungo"),
+        }
+        if days > 1:
+            order["day"] = rng.randrange(days)
+        orders.append(order)
+    return orders
+
+
+def write_orders(path: str, orders: List[Dict[str, Any]]) -> None:
+    """Scrive gli ordini in CSV (intestazione con i nomi dei campi) o JSONL, secondo l'estensione."""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            for order in orders:
+                f.write(json.dumps({k: v for k, v in order.items() if v is not None}) + "\n")
+            return
+        campi = ["code", "type", "sequence", "line", "CH", "sequence_type", "lunghezza_ordine", "day"]
+        writer = csv.writer(f)
+        writer.writerow(campi)
+        for order in orders:
+            writer.writerow(["" if order.get(campo) is None else order[campo] for campo in campi])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generatore di impianti sintetici (regole e ordini)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rules = sub.add_parser("rules", help="database SQLite di regole")
+    rules.add_argument("--clusters", type=int, default=20)
+    rules.add_argument("--codes", type=int, default=20, help="codici colore per cluster")
+    rules.add_argument("--density", type=float, default=0.9, help="quota di coppie con una regola esplicita")
+    rules.add_argument("--forbidden", type=float, default=0.15, help="quota di regole vietate (peso INFINITE_COST)")
+    rules.add_argument("--required-type", type=float, default=0.1, help="quota di regole con tipo richiesto")
+    rules.add_argument("--required-colors", type=float, default=0.05, help="quota di regole con colori richiesti")
+    rules.add_argument("--infeasible", action="store_true", help="non garantire una sequenza percorribile")
+    rules.add_argument("--seed", type=int, default=0)
+    rules.add_argument("--output", required=True)
+
+    orders = sub.add_parser("orders", help="file ordini CSV o JSONL")
+    orders.add_argument("--db", required=True, help="database di regole da cui prendere i codici")
+    orders.add_argument("--colors", type=int, default=1000)
+    orders.add_argument("--skew", type=float, default=1.0)
+    orders.add_argument("--lines", nargs="*", default=[])
+    orders.add_argument("--cabin-split", type=float, default=None, help="quota di ordini 'corto' (cabina 1)")
+    orders.add_argument("--days", type=int, default=1)
+    orders.add_argument("--seed", type=int, default=0)
+    orders.add_argument("--output", required=True, help="file .csv o .jsonl")
+    args = parser.parse_args(argv)
+
+    if args.command == "rules":
+        cluster_dict, cambio_colori = generate_rules(args.clusters, args.codes, args.density, args.forbidden,
+                                                     args.required_type, args.required_colors,
+                                                     not args.infeasible, args.seed)
+        write_rules_db(args.output, cluster_dict, cambio_colori)
+        vietate = sum(r["peso"] >= config.INFINITE_COST for r in cambio_colori.values())
+        print(f"✅ {args.output}: {len(cluster_dict)} cluster, {sum(map(len, cluster_dict.values()))} codici, "
+              f"{len(cambio_colori)} regole ({vietate} vietate)")
+    else:
+        cluster_dict = read_rules_db(args.db)
+        lista = generate_orders(cluster_dict, args.colors, cluster_skew=args.skew, lines=args.lines,
+                                cabin_split=args.cabin_split, days=args.days, seed=args.seed)
+        write_orders(args.output, lista)
+        print(f"✅ {args.output}: {len(lista)} ordini su {len(cluster_dict)} cluster")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
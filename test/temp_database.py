@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Database temporaneo per i test che scrivono (cabine salvate, regole sintetiche, profili).
+
+Impostare DATABASE_PATH prima di importare app non basta quando i test girano nello
+stesso processo (pytest test/): app.config è già importato da un altro modulo e il
+backend scriverebbe nel shared/data/colors.db versionato. TempDatabase modifica anche
+app.config (letto da database.connect_to_db a ogni connessione) e ripristina i valori
+precedenti alla fine.
+
+Uso in un modulo di test (pytest chiama setup_module / teardown_module, lo script
+__main__ li chiama esplicitamente):
+
+    TEMP_DB = TempDatabase("metriche_")
+    setup_module, teardown_module = TEMP_DB.setup_module, TEMP_DB.teardown_module
+
+Il modulo deve avere già "backend" in sys.path (activate importa app.config).
+load_frontend carica un'istanza nuova del frontend dopo activate, legata al database
+del test (un "import main" già fatto da un altro modulo resterebbe sul suo database).
+"""
+
+import contextlib
+import importlib.util
+import io
+import os
+import shutil
+import sys
+import tempfile
+from typing import Any, Dict, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHARED_DB = os.path.join(ROOT, "shared", "data", "colors.db")
+
+
+class TempDatabase:
+    """
+    Copia di colors.db (o un file vuoto con copy=False) in una cartella temporanea.
+    config_overrides: altri valori di app.config da impostare per il modulo (nome -> valore,
+    oppure una funzione della cartella temporanea).
+    """
+
+    def __init__(self, prefix: str, copy: bool = True, filename: str = "colors.db", **config_overrides):
+        self.dir = tempfile.mkdtemp(prefix=prefix)
+        self.path = os.path.join(self.dir, filename)
+        if copy:
+            shutil.copy(SHARED_DB, self.path)
+        self.overrides: Dict[str, Any] = {"DATABASE_PATH": self.path}
+        for name, value in config_overrides.items():
+            self.overrides[name] = value(self.dir) if callable(value) else value
+        self._saved_env: Dict[str, Optional[str]] = {}
+        self._saved_config: Dict[str, Any] = {}
+
+    def activate(self) -> None:
+        """Punta app.config (importandolo) e l'ambiente (per il frontend importato dopo) ai valori del test."""
+        from app import config
+        for name, value in self.overrides.items():
+            self._saved_env.setdefault(name, os.environ.get(name))
+            os.environ[name] = str(int(value)) if isinstance(value, bool) else str(value)
+            self._saved_config.setdefault(name, getattr(config, name))
+            setattr(config, name, value)
+
+    def deactivate(self) -> None:
+        for name, value in self._saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        from app import config
+        for name, value in self._saved_config.items():
+            setattr(config, name, value)
+        self._saved_env.clear()
+        self._saved_config.clear()
+
+    def cleanup(self) -> None:
+        self.deactivate()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def setup_module(self, module=None) -> None:
+        self.activate()
+
+    def teardown_module(self, module=None) -> None:
+        self.cleanup()
+
+
+def load_frontend(module_name: str):
+    """Istanza nuova di frontend/app/main.py (init_db sul DATABASE_PATH corrente), log scartati."""
+    frontend_dir = os.path.join(ROOT, "frontend", "app")
+    if frontend_dir not in sys.path:
+        sys.path.insert(0, frontend_dir)
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(frontend_dir, "main.py"))
+    frontend = importlib.util.module_from_spec(spec)
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        spec.loader.exec_module(frontend)
+    return frontend
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test della baseline delle prestazioni (test/benchmark_baseline.py):
+- riepilogo per scenario (mediana, p95 per rango più vicino, picco di memoria);
+- regressione solo oltre la soglia relativa e il minimo assoluto; miglioramenti, scenari
+  nuovi / mancanti e cambi di costo o stati DP segnalati con il loro stato;
+- ambiente diverso dalla baseline indicato nel rapporto;
+- "save" e "compare" da riga di comando: codice 1 con una regressione, 0 senza;
+  "compare --run" rimisura gli stessi scenari della baseline.
+
+Eseguire dalla root del progetto: python test/test_benchmark_baseline.py
+"""
+
+import contextlib
+import copy
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import benchmark_baseline as bb
+import benchmark_optimizer
+
+
+def record(scenario, times, peak_mb=1.0, cost=10.0):
+    component, clusters, *colors = scenario.split("/")
+    return {"scenario": scenario, "component": component, "clusters": int(clusters[1:]),
+            "colors": int(colors[0][1:]) if colors else None,
+            "wall_ms": {"median": sorted(times)[len(times) // 2], "all": times}, "peak_mb": peak_mb,
+            "dp_states": 64, "cost": cost}
+
+
+METADATA = {"timestamp": "2026-01-01T00:00:00", "python": "3.11", "numpy": "2.0", "processor": "x86_64",
+            "platform": "Linux", "repeat": 5}
+
+
+def run_of(*records, **metadata):
+    return {"metadata": {**METADATA, **metadata}, "scenarios": bb.summarize(list(records))}
+
+
+def test_summary() -> bool:
+    scenari = bb.summarize([record("optimize_color_sequence/c9/n100", [5.0, 1.0, 3.0, 2.0, 4.0])])
+    s = scenari["optimize_color_sequence/c9/n100"]
+    assert s["median_ms"] == 3.0 and s["p95_ms"] == 5.0 and s["repeat"] == 5, s
+    assert s["clusters"] == 9 and s["colors"] == 100, s
+    assert bb._p95([float(v) for v in range(1, 101)]) == 95.0
+    print("✅ riepilogo per scenario: mediana, p95, memoria")
+    return True
+
+
+def test_compare() -> bool:
+    base = run_of(record("a/c3/n10", [10.0] * 5), record("b/c3/n10", [0.2] * 5),
+                  record("c/c3/n10", [10.0] * 5, peak_mb=10.0), record("d/c3/n10", [10.0] * 5),
+                  record("e/c3/n10", [10.0] * 5), record("gone/c3", [1.0] * 5))
+    nuovo = run_of(record("a/c3/n10", [13.0] * 5),               # +30% e +3 ms: regressione
+                   record("b/c3/n10", [0.6] * 5),                # +200% ma 0.4 ms: rumore
+                   record("c/c3/n10", [10.0] * 5, peak_mb=12.0),  # +20% di memoria
+                   record("d/c3/n10", [6.0] * 5),                # -40%: migliorato
+                   record("e/c3/n10", [10.0] * 5, cost=20.0),    # stesso tempo, costo diverso
+                   record("new/c3", [1.0] * 5), processor="arm64")
+    rows = {row["scenario"]: row for row in bb.compare(base, nuovo)}
+    stati = {scenario: row["status"] for scenario, row in rows.items()}
+    assert stati == {"a/c3/n10": bb.STATUS_REGRESSION, "b/c3/n10": bb.STATUS_OK, "c/c3/n10": bb.STATUS_REGRESSION,
+                     "d/c3/n10": bb.STATUS_IMPROVED, "e/c3/n10": bb.STATUS_CHANGED,
+                     "gone/c3": bb.STATUS_MISSING, "new/c3": bb.STATUS_NEW}, stati
+    assert "cost 10.0 -> 20.0" in rows["e/c3/n10"]["problems"]
+    assert bb.compare(base, nuovo, time_threshold=0.5, p95_threshold=0.5)[0]["status"] == bb.STATUS_OK
+
+    report = bb.format_report(list(rows.values()), base, nuovo)
+    assert "ambiente diverso" in report and "processor: x86_64 -> arm64" in report, report
+    assert "| a/c3/n10 | REGRESSIONE |" in report and "b/c3/n10" not in report, report
+    print("✅ confronto: soglie relative e assolute, miglioramenti, cambi di costo, scenari nuovi/mancanti")
+    return True
+
+
+def test_cli() -> bool:
+    tmp = tempfile.mkdtemp(prefix="baseline_")
+    try:
+        risultati = os.path.join(tmp, "risultati.json")
+        baseline = os.path.join(tmp, "baseline.json")
+        dati = {"metadata": METADATA, "results": [record("a/c3/n10", [10.0] * 5)]}
+        with open(risultati, "w") as f:
+            json.dump(dati, f)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            assert bb.main(["compare", risultati, "--baseline", baseline]) == 2  # baseline assente
+            assert bb.main(["save", risultati, "--baseline", baseline]) == 0
+            assert bb.main(["compare", risultati, "--baseline", baseline]) == 0
+            peggiore = copy.deepcopy(dati)
+            peggiore["results"] = [record("a/c3/n10", [20.0] * 5)]
+            with open(risultati, "w") as f:
+                json.dump(peggiore, f)
+            report = os.path.join(tmp, "report.md")
+            assert bb.main(["compare", risultati, "--baseline", baseline, "--report", report]) == 1
+            assert bb.main(["compare", risultati, "--baseline", baseline, "--time-threshold", "1.5",
+                            "--p95-threshold", "1.5"]) == 0
+        with open(report, encoding="utf-8") as f:
+            assert "REGRESSIONE" in f.read()
+
+        # Esecuzione vera, minima: stessa macchina e stesso codice, nessun cambio di costo o stati
+        with contextlib.redirect_stdout(out):
+            benchmark_optimizer.main(["--clusters", "3", "--colors", "10", "--repeat", "2", "--output", risultati])
+            assert bb.main(["save", risultati, "--baseline", baseline]) == 0
+        confronto = io.StringIO()
+        with contextlib.redirect_stdout(confronto):
+            assert bb.main(["compare", "--run", "--baseline", baseline, "--time-threshold", "100",
+                            "--p95-threshold", "100", "--memory-threshold", "100", "--all"]) == 0
+        assert "| held_karp_table/c3 | ok |" in confronto.getvalue(), confronto.getvalue()
+        assert bb.STATUS_CHANGED not in confronto.getvalue(), confronto.getvalue()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    print("✅ save / compare da riga di comando, codici di uscita e --run sugli scenari della baseline")
+    return True
+
+
+if __name__ == "__main__":
+    print("🧪 Test baseline delle prestazioni")
+    print("=" * 60)
+    ok = test_summary() and test_compare() and test_cli()
+    sys.exit(0 if ok else 1)
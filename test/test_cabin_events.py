@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Test degli eventi per cabina (frontend/app/cabin_events.py) scritti dai trigger su una
+copia del database:
+- le modifiche di un batch si fondono per colore: insert+delete spariscono, insert+update
+  resta un insert con la riga aggiornata, update e delete passano come tali;
+- lo spostamento di un colore tra cabine arriva come delete alla vecchia e insert alla nuova;
+- oltre CABIN_EVENTS_MAX_DELTA_ROWS righe si pubblica un "reset";
+- la coda piena di un client lento viene sostituita da un solo "reset";
+- il thread del bus pubblica le scritture di un'altra connessione e si ferma senza iscritti.
+
+Eseguire dalla root del progetto: python test/test_cabin_events.py
+"""
+
+import os
+import queue
+import sqlite3
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from temp_database import TempDatabase, load_frontend
+
+TEMP_DB = TempDatabase("eventi_cabine_")
+setup_module, teardown_module = TEMP_DB.setup_module, TEMP_DB.teardown_module
+
+
+def setup_bus(cabin_ids, maxsize: int = 0):
+    """Bus con iscritti registrati a mano (senza thread) e connessione già al termine del log."""
+    load_frontend("frontend_eventi_cabine")  # init_db installa cabin_changes e i trigger
+    import cabin_events
+    bus = cabin_events.CabinEventBus(TEMP_DB.path)
+    subscribers = {cabin_id: queue.Queue(maxsize=maxsize) for cabin_id in cabin_ids}
+    bus._subscribers = {cabin_id: {q} for cabin_id, q in subscribers.items()}
+    conn = sqlite3.connect(TEMP_DB.path)
+    conn.execute("DELETE FROM optimization_colors")
+    conn.commit()
+    last_id = conn.execute("SELECT IFNULL(MAX(id), 0) FROM cabin_changes").fetchone()[0]
+    return cabin_events, bus, subscribers, conn, last_id
+
+
+def insert(conn, code: str, cabin_id: int) -> int:
+    return conn.execute("INSERT INTO optimization_colors (color_code, color_type, cabin_id) VALUES (?, 'F', ?)",
+                        (code, cabin_id)).lastrowid
+
+
+def drain(q: queue.Queue):
+    events = []
+    while not q.empty():
+        events.append(q.get_nowait())
+    return events
+
+
+def test_delta_merge() -> bool:
+    _, bus, subscribers, conn, last_id = setup_bus([1, 2])
+    updated, moved, deleted = insert(conn, "C1", 1), insert(conn, "D1", 1), insert(conn, "E1", 1)
+    conn.commit()
+    last_id = bus._dispatch_changes(conn, last_id)
+    drain(subscribers[1])
+
+    added = insert(conn, "A1", 1)
+    conn.execute("UPDATE optimization_colors SET completed = 1 WHERE id = ?", (added,))
+    transient = insert(conn, "B1", 1)
+    conn.execute("DELETE FROM optimization_colors WHERE id = ?", (transient,))
+    conn.execute("UPDATE optimization_colors SET in_execution = 1 WHERE id = ?", (updated,))
+    conn.execute("UPDATE optimization_colors SET cabin_id = 2 WHERE id = ?", (moved,))
+    conn.execute("DELETE FROM optimization_colors WHERE id = ?", (deleted,))
+    conn.commit()
+    change_id = bus._dispatch_changes(conn, last_id)
+    conn.close()
+
+    (cabin_1,), (cabin_2,) = drain(subscribers[1]), drain(subscribers[2])
+    assert cabin_1["event"] == cabin_2["event"] == "delta" and cabin_1["change_id"] == change_id > last_id
+    ops = [(c["op"], c["id"]) for c in cabin_1["changes"]]
+    assert ops == [("insert", added), ("update", updated), ("delete", moved), ("delete", deleted)], ops
+    rows = {c["id"]: c["color"] for c in cabin_1["changes"] if "color" in c}
+    assert rows[added].color_code == "A1" and rows[added].completed is True, rows[added]
+    assert rows[updated].in_execution is True, rows[updated]
+    assert [(c["op"], c["id"], c["color"].color_code) for c in cabin_2["changes"]] == [("insert", moved, "D1")]
+    print("✅ delta: insert+delete scartati, insert+update come insert, spostamento come delete+insert")
+    return True
+
+
+def test_reset_above_max_rows() -> bool:
+    cabin_events, bus, subscribers, conn, last_id = setup_bus([1])
+    original = cabin_events.CABIN_EVENTS_MAX_DELTA_ROWS
+    cabin_events.CABIN_EVENTS_MAX_DELTA_ROWS = 3
+    try:
+        for i in range(4):
+            insert(conn, f"R{i}", 1)
+        conn.commit()
+        change_id = bus._dispatch_changes(conn, last_id)
+        assert drain(subscribers[1]) == [{"event": "reset", "cabin_id": 1, "change_id": change_id}]
+
+        color_id = insert(conn, "R4", 1)  # Il batch successivo torna a essere un delta
+        conn.commit()
+        bus._dispatch_changes(conn, change_id)
+        (event,) = drain(subscribers[1])
+        assert event["event"] == "delta" and [(c["op"], c["id"]) for c in event["changes"]] == [("insert", color_id)]
+    finally:
+        cabin_events.CABIN_EVENTS_MAX_DELTA_ROWS = original
+        conn.close()
+    print("✅ oltre CABIN_EVENTS_MAX_DELTA_ROWS righe: evento 'reset'")
+    return True
+
+
+def test_slow_subscriber_reset() -> bool:
+    _, bus, subscribers, conn, last_id = setup_bus([1], maxsize=2)
+    for i in range(3):
+        insert(conn, f"L{i}", 1)
+        conn.commit()
+        last_id = bus._dispatch_changes(conn, last_id)
+    conn.close()
+    assert drain(subscribers[1]) == [{"event": "reset", "cabin_id": 1}]
+    print("✅ client lento: coda sostituita da un solo 'reset'")
+    return True
+
+
+def test_bus_thread() -> bool:
+    cabin_events, bus, _, conn, _ = setup_bus([])
+    original = cabin_events.CABIN_EVENTS_POLL_SECONDS
+    cabin_events.CABIN_EVENTS_POLL_SECONDS = 0.01
+    try:
+        q = bus.subscribe(2)
+        thread = bus._thread
+        time.sleep(0.1)  # Il thread parte dalla fine del log
+        color_id = insert(conn, "T1", 2)  # Scrittura da un'altra connessione, come il backend
+        conn.commit()
+        event = q.get(timeout=5)
+        assert event["event"] == "delta" and [(c["op"], c["id"]) for c in event["changes"]] == [("insert", color_id)]
+        bus.unsubscribe(2, q)
+        thread.join(5)
+        assert not thread.is_alive() and bus._thread is None and bus.subscriber_count() == 0
+    finally:
+        cabin_events.CABIN_EVENTS_POLL_SECONDS = original
+        conn.close()
+    print("✅ thread del bus: delta per le scritture di un'altra connessione, arresto senza iscritti")
+    return True
+
+
+if __name__ == "__main__":
+    print("🧪 Test eventi per cabina dal log delle modifiche")
+    print("=" * 60)
+    setup_module()
+    try:
+        ok = (test_delta_merge() and test_reset_above_max_rows() and test_slow_subscriber_reset()
+              and test_bus_thread())
+    finally:
+        teardown_module()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Test della ripartizione dei colori su N cabine (partition_cabins / optimize_cabin_partition):
+- ogni colore finisce in una sola cabina e i cluster non vengono divisi tra cabine;
+- il carico massimo resta entro la tolleranza quando la partenza LPT ci rientra;
+- il costo della ripartizione non supera quello della sola partenza LPT e coincide con
+  la somma dei costi di optimize_color_sequence sulle singole cabine;
+- /optimize rifiuta cabin_count oltre CABIN_COUNT e i thread delle cabine restano entro
+  PARTITION_MAX_WORKERS;
+- tempo delle cabine ottimizzate in parallelo rispetto a una alla volta.
+
+Eseguire dalla root del progetto: python test/test_cabin_partition.py
+"""
+
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from app import config, database, logic
+from app.color_batch import ColorBatch
+
+
+def random_colors(rng: random.Random, size: int):
+    codes = [code for codes in database.get_cluster_colori().values() for code in codes]
+    colors = []
+    for _ in range(size):
+        color = {"code": rng.choice(codes), "type": rng.choice(["F", "K", "R", "E", "E"])}
+        if rng.random() < 0.8:
+            color["CH"] = rng.choice([0.5, 1, 2, 3, 6])
+        colors.append(color)
+    return colors
+
+
+def lpt_load(batch: ColorBatch, cabin_count: int) -> float:
+    """Carico massimo della sola assegnazione LPT dei cluster (stessi pesi di partition_cabins)."""
+    ore = logic._color_hours(batch)
+    pesi = {}
+    for i in range(len(batch)):
+        pesi[batch.cluster(i)] = pesi.get(batch.cluster(i), 0.0) + float(ore[i])
+    carichi = [0.0] * cabin_count
+    for c in sorted(pesi, key=lambda c: (-pesi[c], c)):
+        k = min(range(cabin_count), key=lambda k: (carichi[k], k))
+        carichi[k] += pesi[c]
+    return max(carichi)
+
+
+def test_partition(iterations: int = 12) -> bool:
+    rng = random.Random(40)
+    cluster_dict = database.get_cluster_colori()
+    cambio_colori = database.get_cambio_colori()
+    for n_case in range(iterations):
+        colors = random_colors(rng, rng.randint(10, 80))
+        cabin_count = rng.choice([1, 2, 3, 4])
+        batch = ColorBatch(colors)
+        with contextlib.redirect_stdout(io.StringIO()):
+            righe, ore = logic.partition_cabins(batch, cabin_count, cluster_dict, cambio_colori)
+            plan = logic.optimize_cabin_partition(colors, cabin_count=cabin_count)
+
+        assert sorted(i for r in righe for i in r) == list(range(len(colors))), n_case
+        proprietario = {}
+        for k, r in enumerate(righe):
+            for i in r:
+                assert proprietario.setdefault(batch.cluster(i), k) == k, (n_case, batch.cluster(i))
+        totale = float(logic._color_hours(batch).sum())
+        limite = max(totale / cabin_count * (1 + config.PARTITION_BALANCE_TOLERANCE),
+                     max(float(logic._color_hours(batch)[[i for i in range(len(batch)) if batch.cluster(i) == c]].sum())
+                         for c in proprietario if c is not None))
+        if lpt_load(batch, cabin_count) <= limite + 1e-9:
+            assert max(ore) <= limite + 1e-9, (n_case, ore, limite)
+
+        assert [c["cabin_id"] for c in plan["cabins"]] == list(range(1, cabin_count + 1)), n_case
+        with contextlib.redirect_stdout(io.StringIO()):
+            for k, cabina in enumerate(plan["cabins"]):
+                if not righe[k]:
+                    continue
+                ordered, sequence, cost, _ = logic.optimize_color_sequence(batch.select(righe[k]))
+                assert cabina["cluster_sequence"] == sequence and cabina["cost"] == cost, (n_case, k)
+                assert [c["code"] for c in cabina["colors"]] == [c["code"] for c in ordered], (n_case, k)
+        assert abs(plan["cost"] - sum(c["cost"] for c in plan["cabins"])) < 1e-9, n_case
+    print(f"✅ {iterations} ripartizioni casuali: cluster interi, carico entro il limite, cabine coerenti")
+    return True
+
+
+def test_local_search_improves() -> bool:
+    rng = random.Random(400)
+    cluster_dict = database.get_cluster_colori()
+    cambio_colori = database.get_cambio_colori()
+    for n_case in range(10):
+        batch = ColorBatch(random_colors(rng, 60))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            logic.partition_cabins(batch, rng.choice([2, 3]), cluster_dict, cambio_colori)
+        righe = [r for r in output.getvalue().splitlines() if r.startswith("[PARTITION]")]
+        lpt = float(righe[0].split("partenza LPT: costo ")[1].split(",")[0])
+        finale = float(righe[1].split("costo ")[1].split(",")[0])
+        assert finale <= lpt + 1e-9, (n_case, lpt, finale)
+    print("✅ la ricerca locale non peggiora mai il costo della partenza LPT")
+    return True
+
+
+def test_cabin_count_limits() -> bool:
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    rng = random.Random(401)
+    colors = random_colors(rng, 30)
+    response = TestClient(app).post("/optimize", json={"colors_today": colors, "mode": "cabine",
+                                                       "cabin_count": config.CABIN_COUNT + 1})
+    assert response.status_code == 422, response.text
+
+    pool_sizes = []
+    executor = logic.ThreadPoolExecutor
+
+    def recording_executor(max_workers=None, **kwargs):
+        pool_sizes.append(max_workers)
+        return executor(max_workers=max_workers, **kwargs)
+
+    logic.ThreadPoolExecutor = recording_executor
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            plan = logic.optimize_cabin_partition(colors, cabin_count=6, max_workers=2)
+    finally:
+        logic.ThreadPoolExecutor = executor
+    assert len(plan["cabins"]) == 6 and pool_sizes == [2], pool_sizes
+    print(f"✅ cabin_count > {config.CABIN_COUNT} rifiutato (422), 6 cabine su {pool_sizes[0]} thread")
+    return True
+
+
+def benchmark(size: int = 600, cabin_count: int = 3) -> None:
+    rng = random.Random(4000)
+    colors = random_colors(rng, size)
+    batch = ColorBatch(colors)
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.perf_counter()
+        plan = logic.optimize_cabin_partition(batch, cabin_count=cabin_count)
+        t_parallel = time.perf_counter() - start_time
+        righe, _ = logic.partition_cabins(batch, cabin_count, database.get_cluster_colori(),
+                                          database.get_cambio_colori())
+        start_time = time.perf_counter()
+        for r in righe:
+            if r:
+                logic.optimize_color_sequence(batch.select(r))
+        t_sequential = time.perf_counter() - start_time
+    print(f"\n⏱️  {size} colori su {cabin_count} cabine: ripartizione + cabine in parallelo "
+          f"{t_parallel * 1000:.0f} ms (ore {[c['hours'] for c in plan['cabins']]}), "
+          f"solo cabine una alla volta {t_sequential * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    print("🧪 Test ripartizione dei colori su N cabine")
+    print("=" * 60)
+    ok = test_partition() and test_local_search_improves() and test_cabin_count_limits()
+    benchmark()
+    sys.exit(0 if ok else 1)
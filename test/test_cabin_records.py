@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Record compatti per il piano colori delle cabine (CabinColor nel backend,
+CabinColorRow nel frontend): stesso JSON dei dizionari per riga usati prima,
+accesso in stile dizionario e confronto di memoria / tempi di serializzazione.
+
+Eseguire dalla root del progetto: python test/test_cabin_records.py
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from app.cabin_records import CabinColor, CABIN_COLOR_SELECT
+from app import serialization
+
+ROWS = 50000
+
+
+def make_db(rows: int) -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    conn.execute("""
+        CREATE TABLE optimization_colors (
+            id INTEGER PRIMARY KEY, cabin_id INTEGER, color_code TEXT, color_type TEXT, cluster TEXT,
+            ch_value REAL, lunghezza_ordine TEXT, input_sequence INTEGER, sequence_type TEXT,
+            locked BOOLEAN, sequence_order INTEGER
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO optimization_colors (cabin_id, color_code, color_type, cluster, ch_value, lunghezza_ordine, "
+        "input_sequence, sequence_type, locked, sequence_order) VALUES (1, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        ((f"RAL{1000 + i % 900}", "EKRF"[i % 4], f"Cluster {i % 9}", 1.5 if i % 3 else None, "corto",
+          i % 7 or None, None, i % 11 == 0 if i % 5 else None, i + 1) for i in range(rows)))
+    return conn
+
+
+def dict_rows(conn):
+    """Forma precedente di get_colors_for_cabin: un dizionario per riga."""
+    rows = conn.execute(f"SELECT {CABIN_COLOR_SELECT} FROM optimization_colors ORDER BY sequence_order").fetchall()
+    return [{
+        'color_code': row[0], 'color_type': row[1], 'cluster': row[2], 'ch_value': row[3],
+        'lunghezza_ordine': row[4], 'input_sequence': row[5], 'sequence_type': row[6],
+        'locked': bool(row[7]) if row[7] is not None else False, 'sequence_order': row[8]
+    } for row in rows]
+
+
+def record_rows(conn):
+    cursor = conn.cursor()
+    cursor.row_factory = CabinColor.row_factory
+    return cursor.execute(f"SELECT {CABIN_COLOR_SELECT} FROM optimization_colors ORDER BY sequence_order").fetchall()
+
+
+def measure(fn, conn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(conn)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def check_equivalence(conn) -> bool:
+    dicts = dict_rows(conn)
+    records = record_rows(conn)
+    ok = json.loads(serialization.dumps_json(records)) == dicts
+    ok &= [r.to_dict() for r in records] == dicts
+    ok &= json.loads(json.dumps(records, default=serialization._default)) == dicts  # fallback senza orjson
+
+    # Accesso in stile dizionario usato dagli endpoint di blocco / riordino / riorganizzazione
+    record = records[0].copy()
+    record['locked'] = True
+    record['position'] = 3
+    ok &= record.get('locked') is True and record['position'] == 3 and records[0].get('position') is None
+    ok &= record.get('code', 'Unknown') == 'Unknown' and 'position' not in json.loads(serialization.dumps_json(record))
+    try:
+        record['inesistente'] = 1
+        ok = False
+    except KeyError:
+        pass
+    print(f"{'✅' if ok else '❌'} Record e dizionari producono lo stesso JSON e lo stesso accesso per chiave")
+    return ok
+
+
+def test_equivalence() -> bool:
+    """Equivalenza su un database piccolo costruito dal test (raccolto anche da pytest)."""
+    ok = check_equivalence(make_db(200))
+    assert ok
+    return ok
+
+
+def benchmark(conn) -> None:
+    dicts, t_dict, mem_dict = measure(dict_rows, conn)
+    records, t_rec, mem_rec = measure(record_rows, conn)
+    start = time.perf_counter()
+    serialization.dumps_json(dicts)
+    t_json_dict = time.perf_counter() - start
+    start = time.perf_counter()
+    serialization.dumps_json(records)
+    t_json_rec = time.perf_counter() - start
+    print(f"\n⏱️  {ROWS} righe (lettura + picco memoria, serializzazione):")
+    print(f"   dizionari  {t_dict * 1000:7.1f} ms  {mem_dict / 1e6:6.1f} MB   json {t_json_dict * 1000:6.1f} ms")
+    print(f"   CabinColor {t_rec * 1000:7.1f} ms  {mem_rec / 1e6:6.1f} MB   json {t_json_rec * 1000:6.1f} ms")
+
+
+if __name__ == "__main__":
+    print("🧪 Test record compatti cabina")
+    print("=" * 60)
+    conn = make_db(ROWS)
+    ok = check_equivalence(conn)
+    benchmark(conn)
+    sys.exit(0 if ok else 1)
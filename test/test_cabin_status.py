@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Test di /api/cabin-status del frontend con CABIN_COUNT=3:
+- la risposta ha una chiave cabin_<id> per ogni cabina di CABIN_IDS, non solo cabin_1/cabin_2;
+- una modifica ai colori della cabina 3 cambia l'ETag (If-None-Match non risponde più 304);
+- /api/optimize rifiuta cabin_count oltre CABIN_COUNT (cabine che l'interfaccia non mostra).
+
+Eseguire dalla root del progetto: python test/test_cabin_status.py
+"""
+
+import os
+import sqlite3
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from temp_database import TempDatabase, load_frontend
+
+TEMP_DB = TempDatabase("stato_cabine_", CABIN_COUNT=3)
+setup_module, teardown_module = TEMP_DB.setup_module, TEMP_DB.teardown_module
+
+
+def test_cabin_status_all_cabins() -> bool:
+    frontend = load_frontend("frontend_stato_cabine")
+    assert frontend.CABIN_IDS == [1, 2, 3], frontend.CABIN_IDS
+    client = frontend.app.test_client()
+
+    conn = sqlite3.connect(TEMP_DB.path)
+    conn.execute("DELETE FROM optimization_colors")
+    conn.executemany(
+        "INSERT INTO optimization_colors (color_code, color_type, cabin_id, completed, in_execution) VALUES (?, 'F', ?, ?, ?)",
+        [("A1", 1, 1, 0), ("B1", 3, 0, 0), ("B2", 3, 0, 1)],
+    )
+    conn.commit()
+
+    response = client.get("/api/cabin-status")
+    assert response.status_code == 200, response.status_code
+    status = response.get_json()
+    assert sorted(status) == ["cabin_1", "cabin_2", "cabin_3"], status
+    assert status["cabin_1"] == {"total": 1, "executing": 0, "completed": 1}, status
+    assert status["cabin_2"] == {"total": 0, "executing": 0, "completed": 0}, status
+    assert status["cabin_3"] == {"total": 2, "executing": 1, "completed": 0}, status
+    etag = response.headers["ETag"]
+    assert client.get("/api/cabin-status", headers={"If-None-Match": etag}).status_code == 304
+
+    conn.execute("UPDATE optimization_colors SET completed = 1 WHERE color_code = 'B1'")
+    conn.commit()
+    conn.close()
+    response = client.get("/api/cabin-status", headers={"If-None-Match": etag})
+    assert response.status_code == 200, response.status_code
+    assert response.get_json()["cabin_3"]["completed"] == 1, response.get_json()
+    print("✅ /api/cabin-status: chiavi per tutte le cabine e ETag invalidato dalla cabina 3")
+    return True
+
+
+def test_cabin_count_validation() -> bool:
+    frontend = load_frontend("frontend_stato_cabine")
+    colors = [{"code": "A1", "type": "F"}]
+    for cabin_count in (3, None):
+        payload, error = frontend._validate_optimization_request({"colors_today": colors, "mode": "cabine",
+                                                                  "cabin_count": cabin_count})
+        assert error is None and payload["cabin_count"] == (cabin_count or 3), (payload, error)
+    for cabin_count in (4, -1, "2", True):
+        _, error = frontend._validate_optimization_request({"colors_today": colors, "mode": "cabine",
+                                                            "cabin_count": cabin_count})
+        assert error and "cabin_count" in error, (cabin_count, error)
+    response = frontend.app.test_client().post("/api/optimize", json={"colors_today": colors, "mode": "cabine",
+                                                                      "cabin_count": 4})
+    assert response.status_code == 400, response.status_code
+    print("✅ /api/optimize: cabin_count limitato a 1..CABIN_COUNT")
+    return True
+
+
+if __name__ == "__main__":
+    print("🧪 Test stato cabine con CABIN_COUNT=3")
+    print("=" * 60)
+    setup_module()
+    try:
+        ok = test_cabin_status_all_cabins() and test_cabin_count_validation()
+    finally:
+        teardown_module()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Test del ColorBatch (colonne per richiesta): mappatura cluster, aggregati per cluster
+e conversione in dizionari devono coincidere con il calcolo diretto sui dizionari
+che facevano prima _map_colors_to_clusters, _build_cost_matrix e
+_get_cluster_sequence_priority.
+
+Eseguire dalla root del progetto: python test/test_color_batch.py
+"""
+
+import contextlib
+import io
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from app.color_batch import ColorBatch, EMPTY_CLUSTER_SEQUENCE, sequence_value
+from app.models import ColorInput
+
+CLUSTER_DICT = {
+    "Bianco": ["RAL9010", "RAL9016", "RAL9001"],
+    "Grigio": ["RAL7035", "RAL7016"],
+    "Blu": ["RAL5010", "RAL5014"],
+    "Rosso": ["RAL3000"],
+}
+CODES = [code for codes in CLUSTER_DICT.values() for code in codes] + ["SCONOSCIUTO"]
+
+
+def random_colors(rng: random.Random):
+    return [{
+        "code": rng.choice(CODES),
+        "type": rng.choice(["F", "K", "R", "r", "RE", "E", "Reintegro"]),
+        "sequence": rng.choice([None, 0, 1, 4, "3", "x"]),
+        "sequence_type": rng.choice([None, "piccola", "successiva"]),
+        "lunghezza_ordine": rng.choice([None, "corto", "lungo"]),
+    } for _ in range(rng.randint(0, 40))]
+
+
+def expected_aggregates(colors, cluster_of, prioritized):
+    """Calcolo diretto sui dizionari (come nella versione precedente della logica)."""
+    per_cluster = {}
+    for c in colors:
+        cluster = cluster_of.get(c["code"])
+        if cluster:
+            per_cluster.setdefault(cluster, []).append(c)
+    result = {}
+    for cluster, members in per_cluster.items():
+        types = {c["type"].upper() for c in members}
+        result[cluster] = {
+            "min_sequence": min(sequence_value(c.get("sequence")) for c in members),
+            "codes": {c["code"] for c in members},
+            "types": types,
+            "has_r": "R" in types,
+            "has_re": "RE" in types,
+            "has_prio": any(c["type"].upper() == "R" and c["code"] in prioritized for c in members),
+        }
+    return result
+
+
+def check(iterations: int = 500) -> bool:
+    rng = random.Random(32)
+    cluster_of = {code: cluster for cluster, codes in CLUSTER_DICT.items() for code in codes}
+    for n in range(iterations):
+        colors = random_colors(rng)
+        prioritized = rng.sample(CODES, 2)
+        # Stesso risultato partendo da dizionari o da modelli ColorInput
+        # ('x' non è valido per il modello: come None vale sequenza 0)
+        source = colors if n % 2 else [ColorInput(**{**c, "sequence": None if c["sequence"] == "x" else c["sequence"]})
+                                       for c in colors]
+        batch = ColorBatch(source)
+        with contextlib.redirect_stdout(io.StringIO()):  # avvisi per i codici senza cluster
+            _, clusters_oggi, urgenti = batch.assign_clusters(CLUSTER_DICT)
+        expected = expected_aggregates(colors, cluster_of, prioritized)
+
+        assert clusters_oggi == sorted(expected), (n, clusters_oggi)
+        assert urgenti == {cluster_of[c["code"]] for c in colors
+                           if c["code"] in cluster_of and c["type"].upper() in ("R", "REINTEGRO")}, n
+        aggregates = batch.aggregates(prioritized)
+        for cluster, values in expected.items():
+            cid = batch.cluster_id(cluster)
+            assert batch.cluster_sequence_priority(cluster) == values["min_sequence"], (n, cluster)
+            assert aggregates.codes[cid] == values["codes"], (n, cluster)
+            assert aggregates.types[cid] == values["types"], (n, cluster)
+            assert bool(aggregates.has_reintegro[cid]) == values["has_r"], (n, cluster)
+            assert bool(aggregates.has_reintegro_non_urgente[cid]) == values["has_re"], (n, cluster)
+            assert bool(aggregates.has_reintegro_prioritario[cid]) == values["has_prio"], (n, cluster)
+        assert batch.cluster_sequence_priority("Inesistente") == EMPTY_CLUSTER_SEQUENCE
+
+        # Uscita: copie dei record con il cluster, input non modificato
+        output = batch.to_dicts()
+        assert [o["code"] for o in output] == [c["code"] for c in colors], n
+        assert [o["cluster"] for o in output] == [cluster_of.get(c["code"]) for c in colors], n
+        assert all("cluster" not in c for c in colors), n
+
+        cabina_1 = batch.where("lunghezza_ordine", "corto")
+        assert [cabina_1.code(i) for i in range(len(cabina_1))] == \
+            [c["code"] for c in colors if c["lunghezza_ordine"] == "corto"], n
+        rows = batch.rows_by_cluster(["Rosso", "Bianco"])
+        assert [output[i]["cluster"] for i in rows] == \
+            sorted((o["cluster"] for o in output if o["cluster"] in ("Rosso", "Bianco")), key=lambda c: c != "Rosso"), n
+    print(f"✅ {iterations} batch casuali: aggregati e conversioni coincidono con il calcolo sui dizionari")
+    return True
+
+
+if __name__ == "__main__":
+    print("🧪 Test ColorBatch")
+    print("=" * 60)
+    sys.exit(0 if check() else 1)
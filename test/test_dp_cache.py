@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Test della cache delle tabelle Held-Karp (logic.dp_cache):
+- la tabella in cache coincide con _held_karp_table e i percorsi (anche con arrivo
+  fissato o ritorno alla partenza) sono gli stessi calcolati senza cache;
+- una sottomatrice con gli stessi nomi dei cluster, anche in ordine diverso, è letta
+  dalla tabella più grande senza ricalcolare;
+- oltre il limite di memoria le tabelle più vecchie scadono;
+- tempo della ripartizione su cabine e di richieste ripetute con e senza cache.
+
+Eseguire dalla root del progetto: python test/test_dp_cache.py
+"""
+
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import numpy as np
+
+from app import config, database, logic
+from app.color_batch import ColorBatch
+
+INF = config.INFINITE_COST
+
+
+def random_matrix(rng: random.Random, n: int, forbidden: float) -> np.ndarray:
+    return np.array([[INF if rng.random() < forbidden else rng.choice([1, 5, 10, 25, 60]) for _ in range(n)]
+                     for _ in range(n)], dtype=float)
+
+
+@contextlib.contextmanager
+def cache_disabled():
+    max_bytes = logic.dp_cache.max_bytes
+    logic.dp_cache.max_bytes = 0
+    try:
+        yield
+    finally:
+        logic.dp_cache.max_bytes = max_bytes
+
+
+def test_same_paths(iterations: int = 300) -> bool:
+    rng = random.Random(43)
+    logic.dp_cache.clear()
+    for n_case in range(iterations):
+        n = rng.randint(2, 8)
+        matrix = random_matrix(rng, n, rng.choice([0.0, 0.2, 0.4]))
+        start = rng.choice([None] + list(range(n)))
+        end = rng.choice([None, start] + list(range(n)))
+        with contextlib.redirect_stdout(io.StringIO()):
+            cached = logic._find_best_path_and_reconstruct(matrix, start, end_node_index=end)
+            again = logic._find_best_path_and_reconstruct(matrix, start, end_node_index=end)
+            with cache_disabled():
+                expected = logic._find_best_path_and_reconstruct(matrix, start, end_node_index=end)
+        assert cached == expected == again, (n_case, cached, expected)
+        assert np.array_equal(logic.dp_cache.table(matrix, start), logic._held_karp_table(matrix, start)), n_case
+    stats = logic.dp_cache.stats()
+    assert stats["hits"] >= iterations, stats
+    print(f"✅ {iterations} matrici casuali: stessi percorsi con e senza cache ({stats['hits']} tabelle riusate)")
+    return True
+
+
+def test_subset_tables(iterations: int = 200) -> bool:
+    rng = random.Random(430)
+    for n_case in range(iterations):
+        logic.dp_cache.clear()
+        n = rng.randint(3, 9)
+        labels = [f"C{k}" for k in range(n)]
+        matrix = random_matrix(rng, n, rng.choice([0.0, 0.3]))
+        start = rng.choice([None] + list(range(n)))
+        logic.dp_cache.table(matrix, start, labels)
+
+        subset = rng.sample(range(n), rng.randint(1, n - 1))
+        if start is not None and start not in subset:
+            subset.append(start)
+            rng.shuffle(subset)
+        if len(subset) == n:
+            continue
+        sub_start = subset.index(start) if start is not None else None
+        sub_matrix = matrix[np.ix_(subset, subset)]
+        hits = logic.dp_cache.stats()["subset_hits"]
+        table = logic.dp_cache.table(sub_matrix, sub_start, [labels[k] for k in subset])
+        assert logic.dp_cache.stats()["subset_hits"] == hits + 1, n_case
+        assert np.array_equal(table, logic._held_karp_table(sub_matrix, sub_start)), (n_case, subset, start)
+
+        # Stessi nomi ma costi diversi: la tabella salvata non vale
+        altered = sub_matrix.copy()
+        altered[0, -1] = 7.0 if altered[0, -1] != 7.0 else 8.0
+        logic.dp_cache.table(altered, sub_start, [labels[k] for k in subset])
+        assert logic.dp_cache.stats()["subset_hits"] == hits + 1, n_case
+    print(f"✅ {iterations} sottoinsiemi: letti dalla tabella su tutti i cluster, solo con sottomatrice identica")
+    return True
+
+
+def test_memory_cap() -> bool:
+    rng = random.Random(431)
+    cache = logic.DPTableCache(max_bytes=3 * (1 << 8) * 8 * 8)  # tre tabelle da 8 nodi
+    matrices = [random_matrix(rng, 8, 0.2) for _ in range(5)]
+    for matrix in matrices:
+        cache.table(matrix, 0)
+    stats = cache.stats()
+    assert stats["entries"] == 3 and stats["bytes"] <= stats["max_bytes"], stats
+    cache.table(matrices[-1], 0)
+    cache.table(matrices[0], 0)
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 6, cache.stats()
+    print("✅ limite di memoria: le tabelle meno usate di recente scadono")
+    return True
+
+
+def benchmark() -> None:
+    rng = random.Random(4300)
+    codes = [code for codes in database.get_cluster_colori().values() for code in codes]
+    colors = [{"code": rng.choice(codes), "type": rng.choice(["F", "K", "R", "E", "E"]), "CH": rng.choice([1, 2, 3])}
+              for _ in range(400)]
+    cluster_dict, cambio_colori = database.get_cluster_colori(), database.get_cambio_colori()
+    for label, disabled in (("senza cache", True), ("con cache", False)):
+        logic.dp_cache.clear()
+        with contextlib.redirect_stdout(io.StringIO()), (cache_disabled() if disabled else contextlib.nullcontext()):
+            start_time = time.perf_counter()
+            logic.partition_cabins(ColorBatch(colors), 3, cluster_dict, cambio_colori)
+            t_partition = time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            for _ in range(5):
+                logic.optimize_color_sequence(colors, cluster_dict=cluster_dict, cambio_colori=cambio_colori)
+            t_repeat = time.perf_counter() - start_time
+        print(f"⏱️  {label}: ripartizione su 3 cabine {t_partition * 1000:.0f} ms, "
+              f"5 ottimizzazioni uguali {t_repeat * 1000:.0f} ms")
+
+    matrix = random_matrix(rng, 16, 0.3)
+    for label in ("prima richiesta", "richiesta ripetuta"):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start_time = time.perf_counter()
+            logic._find_best_path_and_reconstruct(matrix, 0, top_n=1)
+            elapsed = time.perf_counter() - start_time
+        print(f"⏱️  16 cluster, {label}: {elapsed * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    print("🧪 Test cache delle tabelle Held-Karp")
+    print("=" * 60)
+    ok = test_same_paths() and test_subset_tables() and test_memory_cap()
+    print()
+    benchmark()
+    sys.exit(0 if ok else 1)
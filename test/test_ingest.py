@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Test dell'import dei file ordini (ingest.import_colors):
+- CSV con e senza intestazione, con separatore ',' o ';' e decimali con la virgola,
+  e JSONL danno gli stessi colori dell'elenco JSON equivalente;
+- le righe non valide sono scartate con numero di riga e motivo, quelle vuote ignorate;
+- i colori importati ottimizzati coincidono con optimize_color_sequence sull'elenco JSON;
+- righe al secondo e picco di memoria rispetto a json.loads + ColorInput dell'intero corpo.
+
+Eseguire dalla root del progetto: python test/test_ingest.py
+"""
+
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from app import database, ingest, logic
+from app.models import ColorInput
+
+
+def random_colors(rng: random.Random, size: int):
+    codes = [code for codes in database.get_cluster_colori().values() for code in codes]
+    colors = []
+    for _ in range(size):
+        colors.append({"code": rng.choice(codes), "type": rng.choice(["F", "K", "R", "E", "E"]),
+                       "line": rng.choice([None, "L1", "L2"]), "sequence": rng.choice([None, 1, 2, 3]),
+                       "sequence_type": None, "CH": rng.choice([None, 0.5, 2.5]),
+                       "lunghezza_ordine": rng.choice([None, "corto", "lungo"]), "day": None})
+    return colors
+
+
+def as_csv(colors, separator: str, header: bool) -> bytes:
+    righe = ["Codice;Tipo;Sequenza;Linea;CH;Lunghezza ordine".replace(";", separator)] if header else []
+    for c in colors:
+        ch = "" if c["CH"] is None else str(c["CH"]).replace(".", "," if separator == ";" else ".")
+        valori = [c["code"], c["type"], "" if c["sequence"] is None else str(c["sequence"]), c["line"] or "", ch]
+        if header:
+            valori.append(c["lunghezza_ordine"] or "")
+        righe.append(separator.join(valori))
+    return ("\n".join(righe) + "\n").encode("utf-8")
+
+
+def as_jsonl(colors) -> bytes:
+    return "".join(json.dumps({k: v for k, v in c.items() if v is not None}) + "\n" for c in colors).encode("utf-8")
+
+
+def run_import(data: bytes, file_format: str) -> ingest.ImportResult:
+    with contextlib.redirect_stdout(io.StringIO()):
+        return ingest.import_colors(io.BytesIO(data), file_format, database.get_cluster_colori())
+
+
+def test_formats() -> bool:
+    rng = random.Random(42)
+    colors = random_colors(rng, 200)
+    senza_lunghezza = [{**c, "lunghezza_ordine": None} for c in colors]
+    casi = [
+        ("CSV ',' con intestazione", as_csv(colors, ",", True), ingest.FORMAT_CSV, colors),
+        ("CSV ';' con intestazione", as_csv(colors, ";", True), ingest.FORMAT_CSV, colors),
+        ("CSV senza intestazione", as_csv(colors, ",", False), ingest.FORMAT_CSV, senza_lunghezza),
+        ("JSONL", as_jsonl(colors), ingest.FORMAT_JSONL, colors),
+    ]
+    for label, data, file_format, attesi in casi:
+        result = run_import(data, file_format)
+        assert result.colors == attesi, label
+        assert result.rejected == 0 and result.rows == len(colors), (label, result.stats())
+        assert sum(result.clusters.values()) + sum(result.unknown_codes.values()) == len(colors), label
+    print(f"✅ {len(casi)} formati: stessi colori dell'elenco JSON equivalente")
+    return True
+
+
+def test_rejected_rows() -> bool:
+    data = b"Codice,Tipo,Sequenza\n1000,E,1\n,E,2\n\n9005,F,x\n1013,R,2.5\n5010,E,\n"
+    result = run_import(data, ingest.FORMAT_CSV)
+    assert [c["code"] for c in result.colors] == ["1000", "5010"], result.colors
+    assert [e["row"] for e in result.errors] == [3, 5, 6], result.errors
+    assert result.rows == 5 and result.rejected == 3, result.stats()
+
+    data = b'{"code": "1000", "type": "E"}\n[1, 2]\n{"code": "9005", "type": "E", "day": -1}\n{broken\n'
+    result = run_import(data, ingest.FORMAT_JSONL)
+    assert len(result.colors) == 1 and [e["row"] for e in result.errors] == [2, 3, 4], result.errors
+
+    assert ingest.detect_format(None, "text/csv; charset=utf-8", None) == ingest.FORMAT_CSV
+    assert ingest.detect_format(None, None, "ordini.ndjson") == ingest.FORMAT_JSONL
+    assert ingest.detect_format("XLSX", None, None) == ingest.FORMAT_XLSX
+    try:
+        ingest.detect_format(None, "application/octet-stream", "ordini.bin")
+        raise AssertionError("formato sconosciuto accettato")
+    except ValueError:
+        pass
+    print("✅ righe non valide scartate con riga e motivo, righe vuote ignorate, formato riconosciuto")
+    return True
+
+
+def test_same_optimization() -> bool:
+    rng = random.Random(420)
+    colors = random_colors(rng, 80)
+    result = run_import(as_csv(colors, ";", True), ingest.FORMAT_CSV)
+    with contextlib.redirect_stdout(io.StringIO()):
+        da_file = logic.optimize_color_sequence(result.colors)
+        da_json = logic.optimize_color_sequence([ColorInput(**c) for c in colors])
+    assert da_file[1] == da_json[1] and da_file[2] == da_json[2], (da_file[1], da_json[1])
+    assert [c["code"] for c in da_file[0]] == [c["code"] for c in da_json[0]]
+    print("✅ colori importati da CSV: stessa ottimizzazione dell'elenco JSON")
+    return True
+
+
+def benchmark(size: int = 100_000) -> None:
+    rng = random.Random(4200)
+    colors = random_colors(rng, size)
+    data = as_csv(colors, ";", True)
+    body = json.dumps({"colors_today": colors}).encode("utf-8")
+
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    result = run_import(data, ingest.FORMAT_CSV)
+    elapsed = time.perf_counter() - start_time
+    picco_import = tracemalloc.get_traced_memory()[1]
+    tracemalloc.reset_peak()
+    [ColorInput(**c) for c in json.loads(body)["colors_today"]]
+    picco_json = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"\n⏱️  {size} righe CSV ({len(data) / 1e6:.1f} MB): {elapsed * 1000:.0f} ms, "
+          f"{result.rows_per_second:,.0f} righe/s; picco memoria import {picco_import / 1e6:.0f} MB, "
+          f"corpo JSON + ColorInput {picco_json / 1e6:.0f} MB")
+
+
+if __name__ == "__main__":
+    print("🧪 Test import file ordini (CSV / JSONL / XLSX)")
+    print("=" * 60)
+    ok = test_formats() and test_rejected_rows() and test_same_optimization()
+    benchmark()
+    sys.exit(0 if ok else 1)
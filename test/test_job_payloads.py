@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Test della scadenza dei payload dei job di ottimizzazione nel frontend:
+- una voce non usata da più di OPTIMIZATION_JOB_PAYLOADS_TTL_SECONDS viene rimossa
+  al successivo avvio di un job (anche se il job non è mai stato applicato);
+- oltre OPTIMIZATION_JOB_PAYLOADS_MAX voci si scartano le meno recenti;
+- leggere il payload (stream, stop, apply) ne rinnova la scadenza.
+
+Eseguire dalla root del progetto: python test/test_job_payloads.py
+"""
+
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from temp_database import TempDatabase, load_frontend
+
+TEMP_DB = TempDatabase("payload_job_")
+setup_module, teardown_module = TEMP_DB.setup_module, TEMP_DB.teardown_module
+
+
+def test_job_payload_expiry() -> bool:
+    frontend = load_frontend("frontend_payload_job")
+    frontend.OPTIMIZATION_JOB_PAYLOADS_MAX = 3
+    frontend.OPTIMIZATION_JOB_PAYLOADS_TTL_SECONDS = 100
+    clock = [1000.0]
+    frontend.time = types.SimpleNamespace(time=lambda: clock[0])  # Orologio del solo modulo di test
+
+    frontend._remember_job_payload("vecchio", {"n": 0})
+    clock[0] += 60
+    frontend._remember_job_payload("a", {"n": 1})
+    clock[0] += 50  # "vecchio" non usato da 110 s: scaduto
+    assert frontend._job_payload("vecchio") is None
+    frontend._remember_job_payload("b", {"n": 2})
+    frontend._remember_job_payload("c", {"n": 3})
+    assert sorted(frontend._optimization_job_payloads) == ["a", "b", "c"]
+
+    clock[0] += 10
+    assert frontend._job_payload("a") == {"n": 1}  # Rinnova "a": ora la meno recente è "b"
+    frontend._remember_job_payload("d", {"n": 4})
+    assert sorted(frontend._optimization_job_payloads) == ["a", "c", "d"], frontend._optimization_job_payloads
+
+    clock[0] += 101  # Nessuno usato: all'avvio successivo restano solo i nuovi
+    frontend._remember_job_payload("e", {"n": 5})
+    assert list(frontend._optimization_job_payloads) == ["e"], frontend._optimization_job_payloads
+    print("✅ payload dei job: scadenza per inattività e numero massimo di voci")
+    return True
+
+
+if __name__ == "__main__":
+    print("🧪 Test scadenza dei payload dei job nel frontend")
+    print("=" * 60)
+    setup_module()
+    try:
+        ok = test_job_payload_expiry()
+    finally:
+        teardown_module()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Test dell'ottimizzazione per linea di produzione (optimize_by_line):
+- ogni linea coincide con optimize_color_sequence lanciato sui soli colori di quella linea;
+- i colori senza linea formano un gruppo a parte e nessuna linea riceve colori di un'altra;
+- il costo totale è la somma delle linee;
+- /api/optimize del frontend rifiuta la modalità "linee" e un risultato per linea non
+  cancella i piani salvati nelle cabine;
+- tempo delle linee in parallelo rispetto a un'unica ottimizzazione su tutti i colori.
+
+Eseguire dalla root del progetto: python test/test_line_partition.py
+"""
+
+import contextlib
+import io
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from app import database, logic
+from temp_database import TempDatabase, load_frontend
+
+# Il frontend lavora su una copia del database (piani delle cabine)
+TEMP_DB = TempDatabase("linee_")
+setup_module, teardown_module = TEMP_DB.setup_module, TEMP_DB.teardown_module
+
+
+def random_colors(rng: random.Random, size: int, lines: int):
+    codes = [code for codes in database.get_cluster_colori().values() for code in codes]
+    colors = []
+    for _ in range(size):
+        color = {"code": rng.choice(codes), "type": rng.choice(["F", "K", "R", "E", "E"])}
+        if rng.random() < 0.9:
+            color["line"] = f"L{rng.randrange(lines) + 1}"
+        colors.append(color)
+    return colors
+
+
+def test_lines(iterations: int = 12) -> bool:
+    rng = random.Random(41)
+    for n_case in range(iterations):
+        colors = random_colors(rng, rng.randint(10, 80), rng.choice([1, 2, 4]))
+        with contextlib.redirect_stdout(io.StringIO()):
+            plan = logic.optimize_by_line(colors, max_workers=rng.choice([1, 3]))
+            attese = sorted({c.get("line") for c in colors}, key=lambda line: (line is None, line or ""))
+            assert [l["line"] for l in plan["lines"]] == attese, (n_case, attese)
+            for linea in plan["lines"]:
+                subset = [c for c in colors if c.get("line") == linea["line"]]
+                ordered, sequence, cost, _ = logic.optimize_color_sequence(subset)
+                assert linea["cluster_sequence"] == sequence and linea["cost"] == cost, (n_case, linea["line"])
+                assert [c["code"] for c in linea["colors"]] == [c["code"] for c in ordered], (n_case, linea["line"])
+                assert all(c.get("line") == linea["line"] for c in linea["colors"]), (n_case, linea["line"])
+        assert abs(plan["cost"] - sum(l["cost"] for l in plan["lines"])) < 1e-9, n_case
+    print(f"✅ {iterations} insiemi casuali: ogni linea ottimizzata da sola, senza colori di altre linee")
+    return True
+
+
+def test_frontend_keeps_cabin_plans() -> bool:
+    frontend = load_frontend("frontend_linee")
+    rng = random.Random(4101)
+    colors = random_colors(rng, 20, 2)
+
+    def cabin_rows():
+        conn = sqlite3.connect(TEMP_DB.path)
+        rows = conn.execute("SELECT id, color_code, cabin_id FROM optimization_colors ORDER BY id").fetchall()
+        conn.close()
+        return rows
+
+    conn = sqlite3.connect(TEMP_DB.path)
+    conn.executemany("INSERT INTO optimization_colors (color_code, color_type, cabin_id) VALUES (?, 'F', ?)",
+                     [("L1", 1), ("L2", 2)])
+    conn.commit()
+    conn.close()
+    before = cabin_rows()
+
+    response = frontend.app.test_client().post("/api/optimize", json={"colors_today": colors, "mode": "linee"})
+    assert response.status_code == 400 and "linee" in response.get_json()["error"], response.get_data(as_text=True)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        plan = logic.optimize_by_line(colors)
+    frontend.save_optimization_results_to_db(plan, {"colors_today": colors})
+    assert cabin_rows() == before, "un risultato per linea ha modificato i piani delle cabine"
+    print(f"✅ frontend: modalità 'linee' rifiutata, {len(before)} righe delle cabine intatte")
+    return True
+
+
+def benchmark(size: int = 800, lines: int = 4) -> None:
+    rng = random.Random(4100)
+    colors = random_colors(rng, size, lines)
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.perf_counter()
+        plan = logic.optimize_by_line(colors)
+        t_lines = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        logic.optimize_color_sequence(colors)
+        t_single = time.perf_counter() - start_time
+    print(f"\n⏱️  {size} colori su {len(plan['lines'])} gruppi di linea: per linea {t_lines * 1000:.0f} ms, "
+          f"un'unica ottimizzazione {t_single * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    print("🧪 Test ottimizzazione per linea di produzione")
+    print("=" * 60)
+    setup_module()
+    try:
+        ok = test_lines() and test_frontend_keeps_cabin_plans()
+    finally:
+        teardown_module()
+    benchmark()
+    sys.exit(0 if ok else 1)
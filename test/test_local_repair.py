@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test della riparazione locale dopo un drag & drop (repair_after_move):
+- il colore spostato e i colori bloccati restano fermi;
+- cambiano solo le posizioni dentro le finestre vicine allo spostamento;
+- 'order' è una permutazione del piano e i costi sono coerenti con il piano restituito;
+- tempo rispetto alla riottimizzazione completa con blocchi su una cabina da 1000 colori.
+
+Eseguire dalla root del progetto: python test/test_local_repair.py
+"""
+
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from app import database, logic
+
+
+def optimized_plan(rng: random.Random, size: int, lock_ratio: float):
+    codes = [code for codes in database.get_cluster_colori().values() for code in codes]
+    plan = [{"code": rng.choice(codes), "type": rng.choice(["F", "K", "R", "E", "E"]),
+             "locked": rng.random() < lock_ratio} for _ in range(size)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        plan = logic.optimize_with_locked_colors(plan)["colors"]
+    for color in plan:
+        color.pop("position", None)
+    return plan
+
+
+def test_repair(iterations: int = 30) -> bool:
+    rng = random.Random(36)
+    for n_case in range(iterations):
+        plan = optimized_plan(rng, rng.randint(2, 80), rng.choice([0.0, 0.05, 0.2]))
+        moved_from, moved_to = rng.randrange(len(plan)), rng.randrange(len(plan))
+        plan.insert(moved_to, plan.pop(moved_from))
+        radius = rng.choice([0, 1, 3, 8])
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = logic.repair_after_move(plan, moved_from, moved_to, radius)
+        order, colors = result["order"], result["colors"]
+
+        assert sorted(order) == list(range(len(plan))), n_case
+        assert [c["code"] for c in colors] == [plan[i]["code"] for i in order], n_case
+        assert order[moved_to] == moved_to, n_case
+        inside = {i for start, end in result["windows"] for i in range(start, end)}
+        for i, original_index in enumerate(order):
+            if i not in inside or plan[i].get("locked"):
+                assert original_index == i, (n_case, i)
+            assert colors[i]["position"] == i and colors[i]["locked"] == plan[original_index].get("locked", False)
+        assert all(abs(i - moved_to) <= radius or abs(i - moved_from) <= radius + 1 for i in inside), n_case
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            recomputed = logic._plan_costs([colors], database.get_cluster_colori(), database.get_cambio_colori())[0]
+        assert abs(recomputed - result["cost_after_repair"]) < 1e-9, n_case
+        assert abs(result["cost_delta"] - (result["cost_after_repair"] - result["cost_before_move"])) < 1e-9
+    print(f"✅ {iterations} spostamenti casuali: solo le finestre vicine cambiano, spostato e bloccati fermi")
+    return True
+
+
+def benchmark(size: int = 1000) -> None:
+    rng = random.Random(360)
+    plan = optimized_plan(rng, size, 0.02)
+    plan.insert(size * 3 // 4, plan.pop(size // 10))
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = logic.repair_after_move(plan, size // 10, size * 3 // 4)
+        t_repair = time.perf_counter() - start
+        start = time.perf_counter()
+        logic.optimize_with_locked_colors(plan)
+        t_full = time.perf_counter() - start
+    print(f"\n⏱️  {size} colori: riparazione locale {t_repair * 1000:.0f} ms "
+          f"(variazione costo {result['cost_delta']:+.0f}), riottimizzazione completa {t_full * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    print("🧪 Test riparazione locale dopo drag & drop")
+    print("=" * 60)
+    ok = test_repair()
+    benchmark()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Test dell'ottimizzazione a segmenti tra colori bloccati:
+- optimize_locked_segments su piani casuali con i cluster del DB: i bloccati restano
+  al loro posto, ogni colore libero resta nella sua finestra e nessun colore si perde;
+- /optimize-locked-colors passa i reintegri prioritari alla matrice dei costi;
+- tempo rispetto all'ottimizzazione dei liberi come blocco unico.
+
+Eseguire dalla root del progetto: python test/test_locked_segments.py
+"""
+
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from app import database, logic
+
+
+def random_plan(rng: random.Random, codes, size: int, lock_ratio: float):
+    return [{
+        "code": rng.choice(codes),
+        "type": rng.choice(["F", "K", "R", "E", "E"]),
+        "sequence": rng.choice([None, 1, 2]),
+        "locked": rng.random() < lock_ratio,
+    } for _ in range(size)]
+
+
+def test_plans(iterations: int = 20) -> bool:
+    rng = random.Random(340)
+    codes = [code for codes in database.get_cluster_colori().values() for code in codes][:60]
+    for n_case in range(iterations):
+        plan = random_plan(rng, codes, rng.randint(5, 60), rng.choice([0.05, 0.2, 0.5]))
+        if all(c["locked"] for c in plan):
+            continue
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = logic.optimize_with_locked_colors(plan)
+        colors = result["colors"]
+        assert len(colors) == len(plan), n_case
+        for i, (before, after) in enumerate(zip(plan, colors)):
+            if before["locked"]:
+                assert after is before, (n_case, i)
+        for window in logic._split_free_windows(plan):
+            key = lambda c: (c["code"], c["type"], str(c["sequence"]))
+            assert sorted(map(key, plan[window.start:window.end])) == \
+                sorted(map(key, colors[window.start:window.end])), (n_case, window.start)
+            assert [c["position"] for c in colors[window.start:window.end]] == list(range(window.start, window.end))
+    print(f"✅ {iterations} piani casuali: bloccati fermi, liberi nella propria finestra, nessun colore perso")
+    return True
+
+
+def test_prioritized_reintegrations() -> bool:
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    rng = random.Random(341)
+    codes = [code for codes in database.get_cluster_colori().values() for code in codes][:60]
+    plan = random_plan(rng, codes, 30, 0.0)
+    plan[0]["locked"], plan[15]["locked"] = True, True
+    reintegrations = [plan[3]["code"]]
+
+    seen = []
+    build_cost_matrix = logic._build_cost_matrix
+
+    def spy(clusters, batch, cambio_colori, prioritized_reintegrations=None):
+        seen.append(prioritized_reintegrations)
+        return build_cost_matrix(clusters, batch, cambio_colori, prioritized_reintegrations)
+
+    logic._build_cost_matrix = spy
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = TestClient(app).post("/optimize-locked-colors", json={
+                "colors_today": plan, "prioritized_reintegrations": reintegrations})
+    finally:
+        logic._build_cost_matrix = build_cost_matrix
+    assert response.status_code == 200, response.text
+    assert len(response.json()["ordered_colors"]) == len(plan)
+    assert seen and all(r == reintegrations for r in seen), seen
+    print("✅ /optimize-locked-colors: reintegri prioritari usati nelle finestre tra i bloccati")
+    return True
+
+
+def benchmark() -> None:
+    rng = random.Random(3400)
+    codes = [code for codes in database.get_cluster_colori().values() for code in codes]
+    plan = random_plan(rng, codes, 400, 0.03)
+    free = [c for c in plan if not c["locked"]]
+    with contextlib.redirect_stdout(io.StringIO()):
+        logic.optimize_locked_segments(plan[:20])  # riscaldamento (import e cache)
+        start = time.perf_counter()
+        logic.optimize_color_sequence(free)
+        t_block = time.perf_counter() - start
+        start = time.perf_counter()
+        logic.optimize_locked_segments(plan)
+        t_segments = time.perf_counter() - start
+    print(f"\n⏱️  400 colori, {sum(c['locked'] for c in plan)} bloccati: "
+          f"blocco unico {t_block * 1000:.0f} ms, segmenti {t_segments * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    print("🧪 Test ottimizzazione a segmenti tra colori bloccati")
+    print("=" * 60)
+    ok = test_plans() and test_prioritized_reintegrations()
+    benchmark()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Test delle metriche di durata (backend/app/metrics.py e frontend/app/metrics.py):
+- /optimize risponde con Server-Timing per tutte le fasi (regole, cluster, matrice,
+  DP, ricostruzione, ordinamento, salvataggio), anche con le cabine calcolate in parallelo;
+- /metrics del backend espone istogrammi Prometheus coerenti (bucket cumulativi,
+  _count uguale al bucket +Inf) per fase e per route;
+- /metrics del frontend espone le richieste Flask e l'attesa sul backend, misurata
+  su un backend FastAPI vero avviato in un thread.
+
+Eseguire dalla root del progetto: python test/test_metrics.py
+"""
+
+import contextlib
+import io
+import os
+import random
+import re
+import socket
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+import uvicorn
+from fastapi.testclient import TestClient
+
+from app import database, metrics
+from app.main import app
+from temp_database import TempDatabase
+
+# Backend e frontend lavorano su una copia del database
+TEMP_DB = TempDatabase("metriche_")
+setup_module, teardown_module = TEMP_DB.setup_module, TEMP_DB.teardown_module
+
+client = TestClient(app)
+OPTIMIZE_BEFORE = 0.0
+
+
+def random_colors(size: int, seed: int):
+    rng = random.Random(seed)
+    codes = [code for codes in database.get_cluster_colori().values() for code in codes]
+    return [{"code": rng.choice(codes), "type": rng.choice(["F", "K", "R", "E", "E"]),
+             "lunghezza_ordine": rng.choice(["corto", "lungo"])} for _ in range(size)]
+
+
+def server_timing(header: str):
+    return {m.group(1): float(m.group(2)) for m in re.finditer(r'(\w+)(?:;desc="[^"]*")?;dur=([\d.]+)', header)}
+
+
+def check_histograms(text: str) -> int:
+    """Verifica bucket cumulativi e _count == +Inf per ogni serie; restituisce il numero di serie."""
+    series = {}
+    for line in text.splitlines():
+        m = re.match(r'(\w+)_bucket\{(.*)le="([^"]+)"\} (\S+)', line)
+        if m:
+            series.setdefault((m.group(1), m.group(2)), []).append(float(m.group(4)))
+            continue
+        m = re.match(r'(\w+)_count\{(.*)\} (\S+)', line)
+        if m:
+            buckets = series[(m.group(1), m.group(2) + ("," if m.group(2) else ""))]
+            assert buckets == sorted(buckets) and buckets[-1] == float(m.group(3)), line
+    return len(series)
+
+
+OPTIMIZE_OK = 'giotto_http_request_seconds_count{method="POST",route="/optimize",status="200"}'
+
+
+def series_value(text: str, series: str) -> float:
+    """Valore di una serie in /metrics (0 se assente): gli istogrammi sono di processo, condivisi con altri test."""
+    for line in text.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_server_timing() -> bool:
+    global OPTIMIZE_BEFORE
+    OPTIMIZE_BEFORE = series_value(client.get("/metrics").text, OPTIMIZE_OK)
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = client.post("/optimize", json={"colors_today": random_colors(80, 46)})
+    assert response.status_code == 200, response.text
+    fasi = server_timing(response.headers["Server-Timing"])
+    attese = set(metrics.STAGES) | {"total"}
+    assert set(fasi) == attese, fasi
+    assert sum(v for k, v in fasi.items() if k != "total") <= fasi["total"] + 1.0, fasi
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = client.post("/optimize", json={"colors_today": random_colors(80, 460), "mode": "cabine",
+                                                  "cabin_count": 2})
+    fasi = server_timing(response.headers["Server-Timing"])
+    assert set(fasi) == attese, fasi
+    print(f"✅ Server-Timing con tutte le fasi ({', '.join(f'{k} {v:.1f}ms' for k, v in fasi.items())})")
+    return True
+
+
+def test_backend_metrics() -> bool:
+    response = client.get("/metrics")
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain")
+    n_series = check_histograms(response.text)
+    for fase in metrics.STAGES:
+        assert f'giotto_optimization_stage_seconds_count{{stage="{fase}"}}' in response.text, fase
+    assert series_value(response.text, OPTIMIZE_OK) == OPTIMIZE_BEFORE + 2, "le due /optimize di test_server_timing"
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        client.get("/api/cabin/1/colors")
+    text = client.get("/metrics").text
+    assert 'route="/api/cabin/{cabin_id}/colors"' in text, "la route deve essere il template, non l'URL"
+    print(f"✅ /metrics backend: {n_series} serie, bucket cumulativi, route come template")
+    return True
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_frontend_metrics() -> bool:
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="error"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    os.environ["FASTAPI_BACKEND_URL"] = f"http://127.0.0.1:{port}"
+    sys.path.insert(0, os.path.join(ROOT, "frontend", "app"))
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        import main as frontend
+    frontend_client = frontend.app.test_client()
+    try:
+        response = frontend_client.post("/api/optimize/jobs/abc123/stop")
+        assert response.status_code == 404, response.status_code  # Job sconosciuto al backend
+        text = frontend_client.get("/metrics").get_data(as_text=True)
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    check_histograms(text)
+    assert ('giotto_frontend_request_seconds_count{method="POST",endpoint="api_stop_optimization_job",status="404"} 1'
+            in text), text
+    assert ('giotto_frontend_backend_wait_seconds_count{method="POST",route="/optimize/jobs/{id}/stop",status="404"} 1'
+            in text), text
+    print("✅ /metrics frontend: richieste Flask per endpoint e attesa sul backend per route")
+    return True
+
+
+if __name__ == "__main__":
+    print("🧪 Test metriche di durata (Server-Timing e /metrics)")
+    print("=" * 60)
+    setup_module()
+    try:
+        ok = test_server_timing() and test_backend_metrics() and test_frontend_metrics()
+    finally:
+        teardown_module()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Test della pianificazione su più giorni (optimize_multi_day):
+- i colori sono divisi per giorno (campo day, altrimenti "successiva" = domani);
+- ogni giorno parte dal cluster con cui finisce il precedente e coincide con
+  optimize_color_sequence lanciato a mano con quella partenza;
+- con un solo giorno il risultato è quello di optimize_color_sequence;
+- tempo dell'orizzonte rispetto ai singoli giorni ottimizzati uno dopo l'altro.
+
+Eseguire dalla root del progetto: python test/test_multi_day.py
+"""
+
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from app import config, database, logic
+
+
+def random_colors(rng: random.Random, size: int, days: int):
+    codes = [code for codes in database.get_cluster_colori().values() for code in codes]
+    colors = []
+    for _ in range(size):
+        color = {"code": rng.choice(codes), "type": rng.choice(["F", "K", "R", "E", "E"]),
+                 "sequence_type": rng.choice([None, config.SEQUENCE_TYPE_SMALL, config.SEQUENCE_TYPE_NEXT])}
+        if days > 2 and rng.random() < 0.3:
+            color["day"] = rng.randrange(days)
+        colors.append(color)
+    return colors
+
+
+def expected_day(color) -> int:
+    if color.get("day") is not None:
+        return color["day"]
+    return 1 if color.get("sequence_type") == config.SEQUENCE_TYPE_NEXT else 0
+
+
+def test_chained_days(iterations: int = 10) -> bool:
+    rng = random.Random(39)
+    for n_case in range(iterations):
+        colors = random_colors(rng, rng.randint(10, 60), rng.choice([2, 4]))
+        with contextlib.redirect_stdout(io.StringIO()):
+            plan = logic.optimize_multi_day(colors)
+            start = None
+            for giorno in plan["days"]:
+                subset = [c for c in colors if expected_day(c) == giorno["day"]]
+                ordered, sequence, cost, _ = logic.optimize_color_sequence(subset, start_cluster_nome=start)
+                assert [c["code"] for c in giorno["colors"]] == [c["code"] for c in ordered], (n_case, giorno["day"])
+                assert giorno["cluster_sequence"] == sequence and giorno["cost"] == cost, (n_case, giorno["day"])
+                assert all(c["day"] == giorno["day"] for c in giorno["colors"]), n_case
+                if start is not None:
+                    assert sequence[0] == start, (n_case, sequence, start)
+                start = sequence[-1]
+        assert [g["day"] for g in plan["days"]] == sorted({expected_day(c) for c in colors}), n_case
+        assert abs(plan["cost"] - sum(g["cost"] for g in plan["days"])) < 1e-9, n_case
+    print(f"✅ {iterations} orizzonti casuali: giorni agganciati al cluster finale del precedente")
+    return True
+
+
+def test_single_day() -> bool:
+    rng = random.Random(390)
+    colors = [c for c in random_colors(rng, 40, 2) if expected_day(c) == 0]
+    with contextlib.redirect_stdout(io.StringIO()):
+        plan = logic.optimize_multi_day(colors, start_cluster_nome="Giallo")
+        ordered, sequence, cost, _ = logic.optimize_color_sequence(colors, start_cluster_nome="Giallo")
+    assert len(plan["days"]) == 1 and plan["cluster_sequence"] == sequence and plan["cost"] == cost
+    assert [c["code"] for c in plan["colors"]] == [c["code"] for c in ordered]
+    print("✅ un solo giorno: stesso risultato di optimize_color_sequence")
+    return True
+
+
+def benchmark(size: int = 600, days: int = 5) -> None:
+    rng = random.Random(3900)
+    colors = random_colors(rng, size, days)
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.perf_counter()
+        plan = logic.optimize_multi_day(colors)
+        t_plan = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        start = None
+        for giorno in plan["days"]:
+            sequence = logic.optimize_color_sequence([c for c in colors if expected_day(c) == giorno["day"]],
+                                                     start_cluster_nome=start)[1]
+            start = sequence[-1] if sequence else start
+        t_days = time.perf_counter() - start_time
+    print(f"\n⏱️  {size} colori su {len(plan['days'])} giorni: orizzonte {t_plan * 1000:.0f} ms, "
+          f"giorni uno alla volta {t_days * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    print("🧪 Test pianificazione su più giorni")
+    print("=" * 60)
+    ok = test_chained_days() and test_single_day()
+    benchmark()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Test dei job di ottimizzazione in background (backend/app/jobs.py e /optimize/jobs):
+- un job fermato tra due strati della DP termina "stopped" con la migliore sequenza
+  trovata finora (l'incumbent greedy) e gli eventi incumbent, dp_layer, finished;
+- senza una sequenza completa l'interruzione lascia il job "cancelled";
+- una richiesta con la stessa chiave si aggancia al job in corso, non a uno terminato
+  o in fase di arresto;
+- lo stream SSE ha id consecutivi, chiude con l'evento "result" e riprende da Last-Event-ID.
+
+Eseguire dalla root del progetto: python test/test_optimization_jobs.py
+"""
+
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from fastapi.testclient import TestClient
+
+from app import database, jobs, logic
+from app.main import app
+from temp_database import TempDatabase
+
+# /optimize/jobs con lunghezza_ordine salva le cabine: si lavora su una copia del database
+TEMP_DB = TempDatabase("job_")
+setup_module, teardown_module = TEMP_DB.setup_module, TEMP_DB.teardown_module
+
+client = TestClient(app)
+
+
+def plant_colors(seed: int):
+    """Un colore per ogni cluster del DB: la DP ha uno strato per cluster."""
+    rng = random.Random(seed)
+    return [{"code": rng.choice(codes), "type": rng.choice(["F", "K", "E"])}
+            for codes in database.get_cluster_colori().values() if codes]
+
+
+def wait(job: jobs.OptimizationJob, timeout: float = 30) -> None:
+    deadline = time.time() + timeout
+    while job.status == jobs.JOB_RUNNING:
+        assert time.time() < deadline, f"job {job.id} ancora in corso"
+        time.sleep(0.01)
+
+
+def test_stop_between_layers() -> bool:
+    registry = jobs.JobRegistry()
+    colors = plant_colors(26)
+
+    def run(job: jobs.OptimizationJob):
+        def progress(event):
+            # L'operatore preme "stop" mentre la DP è al primo strato
+            if event.get("event") == "dp_layer":
+                job.request_stop()
+            job.progress_callback(event)
+
+        logic.dp_cache.clear()  # La DP deve essere calcolata, non letta dalla cache
+        ordered, sequence, cost, message = logic.optimize_color_sequence(colors, progress_callback=progress)
+        return {"ordered_colors": ordered, "optimal_cluster_sequence": sequence, "calculated_cost": cost,
+                "message": message}
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        job, shared = registry.start(run)
+        wait(job)
+    assert not shared and job.status == jobs.JOB_STOPPED, (job.status, job.error)
+
+    events = job.events_since(0)
+    assert [e["seq"] for e in events] == list(range(len(events))), events
+    kinds = [e["event"] for e in events]
+    assert kinds == ["incumbent", "dp_layer", "finished"], kinds
+    assert events[-1]["status"] == jobs.JOB_STOPPED
+
+    incumbent = events[0]
+    result = job.result
+    assert result["calculated_cost"] == incumbent["best_cost"], (result["calculated_cost"], incumbent)
+    assert result["optimal_cluster_sequence"] == incumbent["best_sequence"], (result, incumbent)
+    assert len(result["ordered_colors"]) == len(colors)
+    assert result["message"].startswith("Ottimizzazione interrotta"), result["message"]
+    print(f"✅ stop al primo strato DP: job 'stopped' con la sequenza greedy (costo {result['calculated_cost']:.0f})")
+    return True
+
+
+def test_cancelled_without_sequence() -> bool:
+    registry = jobs.JobRegistry()
+
+    def run(job: jobs.OptimizationJob):
+        job.request_stop()
+        job.progress_callback({"event": "dp_layer", "layer": 1})  # Nessun incumbent pubblicato
+        return {}
+
+    job, _ = registry.start(run)
+    wait(job)
+    assert job.status == jobs.JOB_CANCELLED and job.result is None and job.error, job.snapshot()
+    finished = job.events_since(0)[-1]
+    assert finished["event"] == "finished" and finished["status"] == jobs.JOB_CANCELLED, finished
+    print("✅ interruzione senza sequenza completa: job 'cancelled'")
+    return True
+
+
+def test_reuse_by_key() -> bool:
+    registry = jobs.JobRegistry()
+    release = threading.Event()
+
+    def run(job: jobs.OptimizationJob):
+        release.wait(10)
+        return {"ok": True}
+
+    first, shared_first = registry.start(run, key="k")
+    again, shared_again = registry.start(run, key="k")
+    other, shared_other = registry.start(run, key="altra")
+    assert not shared_first and shared_again and again is first, (shared_first, shared_again)
+    assert not shared_other and other is not first
+
+    first.request_stop()  # In fase di arresto: una nuova richiesta non deve ricevere il risultato interrotto
+    stopping, shared_stopping = registry.start(run, key="k")
+    assert not shared_stopping and stopping is not first
+
+    release.set()
+    for job in (first, other, stopping):
+        wait(job)
+    after, shared_after = registry.start(run, key="k")
+    wait(after)
+    assert not shared_after and after not in (first, stopping), "un job terminato non va riusato"
+    assert all(job.result == {"ok": True} for job in (first, other, stopping, after))
+    print("✅ chiave uguale: riuso del job in corso, nuovo job se terminato o in arresto")
+    return True
+
+
+def sse_frames(text: str):
+    """Frame SSE come (id o None, evento, dati)."""
+    frames = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        frames.append((int(fields["id"]) if "id" in fields else None, fields["event"], json.loads(fields["data"])))
+    return frames
+
+
+def test_sse_stream() -> bool:
+    rng = random.Random(260)
+    colors = [{**c, "lunghezza_ordine": rng.choice(["corto", "lungo"])} for c in plant_colors(260) * 3]
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = client.post("/optimize/jobs", json={"colors_today": colors})
+        assert started.status_code == 200, started.text
+        job_id = started.json()["job_id"]
+        wait(jobs.registry.get(job_id))
+        frames = sse_frames(client.get(f"/optimize/jobs/{job_id}/events").text)
+
+    progress = [f for f in frames if f[1] == "progress"]
+    assert [f[0] for f in progress] == list(range(len(progress))), [f[0] for f in progress]
+    assert all(f[0] == f[2]["seq"] for f in progress) and progress[-1][2]["event"] == "finished"
+    assert {"incumbent", "dp_layer", "solution"} <= {f[2]["event"] for f in progress}
+    result_id, result_event, snapshot = frames[-1]
+    assert frames[:-1] == progress and result_id is None and result_event == "result", frames[-1][:2]
+    assert snapshot["status"] == jobs.JOB_COMPLETED and {"cabina_1", "cabina_2"} <= set(snapshot["result"]), snapshot
+
+    resume_from = len(progress) // 2
+    with contextlib.redirect_stdout(io.StringIO()):
+        resumed = sse_frames(client.get(f"/optimize/jobs/{job_id}/events",
+                                        headers={"Last-Event-ID": str(resume_from)}).text)
+    assert [f[0] for f in resumed] == list(range(resume_from + 1, len(progress))) + [None], [f[0] for f in resumed]
+
+    stop = client.post(f"/optimize/jobs/{job_id}/stop").json()
+    assert stop["status"] == jobs.JOB_COMPLETED and not stop["stop_requested"], stop
+    assert client.get("/optimize/jobs/sconosciuto/events").status_code == 404
+    print(f"✅ SSE: {len(progress)} eventi con id consecutivi, evento 'result', ripresa da Last-Event-ID {resume_from}")
+    return True
+
+
+if __name__ == "__main__":
+    print("🧪 Test job di ottimizzazione in background")
+    print("=" * 60)
+    setup_module()
+    try:
+        ok = (test_stop_between_layers() and test_cancelled_without_sequence() and test_reuse_by_key()
+              and test_sse_stream())
+    finally:
+        teardown_module()
+    sys.exit(0 if ok else 1)
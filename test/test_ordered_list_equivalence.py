@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+"""
+Test di proprietà per _generate_final_ordered_list (versione con indice per richiesta):
+su input casuali l'ordine prodotto deve coincidere con quello dell'implementazione
+precedente, riportata qui sotto senza modifiche come riferimento.
+
+Copre chiavi code_type duplicate, first_color (anche con spazi o assente), sequenze
+None/stringa/non numeriche, sequence_type, tipi non standard, cluster fuori dal tour,
+cluster ripetuti nel tour e lo stesso codice in più cluster.
+
+Eseguire dalla root del progetto: python test/test_ordered_list_equivalence.py [iterazioni]
+"""
+
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+from typing import Dict, List, Optional, Set
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from app import config
+from app.logic import _generate_final_ordered_list, _safe_get_sequence
+from app.models import ColorObject
+
+DEFAULT_ITERATIONS = 2000
+
+
+# --- Implementazione precedente (riferimento) ---
+
+def legacy_generate_final_ordered_list(tour_clusters: List[str],
+                                 colori_giorno: List[ColorObject],
+                                 first_color: Optional[str] = None) -> List[ColorObject]:
+    """Ordina i colori seguendo il tour dei cluster e le priorità interne."""
+    colori_ordinati: List[ColorObject] = []
+    colori_usati_keys: Set[str] = set() # Per tracciare i colori già aggiunti (code+type)
+
+    print("\nGenerazione lista colori ordinata finale...")
+    # LOG: Stato colori_giorno in ingresso a questa funzione
+    print(f"[ORDERED_LIST] Ricevuti {len(colori_giorno)} colori per ordinamento. Codici: {[c.get('code') + ' ' + str(c.get('type')) for c in colori_giorno]}")
+    
+    # Gestione first_color se specificato
+    first_color_obj = None
+    first_color_cluster = None
+    if first_color:
+        print(f"[FIRST_COLOR] Primo colore specificato: {first_color}")
+        print(f"[FIRST_COLOR] DEBUG: first_color type: {type(first_color)}, repr: {repr(first_color)}")
+        print(f"[FIRST_COLOR] first_color dopo strip: '{first_color.strip()}'" if isinstance(first_color, str) else f"[FIRST_COLOR] first_color non è stringa: {type(first_color)}")
+        
+        print(f"[FIRST_COLOR] Tutti i colori disponibili ({len(colori_giorno)} totali):")
+        for i, c in enumerate(colori_giorno):
+            code = c.get('code', '')
+            print(f"  {i}: code='{code}' (type: {type(code)}), cluster='{c.get('cluster')}'")
+        
+        # Trova il colore nella lista - prova sia con che senza strip
+        search_variations = [first_color]
+        if isinstance(first_color, str):
+            stripped = first_color.strip()
+            if stripped != first_color:
+                search_variations.append(stripped)
+                print(f"[FIRST_COLOR] Aggiunta variazione con strip: '{stripped}'")
+        
+        for variation in search_variations:
+            print(f"[FIRST_COLOR] Cerco variazione: '{variation}'")
+            for c in colori_giorno:
+                color_code = c.get('code', '')
+                if color_code == variation:
+                    first_color_obj = c
+                    first_color_cluster = c.get('cluster')
+                    print(f"[FIRST_COLOR] ✓ Trovato colore {variation} nel cluster {first_color_cluster}")
+                    break
+            if first_color_obj:
+                break
+        
+        if not first_color_obj:
+            print(f"[FIRST_COLOR] ❌ ATTENZIONE: Colore {first_color} non trovato nella lista colori!")
+            print(f"[FIRST_COLOR] Confronti dettagliati effettuati:")
+            for i, c in enumerate(colori_giorno):
+                code = c.get('code', '')
+                for variation in search_variations:
+                    result = code == variation
+                    print(f"  {i}: '{code}' == '{variation}' ? {result} (len: {len(code)} vs {len(variation)})")
+                    if not result and len(code) == len(variation):
+                        # Confronto carattere per carattere
+                        for j, (c1, c2) in enumerate(zip(code, variation)):
+                            if c1 != c2:
+                                print(f"    Differenza alla posizione {j}: '{c1}' != '{c2}' (ord: {ord(c1)} vs {ord(c2)})")
+        elif first_color_cluster and first_color_cluster in tour_clusters:
+            # Riordina tour_clusters per mettere il cluster del primo colore all'inizio
+            new_tour = [first_color_cluster] + [c for c in tour_clusters if c != first_color_cluster]
+            print(f"[FIRST_COLOR] ✓ Tour cluster riordinato: {tour_clusters} -> {new_tour}")
+            tour_clusters = new_tour
+        else:
+            print(f"[FIRST_COLOR] ❌ ATTENZIONE: Cluster {first_color_cluster} non trovato nel tour: {tour_clusters}")
+    else:
+        print(f"[FIRST_COLOR] Nessun primo colore specificato (first_color={repr(first_color)})")
+    
+    for cluster_nome in tour_clusters:
+        print(f"  Processo cluster: {cluster_nome}")
+        colori_del_cluster = [c for c in colori_giorno if c.get("cluster") == cluster_nome and f"{c.get('code')}_{c.get('type')}" not in colori_usati_keys]
+
+        if not colori_del_cluster:
+            print(f"    Nessun colore nuovo per questo cluster.")
+            continue
+
+        # Gestione first_color se il cluster corrente contiene il primo colore specificato
+        first_color_in_cluster = None
+        if first_color and first_color_obj and cluster_nome == first_color_cluster:
+            print(f"    [FIRST_COLOR] ✓ Processando cluster {cluster_nome} che contiene il primo colore {first_color}")
+            # Trova il primo colore in questo cluster
+            for c in colori_del_cluster:
+                if c.get('code') == first_color:
+                    first_color_in_cluster = c
+                    print(f"    [FIRST_COLOR] ✓ Trovato {first_color} in questo cluster")
+                    break
+            
+            if not first_color_in_cluster:
+                print(f"    [FIRST_COLOR] ❌ ERRORE: {first_color} non trovato nei colori del cluster {cluster_nome}")
+                print(f"    [FIRST_COLOR]   colori_del_cluster: {[c.get('code') for c in colori_del_cluster]}")
+        elif first_color and cluster_nome == first_color_cluster:
+            print(f"    [FIRST_COLOR] ❌ ERRORE: Cluster {cluster_nome} dovrebbe contenere {first_color} ma first_color_obj è None")
+        elif first_color:
+            print(f"    [FIRST_COLOR] Cluster {cluster_nome} non contiene il primo colore {first_color} (first_color_cluster={first_color_cluster})")
+
+        # NUOVA REGOLA INTRA-CLUSTER: Raggruppa per stesso codice RAL/codice
+        print(f"    Applicazione regola raggruppamento per stesso codice...")
+        cluster_ordinato_temp = []
+        added_keys_this_cluster = set()
+        
+        # PRIMA PRIORITÀ: Se c'è un first_color in questo cluster, inizia con quello
+        if first_color_in_cluster:
+            cluster_ordinato_temp.append(first_color_in_cluster)
+            added_keys_this_cluster.add(f"{first_color_in_cluster['code']}_{first_color_in_cluster['type']}")
+            print(f"    + [FIRST_COLOR] PRIORITÀ ASSOLUTA: {first_color_in_cluster['code']} {first_color_in_cluster['type']}")
+            
+            # Aggiungi subito tutti gli altri tipi dello stesso codice del first_color
+            first_color_code = first_color_in_cluster.get('code')
+            altri_tipi_first_color = [c for c in colori_del_cluster 
+                                    if c.get('code') == first_color_code and c != first_color_in_cluster]
+            if altri_tipi_first_color:
+                altri_tipi_first_color.sort(key=lambda x: (
+                    0 if x.get('type') == 'F' else
+                    1 if x.get('type') == 'R' else
+                    2 if x.get('type') == 'K' else
+                    3 if x.get('type') not in ['E'] else 4,
+                    _safe_get_sequence(x)
+                ))
+                for colore_stesso_codice in altri_tipi_first_color:
+                    key = f"{colore_stesso_codice['code']}_{colore_stesso_codice['type']}"
+                    if key not in added_keys_this_cluster:
+                        cluster_ordinato_temp.append(colore_stesso_codice)
+                        added_keys_this_cluster.add(key)
+                        print(f"    + [FIRST_COLOR] Stesso codice: {colore_stesso_codice['code']} {colore_stesso_codice['type']}")
+        
+        # Ora continua con la logica normale per i colori rimanenti
+        
+        # Raggruppa i colori per codice (RAL o numerico) - solo quelli non ancora processati
+        colori_per_codice: Dict[str, List[ColorObject]] = {}
+        for c in colori_del_cluster:
+            key = f"{c.get('code')}_{c.get('type')}"
+            if key not in added_keys_this_cluster:  # Solo colori non ancora aggiunti
+                code = c.get('code', '')
+                if code not in colori_per_codice:
+                    colori_per_codice[code] = []
+                colori_per_codice[code].append(c)
+        
+        print(f"    Trovati {len(colori_per_codice)} codici distinti rimanenti: {list(colori_per_codice.keys())}")
+
+        # Separa per tipo e ordina considerando sequence_type per le sequenze piccole - solo colori non ancora processati
+        colori_rimanenti = [c for c in colori_del_cluster if f"{c.get('code')}_{c.get('type')}" not in added_keys_this_cluster]
+        fissi = sorted([c for c in colori_rimanenti if c.get("type") == "F"], 
+                      key=lambda x: (_safe_get_sequence(x), 
+                                   0 if x.get('sequence_type') == config.SEQUENCE_TYPE_SMALL else 1))
+        kit = sorted([c for c in colori_rimanenti if c.get("type") == "K"], 
+                    key=lambda x: (_safe_get_sequence(x), 
+                                 0 if x.get('sequence_type') == config.SEQUENCE_TYPE_SMALL else 1))
+        reintegri = sorted([c for c in colori_rimanenti if c.get("type") == "R"], 
+                          key=lambda x: (_safe_get_sequence(x), 
+                                       0 if x.get('sequence_type') == config.SEQUENCE_TYPE_SMALL else 1))
+        altri_non_estetici = sorted([c for c in colori_rimanenti if c.get("type") not in ["F", "K", "R", "E"]], 
+                                   key=lambda x: (config.TIPOLOGIA_PESO.get(x.get("type", "E"), 100), 
+                                                _safe_get_sequence(x), 
+                                                0 if x.get('sequence_type') == config.SEQUENCE_TYPE_SMALL else 1))
+        estetici = sorted([c for c in colori_rimanenti if c.get("type") == "E"], 
+                         key=lambda x: (_safe_get_sequence(x), 
+                                      0 if x.get('sequence_type') == config.SEQUENCE_TYPE_SMALL else 1))
+
+        # Logica di ordinamento con raggruppamento per stesso codice:
+        # 1. Prendi un fisso come trigger (se presente)
+        # 2. Se del fisso scelto ci sono altri tipi (E, K, R), li raggruppi subito dopo
+        # 3. Poi continui con reintegri, altri non-E, estetici rimanenti
+
+        # 1. Aggiungi UN SOLO pezzo Fisso (il primo) + eventuali altri tipi dello stesso codice
+        primo_fisso_code = None
+        if fissi:
+            primo_fisso = fissi.pop(0) # Prendi e rimuovi il primo
+            primo_fisso_code = primo_fisso.get('code')
+            cluster_ordinato_temp.append(primo_fisso)
+            added_keys_this_cluster.add(f"{primo_fisso['code']}_{primo_fisso['type']}")
+            print(f"    + Fisso (trigger): {primo_fisso['code']}")
+            
+            # NUOVA LOGICA: Aggiungi subito tutti gli altri tipi dello stesso codice del fisso
+            if primo_fisso_code and primo_fisso_code in colori_per_codice:
+                altri_tipi_stesso_codice = [c for c in colori_per_codice[primo_fisso_code] 
+                                          if f"{c.get('code')}_{c.get('type')}" not in added_keys_this_cluster]
+                # Ordina per priorità tipo: R > K > altri > E
+                altri_tipi_stesso_codice.sort(key=lambda x: (
+                    0 if x.get('type') == 'R' else
+                    1 if x.get('type') == 'K' else
+                    2 if x.get('type') not in ['E'] else 3,
+                    _safe_get_sequence(x)
+                ))
+                
+                for colore_stesso_codice in altri_tipi_stesso_codice:
+                    key = f"{colore_stesso_codice['code']}_{colore_stesso_codice['type']}"
+                    if key not in added_keys_this_cluster:
+                        cluster_ordinato_temp.append(colore_stesso_codice)
+                        added_keys_this_cluster.add(key)
+                        print(f"    + Stesso codice del fisso ({primo_fisso_code}): {colore_stesso_codice['type']}")
+
+        # 2. Aggiungi tutti i reintegri rimanenti + eventuali altri tipi degli stessi codici
+        reintegri_da_processare = [r for r in reintegri if f"{r['code']}_{r['type']}" not in added_keys_this_cluster]
+        codici_reintegri_processati = set()
+        
+        for r in reintegri_da_processare:
+            key = f"{r['code']}_{r['type']}"
+            if key not in added_keys_this_cluster:
+                cluster_ordinato_temp.append(r)
+                added_keys_this_cluster.add(key)
+                r_code = r.get('code')
+                print(f"    + Reintegro: {r_code}")
+                codici_reintegri_processati.add(r_code)
+                
+                # Aggiungi subito tutti gli altri tipi dello stesso codice del reintegro
+                if r_code and r_code in colori_per_codice:
+                    altri_tipi_stesso_codice_r = [c for c in colori_per_codice[r_code] 
+                                                if f"{c.get('code')}_{c.get('type')}" not in added_keys_this_cluster]
+                    altri_tipi_stesso_codice_r.sort(key=lambda x: (
+                        0 if x.get('type') == 'F' else
+                        1 if x.get('type') == 'K' else
+                        2 if x.get('type') not in ['E'] else 3,
+                        _safe_get_sequence(x)
+                    ))
+                    
+                    for colore_stesso_codice_r in altri_tipi_stesso_codice_r:
+                        key_r = f"{colore_stesso_codice_r['code']}_{colore_stesso_codice_r['type']}"
+                        if key_r not in added_keys_this_cluster:
+                            cluster_ordinato_temp.append(colore_stesso_codice_r)
+                            added_keys_this_cluster.add(key_r)
+                            print(f"    + Stesso codice del reintegro ({r_code}): {colore_stesso_codice_r['type']}")
+
+        # 3. Aggiungi i rimanenti non estetici + eventuali altri tipi degli stessi codici
+        # 3. Aggiungi i rimanenti non estetici + eventuali altri tipi degli stessi codici
+        rimanenti_non_estetici = [c for c in (fissi + kit + altri_non_estetici) 
+                                 if f"{c.get('code')}_{c.get('type')}" not in added_keys_this_cluster]
+        codici_non_estetici_processati = set()
+        
+        # Ordina per sicurezza per tipo e poi codice
+        rimanenti_non_estetici.sort(key=lambda c: (config.TIPOLOGIA_PESO.get(c.get("type", "E"), 100), c.get('code')))
+        
+        for rne in rimanenti_non_estetici:
+            key = f"{rne['code']}_{rne['type']}"
+            rne_code = rne.get('code')
+            if key not in added_keys_this_cluster and rne_code not in codici_non_estetici_processati:
+                cluster_ordinato_temp.append(rne)
+                added_keys_this_cluster.add(key)
+                print(f"    + {rne['type']}: {rne_code}")
+                codici_non_estetici_processati.add(rne_code)
+                
+                # Aggiungi subito tutti gli altri tipi dello stesso codice
+                if rne_code and rne_code in colori_per_codice:
+                    altri_tipi_stesso_codice_ne = [c for c in colori_per_codice[rne_code] 
+                                                  if f"{c.get('code')}_{c.get('type')}" not in added_keys_this_cluster]
+                    altri_tipi_stesso_codice_ne.sort(key=lambda x: (
+                        0 if x.get('type') == 'F' else
+                        1 if x.get('type') == 'R' else
+                        2 if x.get('type') == 'K' else
+                        3 if x.get('type') not in ['E'] else 4,
+                        _safe_get_sequence(x)
+                    ))
+                    
+                    for colore_stesso_codice_ne in altri_tipi_stesso_codice_ne:
+                        key_ne = f"{colore_stesso_codice_ne['code']}_{colore_stesso_codice_ne['type']}"
+                        if key_ne not in added_keys_this_cluster:
+                            cluster_ordinato_temp.append(colore_stesso_codice_ne)
+                            added_keys_this_cluster.add(key_ne)
+                            print(f"    + Stesso codice ({rne_code}): {colore_stesso_codice_ne['type']}")
+
+        # 4. Aggiungi gli estetici rimanenti + eventuali altri tipi degli stessi codici
+        estetici_da_processare = [e for e in estetici if f"{e['code']}_{e['type']}" not in added_keys_this_cluster]
+        codici_estetici_processati = set()
+        
+        for e in estetici_da_processare:
+            key = f"{e['code']}_{e['type']}"
+            e_code = e.get('code')
+            if key not in added_keys_this_cluster and e_code not in codici_estetici_processati:
+                cluster_ordinato_temp.append(e)
+                added_keys_this_cluster.add(key)
+                print(f"    + Estetico: {e_code}")
+                codici_estetici_processati.add(e_code)
+                
+                # Aggiungi subito tutti gli altri tipi dello stesso codice dell'estetico
+                if e_code and e_code in colori_per_codice:
+                    altri_tipi_stesso_codice_e = [c for c in colori_per_codice[e_code] 
+                                                if f"{c.get('code')}_{c.get('type')}" not in added_keys_this_cluster]
+                    altri_tipi_stesso_codice_e.sort(key=lambda x: (
+                        0 if x.get('type') == 'F' else
+                        1 if x.get('type') == 'R' else
+                        2 if x.get('type') == 'K' else
+                        3 if x.get('type') not in ['E'] else 4,
+                        _safe_get_sequence(x)
+                    ))
+                    
+                    for colore_stesso_codice_e in altri_tipi_stesso_codice_e:
+                        key_e = f"{colore_stesso_codice_e['code']}_{colore_stesso_codice_e['type']}"
+                        if key_e not in added_keys_this_cluster:
+                            cluster_ordinato_temp.append(colore_stesso_codice_e)
+                            added_keys_this_cluster.add(key_e)
+                            print(f"    + Stesso codice dell'estetico ({e_code}): {colore_stesso_codice_e['type']}")
+
+        colori_ordinati.extend(cluster_ordinato_temp)
+        colori_usati_keys.update(added_keys_this_cluster) # Aggiorna set globale
+
+    # Verifica se tutti i colori sono stati inclusi
+    if len(colori_ordinati) != len(colori_giorno):
+        print(f"ATTENZIONE: Numero colori finali ({len(colori_ordinati)}) diverso da input ({len(colori_giorno)}).")
+        original_keys = {f"{c['code']}_{c['type']}" for c in colori_giorno}
+        missing_keys = original_keys - colori_usati_keys
+        if missing_keys:
+             print(f"Colori mancanti: {missing_keys}")
+    # LOG: Stato finale lista ordinata
+    print(f"[ORDERED_LIST OUTPUT] Lista finale ({len(colori_ordinati)}):")
+    for i, color in enumerate(colori_ordinati):
+        if color.get('code') == 'RAL5019':
+            print(f"  [ORDERED OUT] {i}: {color}")
+    print(f"  Tutti i codici ordinati: {[c.get('code') + ' ' + str(c.get('type')) for c in colori_ordinati]}")
+    return colori_ordinati
+
+
+# --- Generatore di input casuali ---
+
+CLUSTERS = ["Bianco", "Grigio Chiaro", "Giallo", "Verde", "Rosso", "Blu", "Nero"]
+TYPES = ["F", "K", "R", "E", "RE", "X"]
+SEQUENCE_TYPES = [config.SEQUENCE_TYPE_SMALL, "normale", None]
+
+
+def random_sequence(rng: random.Random):
+    return rng.choice([None, None, 0, 1, 2, 3, 5, 10, "2", "7", "abc", ""])
+
+
+def random_case(rng: random.Random):
+    n_codes = rng.randint(1, 25)
+    codes = [f"RAL{rng.randint(1000, 9999)}" for _ in range(n_codes)]
+    if rng.random() < 0.1:
+        codes.append("")  # codice vuoto: nessun raggruppamento per codice
+    clusters = rng.sample(CLUSTERS, rng.randint(1, len(CLUSTERS)))
+    colori = []
+    for _ in range(rng.randint(0, 60)):
+        colori.append({
+            "code": rng.choice(codes),
+            "type": rng.choice(TYPES),
+            "cluster": rng.choice(clusters),
+            "sequence": random_sequence(rng),
+            "sequence_type": rng.choice(SEQUENCE_TYPES),
+            "lunghezza_ordine": rng.choice(["corto", "lungo"]),
+        })
+    # Duplicati esatti e stessa chiave con dati diversi
+    for _ in range(rng.randint(0, 4)):
+        if colori:
+            dup = dict(rng.choice(colori))
+            if rng.random() < 0.5:
+                dup["sequence"] = random_sequence(rng)
+                dup["cluster"] = rng.choice(clusters)
+            colori.insert(rng.randint(0, len(colori)), dup)
+
+    tour = list(clusters)
+    rng.shuffle(tour)
+    if rng.random() < 0.2 and len(tour) > 1:
+        tour.pop()  # cluster presente nei colori ma non nel tour
+    if rng.random() < 0.1:
+        tour.append(rng.choice(tour))  # cluster ripetuto
+    if rng.random() < 0.1:
+        tour.append("Inesistente")
+
+    first_color = None
+    r = rng.random()
+    if r < 0.3 and colori:
+        first_color = rng.choice(colori)["code"]
+    elif r < 0.4 and colori:
+        first_color = " " + rng.choice(colori)["code"] + " "
+    elif r < 0.45:
+        first_color = "RAL0000"
+    return tour, colori, first_color
+
+
+def _run_quiet(fn, *args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args)
+
+
+def check_equivalence(iterations: int, seed: int = 31) -> bool:
+    rng = random.Random(seed)
+    for n in range(iterations):
+        tour, colori, first_color = random_case(rng)
+        expected = _run_quiet(legacy_generate_final_ordered_list, list(tour), colori, first_color)
+        actual = _run_quiet(_generate_final_ordered_list, list(tour), colori, first_color)
+        # Stessi oggetti nello stesso ordine (identità, non solo uguaglianza)
+        if [id(c) for c in expected] != [id(c) for c in actual]:
+            print(f"❌ Differenza al caso {n}: tour={tour} first_color={first_color!r}")
+            print(f"   atteso:  {[(c['code'], c['type'], c['cluster']) for c in expected]}")
+            print(f"   ottenuto: {[(c['code'], c['type'], c['cluster']) for c in actual]}")
+            return False
+    print(f"✅ {iterations} casi casuali: ordine identico all'implementazione precedente")
+    return True
+
+
+def benchmark(size: int = 5000, n_clusters: int = 200, seed: int = 7) -> None:
+    rng = random.Random(seed)
+    codes = [f"RAL{i:04d}" for i in range(size // 3)]
+    clusters = [f"Cluster {i}" for i in range(n_clusters)]
+    colori = [{
+        "code": rng.choice(codes),
+        "type": rng.choice(TYPES),
+        "cluster": rng.choice(clusters),
+        "sequence": random_sequence(rng),
+        "sequence_type": rng.choice(SEQUENCE_TYPES),
+    } for _ in range(size)]
+    for name, fn in (("precedente", legacy_generate_final_ordered_list), ("con indice", _generate_final_ordered_list)):
+        start = time.perf_counter()
+        _run_quiet(fn, list(clusters), colori, None)
+        print(f"   {name:<12} {size} colori, {n_clusters} cluster: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ITERATIONS
+    print("🧪 Test equivalenza ordinamento finale (indice per richiesta)")
+    print("=" * 60)
+    ok = check_equivalence(iterations)
+    print("\n⏱️  Confronto tempi:")
+    benchmark()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Test dell'ordine parziale dei cluster come vincoli di precedenza nella DP Held-Karp:
+- _find_best_path_and_reconstruct con precedenze coincide con la ricerca esaustiva
+  (anche con partenza/arrivo fissati) e la soluzione greedy le rispetta;
+- optimize_with_partial_cluster_order: i cluster bloccati mantengono il loro ordine e
+  quelli bloccati in testa restano in testa, senza perdere colori;
+- stati della DP e tempo con e senza ordine parziale su 16 cluster.
+
+Eseguire dalla root del progetto: python test/test_partial_order.py
+"""
+
+import contextlib
+import io
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import numpy as np
+
+from app import config, database, logic
+
+INF = config.INFINITE_COST
+
+
+def random_matrix(rng: random.Random, n: int, forbidden: float) -> np.ndarray:
+    return np.array([[INF if rng.random() < forbidden else rng.choice([1, 5, 10, 25, 60]) for _ in range(n)]
+                     for _ in range(n)], dtype=float)
+
+
+def random_precedences(rng: random.Random, n: int):
+    """Coppie (prima, dopo) compatibili con una permutazione casuale (quindi mai cicliche)."""
+    order = list(range(n))
+    rng.shuffle(order)
+    pairs = []
+    for _ in range(rng.randint(0, n)):
+        i, j = sorted(rng.sample(range(n), 2)) if n > 1 else (0, 0)
+        if i != j:
+            pairs.append((str(order[i]), str(order[j])))
+    return pairs
+
+
+def brute_force(cost_matrix, start, end, masks):
+    n = cost_matrix.shape[0]
+    best = None
+    for perm in itertools.permutations(range(n)):
+        if start is not None and perm[0] != start or end is not None and perm[-1] != end:
+            continue
+        if not logic._respects_precedences(list(perm), masks):
+            continue
+        cost = logic._path_cost(cost_matrix, list(perm))
+        if cost < INF and (best is None or cost < best):
+            best = cost
+    return best
+
+
+def test_against_brute_force(iterations: int = 400) -> bool:
+    rng = random.Random(37)
+    for n_case in range(iterations):
+        n = rng.randint(2, 7)
+        matrix = random_matrix(rng, n, rng.choice([0.0, 0.2, 0.4]))
+        masks = logic._predecessor_masks([str(k) for k in range(n)], random_precedences(rng, n))
+        start = rng.choice([None] + list(range(n)))
+        end = rng.choice([None] + [k for k in range(n) if k != start])
+        with contextlib.redirect_stdout(io.StringIO()):
+            paths = logic._find_best_path_and_reconstruct(matrix, start, end_node_index=end, predecessor_masks=masks)
+            greedy = logic._greedy_path(matrix, start, end, masks)
+        expected = brute_force(matrix, start, end, masks)
+        if expected is None:
+            assert paths == [] and greedy is None, (n_case, paths, greedy)
+            continue
+        assert paths and abs(paths[0][0] - expected) < 1e-9, (n_case, paths, expected)
+        for cost, tour in paths:
+            assert sorted(tour) == list(range(n)) and logic._respects_precedences(tour, masks), (n_case, tour)
+            assert abs(logic._path_cost(matrix, tour) - cost) < 1e-9, (n_case, tour, cost)
+        if greedy is not None:
+            assert greedy[0] >= expected - 1e-9 and logic._respects_precedences(greedy[1], masks), (n_case, greedy)
+    try:
+        logic._predecessor_masks(["A", "B", "C"], [("A", "B"), ("B", "C"), ("C", "A")])
+        raise AssertionError("precedenze cicliche accettate")
+    except ValueError:
+        pass
+    print(f"✅ {iterations} matrici casuali: percorsi con precedenze ottimi come la ricerca esaustiva")
+    return True
+
+
+def test_partial_cluster_order(iterations: int = 15) -> bool:
+    rng = random.Random(370)
+    cluster_dict = database.get_cluster_colori()
+    codes = [code for codes in cluster_dict.values() for code in codes]
+    for n_case in range(iterations):
+        colors = [{"code": rng.choice(codes), "type": rng.choice(["F", "K", "R", "E", "E"])}
+                  for _ in range(rng.randint(10, 80))]
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, sequence, _, _ = logic.optimize_color_sequence(colors)
+            shown = sequence[:]
+            rng.shuffle(shown)
+            partial = [{"cluster": c, "position": i, "locked": rng.random() < 0.4} for i, c in enumerate(shown)]
+            ordered, constrained, cost, _ = logic.optimize_with_partial_cluster_order(colors, partial)
+            expected = logic.optimize_color_sequence(colors)[0]
+
+        assert sorted(constrained) == sorted(sequence) and cost < INF, n_case
+        assert sorted(c["code"] for c in ordered) == sorted(c["code"] for c in expected), n_case
+        locked = [v["cluster"] for v in partial if v["locked"]]
+        assert [c for c in constrained if c in locked] == locked, (n_case, constrained, locked)
+        head = list(itertools.takewhile(lambda v: v["locked"], partial))
+        assert constrained[:len(head)] == [v["cluster"] for v in head], (n_case, constrained, head)
+    print(f"✅ {iterations} ordini parziali: cluster bloccati nel loro ordine, testa bloccata rispettata")
+    return True
+
+
+def benchmark(n: int = 16) -> None:
+    rng = random.Random(3700)
+    matrix = random_matrix(rng, n, 0.3)
+    nodes = [str(k) for k in range(n)]
+    catena = [str(k) for k in range(0, n, 2)]  # metà dei cluster bloccati in un ordine fissato
+    masks = logic._predecessor_masks(nodes, [(a, b) for i, a in enumerate(catena) for b in catena[i + 1:]])
+    for label, vincoli in (("senza ordine parziale", None), (f"{len(catena)} cluster bloccati", masks)):
+        eventi = []
+        start_time = time.perf_counter()
+        logic._held_karp_table(matrix, progress_callback=eventi.append, predecessor_masks=vincoli)
+        elapsed = time.perf_counter() - start_time
+        print(f"⏱️  {n} cluster, {label}: {elapsed * 1000:.0f} ms ({eventi[-1]['states_total']} stati)")
+
+
+if __name__ == "__main__":
+    print("🧪 Test ordine parziale dei cluster (precedenze nella DP)")
+    print("=" * 60)
+    ok = test_against_brute_force() and test_partial_cluster_order()
+    print()
+    benchmark()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Test del solver Held-Karp con partenza e/o arrivo fissati:
+- _find_best_path_and_reconstruct coincide con la ricerca esaustiva su matrici casuali
+  (con transizioni vietate), con arrivo fisso e con ritorno sul nodo di partenza;
+- la tabella potata ha gli stessi valori della tabella completa sugli stati calcolati;
+- la soluzione greedy iniziale rispetta gli stessi vincoli;
+- tempo della DP completa rispetto a quella potata.
+
+Eseguire dalla root del progetto: python test/test_path_constraints.py
+"""
+
+import contextlib
+import io
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import numpy as np
+
+from app import config, logic
+
+INF = config.INFINITE_COST
+
+
+def brute_force(cost_matrix, start, end):
+    n = cost_matrix.shape[0]
+    closes = start is not None and start == end
+    best = None
+    for perm in itertools.permutations(range(n)):
+        if start is not None and perm[0] != start:
+            continue
+        if end is not None and not closes and perm[-1] != end:
+            continue
+        cost = logic._path_cost(cost_matrix, list(perm), closes)
+        if cost < INF and (best is None or cost < best):
+            best = cost
+    return best
+
+
+def random_matrix(rng: random.Random, n: int, forbidden: float) -> np.ndarray:
+    return np.array([[INF if rng.random() < forbidden else rng.choice([1, 5, 10, 25, 60]) for _ in range(n)]
+                     for _ in range(n)], dtype=float)
+
+
+def test_against_brute_force(iterations: int = 400) -> bool:
+    rng = random.Random(35)
+    for n_case in range(iterations):
+        n = rng.randint(1, 7)
+        matrix = random_matrix(rng, n, rng.choice([0.0, 0.2, 0.5]))
+        start = rng.choice([None] + list(range(n)))
+        end = rng.choice([None, start] + list(range(n)))
+        with contextlib.redirect_stdout(io.StringIO()):
+            paths = logic._find_best_path_and_reconstruct(matrix, start, end_node_index=end)
+            greedy = logic._greedy_path(matrix, start, end)
+        expected = 0.0 if n == 1 else brute_force(matrix, start, end)
+        if expected is None:
+            assert paths == [] and greedy is None, (n_case, paths, greedy)
+            continue
+        assert paths and abs(paths[0][0] - expected) < 1e-9, (n_case, paths, expected)
+        closes = start is not None and start == end
+        for cost, tour in paths:
+            assert sorted(tour) == list(range(n)), (n_case, tour)
+            assert start is None or tour[0] == start, (n_case, tour)
+            assert end is None or closes or tour[-1] == end, (n_case, tour)
+            assert abs(logic._path_cost(matrix, tour, closes) - cost) < 1e-9, (n_case, tour, cost)
+        if greedy is not None:
+            assert greedy[0] >= expected - 1e-9 and (start is None or greedy[1][0] == start), (n_case, greedy)
+            assert end is None or closes or greedy[1][-1] == end, (n_case, greedy)
+    print(f"✅ {iterations} matrici casuali: percorsi con partenza/arrivo fissati ottimi come la ricerca esaustiva")
+    return True
+
+
+def test_pruned_table(iterations: int = 100) -> bool:
+    """Gli stati calcolati dalla DP potata valgono come nella DP completa (ricalcolata qui senza vincoli)."""
+    rng = random.Random(350)
+    for n_case in range(iterations):
+        n = rng.randint(2, 8)
+        matrix = random_matrix(rng, n, 0.3)
+        start = rng.choice([None] + list(range(n)))
+        end = rng.choice([None] + [k for k in range(n) if k != start])
+        full = logic._held_karp_table(matrix, start)
+        pruned = logic._held_karp_table(matrix, start, fixed_end_node=end)
+        computed = pruned < INF
+        assert np.array_equal(pruned[computed], full[computed]), n_case
+        if end is not None:
+            full_mask = (1 << n) - 1
+            assert pruned[full_mask, end] == full[full_mask, end], n_case
+    print(f"✅ {iterations} tabelle potate coincidono con la DP completa sugli stati calcolati")
+    return True
+
+
+def benchmark(n: int = 16) -> None:
+    rng = random.Random(3500)
+    matrix = random_matrix(rng, n, 0.4)
+    for label, end in (("solo partenza", None), ("partenza + arrivo", n - 1)):
+        start_time = time.perf_counter()
+        logic._held_karp_table(matrix, 0, fixed_end_node=end)
+        elapsed = time.perf_counter() - start_time
+        print(f"⏱️  {n} cluster, {label}: {elapsed * 1000:.0f} ms "
+              f"({sum(logic._count_dp_states(n, 0, end))} stati al massimo)")
+
+
+if __name__ == "__main__":
+    print("🧪 Test solver con partenza / arrivo fissati")
+    print("=" * 60)
+    ok = test_against_brute_force() and test_pruned_table()
+    print()
+    benchmark()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Test della profilazione per richiesta (backend/app/profiling.py, ?profile=cpu|mem):
+- senza PROFILING_ENABLED il parametro viene rifiutato (403), una modalità sconosciuta dà 400;
+- ?profile=cpu su /optimize restituisce lo stesso risultato, l'header X-Profile-Id e un .prof
+  leggibile da pstats che include il solver eseguito nei thread delle cabine;
+- ?profile=mem su /api/cabin/{id}/optimize-locked salva picco e righe di allocazione;
+- il nome del profilo contiene l'hash del payload (stesso payload, stesso hash);
+- /admin/profiles elenca i profili dal più recente e ne conserva al massimo PROFILES_KEEP.
+
+Eseguire dalla root del progetto: python test/test_profiling.py
+"""
+
+import contextlib
+import io
+import os
+import pstats
+import random
+import sys
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from fastapi.testclient import TestClient
+
+from app import config, database, profiling
+from app.main import app
+from temp_database import TempDatabase
+
+# Database e profili in una cartella temporanea, profilazione attiva
+TEMP_DB = TempDatabase("profili_", PROFILES_DIR=lambda tmp: os.path.join(tmp, "profiles"), PROFILING_ENABLED=True)
+setup_module, teardown_module = TEMP_DB.setup_module, TEMP_DB.teardown_module
+
+client = TestClient(app)
+
+
+def random_colors(size: int, seed: int, **extra):
+    rng = random.Random(seed)
+    codes = [code for codes in database.get_cluster_colori().values() for code in codes]
+    return [{"code": rng.choice(codes), "type": rng.choice(["F", "K", "R", "E", "E"]), **extra} for _ in range(size)]
+
+
+def post(url: str, payload):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return client.post(url, json=payload)
+
+
+def test_guard() -> bool:
+    payload = {"colors_today": random_colors(10, 49)}
+    config.PROFILING_ENABLED = False
+    try:
+        assert post("/optimize?profile=cpu", payload).status_code == 403
+        assert client.get("/admin/profiles").status_code == 403
+    finally:
+        config.PROFILING_ENABLED = True
+    assert post("/optimize?profile=disk", payload).status_code == 400
+    assert post("/optimize", payload).headers.get("X-Profile-Id") is None
+    print("✅ ?profile rifiutato se disattivato (403) o sconosciuto (400)")
+    return True
+
+
+def test_cpu_profile() -> bool:
+    payload = {"colors_today": random_colors(60, 490)}
+    normale = post("/optimize", payload).json()
+    response = post("/optimize?profile=cpu", payload)
+    assert response.status_code == 200, response.text
+    profilata = response.json()
+    assert profilata["ordered_colors"] == normale["ordered_colors"], "la profilazione non deve cambiare il risultato"
+    profile_id = response.headers["X-Profile-Id"]
+    meta = profiling.list_profiles()[0]
+    assert meta["id"] == profile_id and meta["mode"] == "cpu" and meta["endpoint"] == "optimize", meta
+
+    # Cabine in parallelo: il solver gira nei thread del pool e deve comparire nel profilo
+    cabine = {"colors_today": random_colors(60, 491), "mode": "cabine", "cabin_count": 2}
+    response = post("/optimize?profile=cpu", cabine)
+    assert response.status_code == 200, response.text
+    meta = profiling.list_profiles()[0]
+    assert meta["threads"] == 3, meta  # thread della richiesta + una cabina per thread
+    stats = pstats.Stats(os.path.join(config.PROFILES_DIR, meta["id"] + ".prof"))
+    funzioni = {name for (_, _, name) in stats.stats}
+    assert "_held_karp_table" in funzioni, "il solver delle cabine deve essere nel profilo"
+    with open(os.path.join(config.PROFILES_DIR, meta["id"] + ".txt"), encoding="utf-8") as f:
+        assert "cumulative" in f.read()
+
+    again = post("/optimize?profile=cpu", cabine)
+    assert again.headers["X-Profile-Id"].split("_")[-1] == meta["payload_hash"], "stesso payload, stesso hash"
+    print(f"✅ profilo CPU: risultato invariato, {meta['total_calls']} chiamate su {meta['threads']} thread")
+    return True
+
+
+def test_mem_profile() -> bool:
+    colors = random_colors(30, 492)
+    colors_today = [{**c, "locked": i in (10, 20)} for i, c in enumerate(colors)]
+    response = post("/api/cabin/1/optimize-locked?profile=mem", {"colors_today": colors_today})
+    assert response.status_code == 200, response.text
+    meta = profiling.list_profiles()[0]
+    assert meta["id"] == response.headers["X-Profile-Id"] and meta["endpoint"] == "cabin1_optimize_locked", meta
+    assert meta["mode"] == "mem" and meta["peak_bytes"] > 0, meta
+    with open(os.path.join(config.PROFILES_DIR, meta["files"][0]), encoding="utf-8") as f:
+        testo = f.read()
+    assert "Picco di memoria" in testo and "logic.py" in testo, testo[:500]
+    assert not tracemalloc.is_tracing(), "tracemalloc deve essere fermato dopo la richiesta"
+
+    response = post("/optimize-locked-colors?profile=cpu", {"colors_today": colors_today})
+    assert response.status_code == 200 and "X-Profile-Id" in response.headers, response.text
+    print(f"✅ profilo memoria: picco {meta['peak_bytes'] / 1024:.0f} KiB; cabine con blocchi profilate")
+    return True
+
+
+def test_listing_and_retention() -> bool:
+    response = client.get("/admin/profiles?limit=2")
+    assert response.status_code == 200
+    profili = response.json()["profiles"]
+    assert len(profili) == 2 and profili[0]["id"] > profili[1]["id"], profili
+
+    config.PROFILES_KEEP = 3
+    try:
+        for seed in range(2):
+            post("/optimize?profile=cpu", {"colors_today": random_colors(12, 493 + seed)})
+    finally:
+        config.PROFILES_KEEP = 50
+    rimasti = profiling.list_profiles(limit=None)
+    assert len(rimasti) == 3, len(rimasti)
+    file_attesi = {name for meta in rimasti for name in meta["files"] + [meta["id"] + ".json"]}
+    assert set(os.listdir(config.PROFILES_DIR)) == file_attesi, "i file dei profili cancellati devono sparire"
+    print("✅ /admin/profiles dal più recente, profili oltre PROFILES_KEEP cancellati")
+    return True
+
+
+if __name__ == "__main__":
+    print("🧪 Test profilazione per richiesta")
+    print("=" * 60)
+    setup_module()
+    try:
+        ok = test_guard() and test_cpu_profile() and test_mem_profile() and test_listing_and_retention()
+    finally:
+        teardown_module()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Test della versione delle regole memorizzata (chiave di coalescing di /optimize):
+- backend: senza scritture sul database get_rules_version non rilegge le tabelle;
+- dopo l'installazione dei trigger (init_db del frontend) una scrittura che non tocca
+  le regole (optimization_colors) non fa ricalcolare lo sha1, una su cambio_colori sì;
+- frontend: stesso comportamento usando il contatore "rules" di data_versions.
+
+Eseguire dalla root del progetto: python test/test_rules_version.py
+"""
+
+import contextlib
+import os
+import sqlite3
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+from app import database
+from temp_database import TempDatabase, load_frontend
+
+TEMP_DB = TempDatabase("versione_regole_")
+setup_module, teardown_module = TEMP_DB.setup_module, TEMP_DB.teardown_module
+
+
+@contextlib.contextmanager
+def count_computations(module):
+    """Conta le chiamate a _compute_rules_version del modulo durante il blocco."""
+    calls = []
+    original = module._compute_rules_version
+
+    def counted():
+        calls.append(1)
+        return original()
+
+    module._compute_rules_version = counted
+    try:
+        yield calls
+    finally:
+        module._compute_rules_version = original
+
+
+def write(sql: str) -> None:
+    conn = sqlite3.connect(TEMP_DB.path)
+    conn.execute(sql)
+    conn.commit()
+    conn.close()
+
+
+def test_backend_rules_version() -> bool:
+    version = database.get_rules_version()
+    assert version == database._compute_rules_version(), version
+    with count_computations(database) as calls:
+        assert database.get_rules_version() == version
+        assert database.get_rules_version() == version
+    assert not calls, "regole rilette senza modifiche al database"
+
+    load_frontend("frontend_versione_regole")  # Crea data_versions e i trigger delle regole
+    with count_computations(database) as calls:
+        assert database.get_rules_version() == version
+        write("INSERT INTO optimization_colors (color_code, color_type) VALUES ('X1', 'F')")
+        assert database.get_rules_version() == version
+    assert len(calls) <= 1, f"{len(calls)} ricalcoli per scritture fuori dalle regole"
+
+    write("UPDATE cambio_colori SET peso = peso + 1 WHERE id = (SELECT MIN(id) FROM cambio_colori)")
+    changed = database.get_rules_version()
+    assert changed != version and changed == database._compute_rules_version()
+    print("✅ backend: sha1 delle regole ricalcolato solo quando cambia il contatore 'rules'")
+    return True
+
+
+def test_frontend_rules_version() -> bool:
+    frontend = load_frontend("frontend_versione_regole")
+    version = frontend.get_rules_version()
+    assert version == database._compute_rules_version(), version
+    with count_computations(frontend) as calls:
+        write("INSERT INTO optimization_colors (color_code, color_type) VALUES ('X2', 'F')")
+        assert frontend.get_rules_version() == version
+    assert not calls, "regole rilette per una scrittura su optimization_colors"
+
+    write("DELETE FROM cluster_colori WHERE rowid = (SELECT MAX(rowid) FROM cluster_colori)")
+    with count_computations(frontend) as calls:
+        changed = frontend.get_rules_version()
+    assert len(calls) == 1 and changed != version
+    assert changed == database.get_rules_version()
+    print("✅ frontend: versione delle regole memorizzata e allineata al backend")
+    return True
+
+
+if __name__ == "__main__":
+    print("🧪 Test versione delle regole memorizzata")
+    print("=" * 60)
+    setup_module()
+    try:
+        ok = test_backend_rules_version() and test_frontend_rules_version()
+    finally:
+        teardown_module()
+    sys.exit(0 if ok else 1)
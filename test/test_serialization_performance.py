@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark della serializzazione delle risposte di ottimizzazione:
+modello Pydantic per riga + JSON (percorso precedente) contro record diretti
++ orjson/msgpack (+ gzip), con 5000 colori per cabina.
+
+Eseguire dalla root del progetto: python test/test_serialization_performance.py
+"""
+
+import gzip
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from app.models import CabinOptimizationResponse, OptimizedColorOutput
+from app import serialization
+
+COLORS_PER_CABIN = 5000
+ITERATIONS = 5
+
+
+def generate_ordered_colors(size, lunghezza_ordine):
+    """Colori già ordinati come li restituisce logic.optimize_color_sequence"""
+    clusters = ["Bianco", "Grigio Chiaro", "Metallizzati", "Giallo", "Verde", "Rosso", "Grigio Scuro", "Nero", "Blu"]
+    types = ["E", "K", "R", "RE", "F"]
+    return [{
+        "code": f"RAL{1000 + i}",
+        "type": types[i % len(types)],
+        "line": f"L{i % 3 + 1}",
+        "cluster": clusters[i % len(clusters)],
+        "sequence": i % 4 or None,
+        "sequence_type": None,
+        "CH": round(1.0 + (i % 5) * 0.5, 1),
+        "lunghezza_ordine": lunghezza_ordine,
+        "locked": False,
+        "position": i,
+    } for i in range(size)]
+
+
+def cabin_result(ordered_colors, build_row):
+    return {
+        "ordered_colors": [build_row(c) for c in ordered_colors],
+        "optimal_cluster_sequence": ["Bianco", "Grigio Chiaro", "Metallizzati"],
+        "calculated_cost": "300.00",
+        "message": "Ottimizzazione completata",
+    }
+
+
+def model_path(colors_1, colors_2):
+    """Percorso precedente: OptimizedColorOutput per riga, poi serializzazione JSON del modello"""
+    response = CabinOptimizationResponse(
+        cabina_1=cabin_result(colors_1, lambda c: OptimizedColorOutput(**c)),
+        cabina_2=cabin_result(colors_2, lambda c: OptimizedColorOutput(**c)),
+        message="Ottimizzazione completata per le cabine separate",
+    )
+    return json.dumps(response.model_dump()).encode("utf-8")
+
+
+def fast_path(colors_1, colors_2, media_type, compress):
+    """Nuovo percorso: record costruiti dai dizionari interni e serializzati direttamente"""
+    payload = {
+        "cabina_1": cabin_result(colors_1, serialization.color_output_record),
+        "cabina_2": cabin_result(colors_2, serialization.color_output_record),
+        "message": "Ottimizzazione completata per le cabine separate",
+    }
+    body = serialization.encode(payload, media_type)
+    if compress:
+        body = gzip.compress(body, compresslevel=5)
+    return body
+
+
+def measure(name, func):
+    times = []
+    body = b""
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        body = func()
+        times.append(time.perf_counter() - start)
+    avg = statistics.mean(times)
+    print(f"  {name:<32} {avg * 1000:8.1f} ms   {len(body) / 1024:8.1f} KiB")
+    return avg
+
+
+def main():
+    print("=" * 70)
+    print(f"BENCHMARK SERIALIZZAZIONE - {COLORS_PER_CABIN} colori per cabina")
+    print(f"orjson: {'sì' if serialization.orjson else 'no'}   msgpack: {'sì' if serialization.msgpack else 'no'}")
+    print("=" * 70)
+
+    colors_1 = generate_ordered_colors(COLORS_PER_CABIN, "corto")
+    colors_2 = generate_ordered_colors(COLORS_PER_CABIN, "lungo")
+
+    baseline = measure("Pydantic per riga + json", lambda: model_path(colors_1, colors_2))
+    fast_json = measure("Record + JSON veloce", lambda: fast_path(colors_1, colors_2, serialization.JSON_MEDIA_TYPE, False))
+    measure("Record + JSON veloce + gzip", lambda: fast_path(colors_1, colors_2, serialization.JSON_MEDIA_TYPE, True))
+    if serialization.msgpack is not None:
+        measure("Record + msgpack", lambda: fast_path(colors_1, colors_2, serialization.MSGPACK_MEDIA_TYPE, False))
+
+    # Il contenuto deve essere identico al percorso con i modelli
+    same = json.loads(model_path(colors_1, colors_2)) == json.loads(fast_path(colors_1, colors_2, serialization.JSON_MEDIA_TYPE, False))
+    print("-" * 70)
+    print(f"Speedup JSON: {baseline / fast_json:.1f}x   Contenuto identico: {'✅' if same else '❌'}")
+    return same
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Test del coalescing delle richieste identiche (SingleFlight di backend e frontend):
+- richieste concorrenti con la stessa chiave eseguono un solo calcolo e ricevono lo
+  stesso risultato (condiviso=True per tutte tranne la prima); chiavi diverse no;
+- l'errore del calcolo arriva a ogni richiesta in attesa;
+- a calcolo finito la voce in corso viene rimossa e la richiesta successiva ricalcola;
+- backend: l'annullamento di una richiesta in attesa non annulla il calcolo condiviso.
+
+Eseguire dalla root del progetto: python test/test_singleflight.py
+"""
+
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import sys
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+sys.path.insert(0, os.path.join(ROOT, "frontend", "app"))
+
+from app import singleflight as backend_singleflight
+import singleflight as frontend_singleflight
+
+WAITERS = 5
+
+
+def test_backend_singleflight() -> bool:
+    flights = backend_singleflight.SingleFlight("test")
+    calls = []
+
+    async def compute(value):
+        calls.append(value)
+        await asyncio.sleep(0.05)  # Le altre richieste arrivano mentre il calcolo è in corso
+        return {"value": value}
+
+    async def fail():
+        calls.append("errore")
+        await asyncio.sleep(0.05)
+        raise ValueError("regole non valide")
+
+    async def scenario():
+        results = await asyncio.gather(*(flights.do("k", lambda: compute(1)) for _ in range(WAITERS)),
+                                       flights.do("altra", lambda: compute(2)))
+        assert calls == [1, 2], calls
+        assert [r[0] for r in results] == [{"value": 1}] * WAITERS + [{"value": 2}]
+        assert [r[1] for r in results] == [False] + [True] * (WAITERS - 1) + [False], results
+        assert results[0][0] is results[1][0], "le richieste condivise ricevono lo stesso oggetto"
+        assert flights.inflight_count == 0
+
+        errors = await asyncio.gather(*(flights.do("k", fail) for _ in range(WAITERS)), return_exceptions=True)
+        assert all(isinstance(e, ValueError) for e in errors) and calls.count("errore") == 1, errors
+        assert flights.inflight_count == 0
+
+        # Un client che si disconnette (richiesta annullata) non annulla il calcolo degli altri
+        first = asyncio.ensure_future(flights.do("k", lambda: compute(3)))
+        second = asyncio.ensure_future(flights.do("k", lambda: compute(3)))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == ({"value": 3}, True) and first.cancelled()
+        assert await flights.do("k", lambda: compute(4)) == ({"value": 4}, False)
+        assert calls == [1, 2, "errore", 3, 4] and flights.inflight_count == 0, calls
+        assert flights.coalesced_count == 2 * (WAITERS - 1) + 1
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(scenario())
+    print(f"✅ backend: {WAITERS} richieste asyncio identiche, un solo calcolo, errore a tutte, voce rimossa")
+    return True
+
+
+class _WaitingFollowers(logging.Handler):
+    """Conta i thread che hanno trovato il calcolo in corso (SingleFlight lo registra nel log)."""
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+        self.changed = threading.Condition()
+
+    def emit(self, record):
+        if "attendo il risultato condiviso" in record.getMessage():
+            with self.changed:
+                self.count += 1
+                self.changed.notify_all()
+
+    def wait_for(self, count: int) -> None:
+        with self.changed:
+            assert self.changed.wait_for(lambda: self.count >= count, timeout=10), self.count
+            self.count = 0
+
+
+def run_threads(flights, fn, followers: _WaitingFollowers):
+    """Il primo thread avvia fn; gli altri arrivano con fn in corso, poi fn viene sbloccato."""
+    started, release = threading.Event(), threading.Event()
+    outcomes = [None] * WAITERS
+
+    def leader_fn():
+        started.set()
+        release.wait(10)
+        return fn()
+
+    def worker(i):
+        try:
+            outcomes[i] = ("ok", flights.do("k", leader_fn))
+        except Exception as e:
+            outcomes[i] = ("errore", e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(WAITERS)]
+    threads[0].start()
+    assert started.wait(10)
+    for thread in threads[1:]:
+        thread.start()
+    followers.wait_for(WAITERS - 1)  # Tutti in attesa del calcolo del primo
+    release.set()
+    for thread in threads:
+        thread.join(10)
+    return outcomes
+
+
+def test_frontend_singleflight() -> bool:
+    flights = frontend_singleflight.SingleFlight("test")
+    followers = _WaitingFollowers()
+    logger = frontend_singleflight.logger
+    logger.addHandler(followers)
+    previous_level = logger.level
+    logger.setLevel(logging.INFO)
+    calls = []
+    try:
+        def compute():
+            calls.append("ok")
+            return {"value": len(calls)}
+
+        outcomes = run_threads(flights, compute, followers)
+        assert calls == ["ok"], calls
+        assert outcomes[0] == ("ok", ({"value": 1}, False)), outcomes[0]
+        assert all(o == ("ok", ({"value": 1}, True)) for o in outcomes[1:]), outcomes
+        assert outcomes[0][1][0] is outcomes[1][1][0], "i thread in attesa ricevono lo stesso oggetto"
+        assert not flights._calls
+
+        def fail():
+            calls.append("errore")
+            raise ValueError("backend non raggiungibile")
+
+        outcomes = run_threads(flights, fail, followers)
+        assert calls == ["ok", "errore"], calls
+        assert all(kind == "errore" and isinstance(e, ValueError) for kind, e in outcomes), outcomes
+        assert not flights._calls
+
+        assert flights.do("k", compute) == ({"value": 3}, False), "a calcolo finito si ricalcola"
+    finally:
+        logger.removeHandler(followers)
+        logger.setLevel(previous_level)
+    print(f"✅ frontend: {WAITERS} thread identici, un solo calcolo, errore a tutti, voce rimossa")
+    return True
+
+
+if __name__ == "__main__":
+    print("🧪 Test coalescing delle richieste identiche (SingleFlight)")
+    print("=" * 60)
+    ok = test_backend_singleflight() and test_frontend_singleflight()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Test delle statistiche del solver (logic.collect_solver_stats, campo "stats" di /optimize):
+- stati DP valutati uguali al conteggio di _count_dp_states senza transizioni vietate,
+  meno stati con il limite del warm start, memoria della tabella uguale a dp.nbytes;
+- la seconda richiesta uguale legge la tabella dalla cache (hit, nessuno stato valutato);
+- una ricerca interrotta riporta il motore "greedy" e ottimalità non provata;
+- oltre HELD_KARP_MAX_NODES cluster la tabella densa non viene allocata: percorso greedy
+  con ricerca locale, motore "greedy" e ottimalità non provata;
+- raccoglitori annidati (cabine) sommano nel totale, thread concorrenti restano separati;
+- /optimize e le cabine "corto"/"lungo" restituiscono stats validi per i modelli di risposta.
+
+Eseguire dalla root del progetto: python test/test_solver_stats.py
+"""
+
+import contextlib
+import io
+import os
+import random
+import sys
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from app import config, database, logic
+from app.main import app
+from app.models import CabinOptimizationResponse, OptimizationResponse
+from temp_database import TempDatabase
+
+# Le cabine "corto"/"lungo" vengono salvate: si lavora su una copia del database
+TEMP_DB = TempDatabase("statistiche_")
+setup_module, teardown_module = TEMP_DB.setup_module, TEMP_DB.teardown_module
+
+client = TestClient(app)
+
+
+def random_matrix(rng: random.Random, n: int) -> np.ndarray:
+    return np.array([[rng.choice([1, 5, 10, 25, 60]) for _ in range(n)] for _ in range(n)], dtype=float)
+
+
+def solve(matrix, start=None, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()), logic.collect_solver_stats() as stats:
+        paths = logic._find_best_path_and_reconstruct(matrix, start, **kwargs)
+    return paths, stats.to_dict()
+
+
+def test_dp_counters() -> bool:
+    rng = random.Random(47)
+    logic.dp_cache.clear()
+    for n in range(3, 11):
+        matrix = random_matrix(rng, n)
+        start = rng.choice([None, 0])
+        paths, stats = solve(matrix, start)
+        assert stats["dp_states"] == sum(logic._count_dp_states(n, start)), (n, stats)
+        assert stats["dp_tables"] == 1 and stats["cache_misses"] == 1, stats
+        assert stats["peak_table_bytes"] == (1 << n) * n * 8, stats
+        assert stats["paths_reconstructed"] >= len(paths), stats
+
+        _, again = solve(matrix, start)
+        assert again["cache_hits"] == 1 and again["dp_states"] == 0 and again["dp_tables"] == 0, again
+
+        warm = list(range(n)) if start is None else [0] + rng.sample(range(1, n), n - 1)
+        _, bounded = solve(matrix, start, warm_start_tour=warm)
+        assert 0 < bounded["dp_states"] <= stats["dp_states"], (bounded, stats)
+    print("✅ stati DP, memoria della tabella, cache e limite del warm start contati per richiesta")
+    return True
+
+
+def test_interrupted() -> bool:
+    rng = random.Random(470)
+    colors = [{"code": c, "type": rng.choice(["E", "F", "K"])}
+              for c in rng.sample([code for codes in database.get_cluster_colori().values() for code in codes], 60)]
+
+    def stop(event):
+        if event.get("event") == "dp_layer":
+            raise logic.SolverCancelled()
+
+    logic.dp_cache.clear()
+    with contextlib.redirect_stdout(io.StringIO()), logic.collect_solver_stats() as stats:
+        logic.optimize_color_sequence(colors, progress_callback=stop)
+    result = stats.to_dict()
+    assert result["engine"] == logic.ENGINE_GREEDY and result["optimality_proven"] is False, result
+
+    with contextlib.redirect_stdout(io.StringIO()), logic.collect_solver_stats() as stats:
+        logic.optimize_color_sequence(colors[:1])
+    result = stats.to_dict()
+    assert result["engine"] == logic.ENGINE_SINGLE_CLUSTER and result["optimality_proven"] is True, result
+    print("✅ ricerca interrotta: motore greedy e ottimalità non provata; un cluster: single_cluster")
+    return True
+
+
+def test_held_karp_limit() -> bool:
+    rng = random.Random(473)
+    matrix = random_matrix(rng, 7)
+    exact, _ = solve(matrix, 0)
+    codes = {cluster: codes for cluster, codes in database.get_cluster_colori().items() if codes}
+    colors = [{"code": rng.choice(cluster_codes), "type": "F"} for cluster_codes in list(codes.values())[:12]]
+
+    limite = config.HELD_KARP_MAX_NODES
+    config.HELD_KARP_MAX_NODES = 6
+    try:
+        try:
+            logic._held_karp_table(matrix, 0)
+            raise AssertionError("tabella densa calcolata oltre HELD_KARP_MAX_NODES")
+        except ValueError:
+            pass
+        logic.dp_cache.clear()
+        paths, stats = solve(matrix, 0)
+        assert len(paths) == 1 and stats["dp_tables"] == 0 and stats["dp_states"] == 0, (paths, stats)
+        cost, tour = paths[0]
+        assert tour[0] == 0 and sorted(tour) == list(range(7)), tour
+        assert cost == logic._path_cost(matrix, tour) >= exact[0][0], (cost, exact[0][0])
+
+        with contextlib.redirect_stdout(io.StringIO()), logic.collect_solver_stats() as stats:
+            ordered, sequence, _, message = logic.optimize_color_sequence(colors)
+        result = stats.to_dict()
+    finally:
+        config.HELD_KARP_MAX_NODES = limite
+    assert len(ordered) == len(colors) and len(sequence) > 6, sequence
+    assert result["engine"] == logic.ENGINE_GREEDY and result["optimality_proven"] is False, result
+    assert result["peak_table_bytes"] == 0 and "HELD_KARP_MAX_NODES" in message, (result, message)
+    print(f"✅ oltre HELD_KARP_MAX_NODES: nessuna tabella densa, percorso greedy con ricerca locale "
+          f"(costo {cost:.0f} contro ottimo {exact[0][0]:.0f})")
+    return True
+
+
+def test_nesting_and_threads() -> bool:
+    rng = random.Random(471)
+    matrices = [random_matrix(rng, 8) for _ in range(4)]
+    logic.dp_cache.clear()
+    with contextlib.redirect_stdout(io.StringIO()), logic.collect_solver_stats() as total:
+        parziali = []
+        for matrix in matrices[:2]:
+            with logic.collect_solver_stats() as stats:
+                logic._find_best_path_and_reconstruct(matrix, 0)
+            parziali.append(stats.to_dict())
+    somma = total.to_dict()
+    assert somma["dp_states"] == sum(p["dp_states"] for p in parziali) > 0, (somma, parziali)
+    assert somma["paths_reconstructed"] == sum(p["paths_reconstructed"] for p in parziali)
+
+    risultati = {}
+
+    def worker(k):
+        risultati[k] = solve(matrices[k], 0)[1]
+
+    threads = [threading.Thread(target=worker, args=(k,)) for k in (2, 3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(r["dp_tables"] == 1 and r["cache_misses"] == 1 for r in risultati.values()), risultati
+    print("✅ statistiche annidate sommate nel totale, richieste concorrenti separate")
+    return True
+
+
+def test_responses() -> bool:
+    rng = random.Random(472)
+    codes = [code for codes in database.get_cluster_colori().values() for code in codes]
+    colors = [{"code": rng.choice(codes), "type": rng.choice(["E", "F", "K", "R"])} for _ in range(50)]
+    logic.dp_cache.clear()
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = client.post("/optimize", json={"colors_today": colors})
+    body = response.json()
+    OptimizationResponse.model_validate(body)
+    assert body["stats"]["engine"] == "held_karp" and body["stats"]["optimality_proven"], body["stats"]
+    assert body["stats"]["dp_states"] > 0 and body["stats"]["cache_misses"] == 1, body["stats"]
+
+    cabine = [{**c, "lunghezza_ordine": rng.choice(["corto", "lungo"])} for c in colors]
+    with contextlib.redirect_stdout(io.StringIO()):
+        body = client.post("/optimize", json={"colors_today": cabine}).json()
+    CabinOptimizationResponse.model_validate(body)
+    assert body["stats"]["solves"] == 2, body["stats"]
+    assert body["stats"]["dp_states"] == body["cabina_1"]["stats"]["dp_states"] + body["cabina_2"]["stats"]["dp_states"]
+    print(f"✅ /optimize: stats nella risposta e per cabina ({body['stats']})")
+    return True
+
+
+if __name__ == "__main__":
+    print("🧪 Test statistiche del solver")
+    print("=" * 60)
+    setup_module()
+    try:
+        ok = (test_dp_counters() and test_interrupted() and test_held_karp_limit() and test_nesting_and_threads()
+              and test_responses())
+    finally:
+        teardown_module()
+    sys.exit(0 if ok else 1)
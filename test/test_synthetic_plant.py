@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Test del generatore di impianti sintetici (synthetic_plant):
+- il database scritto viene riletto da database.get_cluster_colori/get_cambio_colori
+  uguale alle regole generate, con lo schema di colors.db;
+- densità delle regole e quote di transizioni vietate / tipi / colori richiesti vicine
+  a quelle richieste, stesso seed -> stesso impianto;
+- gli ordini generati (anche via CSV/JSONL e ingest) si ottimizzano su un impianto
+  da 20 cluster leggendo le regole dal database sintetico.
+
+Eseguire dalla root del progetto: python test/test_synthetic_plant.py
+"""
+
+import contextlib
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from app import config, database, ingest, logic
+from synthetic_plant import generate_orders, generate_rules, read_rules_db, write_orders, write_rules_db
+from temp_database import TempDatabase
+
+# database e logic leggono le regole dal database sintetico scritto da test_roundtrip
+TEMP_DB = TempDatabase("impianto_", copy=False, filename="impianto.db")
+setup_module, teardown_module = TEMP_DB.setup_module, TEMP_DB.teardown_module
+TMP_DIR, DB_PATH = TEMP_DB.dir, TEMP_DB.path
+
+
+def test_roundtrip() -> bool:
+    cluster_dict, cambio_colori = generate_rules(20, codes_per_cluster=30, seed=45)
+    write_rules_db(DB_PATH, cluster_dict, cambio_colori)
+    assert database.get_cluster_colori() == cluster_dict
+    assert database.get_cambio_colori() == cambio_colori
+    assert read_rules_db(DB_PATH) == cluster_dict
+    print(f"✅ database sintetico riletto uguale: {len(cluster_dict)} cluster, {len(cambio_colori)} regole")
+    return True
+
+
+def test_shares() -> bool:
+    n = 40
+    _, cambio_colori = generate_rules(n, codes_per_cluster=5, rule_density=0.5, forbidden_share=0.3,
+                                      required_type_share=0.2, required_colors_share=0.2, seed=450)
+    regole = list(cambio_colori.values())
+    densita = len(regole) / (n * (n - 1))
+    vietate = sum(r["peso"] >= config.INFINITE_COST for r in regole) / len(regole)
+    con_tipo = sum(r["required_type"] is not None for r in regole) / len(regole)
+    con_colori = sum(bool(r["colors"]) for r in regole) / len(regole)
+    assert abs(densita - 0.5) < 0.05, densita
+    assert abs(vietate - 0.3) < 0.05, vietate
+    # Le quote si applicano in cascata alle regole non vietate: 0.7 * 0.2 e 0.7 * 0.8 * 0.2
+    assert abs(con_tipo - 0.14) < 0.04 and abs(con_colori - 0.112) < 0.04, (con_tipo, con_colori)
+
+    assert generate_rules(12, seed=7) == generate_rules(12, seed=7)
+    assert generate_rules(12, seed=7) != generate_rules(12, seed=8)
+    assert generate_orders(*generate_rules(12, seed=7)[:1], 50, seed=3) == \
+        generate_orders(*generate_rules(12, seed=7)[:1], 50, seed=3)
+    print(f"✅ quote rispettate (densità {densita:.2f}, vietate {vietate:.2f}, tipo {con_tipo:.2f}, "
+          f"colori {con_colori:.2f}), stesso seed -> stesso impianto")
+    return True
+
+
+def test_orders() -> bool:
+    cluster_dict = database.get_cluster_colori()
+    orders = generate_orders(cluster_dict, 600, lines=["L1", "L2"], cabin_split=0.4, days=3,
+                             cover_clusters=True, seed=451)
+    assert {o["code"] for o in orders[:len(cluster_dict)]} <= {c for codes in cluster_dict.values() for c in codes}
+    assert len({o["line"] for o in orders}) == 2 and {o["day"] for o in orders} == {0, 1, 2}
+
+    for nome, fmt in (("ordini.csv", ingest.FORMAT_CSV), ("ordini.jsonl", ingest.FORMAT_JSONL)):
+        path = os.path.join(TMP_DIR, nome)
+        write_orders(path, orders)
+        with open(path, "rb") as f, contextlib.redirect_stdout(io.StringIO()):
+            result = ingest.import_colors(f, fmt, cluster_dict)
+        assert result.rejected == 0 and not result.unknown_codes, result.stats()
+        assert result.colors == [{**o, "day": o.get("day")} for o in orders], nome
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        ordered, sequence, cost, message = logic.optimize_color_sequence([{**o, "day": None} for o in orders])
+    assert ordered and len(sequence) == len(cluster_dict) and cost < config.INFINITE_COST, message
+    print(f"✅ {len(orders)} ordini su 20 cluster: import CSV/JSONL identico, ottimizzati con costo {cost}")
+    return True
+
+
+if __name__ == "__main__":
+    print("🧪 Test generatore di impianti sintetici")
+    print("=" * 60)
+    setup_module()
+    try:
+        ok = test_roundtrip() and test_shares() and test_orders()
+    finally:
+        teardown_module()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Test del warm start dal piano attuale:
+- con un percorso iniziale (anche pessimo) _find_best_path_and_reconstruct resta ottimo
+  come la ricerca esaustiva, con partenza/arrivo fissati e precedenze;
+- _local_search non peggiora mai e rispetta i vincoli;
+- optimize_color_sequence riporta il costo del piano attuale e il miglioramento;
+- tempo della DP a freddo e con il limite dato dal piano attuale leggermente modificato.
+
+Eseguire dalla root del progetto: python test/test_warm_start.py
+"""
+
+import contextlib
+import io
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import numpy as np
+
+from app import config, database, logic
+
+INF = config.INFINITE_COST
+
+
+def random_matrix(rng: random.Random, n: int, forbidden: float) -> np.ndarray:
+    return np.array([[INF if rng.random() < forbidden else rng.choice([1, 5, 10, 25, 60]) for _ in range(n)]
+                     for _ in range(n)], dtype=float)
+
+
+def brute_force(cost_matrix, start, end, masks):
+    n = cost_matrix.shape[0]
+    costs = [logic._path_cost(cost_matrix, list(perm)) for perm in itertools.permutations(range(n))
+             if logic._tour_is_valid(list(perm), n, start, end, masks)]
+    costs = [cost for cost in costs if cost < INF]
+    return min(costs) if costs else None
+
+
+def test_against_brute_force(iterations: int = 400) -> bool:
+    rng = random.Random(38)
+    for n_case in range(iterations):
+        n = rng.randint(2, 7)
+        matrix = random_matrix(rng, n, rng.choice([0.0, 0.2, 0.4]))
+        start = rng.choice([None] + list(range(n)))
+        end = rng.choice([None] + [k for k in range(n) if k != start])
+        masks = None
+        if rng.random() < 0.3 and n > 2:
+            a, b = rng.sample(range(n), 2)
+            masks = logic._predecessor_masks([str(k) for k in range(n)], [(str(a), str(b))])
+        warm = list(range(n))
+        rng.shuffle(warm)
+        with contextlib.redirect_stdout(io.StringIO()):
+            paths = logic._find_best_path_and_reconstruct(matrix, start, end_node_index=end,
+                                                          predecessor_masks=masks, warm_start_tour=warm)
+        expected = brute_force(matrix, start, end, masks)
+        if expected is None:
+            assert paths == [], (n_case, paths)
+            continue
+        assert paths and abs(paths[0][0] - expected) < 1e-9, (n_case, paths, expected)
+        for cost, tour in paths:
+            assert logic._tour_is_valid(tour, n, start, end, masks), (n_case, tour)
+            assert abs(logic._path_cost(matrix, tour) - cost) < 1e-9, (n_case, tour, cost)
+
+        if logic._tour_is_valid(warm, n, start, end, masks):
+            initial = logic._path_cost(matrix, warm)
+            cost, tour = logic._local_search(matrix, warm, start, end, masks)
+            assert cost <= initial and logic._tour_is_valid(tour, n, start, end, masks), (n_case, warm, tour)
+            assert abs(logic._path_cost(matrix, tour) - cost) < 1e-9, n_case
+    print(f"✅ {iterations} matrici casuali: con warm start il solver resta ottimo come la ricerca esaustiva")
+    return True
+
+
+def test_report_improvement() -> bool:
+    rng = random.Random(380)
+    codes = [code for codes in database.get_cluster_colori().values() for code in codes]
+    colors = [{"code": rng.choice(codes), "type": rng.choice(["F", "K", "R", "E", "E"])} for _ in range(80)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, sequence, cost, _ = logic.optimize_color_sequence(colors)
+        same = logic.optimize_color_sequence(colors, warm_start_sequence=sequence)
+        worse = logic.optimize_color_sequence(colors, warm_start_sequence=list(reversed(sequence)))
+    assert same[2] == cost and worse[2] == cost, (cost, same[2], worse[2])
+    assert "miglioramento 0.00" in same[3], same[3]
+    assert "Piano attuale" in worse[3], worse[3]
+    print("✅ optimize_color_sequence: stesso ottimo con e senza warm start, miglioramento riportato nel messaggio")
+    return True
+
+
+def benchmark(n: int = 16) -> None:
+    rng = random.Random(3800)
+    matrix = random_matrix(rng, n, 0.3)
+    with contextlib.redirect_stdout(io.StringIO()):
+        best_cost, best_tour = logic._find_best_path_and_reconstruct(matrix, 0, top_n=1)[0]
+    edited = best_tour[:]
+    edited[5], edited[9] = edited[9], edited[5]  # piccola modifica manuale al piano
+    for label, warm in (("a freddo", None), ("warm start dal piano modificato", edited)):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start_time = time.perf_counter()
+            cost, _ = logic._find_best_path_and_reconstruct(matrix, 0, top_n=1, warm_start_tour=warm)[0]
+            elapsed = time.perf_counter() - start_time
+        assert abs(cost - best_cost) < 1e-9
+        print(f"⏱️  {n} cluster, {label}: {elapsed * 1000:.0f} ms (costo {cost:.0f})")
+
+
+if __name__ == "__main__":
+    print("🧪 Test warm start dal piano attuale")
+    print("=" * 60)
+    ok = test_against_brute_force() and test_report_improvement()
+    print()
+    benchmark()
+    sys.exit(0 if ok else 1)